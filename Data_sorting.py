@@ -64,11 +64,11 @@ def crop_point_data_to_base_raster(raster_name, raster_directory, csv_file, EPSG
     long_min,lat_min = transform(inProj,outProj,x_min,y_min)
     long_max,lat_max = transform(inProj,outProj,x_max,y_max)
 
-    # data sorting
-    df = df[df.longitude<long_max]
-    df = df[df.latitude<lat_max]
-    df = df[df.latitude>lat_min]
-    df = df[df.longitude>long_min]
+    # data sorting: one combined mask rather than copying the dataframe four times
+    longitude = df.longitude.values
+    latitude = df.latitude.values
+    in_raster = (longitude>long_min) & (longitude<long_max) & (latitude>lat_min) & (latitude<lat_max)
+    df = df[in_raster]
     df.to_csv(csv_file[:-4]+"_"+raster_name+"_filtered.csv", index = False)
 
     #return the name of the new csv file
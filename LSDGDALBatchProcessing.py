@@ -4,69 +4,240 @@ Created on Wed Sep 09 16:52:27 2015
 
 @author: smudd
 """
+from __future__ import absolute_import, division, print_function, unicode_literals
 
 import numpy as np
 from glob import glob
-import LSDOSystemTools as LSDost
+from LSDPlottingTools import LSDMap_OSystemTools as LSDost
 import os
-import shutil
-import subprocess
+import csv
+import time
+import multiprocessing
+from osgeo import gdal
+
+# The extension of each raster format
+_FORMAT_EXTENSIONS = {"ENVI": ".bil", "EHdr": ".bil", "GTiff": ".tif"}
+
+# The default creation options of each output format. The ENVI driver can't
+# compress, but the bil interleave is what LSDTopoTools wants. Geotiffs are
+# tiled and compressed.
+_DEFAULT_CREATION_OPTIONS = {"ENVI": ["INTERLEAVE=BIL"],
+                             "EHdr": [],
+                             "GTiff": ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]}
+
+# The columns of the manifest csv
+_MANIFEST_COLUMNS = ["source", "output", "status", "seconds", "message"]
+
+# This gets the extension of a raster format. It returns "NULL" if the format
+# isn't one we know about.
+def GetRasterExtension(raster_format):
+    if raster_format in _FORMAT_EXTENSIONS:
+        return _FORMAT_EXTENSIONS[raster_format]
+    print("You have not selcted a valid raster format!")
+    print("Options are "+", ".join(sorted(_FORMAT_EXTENSIONS)))
+    return "NULL"
+
+# This makes a directory if it isn't there already
+def _MakeDirectory(target_directory):
+    if not os.access(target_directory,os.F_OK):
+        print("Making path: ")
+        os.makedirs(target_directory)
+        print("I made a directory: " + target_directory)
+    else:
+        print("Path: " +target_directory+" already exists.")
+
+# This gets the files that make up a raster: the raster itself and its header
+# if it has one (ENVI and EHdr rasters).
+def _GetRasterFiles(FileName):
+    FileNames = [FileName]
+    header = os.path.splitext(FileName)[0]+".hdr"
+    if os.path.isfile(header):
+        FileNames.append(header)
+    return FileNames
+
+# This checks if an output is newer than all of its inputs, in which case
+# it doesn't need to be made again. This is what makes the batch jobs
+# restartable: if they are stopped you just run them again.
+def IsUpToDate(InputFiles, OutputFile):
+    if not os.path.isfile(OutputFile):
+        return False
+    output_time = os.path.getmtime(OutputFile)
+    if os.path.splitext(OutputFile)[1] == ".bil":
+        header = os.path.splitext(OutputFile)[0]+".hdr"
+        if not os.path.isfile(header):
+            return False
+        output_time = min(output_time, os.path.getmtime(header))
+    for InputFile in InputFiles:
+        for FileName in _GetRasterFiles(InputFile):
+            if os.path.getmtime(FileName) > output_time:
+                return False
+    return True
+
+# This sets up gdal in each worker process. Each worker gets its own
+# block cache of gdal_cache_mb megabytes, so the pool doesn't use more than
+# n_workers*gdal_cache_mb for the cache.
+def _InitGDALWorker(gdal_cache_mb):
+    gdal.UseExceptions()
+    gdal.SetCacheMax(int(gdal_cache_mb)*1024*1024)
+
+# If there is only one worker the tasks run in the caller's process, so these
+# save and restore the gdal settings that _InitGDALWorker changes.
+def _SaveGDALState():
+    return (gdal.GetUseExceptions(), gdal.GetCacheMax())
+
+def _RestoreGDALState(state):
+    use_exceptions, cache_max = state
+    if not use_exceptions:
+        gdal.DontUseExceptions()
+    gdal.SetCacheMax(cache_max)
+
+# This processes one task: it either translates the source (if there is no
+# reprojection or change of resolution) or warps it. The source can be a
+# single raster or a vrt of several. It returns a row for the manifest.
+def _ProcessRasterTask(task):
+    start_time = time.time()
+    row = {"source": ";".join(task["sources"]), "output": task["output"]}
+    try:
+        source = task["sources"][0] if len(task["sources"]) == 1 else gdal.BuildVRT("", task["sources"])
+        creation_options = task["creation_options"]
+
+        if task["dst_srs"] is None and task["resolution"] is None:
+            gdal.Translate(task["output"], source, format = task["format"],
+                           creationOptions = creation_options, noData = task["nodata"])
+        else:
+            warp_kwargs = dict(format = task["format"], creationOptions = creation_options,
+                               resampleAlg = task["resampling"], dstNodata = task["nodata"],
+                               warpMemoryLimit = task["gdal_cache_mb"]*1024*1024,
+                               multithread = task.get("multithread", False))
+            if warp_kwargs["multithread"]:
+                # a warp option rather than the GDAL_NUM_THREADS config option, which is global
+                warp_kwargs["warpOptions"] = ["NUM_THREADS=ALL_CPUS"]
+            if task["dst_srs"] is not None:
+                warp_kwargs["dstSRS"] = task["dst_srs"]
+            if task["resolution"] is not None:
+                warp_kwargs["xRes"] = task["resolution"]
+                warp_kwargs["yRes"] = task["resolution"]
+                warp_kwargs["targetAlignedPixels"] = True
+            gdal.Warp(task["output"], source, **warp_kwargs)
+        source = None
+
+        row["status"] = "done"
+        row["message"] = ""
+    except RuntimeError as error:
+        row["status"] = "failed"
+        row["message"] = str(error)
+    row["seconds"] = round(time.time()-start_time, 3)
+    return row
+
+# This runs a list of tasks in a pool of worker processes and writes a
+# manifest csv with a row for every output: whether it was made, skipped
+# because it was up to date, or failed (with the gdal error).
+# The manifest is written as the tasks finish, so you can watch it.
+def RunRasterTasks(tasks, manifest_file, n_workers = None, gdal_cache_mb = 256, overwrite = False):
+
+    rows = []
+    todo = []
+    for task in tasks:
+        if not overwrite and IsUpToDate(task["sources"], task["output"]):
+            rows.append({"source": ";".join(task["sources"]), "output": task["output"],
+                         "status": "skipped", "seconds": 0, "message": "output is newer than the source"})
+        else:
+            task["gdal_cache_mb"] = gdal_cache_mb
+            todo.append(task)
+    print("There are "+str(len(tasks))+" rasters. "+str(len(tasks)-len(todo))+" are up to date, I will make the other "+str(len(todo)))
+
+    with open(manifest_file, "w") as f:
+        writer = csv.DictWriter(f, fieldnames = _MANIFEST_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        n_workers = max(1, min(n_workers, len(todo)))
+
+        gdal_state = None
+        pool = None
+        if n_workers == 1:
+            gdal_state = _SaveGDALState()
+            _InitGDALWorker(gdal_cache_mb)
+            results = (_ProcessRasterTask(task) for task in todo)
+        else:
+            pool = multiprocessing.Pool(n_workers, initializer = _InitGDALWorker, initargs = (gdal_cache_mb,))
+            results = pool.imap_unordered(_ProcessRasterTask, todo)
+
+        try:
+            for row in results:
+                print(row["status"]+": "+row["output"]+" ("+str(row["seconds"])+" s) "+row["message"])
+                writer.writerow(row)
+                f.flush()
+                rows.append(row)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if gdal_state is not None:
+                _RestoreGDALState(gdal_state)
+
+    n_failed = sum(1 for row in rows if row["status"] == "failed")
+    if n_failed > 0:
+        print("WARNING: "+str(n_failed)+" rasters failed, see "+manifest_file)
+    print("The manifest is in "+manifest_file)
+    return rows
 
 # This function looks for all the files of a certain format in a directory and
 # then translates them into a new format into a subdirectory named
-# after the target format. 
-def GDALBatchConvert(DataDirectory,raster_format,target_format):
- 
-    NewDataDirectory = LSDost.ReformatSeperators(DataDirectory)   
+# after the target format.
+# You can also reproject them (dst_srs, anything gdal understands, e.g. "EPSG:32630")
+# and/or change the resolution. The files are done in a pool of n_workers
+# processes (default one per cpu), each with a gdal cache of gdal_cache_mb.
+# Files whose output is newer than them are skipped unless overwrite is True.
+# A manifest of what was done is written to the target directory.
+# creation_options replace the default creation options of the target format.
+def GDALBatchConvert(DataDirectory,raster_format,target_format, dst_srs = None, resolution = None,
+                     resampling = "bilinear", nodata = None, creation_options = None,
+                     n_workers = None, gdal_cache_mb = 256, overwrite = False):
+
+    NewDataDirectory = LSDost.ReformatSeperators(DataDirectory)
     DataDirectory = LSDost.AppendSepToDirectoryPath(NewDataDirectory)
 
-    # Check the target format   
-    if target_format == "ENVI":
-        target_extension = ".bil"
-    elif target_format == "EHdr":
-        target_extension = ".bil"
-    elif target_format == "GTiff":
-        target_extension = ".tiff"
-    else:
-        print "You have not selcted a valid raster format!"
-        print "Options are ENVI, EHdr and GTiff"
-        target_extension = "NULL"   
-
-    # now make a directory   
-    if target_extension != "NULL":
-        
-        target_directory = DataDirectory+target_format
-
-        if not os.access(target_directory,os.F_OK):
-            print "Making path: "
-            os.mkdir(target_directory)
-            print "I made a directory: " + target_directory
-        else:
-            print "Path: " +target_directory+" already exists."     
-
-    # Now check the source format   
-    if raster_format == "ENVI":
-        raster_extension = ".bil"
-    elif raster_format == "EHdr":
-        raster_extension = ".bil"
-    elif raster_format == "GTiff":
-        raster_extension = ".tif"
-    else:
-        print "You have not selcted a valid raster format!"
-        print "Options are ENVI, EHdr and GTiff"
-        raster_extension = "NULL"
-
-    # find all the dataset of the source format  
-    print "The data directory is: " + DataDirectory
-    print "The raster extension is: " + raster_extension
-    if raster_extension != "NULL":
-        for FileName in glob(DataDirectory+"*"+raster_extension):
-            print "found file: " + FileName
-            subprocess.call(['gdalinfo',FileName])
-        
-def GDALBatchMerge(DataDirectory,merge_subfolder_name,merge_filename,raster_format,target_format):
-    
-    NewDataDirectory = LSDost.ReformatSeperators(DataDirectory)   
+    # Check the formats
+    target_extension = GetRasterExtension(target_format)
+    raster_extension = GetRasterExtension(raster_format)
+    if target_extension == "NULL" or raster_extension == "NULL":
+        return []
+
+    # now make a directory
+    target_directory = LSDost.AppendSepToDirectoryPath(DataDirectory+target_format)
+    _MakeDirectory(target_directory)
+
+    if creation_options is None:
+        creation_options = _DEFAULT_CREATION_OPTIONS[target_format]
+
+    # find all the dataset of the source format
+    print("The data directory is: " + DataDirectory)
+    print("The raster extension is: " + raster_extension)
+    tasks = []
+    for FileName in sorted(glob(DataDirectory+"*"+raster_extension)):
+        print("found file: " + FileName)
+        OutFileName = target_directory+LSDost.GetFilePrefix(FileName)+target_extension
+        tasks.append({"sources": [FileName], "output": OutFileName, "format": target_format,
+                      "dst_srs": dst_srs, "resolution": resolution, "resampling": resampling,
+                      "nodata": nodata, "creation_options": creation_options})
+
+    return RunRasterTasks(tasks, target_directory+"manifest.csv", n_workers = n_workers,
+                          gdal_cache_mb = gdal_cache_mb, overwrite = overwrite)
+
+# This merges all the rasters of a format in a directory into one mosaic, in
+# a subfolder. The tiles are put together in a vrt so nothing is copied until
+# the mosaic is written (and reprojected, if you give dst_srs, or resampled,
+# if you give a resolution). If the mosaic is newer than all the tiles it
+# isn't made again unless overwrite is True.
+def GDALBatchMerge(DataDirectory,merge_subfolder_name,merge_filename,raster_format,target_format,
+                   dst_srs = None, resolution = None, resampling = "bilinear", nodata = None,
+                   creation_options = None, gdal_cache_mb = 1024, overwrite = False):
+
+    NewDataDirectory = LSDost.ReformatSeperators(DataDirectory)
     DataDirectory = LSDost.AppendSepToDirectoryPath(NewDataDirectory)
 
     # get the name of the data directory into which the file should be merged
@@ -74,59 +245,39 @@ def GDALBatchMerge(DataDirectory,merge_subfolder_name,merge_filename,raster_form
     mDataDriectory = LSDost.AppendSepToDirectoryPath(merge_DataDirectory)
 
     # make the directory
-    if not os.access(mDataDriectory,os.F_OK):
-        print "Making path: "
-        os.mkdir(mDataDriectory)
-        print "I made a directory: " + mDataDriectory
-    else:
-        print "Path: " +mDataDriectory+" already exists."             
-
-    # Check the source format   
-    if raster_format == "ENVI":
-        raster_extension = ".bil"
-    elif raster_format == "EHdr":
-        raster_extension = ".bil"
-    elif raster_format == "GTiff":
-        raster_extension = ".tif"
-    else:
-        print "You have not selcted a valid raster format!"
-        print "Options are ENVI, EHdr and GTiff"
-        raster_extension = "NULL"
-
-    # Check the target format. Default is geotiff  
-    if target_format == "ENVI":
-        target_extension = ".bil"
-    elif target_format == "EHdr":
-        target_extension = ".bil"
-    elif target_format == "GTiff":
-        target_extension = ".tif"
-    else:
-        print "You have not selcted a valid raster format!"
-        print "Defaulting to GTiff"
-        target_format == "GTiff"        
-        target_extension = ".tif"
-    
+    _MakeDirectory(mDataDriectory)
+
+    # Check the source format
+    raster_extension = GetRasterExtension(raster_format)
+    if raster_extension == "NULL":
+        return []
+
+    # Check the target format. Default is geotiff
+    if target_format not in _FORMAT_EXTENSIONS:
+        print("You have not selcted a valid raster format!")
+        print("Defaulting to GTiff")
+        target_format = "GTiff"
+    target_extension = _FORMAT_EXTENSIONS[target_format]
+
+    if creation_options is None:
+        creation_options = _DEFAULT_CREATION_OPTIONS[target_format]
+
     # set the name of the target file
     target_FileName = mDataDriectory+merge_filename+target_extension
 
-    # find all the dataset of the source format  
-    print "The data directory is: " + DataDirectory
-    print "The raster extension is: " + raster_extension
-    if raster_extension != "NULL":
-        
-        # Set up the list for holding command prompt commands        
-        command_prompt = []
-        command_prompt.append("gdal_merge.py")
-        command_prompt.append("-of")
-        command_prompt.append(target_format)
-        command_prompt.append("-o")
-        command_prompt.append(target_FileName)
-                
-        
-        for FileName in glob(DataDirectory+"*"+raster_extension):
-            print "found file: " + FileName
-            command_prompt.append(FileName)            
-            
-        print "The subprocess call is: "
-        print command_prompt         
-        subprocess.call(command_prompt)
+    # find all the dataset of the source format
+    print("The data directory is: " + DataDirectory)
+    print("The raster extension is: " + raster_extension)
+    FileNames = sorted(glob(DataDirectory+"*"+raster_extension))
+    for FileName in FileNames:
+        print("found file: " + FileName)
+    if len(FileNames) == 0:
+        print("I didn't find any rasters to merge")
+        return []
+
+    # one mosaic, so one worker, but gdal can use all the cpus for the warp
+    task = {"sources": FileNames, "output": target_FileName, "format": target_format,
+            "dst_srs": dst_srs, "resolution": resolution, "resampling": resampling,
+            "nodata": nodata, "creation_options": creation_options, "multithread": True}
+    return RunRasterTasks([task], mDataDriectory+merge_filename+"_manifest.csv", n_workers = 1,
+                          gdal_cache_mb = gdal_cache_mb, overwrite = overwrite)
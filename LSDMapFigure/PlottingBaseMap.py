@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+PlottingBaseMap
+
+A reusable base map for the MapFigure objects. Most of the map functions
+in LSDMappingTools start from the same landscape: the hillshade of the DEM,
+its extent and tick marks and the outlines of the basins. Building these is
+the slow bit (reading the hillshade and polygonising the basin raster), so
+here we build them once per DEM prefix and then hand them to as many
+MapFigure objects as you like.
+
+Usage:
+    BM = GetBaseMap(DataDirectory, fname_prefix, raster_ext = ".bil")
+    MF = MapFigure(fname_prefix+"_hs.bil", DataDirectory, coord_type="UTM_km", base_map = BM)
+    MF.plot_polygon_outlines(BM.basins, linewidth = 0.5)
+
+The base maps are kept for the rest of the python session. If the image cache
+is on (see LSDPlottingTools.LSDMap_ImageCache.EnableImageCache) they are also
+saved in the image cache directory, so later sessions can read them rather
+than build them. They are rebuilt automatically if the hillshade changes.
+
+Author: SMM
+
+Date: 19/10/2026
+"""
+
+import os
+import hashlib
+import numpy as np
+import LSDPlottingTools as LSDP
+from LSDPlottingTools import LSDMap_OSystemTools as LSDOst
+from LSDPlottingTools import LSDMap_ImageCache as LSDImageCache
+
+# Base maps that have already been loaded in this python session, so that
+# we don't even have to read the npz file twice.
+# The key is the hillshade (with path) and coordinate type, the value is the BaseMap object
+_LOADED_BASE_MAPS = {}
+
+
+class BaseMap(object):
+    """
+    This holds everything that is needed to start a MapFigure over a given DEM:
+    the hillshade array, its extents, the EPSG string, the tick marks and
+    (optionally) the basin polygons. The basin polygons come from the basin
+    geometry store (see LSDMap_VectorTools.GetBasinGeometryStore), which keeps
+    its own sidecar file, so they are not duplicated in the base map cache.
+
+    Args:
+        DataDirectory (str): The path to the data. Needs to have the trailing slash
+        fname_prefix (str): The prefix of the DEM (no extension)
+        coord_type (str): The coordinate type for the ticks. "UTM", "UTM_km" or "None"
+        include_basins (bool): If true, and the _AllBasins raster exists, the basin polygons are stored
+        rebuild (bool): If true, ignore any cached file and rebuild the base map
+        raster_ext (str): The extension of the rasters, e.g. ".bil" or ".tif"
+
+    Author: SMM
+    """
+    def __init__(self, DataDirectory, fname_prefix, coord_type = "UTM_km",
+                 include_basins = True, rebuild = False, raster_ext = ".bil"):
+
+        self._Directory = DataDirectory
+        self._fname_prefix = fname_prefix
+        self._coord_type = coord_type
+        self._include_basins = include_basins
+
+        self.HillshadeName = fname_prefix+"_hs"+raster_ext
+        self.BasinsName = fname_prefix+"_AllBasins"+raster_ext
+        self._FullPathHillshade = DataDirectory+self.HillshadeName
+        self._FullPathBasins = DataDirectory+self.BasinsName
+        self.CacheFileName = GetBaseMapCacheFileName(self._FullPathHillshade, coord_type)
+
+        self.fingerprint = self.get_source_fingerprint()
+
+        loaded = False
+        if not rebuild and self.CacheFileName is not None and os.path.isfile(self.CacheFileName):
+            loaded = self.load()
+
+        if not loaded:
+            self.build()
+            self.save()
+
+    def get_source_fingerprint(self):
+        """
+        Gets a fingerprint of the files the base map is built from.
+
+        Author: SMM
+        """
+        source_files = [self._FullPathHillshade, os.path.splitext(self._FullPathHillshade)[0]+".hdr"]
+        return LSDOst.GetFileFingerprint(source_files)
+
+    def build(self):
+        """
+        Builds the base map from the rasters. This is the slow bit.
+
+        Author: SMM
+        """
+        print("I am building the base map for "+self._fname_prefix+". This only happens once.")
+        self.hillshade = LSDP.ReadRasterArrayBlocks(self._FullPathHillshade).astype(np.float32)
+        self.extents = list(LSDP.GetRasterExtent(self._FullPathHillshade))
+        self.EPSG_string = LSDP.GetUTMEPSG(self._FullPathHillshade)
+
+        xmin,xmax,ymin,ymax = self.extents
+        if self._coord_type == "UTM":
+            xlocs,ylocs,xlabels,ylabels = LSDP.GetTicksForUTMNoInversion(self._FullPathHillshade,xmax,xmin,ymax,ymin,5)
+        elif self._coord_type == "UTM_km":
+            xlocs,ylocs,xlabels,ylabels = LSDP.GetTicksForUTMNoInversion(self._FullPathHillshade,xmax,xmin,ymax,ymin,5,minimum_tick_spacing=1000)
+            xlabels = LSDP.TickLabelShortenizer(xlabels,3)
+            ylabels = LSDP.TickLabelShortenizer(ylabels,3)
+        else:
+            xlocs,ylocs,xlabels,ylabels = [],[],[],[]
+        self.ticks = [list(xlocs),list(ylocs),[str(x) for x in xlabels],[str(y) for y in ylabels]]
+
+        self.load_basins()
+
+    def load_basins(self):
+        """
+        Gets the basin polygons from the basin geometry store. The raster is
+        only polygonised if it has changed since the last time.
+
+        Author: SMM
+        """
+        self._basin_store = None
+        self.basins = {}
+        if self._include_basins and os.path.isfile(self._FullPathBasins):
+            self._basin_store = LSDP.GetBasinGeometryStore(self._Directory, self.BasinsName)
+            self.basins = self._basin_store.outlines
+
+    def basins_are_current(self):
+        """
+        Checks that the basin polygons are up to date with the basin raster.
+
+        Author: SMM
+        """
+        if not self._include_basins:
+            return True
+        if self._basin_store is None:
+            return not os.path.isfile(self._FullPathBasins)
+        return LSDP.GetBasinGeometryStore(self._Directory, self.BasinsName) is self._basin_store
+
+    def save(self):
+        """
+        Writes the base map to a npz file in the image cache, if it is on.
+
+        Author: SMM
+        """
+        if self.CacheFileName is None:
+            return
+        try:
+            CacheDirectory = os.path.dirname(self.CacheFileName)
+            if not os.path.isdir(CacheDirectory):
+                os.makedirs(CacheDirectory)
+            np.savez(self.CacheFileName,
+                     fingerprint = np.array(self.fingerprint),
+                     hillshade = self.hillshade,
+                     extents = np.array(self.extents, dtype=np.float64),
+                     EPSG_string = np.array(self.EPSG_string),
+                     tick_xlocs = np.array(self.ticks[0], dtype=np.float64),
+                     tick_ylocs = np.array(self.ticks[1], dtype=np.float64),
+                     tick_xlabels = np.array(self.ticks[2], dtype=np.str_),
+                     tick_ylabels = np.array(self.ticks[3], dtype=np.str_))
+            print("I saved the base map to "+self.CacheFileName)
+        except (IOError, OSError):
+            print("I could not write the base map cache "+self.CacheFileName+", it will be rebuilt next time.")
+            return
+        LSDImageCache.EvictImages(keep_key = os.path.basename(CacheDirectory))
+
+    def load(self):
+        """
+        Reads the base map from the npz file. Returns False if the cache is
+        out of date (i.e. the rasters have changed since it was written).
+
+        Author: SMM
+        """
+        try:
+            cache = np.load(self.CacheFileName)
+        except (IOError, OSError):
+            # another process might have just evicted it
+            return False
+        with cache:
+            if str(cache["fingerprint"]) != self.fingerprint:
+                print("The base map cache is out of date, I will rebuild it.")
+                return False
+
+            print("I am loading the base map from "+self.CacheFileName)
+            self.hillshade = cache["hillshade"]
+            self.extents = [float(x) for x in cache["extents"]]
+            self.EPSG_string = str(cache["EPSG_string"])
+            self.ticks = [[float(x) for x in cache["tick_xlocs"]], [float(y) for y in cache["tick_ylocs"]],
+                          [str(x) for x in cache["tick_xlabels"]], [str(y) for y in cache["tick_ylabels"]]]
+
+        # mark the base map as used, for the least recently used eviction of the image cache
+        try:
+            os.utime(os.path.dirname(self.CacheFileName), None)
+        except (IOError, OSError):
+            pass
+        self.load_basins()
+        return True
+
+    def matches(self, FullPathRaster):
+        """
+        Checks if a raster is the hillshade of this base map.
+
+        Args:
+            FullPathRaster (str): The raster name with path and extension
+
+        Author: SMM
+        """
+        return os.path.abspath(FullPathRaster) == os.path.abspath(self._FullPathHillshade)
+
+    def get_representative_points(self):
+        """
+        Gets a dict where the key is the basin (junction) and the value is a
+        shapely point guaranteed to be within the basin. Same as
+        LSDP.GetPointWithinBasins but without polygonising the raster again.
+
+        Author: SMM
+        """
+        if self._basin_store is None:
+            return {}
+        return dict(self._basin_store.representative_points)
+
+    @property
+    def coord_type(self):
+        return self._coord_type
+
+    @property
+    def aspect_ratio(self):
+        return (self.extents[1]-self.extents[0])/(self.extents[3]-self.extents[2])
+
+
+def GetBaseMapCacheFileName(FullPathHillshade, coord_type):
+    """
+    Gets the name of the file a base map is saved in, in the image cache
+    directory. None if the image cache is off.
+
+    Args:
+        FullPathHillshade (str): The hillshade with path and extension
+        coord_type (str): The coordinate type for the ticks
+
+    Author: SMM
+    """
+    CacheDirectory = LSDImageCache.GetCacheDirectory()
+    if CacheDirectory is None:
+        return None
+    key = hashlib.sha1(("basemap|"+os.path.abspath(FullPathHillshade)+"|"+coord_type).encode("utf-8")).hexdigest()
+    return os.path.join(CacheDirectory, key, "basemap.npz")
+
+
+def GetBaseMap(DataDirectory, fname_prefix, coord_type = "UTM_km", include_basins = True, rebuild = False,
+               raster_ext = ".bil"):
+    """
+    Gets a base map for a DEM. If it has been loaded already in this session you
+    get the same object back, if it is in the image cache it is read, otherwise
+    it is built (and saved in the image cache if it is on).
+
+    Args:
+        DataDirectory (str): The path to the data. Needs to have the trailing slash
+        fname_prefix (str): The prefix of the DEM (no extension)
+        coord_type (str): The coordinate type for the ticks. "UTM", "UTM_km" or "None"
+        include_basins (bool): If true, and the _AllBasins.bil raster exists, the basin polygons are stored
+        rebuild (bool): If true, ignore any cached file and rebuild the base map
+        raster_ext (str): The extension of the rasters, e.g. ".bil" or ".tif"
+
+    Returns:
+        A BaseMap object
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    base_map_key = (os.path.abspath(DataDirectory+fname_prefix+"_hs"+raster_ext), coord_type)
+
+    if not rebuild and base_map_key in _LOADED_BASE_MAPS:
+        this_base_map = _LOADED_BASE_MAPS[base_map_key]
+        # make sure the data hasn't changed under our feet and that it has the basins if you want them
+        has_what_you_need = this_base_map._include_basins or not include_basins
+        if has_what_you_need and this_base_map.get_source_fingerprint() == this_base_map.fingerprint:
+            if not this_base_map.basins_are_current():
+                this_base_map.load_basins()
+            return this_base_map
+
+    this_base_map = BaseMap(DataDirectory, fname_prefix, coord_type = coord_type,
+                            include_basins = include_basins, rebuild = rebuild, raster_ext = raster_ext)
+    _LOADED_BASE_MAPS[base_map_key] = this_base_map
+    return this_base_map
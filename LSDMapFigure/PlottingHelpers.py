@@ -10,6 +10,7 @@ Released under GPL3
 """
 
 import os
+import numpy as np
 import pandas as pd
 import fiona
 from shapely.geometry import shape, Polygon, Point, LineString
@@ -371,6 +372,77 @@ def GetTicksForUTMNoInversion(FileName,x_max,x_min,y_max,y_min,n_target_tics):
 #==============================================================================
 
 
+#==============================================================================
+# This thins point data down to one point per pixel of the final image
+#------------------------------------------------------------------------------
+def DecimatePointsToPixels(easting, northing, pixel_size, priority_data = [],
+                           colour_data = [], colour_aggregation = "representative"):
+    """This bins points into cells the size of a pixel in the saved figure and
+    keeps one point per cell. There is no point drawing a million channel nodes
+    if the image only has a few hundred thousand pixels, and it keeps pdfs and
+    svgs small.
+
+    Args:
+        easting (array): the x locations of the points
+        northing (array): the y locations of the points
+        pixel_size (float): the size of a pixel of the final image in map units
+        priority_data (array): In each cell the point with the highest value is kept (e.g. drainage area, so the trunk channel is drawn). If empty the first point is kept.
+        colour_data (array): the data used to colour the points. Can be empty.
+        colour_aggregation (str): how the colour data of the kept point is set: "representative" (from the kept point), "mean", "max" or "min" (of the finite values in the cell)
+
+    Returns:
+        keep_index (np.array): the indices of the kept points
+        new_colour_data (np.array): the colour data of the kept points (empty if there is no colour data)
+
+    Author: SMM
+    """
+    easting = np.asarray(easting, dtype=np.float64)
+    northing = np.asarray(northing, dtype=np.float64)
+    n_points = len(easting)
+    if n_points == 0:
+        return np.array([], dtype=np.int64), np.asarray(colour_data)
+
+    # get the cell of each point
+    cell_x = np.floor((easting-np.nanmin(easting))/pixel_size)
+    cell_y = np.floor((northing-np.nanmin(northing))/pixel_size)
+    n_cell_cols = np.nanmax(cell_x)+1
+    cell_id = np.nan_to_num(cell_y*n_cell_cols+cell_x, nan=-1).astype(np.int64)
+
+    # sort by cell and then by priority (highest first) so the first point in each cell is the one we keep
+    if len(priority_data) == n_points:
+        priority = np.nan_to_num(np.asarray(priority_data, dtype=np.float64), nan=-np.inf)
+        order = np.lexsort((-priority, cell_id))
+    else:
+        order = np.argsort(cell_id, kind="stable")
+    sorted_cell_id = cell_id[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cell_id[1:] != sorted_cell_id[:-1]])
+    keep_index = order[starts]
+
+    new_colour_data = np.asarray(colour_data)
+    if len(colour_data) == n_points:
+        new_colour_data = new_colour_data[keep_index]
+        if colour_aggregation != "representative" and np.issubdtype(new_colour_data.dtype, np.number):
+            sorted_colour = np.asarray(colour_data, dtype=np.float64)[order]
+            finite = np.isfinite(sorted_colour)
+            if colour_aggregation == "mean":
+                sums = np.add.reduceat(np.where(finite, sorted_colour, 0), starts)
+                counts = np.add.reduceat(finite.astype(np.int64), starts)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    new_colour_data = np.where(counts > 0, sums/np.maximum(counts,1), np.nan)
+            elif colour_aggregation == "max":
+                new_colour_data = np.maximum.reduceat(np.where(finite, sorted_colour, -np.inf), starts)
+                new_colour_data[np.isinf(new_colour_data)] = np.nan
+            elif colour_aggregation == "min":
+                new_colour_data = np.minimum.reduceat(np.where(finite, sorted_colour, np.inf), starts)
+                new_colour_data[np.isinf(new_colour_data)] = np.nan
+            else:
+                print("I don't know the colour aggregation "+colour_aggregation+", I am using the colour of the representative point.")
+
+    print("I have thinned "+str(n_points)+" points to "+str(len(keep_index))+", one per pixel.")
+    return keep_index, new_colour_data
+#==============================================================================
+
+
 #=============================================================================
 # CSV READERS
 # Read in the csv files to pandas dataframes
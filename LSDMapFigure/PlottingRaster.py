@@ -17,6 +17,8 @@ This software is released under the Artistic Licence v2.0
 
 # LSDPlottingTools must be in your pythonpath
 import LSDPlottingTools as LSDP
+from LSDPlottingTools import LSDMap_ImageCache as LSDImageCache
+from LSDPlottingTools import LSDMap_CategoricalRaster as LSDCatRaster
 from . import PlottingHelpers as phelp
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -40,23 +42,31 @@ class BaseRaster(object):
         RasterName (str): The name of the rasters (with extension). It is read by gdal so should cope with mulitple formats
         Directory (str): The path to the raster. Needs to have the trailing slash
         NFF_opti (bool): experimental test of reading raster using numpy.fromfile() which a super efficient binary reader
+        base_map (BaseMap): A cached base map (see PlottingBaseMap). If the raster is the hillshade of the base map, the cached array is used rather than reading the file.
 
     Author: DAV and SMM
     """
-    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1):
+    def __init__(self, RasterName, Directory, NFF_opti = False, alpha = 1, base_map = None):
 
         self._RasterFileName = RasterName
         self._RasterDirectory = Directory
         self._FullPathRaster = self._RasterDirectory + self._RasterFileName
 
-        # I think the BaseRaster should contain a numpy array of the Raster
-        if(NFF_opti):
-            self._RasterArray = LSDP.ReadRasterArrayBlocks_numpy(self._FullPathRaster)
-        else:
-            self._RasterArray = LSDP.ReadRasterArrayBlocks(self._FullPathRaster)
+        # If this is the hillshade of a cached base map we just copy the cached data
+        use_base_map = base_map is not None and base_map.matches(self._FullPathRaster)
+        self._base_map = base_map if use_base_map else None
+        self._NFF_opti = NFF_opti
+
+        # I think the BaseRaster should contain a numpy array of the Raster.
+        # It is only read when it is first needed (see _RasterArray), so a base
+        # image that comes from the image cache never reads the raster at all.
+        self._raster_array = None
 
         # Get the extents as a list
-        self._RasterExtents = LSDP.GetRasterExtent(self._FullPathRaster)
+        if use_base_map:
+            self._RasterExtents = list(base_map.extents)
+        else:
+            self._RasterExtents = LSDP.GetRasterExtent(self._FullPathRaster)
         self._RasterAspectRatio = (self._RasterExtents[1]-self._RasterExtents[0])/(self._RasterExtents[3]-self._RasterExtents[2])
 
         # set the default colourmap
@@ -66,9 +76,40 @@ class BaseRaster(object):
         self._alpha = alpha
 
         # get the EPSG string
-        self._EPSGString = LSDP.LSDMap_IO.GetUTMEPSG(self._FullPathRaster)
+        if use_base_map:
+            self._EPSGString = base_map.EPSG_string
+        else:
+            self._EPSGString = LSDP.LSDMap_IO.GetUTMEPSG(self._FullPathRaster)
         #print("The EPSGString is: "+ self._EPSGString)
 
+    def read_raster_array(self):
+        """
+        Reads the raster array (or copies it from the base map), without keeping it.
+
+        Author: SMM
+        """
+        if self._base_map is not None:
+            # A copy, since the masking functions modify the array in place
+            return self._base_map.hillshade.copy()
+        elif(self._NFF_opti):
+            return LSDP.ReadRasterArrayBlocks_numpy(self._FullPathRaster)
+        else:
+            return LSDP.ReadRasterArrayBlocks(self._FullPathRaster)
+
+    @property
+    def _RasterArray(self):
+        if self._raster_array is None:
+            self._raster_array = self.read_raster_array()
+        return self._raster_array
+
+    @_RasterArray.setter
+    def _RasterArray(self, array):
+        self._raster_array = array
+
+    @property
+    def is_loaded(self):
+        return self._raster_array is not None
+
     @property
     def extents(self):
         return self._RasterExtents
@@ -213,10 +254,26 @@ class BaseRaster(object):
 
         Date: 17/06/17
         """
-        for idx, value in enumerate(old_values):
-            old_values_index = self._RasterArray == value
-            self._RasterArray[old_values_index] = new_values[idx]
-        #print self._RasterArray
+        if len(old_values) == 0:
+            return
+
+        # If we haven't read the raster yet, the factorised raster (which is
+        # cached) gives us the new array in one go without reading it again
+        if not self.is_loaded and self._base_map is None:
+            categorical_raster = LSDCatRaster.GetCategoricalRaster(self._FullPathRaster)
+            self._RasterArray = categorical_raster.replace_values(old_values, new_values)
+            return
+
+        # Otherwise look up all the values at once. If a value is in old_values
+        # more than once the first one wins.
+        old_values = np.asarray(old_values, dtype=np.float64)
+        new_values = np.asarray(new_values, dtype=np.float64)
+        order = np.argsort(old_values, kind="stable")
+        sorted_old_values = old_values[order]
+        positions = np.searchsorted(sorted_old_values, self._RasterArray)
+        positions = np.minimum(positions, len(sorted_old_values)-1)
+        to_replace = sorted_old_values[positions] == self._RasterArray
+        self._RasterArray[to_replace] = new_values[order][positions[to_replace]]
 
         
     def get_min_max(self):
@@ -233,19 +290,56 @@ class BaseRaster(object):
         
         return([zmin,zmax])
     
+    def sample_at_points(self, easting, northing, method = "nearest"):
+        """
+        Gets the raster values at a set of points, all in one go.
+
+        Args:
+            easting (array): the x coordinates of the points
+            northing (array): the y coordinates of the points
+            method (str): "nearest" or "bilinear"
+
+        Returns:
+            np.array of the values at the points, nan if they are off the raster
+
+        Author: SMM
+        """
+        return LSDP.SampleArrayAtPoints(self._RasterArray, self._RasterExtents, easting, northing, method = method)
+
     def get_unique(self):
         """
-        Gets unique values from the raster. Used for categorised plotting
+        Gets unique values from the raster (not including nodata). Used for categorised plotting
 
         Author: SMM
 
         Date: 23/03/2020
         """
-        
-        vals = np.unique(self._RasterArray)
-        
+        vals, category_index = self.factorise()
         return(vals)
 
+    def factorise(self):
+        """
+        Gets the unique values of the raster and the index of the value of each
+        pixel, so the raster can be recoloured with one lookup. If the raster hasn't
+        been read this comes from the cached factorised raster (see LSDMap_CategoricalRaster).
+
+        Returns:
+            np.array of the unique values (float) and an array of the index of each pixel in it (nan for nodata)
+
+        Author: SMM
+
+        Date: 19/10/2026
+        """
+        if not self.is_loaded and self._base_map is None:
+            categorical_raster = LSDCatRaster.GetCategoricalRaster(self._FullPathRaster)
+            return categorical_raster.categories.astype(np.float64), categorical_raster.get_index_raster()
+
+        valid = ~np.isnan(self._RasterArray)
+        vals, valid_index = np.unique(self._RasterArray[valid], return_inverse=True)
+        category_index = np.full(self._RasterArray.shape, np.nan)
+        category_index[valid] = valid_index.ravel()
+        return vals, category_index
+
 class MapFigure(object):
     """
     This is the main object used for plotting. It contains the underlying axes of the figures.
@@ -254,7 +348,8 @@ class MapFigure(object):
     etc.
     """
     def __init__(self, BaseRasterName, Directory,
-                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1,*args, **kwargs):
+                 coord_type="UTM", colourbar_location = "None", basemap_colourmap = "gray", plot_title = "None", NFF_opti = False,alpha = 1, base_map = None,
+                 use_image_cache = False, *args, **kwargs):
         """
         Initiates the object.
 
@@ -266,6 +361,8 @@ class MapFigure(object):
             basemap_colourmap (string or colormap): The colourmap of the base raster.
             plot_title (string): The title of the plot, if "None" then will not be plotted.
             NFF_opti (bool): If true, use a fast python native file loading. Much faster but not completely tested.
+            base_map (BaseMap): A cached base map from PlottingBaseMap.GetBaseMap. If given, the hillshade, extents and ticks are taken from it rather than recomputed.
+            use_image_cache (bool): If true, the coloured base image is taken from the image cache (see LSDMap_ImageCache) and only rendered the first time. If the cache is off this turns it on with the default directory and size; call LSDMap_ImageCache.EnableImageCache first to choose them.
 
         Author: SMM and DAV
 
@@ -305,6 +402,11 @@ class MapFigure(object):
         self._BaseRasterName = BaseRasterName
         self._BaseRasterFullName = Directory+BaseRasterName
 
+        # The cached base map, if there is one
+        self._base_map = base_map
+        self._use_image_cache = use_image_cache
+        if use_image_cache and not LSDImageCache.ImageCacheEnabled():
+            LSDImageCache.EnableImageCache()
 
         self.FigFileName = self._Directory+"TestFig.png"
         self.FigFormat = "png"
@@ -316,9 +418,9 @@ class MapFigure(object):
         # and properties
         self._RasterList = []
         if basemap_colourmap == "gray":
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha, base_map = base_map))
         else:
-            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha))
+            self._RasterList.append(BaseRaster(BaseRasterName,Directory, NFF_opti = NFF_opti, alpha = alpha, base_map = base_map))
             self._RasterList[-1].set_colourmap(basemap_colourmap)
 
         # The coordinate type. UTM and UTM with tick in km are supported at the moment
@@ -382,7 +484,15 @@ class MapFigure(object):
         Author: SMM
         """
 
-        if self._coord_type == "UTM":
+        # If the extent is the one of the cached base map, we can just use its ticks
+        use_base_map_ticks = False
+        if self._base_map is not None and self._base_map.coord_type == self._coord_type and self._base_map.matches(self._BaseRasterFullName):
+            use_base_map_ticks = None in [self._xmin,self._xmax,self._ymin,self._ymax] or \
+                [self._xmin,self._xmax,self._ymin,self._ymax] == list(self._base_map.extents)
+
+        if use_base_map_ticks:
+            self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = [list(t) for t in self._base_map.ticks]
+        elif self._coord_type == "UTM":
             self.tick_xlocs,self.tick_ylocs,self.tick_x_labels,self.tick_y_labels = LSDP.GetTicksForUTMNoInversion(self._BaseRasterFullName,self._xmax,self._xmin,
                              self._ymax,self._ymin,self._n_target_ticks,self.min_tick_spacing)
         elif self._coord_type == "UTM_km":
@@ -507,8 +617,21 @@ class MapFigure(object):
         # We need to initiate with a figure
         #self.ax = self.fig.add_axes([0.1,0.1,0.7,0.7])
 
-        print("This colourmap is: "+ self._RasterList[0]._colourmap)
-        im = self.ax_list[0].imshow(self._RasterList[0]._RasterArray, self._RasterList[0]._colourmap, extent = self._RasterList[0].extents, interpolation="nearest", alpha = self._RasterList[0]._alpha)
+        print("This colourmap is: "+ str(self._RasterList[0]._colourmap))
+        base_raster = self._RasterList[0]
+        # If the raster hasn't been read (and so can't have been changed) the
+        # coloured pixels come from the image cache, so the raster is only read
+        # and coloured the first time you make a figure with it
+        if self._use_image_cache and not base_raster.is_loaded:
+            base_image, clim = LSDImageCache.GetBaseImage(base_raster.fullpath_to_raster, base_raster.read_raster_array,
+                                                          colourmap = base_raster._colourmap, return_clim = True)
+            self.ax_list[0].imshow(base_image, extent = base_raster.extents, interpolation="nearest", alpha = base_raster._alpha)
+            # The image is RGBA, so a colourbar made from it would map the colours, not
+            # the raster values. Keep a mappable of the values the image was coloured with.
+            im = plt.cm.ScalarMappable(norm = colors.Normalize(vmin = clim[0], vmax = clim[1]), cmap = base_raster._colourmap)
+            im.set_array(np.array([]))
+        else:
+            im = self.ax_list[0].imshow(base_raster._RasterArray, base_raster._colourmap, extent = base_raster.extents, interpolation="nearest", alpha = base_raster._alpha)
 
         # This affects all axes because we set share_all = True.
         #ax.set_xlim(self._xmin,self._xmax)
@@ -590,18 +713,14 @@ class MapFigure(object):
         
         Date: 23/03/2020
         """
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti, base_map = self._base_map)
         
         
-        # Get unique values
-        unique_val = Raster.get_unique()
+        # Get unique values, and the index of the value of each pixel
+        unique_val, category_index = Raster.factorise()
         print("Unique values are:")
         print(unique_val)
         
-        dictOfVal = { i : unique_val[i] for i in range(0, len(unique_val) ) }
-        
-        replace_ints  = list(range(0, len(unique_val) ))
-        
         str_vals = []
         for val in unique_val:
             #x = Decimal(val)
@@ -610,12 +729,10 @@ class MapFigure(object):
             
         dictOfStr = { i : str_vals[i] for i in range(0, len(str_vals) ) }
         
-        print(dictOfVal)
         print(dictOfStr)
-        print(replace_ints)
         
-        # Replace the raster vales with integers
-        Raster.replace_raster_values(unique_val, replace_ints)
+        # Replace the raster vales with integers (the index of each value)
+        Raster._RasterArray = category_index
 
         print("N colours: "+str(len(str_vals)))
         n_colours = len(str_vals)
@@ -729,7 +846,7 @@ class MapFigure(object):
 
         Author: SMM
         """
-        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti)
+        Raster = BaseRaster(RasterName,Directory, NFF_opti = NFF_opti, base_map = self._base_map)
         if modify_raster_values == True:
             Raster.replace_raster_values(old_values, new_values)
 
@@ -818,7 +935,7 @@ class MapFigure(object):
                          label_basins = True, adjust_text = False, rename_dict = {},
                          value_dict = {}, mask_list = [],
                          edgecolour='black', linewidth=1, cbar_dict = {}, colorbartickthinfactor=1, parallel=False,
-                         outlines_only = False,zorder = 1):
+                         outlines_only = False,zorder = 1, adjust_text_method = "original", fill_from_raster = False):
         """
         This is a basin plotting routine. It plots basins as polygons which
         can be coloured and labelled in various ways.
@@ -836,7 +953,8 @@ class MapFigure(object):
             cbar_type (type): Sets the type of the colourbar (if you want int labels, set to int)
             use_keys_not_junctions (bool): If true, the basin keys rather than the junction indices are used to map to the basins. f false the junction indices are used.
             label_basins (bool): If true, add text labels to basins.
-            adjust_text (bool): If true calls the text adjustment routine. Takes a long time!
+            adjust_text (bool): If true calls the text adjustment routine.
+            adjust_text_method (str): "original" (the adjustText routine, the default, slow for lots of basins), "grid" (fast repelling of the labels) or "greedy" (deterministic placement, labels first in the list win)
             rename_dict (dict): a dictionary where the key is the basin to rename (either key or junc, depending on use_keys_not_junctions) and the value is a string of the new name.
             value_dict (dict): the key is the basin (either key or junc, depending on use_keys_not_junctions) and the value is a new value that is used as a colour for the basin.
             mask_list (list of ints): Any basin named in this list (can be either a key or junction index depending on use_keys_not_junctions) is removed from the polgons and not plotted.
@@ -848,6 +966,7 @@ class MapFigure(object):
             colorbartickthinfactor(int): a factor to reduce the number of ticks and labels displayed on the colour bar. Value of 2 would display every 2nd tick.
             parallel (bool): option flag for processing multiple basin raster files triggered by parallel chi mapping tool.
             outlines_only (bool): If true, only plot the outlines.
+            fill_from_raster (bool): If true, the basins are filled by recolouring the basin raster rather than drawing the polygons. This is much faster for lots of basins, the outlines are still polygons. Not used with parallel.
 
         Author: SMM
         """
@@ -860,7 +979,11 @@ class MapFigure(object):
         # Basins referes to a dict where the key is the junction index and the
         # value is a shapely polygon object
         if not parallel:
-          Basins = LSDP.GetBasinOutlines(Directory, RasterName)
+          if self._base_map is not None and self._base_map.BasinsName == RasterName and len(self._base_map.basins) > 0:
+            # Copy the dict since masked basins are deleted from it below
+            Basins = dict(self._base_map.basins)
+          else:
+            Basins = LSDP.GetBasinOutlines(Directory, RasterName)
         else:
           Basins = LSDP.GetMultipleBasinOutlines(Directory)
 
@@ -959,8 +1082,8 @@ class MapFigure(object):
                     texts = self.add_text_annotation_from_shapely_points_v2(Points, text_colour='k', label_dict=new_label_dict,zorder = zorder +1)
 
             if adjust_text == True:
-                print("I am adjusting the text for you. Warning: this takes a long time!")
-                LSDP.adjust_text(texts)
+                print("I am adjusting the text for you.")
+                LSDP.adjust_text(texts, ax=self.ax_list[0], method=adjust_text_method)
                 print("Finished adjusting text.")
 
 
@@ -990,17 +1113,11 @@ class MapFigure(object):
             cNorm  = colors.Normalize(min_value, max_value)
             new_colours = plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
 
-            # now plot the polygons
+            # The colours of all the basins in one go
             print('Plotting the polygons, colouring by basin...')
-            for key, poly in Basins.items():
-                print(key, int(key))
-                colourkey = int(key) % n_colours
-                # We need two patches since we don't want the edges transparent
-                if not outlines_only:
-                    this_patch = PolygonPatch(poly, fc=new_colours.to_rgba(colourkey), ec="none", alpha=alpha,zorder = zorder)
-                    self.ax_list[0].add_patch(this_patch)
-                this_patch = PolygonPatch(poly, fc="none", ec=edgecolour, alpha=1,zorder = zorder)
-                self.ax_list[0].add_patch(this_patch)
+            basin_juncs = list(Basins.keys())
+            colourkeys = np.array([int(key) for key in basin_juncs], dtype=np.int64) % n_colours
+            face_colours = new_colours.to_rgba(colourkeys)
         else:
             if discrete_cmap:
                 this_cmap = self.cmap_discretize(this_cmap, n_colours)
@@ -1022,37 +1139,46 @@ class MapFigure(object):
             # we need a grayed out value for basins that don't have a value
             gray_colour = "#a9a9a9"
 
-            # now plot the polygons
-            print(Basins)
-            print(junction_to_key_dict)
+            # The value of each basin. If we are using keys, we need to get the key
+            # referred to by each junction. Basins without a value are grayed out.
             print('Plotting the polygons, colouring by value...')
-            for junc, poly in Basins.items():
-
-                # If we are using keys, we need to check to see if the key referred to by
-                # this junction is in the value dict
-                if not outlines_only:
-                    if use_keys_not_junctions:
-                        print(junc)
-                        this_key = junction_to_key_dict[int(junc)]
-                        #print ("This key is: "+str(this_key)+", and this value is: "+str(value_dict[this_key]))
-                        if this_key in value_dict:
-                            this_patch = PolygonPatch(poly, fc=new_colours.to_rgba( value_dict[this_key] ), ec="none", alpha=alpha, zorder = zorder)
-                            self.ax_list[0].add_patch(this_patch)
-                        else:
-                            this_patch = PolygonPatch(poly, fc=gray_colour, ec="none", alpha=alpha, zorder = zorder)
-                            self.ax_list[0].add_patch(this_patch)
-                    else:
-                        # We are using junction indices so these link directly in to the polygon keys
-                        if junc in value_dict:
-                            this_patch = PolygonPatch(poly, fc=new_colours.to_rgba( value_dict[junc] ), ec="none", alpha=alpha, zorder = zorder)
-                            self.ax_list[0].add_patch(this_patch)
-                        else:
-                            this_patch = PolygonPatch(poly, fc=gray_colour, ec="none", alpha=alpha, zorder = zorder)
-                            self.ax_list[0].add_patch(this_patch)
-
-                # We need to add the outline seperately because we don't want it to be transparent
-                this_patch = PolygonPatch(poly, fc="none", ec=edgecolour, alpha=1, zorder = zorder)
-                self.ax_list[0].add_patch(this_patch)
+            basin_juncs = list(Basins.keys())
+            if use_keys_not_junctions:
+                value_keys = [junction_to_key_dict[int(junc)] for junc in basin_juncs]
+            else:
+                # We are using junction indices so these link directly in to the polygon keys
+                value_keys = basin_juncs
+            has_value = np.array([key in value_dict for key in value_keys], dtype=bool)
+            basin_values = np.array([value_dict[key] if key in value_dict else np.nan for key in value_keys], dtype=np.float64)
+
+            # The colours of all the basins in one go
+            face_colours = new_colours.to_rgba(basin_values)
+            if len(basin_juncs) > 0:
+                face_colours[~has_value] = colors.to_rgba(gray_colour)
+
+        # now plot the polygons. We need two collections since we don't want the edges transparent
+        basin_polys = [Basins[junc] for junc in basin_juncs]
+        if not outlines_only and fill_from_raster and not parallel:
+            # Give each category (junction) of the factorised basin raster the colour of
+            # its basin, so the fill is one lookup over the pixels. Masked basins and
+            # pixels that aren't in a basin are transparent.
+            print('Filling the basins from the basin raster...')
+            categorical_raster = LSDCatRaster.GetCategoricalRaster(Directory+RasterName)
+            colour_lut = np.zeros((categorical_raster.n_categories, 4))
+            if len(basin_juncs) > 0:
+                positions = categorical_raster.get_category_positions(np.asarray(basin_juncs, dtype=np.float64))
+                found = positions >= 0
+                colour_lut[positions[found]] = np.asarray(face_colours)[found]
+            self.ax_list[0].imshow(categorical_raster.colour(colour_lut), extent = self._RasterList[0].extents,
+                                   interpolation="nearest", alpha = alpha, zorder = zorder)
+        elif not outlines_only and len(basin_polys) > 0:
+            fill_collection = PatchCollection([PolygonPatch(poly) for poly in basin_polys], facecolors=face_colours,
+                                              edgecolors="none", alpha=alpha, zorder = zorder)
+            self.ax_list[0].add_collection(fill_collection)
+        if len(basin_polys) > 0:
+            outline_collection = PatchCollection([PolygonPatch(poly) for poly in basin_polys], facecolors="none",
+                                                 edgecolors=edgecolour, alpha=1, zorder = zorder)
+            self.ax_list[0].add_collection(outline_collection)
 
 
 
@@ -1334,7 +1460,9 @@ class MapFigure(object):
                        colour_log = False, colour_manual_scale = [],
                        manual_size = 0.5, alpha = 1, minimum_log_scale_cut_off = -10, label_field = "None",
                        font_size = 6, offset = 100, zorder=1, marker = "o", black_contours = False, discrete_colours = False, NColours = 10,scale_in_absolute = False, color_abs =False, unicolor = "blue",
-                       recast_scale_min_max = [], scale_in_abs_after_recasting = False, legend=False, label=""):
+                       recast_scale_min_max = [], scale_in_abs_after_recasting = False, legend=False, label="",
+                       decimate_points = False, decimate_fig_width_inches = 4, decimate_dpi = 300,
+                       colour_aggregation = "representative", rasterized = False):
 
         """
         This add point data to the map.
@@ -1369,6 +1497,11 @@ class MapFigure(object):
             color_abs: get the absolute data for scale
             recast_scale_min_max: recast the min and max of the array before scaling
             scale_in_abs_after_recasting: give the abolute value of scaling after recasting the data
+            decimate_points (bool): If true, the points are thinned to one per pixel of the saved figure. In each pixel the point with the biggest size is kept.
+            decimate_fig_width_inches (float): The width of the figure you will save, used to get the pixel size for decimate_points
+            decimate_dpi (int): The dpi of the figure you will save, used to get the pixel size for decimate_points
+            colour_aggregation (str): With decimate_points, how the colour of each pixel is set: "representative" (the kept point), "mean", "max" or "min"
+            rasterized (bool): If true the points are drawn as an image in vector formats (pdf, svg), which keeps the file size down
 
         Author: SMM, BG
         """
@@ -1383,14 +1516,22 @@ class MapFigure(object):
 
 
         # convert to easting and northing or pull easting northing from file
-        # I had an old file that didnt report lat/long so pull directly if lat/lon not found
-        # MDH 1/3/18
-        try:
-            [easting,northing] = thisPointData.GetUTMEastingNorthing(EPSG_string)
-        except:
-            # check to see if easting and northing data already exists
-            easting = thisPointData.QueryData("easting").as_matrix().astype(float)
-            northing = thisPointData.QueryData("northing").as_matrix().astype(float)
+        # The point data keeps these in its spatial index so they are only
+        # computed once, however many times the points are plotted
+        this_index = None
+        if hasattr(thisPointData, "GetSpatialIndex"):
+            this_index = thisPointData.GetSpatialIndex(EPSG_string)
+            easting = this_index.x
+            northing = this_index.y
+        else:
+            # I had an old file that didnt report lat/long so pull directly if lat/lon not found
+            # MDH 1/3/18
+            try:
+                [easting,northing] = thisPointData.GetUTMEastingNorthing(EPSG_string)
+            except:
+                # check to see if easting and northing data already exists
+                easting = thisPointData.QueryData("easting").as_matrix().astype(float)
+                northing = thisPointData.QueryData("northing").as_matrix().astype(float)
 
         print("I got the easting and northing")
 
@@ -1472,13 +1613,63 @@ class MapFigure(object):
 
 
 
+        # Only plot the points that are on the map. The spatial index gets them
+        # without scanning all the points. If you want, the points are then
+        # thinned to one per pixel of the saved figure. The colour scale is still
+        # set from all of the points so it doesn't depend on what is plotted.
+        easting = np.asarray(easting)
+        northing = np.asarray(northing)
+        have_colour_data = len(this_data) != 0 and len(this_data) == len(easting)
+        if have_colour_data:
+            this_data = np.asarray(this_data)
+        scale_is_array = isinstance(point_scale, np.ndarray) and len(point_scale) == len(easting)
+        plot_index = np.arange(len(easting))
+        colour_vmin = None
+        colour_vmax = None
+        if this_index is not None and len(easting) > 0:
+            x_margin = 0.01*abs(this_xlim[1]-this_xlim[0])
+            y_margin = 0.01*abs(this_ylim[1]-this_ylim[0])
+            plot_index = this_index.query_bbox(min(this_xlim)-x_margin, max(this_xlim)+x_margin,
+                                               min(this_ylim)-y_margin, max(this_ylim)+y_margin)
+            if len(plot_index) < len(easting):
+                print("Only "+str(len(plot_index))+" of your "+str(len(easting))+" points are on the map, I will only plot those.")
+
+        decimated_colour_data = None
+        if decimate_points and len(plot_index) > 0:
+            pixel_size = abs(this_xlim[1]-this_xlim[0])/(decimate_fig_width_inches*decimate_dpi)
+            print("I am thinning the points to one per pixel, the pixels are "+str(pixel_size)+" map units wide")
+            if discrete_colours:
+                # averaging categories doesn't make sense
+                colour_aggregation = "representative"
+            keep_index, decimated_colour_data = phelp.DecimatePointsToPixels(easting[plot_index], northing[plot_index], pixel_size,
+                                                                          priority_data = point_scale[plot_index] if scale_is_array else [],
+                                                                          colour_data = this_data[plot_index] if have_colour_data else [],
+                                                                          colour_aggregation = colour_aggregation)
+            plot_index = plot_index[keep_index]
+
+        if len(plot_index) < len(easting):
+            if have_colour_data:
+                if np.issubdtype(this_data.dtype, np.number):
+                    finite_data = this_data[np.isfinite(this_data)]
+                    if len(finite_data) > 0:
+                        colour_vmin = np.min(finite_data)
+                        colour_vmax = np.max(finite_data)
+                if decimated_colour_data is not None:
+                    this_data = decimated_colour_data
+                else:
+                    this_data = this_data[plot_index]
+            if scale_is_array:
+                point_scale = point_scale[plot_index]
+            easting = easting[plot_index]
+            northing = northing[plot_index]
+
         print("I will plot the points now.")
-        if len(this_data) == 0 or len(this_data) != len(easting):
+        if not have_colour_data:
             print("I am only plotting the points.")
             unicolor = unicolor
-            sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c= unicolor,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+            sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c= unicolor,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
             if(black_contours):
-                self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker)
+                self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
 
         else:
             print("I will colour by the points")
@@ -1491,10 +1682,10 @@ class MapFigure(object):
                     #scalarMap.set_array(tps_color)
                     #this_colourmap = scalarMap
                     #sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=tps_color,cmap=this_colourmap,edgecolors='none', alpha = alpha)
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,norm=cNorm,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,norm=cNorm,edgecolors='none', alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
                     if(black_contours):
 
-                        self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3,edgecolors='k',facecolor = "none",norm=cNorm, alpha = alpha,zorder=zorder, marker = marker)
+                        self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3,edgecolors='k',facecolor = "none",norm=cNorm, alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
 
                 else:
                     print("Your colour_log_manual_scale should be something like [min,max], aborting")
@@ -1510,24 +1701,25 @@ class MapFigure(object):
                     plt.cm.ScalarMappable(norm=cNorm, cmap=this_colourmap)
                     channel_data = [x % NUM_COLORS for x in this_data]
 
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=channel_data,cmap=this_colourmap, norm=cNorm, alpha = alpha,zorder=zorder)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=channel_data,cmap=this_colourmap, norm=cNorm, alpha = alpha,zorder=zorder, rasterized = rasterized)
                     if(black_contours):
-                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors = "k", facecolor = "none", norm=cNorm, alpha = alpha,zorder=zorder)
+                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors = "k", facecolor = "none", norm=cNorm, alpha = alpha,zorder=zorder, rasterized = rasterized)
 
                 else:
-                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,edgecolors='none', alpha = alpha,zorder=zorder, marker = marker)
+                    sc = self.ax_list[0].scatter(easting,northing,s=point_scale, c=this_data,cmap=this_colourmap,vmin=colour_vmin,vmax=colour_vmax,edgecolors='none', alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
                     if(black_contours):
-                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, marker = marker)
+                        sc = self.ax_list[0].scatter(easting,northing,s=point_scale,lw = 0.3, edgecolors='k',facecolor = "none", alpha = alpha,zorder=zorder, rasterized = rasterized, marker = marker)
 
 
         # Setting the labelling
         if(label_field != "None"):
             # print("labelling from this tool is not available yet, Boris is working on it")
-            tg = thisPointData.QueryData(label_field)
+            tg = list(thisPointData.QueryData(label_field))
             print(tg)
             for i in range(len(easting)):
-                print(str(tg[i]))
-                sc =self.ax_list[0].text(easting[i]-offset,northing[i]-offset,str(tg[i]),fontsize = font_size)
+                this_label = tg[plot_index[i]]
+                print(str(this_label))
+                sc =self.ax_list[0].text(easting[i]-offset,northing[i]-offset,str(this_label),fontsize = font_size)
 
         # Annoying but the scatter plot resets the extents so you need to reassert them
         self.ax_list[0].set_xlim(this_xlim)
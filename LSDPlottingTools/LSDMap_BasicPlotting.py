@@ -13,8 +13,10 @@ from .adjust_text import adjust_text
 import LSDPlottingTools.LSDMap_GDALIO as LSDMap_IO
 import LSDPlottingTools.LSDMap_BasicManipulation as LSDMap_BM
 import LSDPlottingTools.LSDMap_OSystemTools as LSDOst
+import LSDPlottingTools.LSDMap_ImageCache as LSDImageCache
 from scipy import signal
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
 from LSDPlottingTools import colours
 
 
@@ -779,7 +781,15 @@ def DrapedOverHillshade(FileName, DrapeName, thiscmap='gray',drape_cmap='gray',
     rcParams['font.sans-serif'] = ['Liberation Sans']
     rcParams['font.size'] = label_size
 
-    hillshade = Hillshade(FileName)
+    # The coloured hillshade comes from the image cache if it is on (see
+    # LSDMap_ImageCache), so it is only computed the first time. (0,0) colour limits go from 0 to the maximum of the hillshade.
+    if (clim_val == (0,0)):
+        hillshade_clim = (0, None)
+    else:
+        hillshade_clim = (clim_val[0], clim_val[1])
+    print("Setting colour limits to "+str(clim_val[0])+" and "+str(clim_val[1]))
+    hillshade_image, hillshade_clim = LSDImageCache.GetHillshadeImage(FileName, colourmap = thiscmap,
+                                                                      clim = hillshade_clim, return_clim = True)
 
     # DAV - option to supply array directly (after masking for example, rather
     # than reading directly from a file. Should not break anyone's code)
@@ -828,21 +838,15 @@ def DrapedOverHillshade(FileName, DrapeName, thiscmap='gray',drape_cmap='gray',
     n_target_tics = 5
     xlocs,ylocs,new_x_labels,new_y_labels = GetTicksForUTM(FileName,x_max,x_min,y_max,y_min,n_target_tics)
 
-    im = grid[0].imshow(hillshade[::-1], thiscmap, extent = extent_raster, interpolation="nearest")
+    im = grid[0].imshow(hillshade_image[::-1], extent = extent_raster, interpolation="nearest")
     #im = grid[0].imshow(raster, thiscmap, interpolation="nearest")
     if ShowColorbar:
-        cbar = grid.cbar_axes[0].colorbar(im)
+        # the image is already coloured, so the colourbar needs its own mappable
+        hillshade_mappable = plt.cm.ScalarMappable(norm = mcolors.Normalize(vmin = hillshade_clim[0], vmax = hillshade_clim[1]),
+                                                   cmap = plt.get_cmap(thiscmap))
+        cbar = grid.cbar_axes[0].colorbar(hillshade_mappable)
         cbar.set_label_text(colorbarlabel)
 
-    # set the colour limits
-    print("Setting colour limits to "+str(clim_val[0])+" and "+str(clim_val[1]))
-    if (clim_val == (0,0)):
-        print("I don't think I should be here")
-        im.set_clim(0, np.nanmax(hillshade))
-    else:
-        print("Now setting colour limits to "+str(clim_val[0])+" and "+str(clim_val[1]))
-        im.set_clim(clim_val[0],clim_val[1])
-
     # Now for the drape: it is in grayscape
     im2 = grid[0].imshow(raster_drape[::-1], drape_cmap, extent = extent_raster, alpha = drape_alpha, interpolation="none")
 
@@ -911,7 +915,14 @@ def DrapedOverHillshade_Categories(FileName, DrapeName, nCategories,
     rcParams['font.sans-serif'] = ['Liberation Sans']
     rcParams['font.size'] = label_size
 
-    hillshade = Hillshade(FileName)
+    # The coloured hillshade comes from the image cache if it is on (see
+    # LSDMap_ImageCache), so it is only computed the first time. (0,0) colour limits go from 0 to the maximum of the hillshade.
+    if (clim_val == (0, 0)):
+        hillshade_clim = (0, None)
+    else:
+        hillshade_clim = (clim_val[0], clim_val[1])
+    hillshade_image = LSDImageCache.GetHillshadeImage(FileName, colourmap=thiscmap,
+                                                      clim=hillshade_clim)
 
     # DAV - option to supply array directly (after masking for example, rather
     # than reading directly from a file. Should not break anyone's code)
@@ -965,15 +976,9 @@ def DrapedOverHillshade_Categories(FileName, DrapeName, nCategories,
                                                               y_min,
                                                               n_target_tics)
 
-    im = grid[0].imshow(hillshade[::-1], thiscmap, extent=extent_raster,
+    im = grid[0].imshow(hillshade_image[::-1], extent=extent_raster,
                         interpolation="nearest")
 
-    # set the colour limits
-    if (clim_val == (0, 0)):
-        im.set_clim(0, np.nanmax(hillshade))
-    else:
-        im.set_clim(clim_val[0], clim_val[1])
-
     # Now for the drape: it is in grayscape
     im2 = grid[0].imshow(raster_drape[::-1], drape_cmap, extent=extent_raster,
                          alpha=drape_alpha, interpolation="none")
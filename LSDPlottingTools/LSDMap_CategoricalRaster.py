@@ -0,0 +1,229 @@
+## LSDMap_CategoricalRaster.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## Tools for rasters of categories, like the basin rasters (where the value
+## is the junction of the basin) or lithology rasters.
+##
+## The raster is factorised once: we find the categories in it and, for every
+## pixel, the index of its category. After that, giving the categories new
+## values (e.g. the m/n or ksn of each basin) or colours is one lookup table
+## gather over the pixels, however many categories there are. The factorised
+## rasters are cached for the python session (and updated if the file
+## changes), so you can recolour the same basin raster by lots of different
+## things without reading it again.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## SMM
+## 19/10/2026
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import numpy as np
+import LSDPlottingTools.LSDMap_GDALIO as LSDMap_IO
+import LSDPlottingTools.LSDMap_OSystemTools as LSDOst
+
+# The factorised rasters of this python session.
+# The key is the raster name (with the full path), the value is a tuple of
+# the fingerprint of the raster files and the CategoricalRaster object
+_CATEGORICAL_RASTERS = {}
+
+#==============================================================================
+def FactoriseArray(data_array, NoDataValue = None):
+    """This finds the categories in an array and the category index of every
+    element. Integer arrays with a compact range of values are done with a
+    lookup table (no sorting), everything else with np.unique.
+
+    Args:
+        data_array (np.array): The array, in its own data type
+        NoDataValue (float): Elements with this value (and nan) don't get a category
+
+    Returns:
+        np.array: the sorted categories
+        np.array: the index of the category of each element (int32, same shape as the data), -1 for nodata
+
+    Author: SMM
+    """
+    data_array = np.asarray(data_array)
+    valid = np.ones(data_array.shape, dtype=bool)
+    if NoDataValue is not None:
+        valid &= data_array != NoDataValue
+    if data_array.dtype.kind == "f":
+        valid &= ~np.isnan(data_array)
+
+    valid_values = data_array[valid]
+    inverse = np.full(data_array.shape, -1, dtype=np.int32)
+    if valid_values.size == 0:
+        return valid_values, inverse
+
+    if data_array.dtype.kind in "iub":
+        min_value = int(valid_values.min())
+        value_range = int(valid_values.max())-min_value+1
+    else:
+        value_range = None
+
+    if value_range is not None and value_range <= max(2*valid_values.size, 65536):
+        # a lookup table from the value to the category index
+        offsets = (valid_values.astype(np.int64)-min_value)
+        present = np.bincount(offsets, minlength=value_range) > 0
+        category_lut = np.cumsum(present, dtype=np.int64)-1
+        categories = (np.flatnonzero(present)+min_value).astype(data_array.dtype)
+        inverse[valid] = category_lut[offsets]
+    else:
+        categories, valid_inverse = np.unique(valid_values, return_inverse=True)
+        inverse[valid] = valid_inverse.ravel()
+
+    return categories, inverse
+
+#==============================================================================
+class CategoricalRaster(object):
+    """
+    A raster of categories, factorised so it can be given new values or
+    colours quickly.
+
+    Args:
+        FullPathRaster (str): The raster name with path and extension
+
+    Author: SMM
+    """
+    def __init__(self, FullPathRaster):
+        self._FullPathRaster = FullPathRaster
+        data_array, self.NoDataValue = LSDMap_IO.ReadRasterArrayNative(FullPathRaster)
+        self.categories, self.inverse = FactoriseArray(data_array, self.NoDataValue)
+        self.shape = self.inverse.shape
+        print("The raster "+FullPathRaster+" has "+str(len(self.categories))+" categories.")
+
+    @property
+    def n_categories(self):
+        return len(self.categories)
+
+    def get_category_positions(self, values):
+        """
+        Gets the index of the category of each value.
+
+        Args:
+            values (list or array): the values
+
+        Returns:
+            np.array with the category index of each value, -1 if it isn't a category
+
+        Author: SMM
+        """
+        values = np.asarray(values)
+        positions = np.searchsorted(self.categories, values)
+        positions = np.minimum(positions, max(len(self.categories)-1, 0))
+        if len(self.categories) == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+        found = self.categories[positions] == values
+        return np.where(found, positions, -1)
+
+    def gather(self, category_lut, nodata_value = np.nan):
+        """
+        Makes a raster from a value for each category. This is the only bit that
+        goes over all the pixels.
+
+        Args:
+            category_lut (np.array): The value of each category (the same length as categories). Can also be (n_categories, 4) for colours.
+            nodata_value: The value of the nodata pixels
+
+        Returns:
+            The raster
+
+        Author: SMM
+        """
+        category_lut = np.asarray(category_lut)
+        # the nodata pixels have index -1, so they get the last row
+        nodata_row = np.full((1,)+category_lut.shape[1:], nodata_value, dtype=category_lut.dtype)
+        return np.concatenate([category_lut, nodata_row])[self.inverse]
+
+    def map_values(self, value_dict, default = np.nan):
+        """
+        Makes a raster where each category has a new value, e.g. the basin junctions
+        are replaced by the m/n of the basins.
+
+        Args:
+            value_dict (dict): The key is the category, the value is its new value
+            default: The value of categories that aren't in the dict
+
+        Returns:
+            A float raster, nan for the nodata
+
+        Author: SMM
+        """
+        category_lut = np.full(len(self.categories), default, dtype=np.float64)
+        if len(value_dict) > 0:
+            positions = self.get_category_positions(list(value_dict.keys()))
+            new_values = np.asarray(list(value_dict.values()), dtype=np.float64)
+            found = positions >= 0
+            category_lut[positions[found]] = new_values[found]
+        return self.gather(category_lut)
+
+    def replace_values(self, old_values, new_values):
+        """
+        Makes a raster where some of the categories are replaced by new values
+        and the others keep their value (like BaseRaster.replace_raster_values).
+        If a value is in old_values more than once the first one is used.
+
+        Args:
+            old_values (list): The categories to replace
+            new_values (list): The new values, the same length as old_values
+
+        Returns:
+            A float raster, nan for the nodata
+
+        Author: SMM
+        """
+        category_lut = self.categories.astype(np.float64)
+        positions = self.get_category_positions(old_values)
+        new_values = np.asarray(new_values, dtype=np.float64)
+        # return_index gives the first of any repeated values
+        replaced, first_index = np.unique(positions, return_index=True)
+        found = replaced >= 0
+        category_lut[replaced[found]] = new_values[first_index[found]]
+        return self.gather(category_lut)
+
+    def get_index_raster(self):
+        """
+        Makes a raster of the category index of each pixel (0 to n_categories-1), nan for nodata.
+
+        Author: SMM
+        """
+        return self.gather(np.arange(len(self.categories), dtype=np.float64))
+
+    def colour(self, colour_lut, nodata_colour = (0, 0, 0, 0)):
+        """
+        Makes an RGBA image from a colour for each category.
+
+        Args:
+            colour_lut (np.array): (n_categories, 4) RGBA colours, floats from 0 to 1
+            nodata_colour (tuple): The RGBA colour of the nodata
+
+        Returns:
+            (rows, cols, 4) RGBA image
+
+        Author: SMM
+        """
+        colour_lut = np.vstack([np.asarray(colour_lut, dtype=np.float64), nodata_colour])
+        return colour_lut[self.inverse]
+
+#==============================================================================
+def GetCategoricalRaster(FullPathRaster):
+    """This gets the factorised version of a raster. It is only factorised
+    the first time, after that you get the same object back until the raster changes.
+
+    Args:
+        FullPathRaster (str): The raster name with path and extension
+
+    Returns:
+        A CategoricalRaster object
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    cache_key = os.path.abspath(FullPathRaster)
+    fingerprint = LSDOst.GetFileFingerprint([FullPathRaster, os.path.splitext(FullPathRaster)[0]+".hdr"])
+    if cache_key in _CATEGORICAL_RASTERS and _CATEGORICAL_RASTERS[cache_key][0] == fingerprint:
+        return _CATEGORICAL_RASTERS[cache_key][1]
+
+    categorical_raster = CategoricalRaster(FullPathRaster)
+    _CATEGORICAL_RASTERS[cache_key] = (fingerprint, categorical_raster)
+    return categorical_raster
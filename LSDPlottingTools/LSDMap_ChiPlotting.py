@@ -24,6 +24,7 @@ import LSDPlottingTools.LSDMap_BasicManipulation as LSDMap_BM
 import LSDPlottingTools.statsutilities as LSDStats
 from LSDMapFigure.PlottingRaster import MapFigure
 from LSDMapFigure.PlottingRaster import BaseRaster
+from LSDMapFigure.PlottingBaseMap import GetBaseMap
 from LSDMapFigure import PlottingHelpers as Helper
 from LSDPlottingTools import colours as lsdcolours
 from LSDPlottingTools import statsutilities as SUT
@@ -274,7 +275,7 @@ def BasicChiPlotGridPlotKirby(FileName, DrapeName, chi_csv_fname, thiscmap='gray
     EPSG_string = LSDMap_IO.GetUTMEPSG(FileName)
     print("EPSG string is: " + EPSG_string)
 
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
     thisPointData.ThinData('elevation',elevation_threshold)
 
     # convert to easting and northing
@@ -773,7 +774,7 @@ def BasicChannelPlotGridPlotCategories(FileName, DrapeName, chi_csv_fname, thisc
     EPSG_string = LSDMap_IO.GetUTMEPSG(FileName)
     print("EPSG string is: " + EPSG_string)
 
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
     thisPointData.ThinData('elevation',elevation_threshold)
 
     # Logic for thinning the sources
@@ -938,7 +939,7 @@ def BasicChannelPlotByBasin(FileName, DrapeName, chi_csv_fname, thiscmap='gray',
     EPSG_string = LSDMap_IO.GetUTMEPSG(FileName)
     print("EPSG string is: " + EPSG_string)
 
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
 
     # mask for the basin
     thisPointData.ThinDataSelection("basin_key",basin_key)
@@ -1048,7 +1049,7 @@ def ChiProfiles(chi_csv_fname, FigFileName = 'Image.pdf',FigFormat = 'show',
     gs = plt.GridSpec(100,100,bottom=0.25,left=0.1,right=1.0,top=1.0)
     ax = fig.add_subplot(gs[25:100,10:95])
 
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
     thisPointData.ThinData('elevation',elevation_threshold)
 
     # Logic for thinning the sources
@@ -1296,7 +1297,7 @@ def StackedChiProfiles(chi_csv_fname, FigFileName = 'Image.pdf',
     gs = plt.GridSpec(100,100,bottom=0.25,left=0.1,right=1.0,top=1.0)
     ax = fig.add_subplot(gs[25:100,10:95])
 
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
     thisPointData.ThinData('elevation',elevation_threshold)
     thisPointData.ThinData('chi',0)
 
@@ -1568,7 +1569,7 @@ def StackedProfilesGradient(chi_csv_fname, FigFileName = 'Image.pdf',
     ax = fig.add_subplot(gs[25:100,10:95])
 
     print("Getting data from the file: "+chi_csv_fname)
-    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname)
+    thisPointData = LSDMap_PD.LSDMap_PointData(chi_csv_fname, compact_dtypes = True)
 
     print("I am going to thin your data to elevation and chi thresholds for you.")
     thisPointData.GetLongitude(PrintToScreen = True)
@@ -2050,18 +2051,17 @@ def map_Mchi_standard(DataDirectory, fname_prefix, size_format='ESURF', FigForma
     BasinsName = fname_prefix+'_AllBasins'+raster_ext
 
 
-    # create the map figure
-    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", alpha = alpha_background)
+    # create the map figure. The hillshade and basins come from the cached base map
+    BM = GetBaseMap(DataDirectory, fname_prefix, coord_type="UTM_km", raster_ext = raster_ext)
+    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", alpha = alpha_background, base_map = BM)
     if bkbg:
         MF.add_drape_image(HillshadeName,DataDirectory,colourmap = "gray",colour_min_max = [10000,10001],modify_raster_values=False,old_values=[], new_values=[],NFF_opti = True, alpha =alpha_background)
         # plot the basin outlines
-        Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
-        MF.plot_polygon_outlines(Basins, linewidth=0.5, colour = "white")
+        MF.plot_polygon_outlines(BM.basins, linewidth=0.5, colour = "white")
     else:
         # plot the basin outlines
         MF.add_drape_image(HillshadeName,DataDirectory,colourmap = "gray",colour_min_max = [10,240],modify_raster_values=False,old_values=[], new_values=[],NFF_opti = True, alpha =1)
-        Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
-        MF.plot_polygon_outlines(Basins, linewidth=0.5)
+        MF.plot_polygon_outlines(BM.basins, linewidth=0.5)
 
     # add the channel network without color
     if (knickpoint):
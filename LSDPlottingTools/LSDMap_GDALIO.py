@@ -16,6 +16,8 @@ from osgeo import ogr
 import os
 from os.path import exists
 from osgeo.gdalconst import GA_ReadOnly
+from multiprocessing.pool import ThreadPool
+from . import LSDMap_OSystemTools as LSDOst
 
 #==============================================================================
 def getNoDataValue(rasterfn):
@@ -226,6 +228,41 @@ def GetRasterExtent(FileName):
     return extent
 
 #==============================================================================
+
+#==============================================================================
+# This gets the row and column of the raster cell under each point
+def GetRowColFromEastingNorthing(FileName, easting, northing):
+    """This gets the row and column of the raster cell that contains each point.
+    It works on whole arrays of points at once using the geotransform, so there
+    is no need to search the raster.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        easting (array): the x coordinates of the points, in the raster's coordinate system
+        northing (array): the y coordinates of the points, in the raster's coordinate system
+
+    Return:
+        rows (np.array, int): the row of each point
+        cols (np.array, int): the column of each point
+        inside (np.array, bool): True where the point is within the raster. Rows and columns of points outside are clipped to the edge of the raster.
+
+    Author: SMM
+    """
+    NDV, xsize, ysize, GeoT, Projection, DataType = GetGeoInfo(FileName)
+
+    easting = np.asarray(easting, dtype=np.float64)
+    northing = np.asarray(northing, dtype=np.float64)
+
+    # GeoT[5] is negative for north up rasters
+    cols = np.floor((easting-GeoT[0])/GeoT[1]).astype(np.int64)
+    rows = np.floor((northing-GeoT[3])/GeoT[5]).astype(np.int64)
+
+    inside = (cols >= 0) & (cols < xsize) & (rows >= 0) & (rows < ysize)
+    np.clip(cols, 0, xsize-1, out=cols)
+    np.clip(rows, 0, ysize-1, out=rows)
+
+    return rows, cols, inside
+#==============================================================================
 # Function to read the original file's projection:
 def GetGeoInfo(FileName):
     """This gets information from the raster file using gdal
@@ -453,6 +490,189 @@ def CheckNoData(FileName):
 #==============================================================================
 
 
+#==============================================================================
+# These sample rasters at a load of points at once
+#==============================================================================
+def _InterpolateAtPixels(GetPixelValues, GeoT, xsize, ysize, easting, northing, method = "nearest"):
+    """This does the work for SampleRasterAtPoints and SampleArrayAtPoints.
+    The pixel indices of all the points are computed in one go and the values
+    come from GetPixelValues(rows, cols), so this doesn't care if the data is
+    in memory or still in the file.
+
+    Args:
+        GetPixelValues (function): takes arrays of rows and columns and returns the (float) values there, nodata as nan
+        GeoT (tuple): the geotransform of the raster
+        xsize (int): the number of columns
+        ysize (int): the number of rows
+        easting (array): the x coordinates of the points
+        northing (array): the y coordinates of the points
+        method (str): "nearest" or "bilinear"
+
+    Return:
+        np.array: the values at the points. Points off the raster get nan.
+
+    Author: SMM
+    """
+    easting = np.asarray(easting, dtype=np.float64)
+    northing = np.asarray(northing, dtype=np.float64)
+    values = np.full(easting.shape, np.nan)
+
+    # the position of the points in pixel units
+    pixel_x = (easting-GeoT[0])/GeoT[1]
+    pixel_y = (northing-GeoT[3])/GeoT[5]
+    inside = (pixel_x >= 0) & (pixel_x < xsize) & (pixel_y >= 0) & (pixel_y < ysize)
+    if not np.any(inside):
+        return values
+    pixel_x = pixel_x[inside]
+    pixel_y = pixel_y[inside]
+
+    if method == "nearest":
+        values[inside] = GetPixelValues(pixel_y.astype(np.int64), pixel_x.astype(np.int64))
+    elif method == "bilinear":
+        # pixel centres are at i+0.5. Near the edge we just use the edge pixels.
+        x = np.clip(pixel_x-0.5, 0, xsize-1)
+        y = np.clip(pixel_y-0.5, 0, ysize-1)
+        col0 = np.floor(x).astype(np.int64)
+        row0 = np.floor(y).astype(np.int64)
+        col1 = np.minimum(col0+1, xsize-1)
+        row1 = np.minimum(row0+1, ysize-1)
+        fx = x-col0
+        fy = y-row0
+
+        # get all four corners in one call so each block is only read once
+        n = len(x)
+        corners = GetPixelValues(np.concatenate([row0,row0,row1,row1]), np.concatenate([col0,col1,col0,col1]))
+        corners = corners.reshape(4,n)
+        weights = np.vstack([(1-fx)*(1-fy), fx*(1-fy), (1-fx)*fy, fx*fy])
+
+        # nodata corners are left out and the other weights scaled up
+        valid = np.isfinite(corners)
+        weights[~valid] = 0
+        corners[~valid] = 0
+        weight_sum = weights.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[inside] = np.where(weight_sum > 0, (weights*corners).sum(axis=0)/weight_sum, np.nan)
+    else:
+        raise Exception("The sampling method needs to be nearest or bilinear, you gave me: "+str(method))
+
+    return values
+#==============================================================================
+
+#==============================================================================
+def SampleRasterAtPoints(FileName, easting, northing, method = "nearest", raster_band = 1):
+    """This gets the raster values at a set of points. Only the blocks of the
+    raster that have points in them are read, so you don't need to load the
+    whole raster to sample a few channels.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        easting (array): the x coordinates of the points, in the raster's coordinate system
+        northing (array): the y coordinates of the points, in the raster's coordinate system
+        method (str): "nearest" (the value of the pixel under the point) or "bilinear"
+        raster_band (int): the band of the raster
+
+    Return:
+        np.array: the values at the points. Points off the raster or on nodata get nan.
+
+    Author: SMM
+    """
+    if exists(FileName) is False:
+            raise Exception('[Errno 2] No such file or directory: \'' + FileName + '\'')
+
+    dataset = gdal.Open(FileName, GA_ReadOnly)
+    if dataset == None:
+        raise Exception("Unable to read the data file")
+
+    band = dataset.GetRasterBand(raster_band)
+    NoDataValue = band.GetNoDataValue()
+    xsize = band.XSize
+    ysize = band.YSize
+    GeoT = dataset.GetGeoTransform()
+
+    # Blocks of ENVI files are single rows, so we read chunks of rows
+    block_sizes = band.GetBlockSize()
+    block_cols = xsize if block_sizes[0] >= xsize else max(block_sizes[0], 256)
+    block_rows = max(block_sizes[1], 256)
+    n_block_cols = (xsize+block_cols-1)//block_cols
+
+    def GetPixelValues(rows, cols):
+        values = np.empty(len(rows))
+        block_id = (rows//block_rows)*n_block_cols+cols//block_cols
+        order = np.argsort(block_id, kind="stable")
+        block_id = block_id[order]
+        unique_blocks, starts = np.unique(block_id, return_index=True)
+        ends = np.append(starts[1:], len(block_id))
+
+        for this_block, start, end in zip(unique_blocks, starts, ends):
+            row_start = (this_block//n_block_cols)*block_rows
+            col_start = (this_block%n_block_cols)*block_cols
+            n_rows = min(block_rows, ysize-row_start)
+            n_cols = min(block_cols, xsize-col_start)
+            block = band.ReadAsArray(int(col_start), int(row_start), int(n_cols), int(n_rows))
+
+            these_points = order[start:end]
+            values[these_points] = block[rows[these_points]-row_start, cols[these_points]-col_start]
+
+        if NoDataValue is not None:
+            values[values == NoDataValue] = np.nan
+        return values
+
+    values = _InterpolateAtPixels(GetPixelValues, GeoT, xsize, ysize, easting, northing, method)
+    print("I sampled the raster "+FileName+" at "+str(len(values))+" points.")
+    return values
+#==============================================================================
+
+#==============================================================================
+def SampleArrayAtPoints(data_array, extent, easting, northing, method = "nearest"):
+    """This gets the values of a raster that is already in memory at a set of points.
+
+    Args:
+        data_array (np.array): the raster, e.g. from ReadRasterArrayBlocks. Nodata should be nan.
+        extent (list): [XMin, XMax, YMin, YMax] of the raster, from GetRasterExtent
+        easting (array): the x coordinates of the points
+        northing (array): the y coordinates of the points
+        method (str): "nearest" or "bilinear"
+
+    Return:
+        np.array: the values at the points. Points off the raster get nan.
+
+    Author: SMM
+    """
+    ysize, xsize = data_array.shape
+    GeoT = (extent[0], (extent[1]-extent[0])/xsize, 0, extent[3], 0, -(extent[3]-extent[2])/ysize)
+
+    def GetPixelValues(rows, cols):
+        return data_array[rows, cols].astype(np.float64)
+
+    return _InterpolateAtPixels(GetPixelValues, GeoT, xsize, ysize, easting, northing, method)
+#==============================================================================
+
+#==============================================================================
+# A cache of rasters that have been read. It is off unless you switch it on
+# (e.g. the plotting driver switches it on while it makes a batch of plots
+# that share the same DEM and hillshade). The key is (full path, band), the
+# value is (file fingerprint, array).
+_RASTER_READ_CACHE = None
+
+def EnableRasterReadCache():
+    """This switches on the raster read cache: ReadRasterArrayBlocks then only
+    reads each raster once and hands out copies (callers often change the array in place).
+
+    Author: SMM
+    """
+    global _RASTER_READ_CACHE
+    if _RASTER_READ_CACHE is None:
+        _RASTER_READ_CACHE = {}
+
+def DisableRasterReadCache():
+    """This switches off the raster read cache and frees the memory.
+
+    Author: SMM
+    """
+    global _RASTER_READ_CACHE
+    _RASTER_READ_CACHE = None
+#==============================================================================
+
 #==============================================================================
 def ReadRasterArrayBlocks(raster_file,raster_band=1):
     """This reads a raster file (from GDAL) into an array. The "blocks" bit makes it efficient.
@@ -470,6 +690,13 @@ def ReadRasterArrayBlocks(raster_file,raster_band=1):
     if exists(raster_file) is False:
             raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
 
+    if _RASTER_READ_CACHE is not None:
+        cache_key = (os.path.abspath(raster_file), raster_band)
+        fingerprint = LSDOst.GetFileFingerprint([raster_file, os.path.splitext(raster_file)[0]+".hdr"])
+        if cache_key in _RASTER_READ_CACHE and _RASTER_READ_CACHE[cache_key][0] == fingerprint:
+            print("I already read "+raster_file+", using the cached copy.")
+            return _RASTER_READ_CACHE[cache_key][1].copy()
+
     dataset = gdal.Open(raster_file, GA_ReadOnly )
     if dataset == None:
         raise Exception("Unable to read the data file")
@@ -529,6 +756,9 @@ def ReadRasterArrayBlocks(raster_file,raster_band=1):
         nodata_mask = data_array == NoDataValue
         data_array[nodata_mask] = np.nan
 
+    if _RASTER_READ_CACHE is not None:
+        _RASTER_READ_CACHE[cache_key] = (fingerprint, data_array.copy())
+
     return data_array
 #==============================================================================
 
@@ -633,6 +863,307 @@ def ReadRasterArrayBlocks_numpy(raster_file,raster_band=1):
     return data_array
 #==============================================================================
 
+#==============================================================================
+# The statistics of rasters we have already scanned in this session.
+# The key is the full path of the raster, the value is a tuple of the
+# file fingerprint and the statistics dict
+_RASTER_STATISTICS = {}
+
+# The number of quantiles kept for each raster so the percentiles of a whole
+# collection of rasters can be worked out without reading them all again
+_N_SKETCH_QUANTILES = 1001
+
+def _ComputeRasterStatistics(data_array):
+    """This gets the statistics of one raster array: the min, the max, the
+    number of valid (not nodata) pixels and a quantile sketch of the values.
+
+    Args:
+        data_array (np.array): The raster data, nodata as nan
+
+    Return:
+        dict: with keys "min", "max", "count" and "sketch"
+
+    Author: SMM
+    """
+    valid = data_array[np.isfinite(data_array)]
+    if valid.size == 0:
+        return {"min": np.nan, "max": np.nan, "count": 0, "sketch": np.array([])}
+    sketch = np.percentile(valid, np.linspace(0, 100, _N_SKETCH_QUANTILES))
+    return {"min": float(sketch[0]), "max": float(sketch[-1]),
+            "count": int(valid.size), "sketch": sketch}
+
+def _SketchPercentiles(statistics_list, percentiles):
+    """This merges the quantile sketches of several rasters into percentiles
+    of the whole collection. Each sketch value stands in for count/n_quantiles
+    pixels, so the ranks are good to about 0.1% of the pixels.
+
+    Author: SMM
+    """
+    sketches = [s["sketch"] for s in statistics_list if s["count"] > 0]
+    if len(sketches) == 0:
+        return [np.nan for p in percentiles]
+    weights = [np.full(_N_SKETCH_QUANTILES, s["count"]/float(_N_SKETCH_QUANTILES)) for s in statistics_list if s["count"] > 0]
+    values = np.concatenate(sketches)
+    weights = np.concatenate(weights)
+    order = np.argsort(values, kind="mergesort")
+    values = values[order]
+    cumulative = np.cumsum(weights[order])
+    # the rank of each sketch value as a fraction, from 0 to 1
+    ranks = (cumulative - 0.5*weights[order]) / cumulative[-1]
+    return [float(x) for x in np.interp(np.asarray(percentiles, dtype=float)/100.0, ranks, values)]
+
+def GetRasterStatistics(FileName, data_array = None):
+    """This gets the min, max, number of valid pixels and a quantile sketch of a raster.
+    The result is remembered for as long as the file doesn't change, so asking
+    again (e.g. when you make another figure with the same rasters) doesn't read the file.
+
+    Args:
+        FileName (str): The filename (with path and extension) of the raster.
+        data_array (np.array): If you have already read the raster, pass it here to avoid reading it again
+
+    Return:
+        dict: with keys "min", "max", "count" and "sketch"
+
+    Author: SMM
+    """
+    full_path = os.path.abspath(FileName)
+    fingerprint = LSDOst.GetFileFingerprint([full_path, os.path.splitext(full_path)[0]+".hdr"])
+
+    if full_path in _RASTER_STATISTICS and _RASTER_STATISTICS[full_path][0] == fingerprint:
+        return _RASTER_STATISTICS[full_path][1]
+
+    if data_array is None:
+        data_array = ReadRasterArrayBlocks(FileName)
+    statistics = _ComputeRasterStatistics(data_array)
+    _RASTER_STATISTICS[full_path] = (fingerprint, statistics)
+    return statistics
+
+def GetRasterCollectionStatistics(FileList, percentiles = [], keep_arrays = False, n_threads = 4, array_filter = None):
+    """This gets the statistics of a collection of rasters (e.g. a time series of
+    water depths) in one pass, so you can give a series of subplots the same colour scale.
+    The rasters are read in a pool of threads (GDAL and numpy let go of the
+    python lock while they work). Each raster is read at most once: if you
+    want to plot the rasters afterwards set keep_arrays and you get them back,
+    otherwise only rasters that have changed since they were last scanned are read.
+
+    Args:
+        FileList (list): The filenames (with path and extension) of the rasters. Can also be a glob wildcard string.
+        percentiles (list): Percentiles (0-100) of the whole collection you want, e.g. [2,98] for a robust colour stretch
+        keep_arrays (bool): If true, the arrays are returned so you don't need to read them again to plot them
+        n_threads (int): The number of threads doing the reading
+        array_filter (function): If you keep the arrays, this is applied to each one as it is read and
+            you get back what it returns (e.g. a decimated copy for plotting), so the full arrays aren't all kept
+
+    Return:
+        dict: with keys "min", "max", "count", "percentiles" (a list, same order as the percentiles you asked for),
+        "files" (the file list) and "arrays" (a list of arrays if keep_arrays, otherwise None)
+
+    Author: SMM
+    """
+    if isinstance(FileList, str):
+        from glob import glob
+        FileList = sorted(glob(FileList), key=str)
+    FileList = list(FileList)
+
+    def read_one(FileName):
+        if keep_arrays:
+            data_array = ReadRasterArrayBlocks(FileName)
+            statistics = GetRasterStatistics(FileName, data_array)
+            if array_filter is not None:
+                data_array = array_filter(data_array)
+            return statistics, data_array
+        return GetRasterStatistics(FileName), None
+
+    n_threads = max(1, min(n_threads, len(FileList)))
+    if n_threads == 1:
+        results = [read_one(FileName) for FileName in FileList]
+    else:
+        pool = ThreadPool(n_threads)
+        try:
+            results = pool.map(read_one, FileList)
+        finally:
+            pool.close()
+            pool.join()
+
+    statistics_list = [r[0] for r in results]
+    valid_statistics = [s for s in statistics_list if s["count"] > 0]
+    collection = {"files": FileList,
+                  "count": sum(s["count"] for s in statistics_list),
+                  "min": min(s["min"] for s in valid_statistics) if valid_statistics else np.nan,
+                  "max": max(s["max"] for s in valid_statistics) if valid_statistics else np.nan,
+                  "percentiles": _SketchPercentiles(statistics_list, percentiles),
+                  "arrays": [r[1] for r in results] if keep_arrays else None}
+    print("The collection of "+str(len(FileList))+" rasters goes from "+str(collection["min"])+" to "+str(collection["max"]))
+    return collection
+#==============================================================================
+
+#==============================================================================
+def ReadENVIHeader(raster_file):
+    """This reads the bits of an ENVI header (the .hdr next to a .bil) that
+    are needed to read the raw data.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+
+    Return:
+        dict: with the keys "samples", "lines", "bands", "header offset",
+        "data type", "byte order", "interleave" and "data ignore value" (the last is None if missing).
+        None if there is no header.
+
+    Author: SMM
+    """
+    hdr_name = os.path.splitext(raster_file)[0]+".hdr"
+    if exists(hdr_name) is False:
+        return None
+
+    header = {"bands": 1, "header offset": 0, "byte order": 0,
+              "interleave": "bsq", "data ignore value": None}
+    with open(hdr_name,"r") as hdr_file:
+        for line in hdr_file:
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip().lower()
+            value = value.strip()
+            if key in ["samples", "lines", "bands", "header offset", "data type", "byte order"]:
+                header[key] = int(value)
+            elif key == "interleave":
+                header[key] = value.lower()
+            elif key == "data ignore value":
+                header[key] = float(value)
+    return header
+#==============================================================================
+
+#==============================================================================
+def MemmapENVIRaster(raster_file):
+    """This maps a single band ENVI raster (e.g. a .bil from LSDTopoTools)
+    into memory without reading it. Only the parts of the array you use are
+    read from disk, which is handy when you need a few values from lots of rasters.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+
+    Return:
+        np.memmap: A read only (lines, samples) array of the raw data, or None if
+        the raster isn't a single band ENVI raster we can map.
+        float: the nodata value (None if there isn't one)
+
+    Author: SMM
+    """
+    header = ReadENVIHeader(raster_file)
+    if header is None or header["bands"] != 1 or "samples" not in header or "lines" not in header:
+        return None, None
+
+    # The ENVI data types
+    envi_dtypes = {1: "u1", 2: "i2", 3: "i4", 4: "f4", 5: "f8", 12: "u2", 13: "u4", 14: "i8", 15: "u8"}
+    if header.get("data type") not in envi_dtypes:
+        return None, None
+    byte_order = ">" if header["byte order"] == 1 else "<"
+    data_type = np.dtype(byte_order+envi_dtypes[header["data type"]])
+
+    data_array = np.memmap(raster_file, dtype=data_type, mode="r",
+                           offset=header["header offset"],
+                           shape=(header["lines"], header["samples"]))
+    return data_array, header["data ignore value"]
+#==============================================================================
+
+#==============================================================================
+def ReadRasterArrayNative(raster_file,raster_band=1):
+    """This reads a raster in its own data type (so integer rasters like basin
+    or lithology rasters stay integers), without turning the nodata into nan.
+    ENVI rasters are mapped rather than read.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        raster_band (int): the band of the raster
+
+    Return:
+        np.array: The data, in the data type of the raster
+        float: the nodata value (None if there isn't one)
+
+    Author: SMM
+    """
+    if exists(raster_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    if raster_band == 1:
+        data_array, NoDataValue = MemmapENVIRaster(raster_file)
+        if data_array is not None:
+            return data_array, NoDataValue
+
+    dataset = gdal.Open(raster_file, GA_ReadOnly )
+    if dataset == None:
+        raise Exception("Unable to read the data file")
+    band = dataset.GetRasterBand(raster_band)
+    return band.ReadAsArray(), band.GetNoDataValue()
+#==============================================================================
+
+#==============================================================================
+def GetDecimationStep(shape, max_pixels):
+    """This gets the step between the pixels that are kept so a raster of this
+    shape is no bigger than max_pixels (rows, cols).
+
+    Args:
+        shape (tuple): The (rows, cols) of the raster
+        max_pixels (tuple): The most (rows, cols) you want. None keeps every pixel.
+
+    Return:
+        int: the step
+
+    Author: FJC
+    """
+    if max_pixels is None:
+        return 1
+    return max(1, int(np.ceil(float(shape[0])/max_pixels[0])), int(np.ceil(float(shape[1])/max_pixels[1])))
+
+def ReadRasterArrayDecimated(raster_file, max_pixels = None, step = None, raster_band = 1):
+    """This reads every step-th pixel of a raster, e.g. so a figure doesn't need
+    the whole of a big DEM in memory. ENVI rasters are mapped so only the rows
+    that are kept are read. Other rasters are read by GDAL straight into the
+    smaller array (nearest neighbour), so the full raster is never in memory.
+
+    Args:
+        raster_file (str): The filename (with path and extension) of the raster.
+        max_pixels (tuple): The most (rows, cols) you want. The step is worked out from this.
+        step (int): The step between the pixels that are kept, if you want to set it yourself (e.g. to match another raster)
+        raster_band (int): the band of the raster
+
+    Return:
+        np.array: A float32 array with the kept pixels, nodata as nan
+        int: the step
+
+    Author: FJC
+    """
+    if exists(raster_file) is False:
+        raise Exception('[Errno 2] No such file or directory: \'' + raster_file + '\'')
+
+    data_array = None
+    if raster_band == 1:
+        mapped_array, NoDataValue = MemmapENVIRaster(raster_file)
+        if mapped_array is not None:
+            if step is None:
+                step = GetDecimationStep(mapped_array.shape, max_pixels)
+            data_array = np.array(mapped_array[::step, ::step], dtype=np.float32)
+            del mapped_array
+
+    if data_array is None:
+        dataset = gdal.Open(raster_file, GA_ReadOnly )
+        if dataset == None:
+            raise Exception("Unable to read the data file")
+        band = dataset.GetRasterBand(raster_band)
+        NoDataValue = band.GetNoDataValue()
+        if step is None:
+            step = GetDecimationStep((band.YSize, band.XSize), max_pixels)
+        buf_ysize = int(np.ceil(float(band.YSize)/step))
+        buf_xsize = int(np.ceil(float(band.XSize)/step))
+        data_array = band.ReadAsArray(0, 0, band.XSize, band.YSize,
+                                      buf_xsize = buf_xsize, buf_ysize = buf_ysize).astype(np.float32)
+
+    if NoDataValue is not None:
+        data_array[data_array == NoDataValue] = np.nan
+    return data_array, step
+#==============================================================================
+
 #==============================================================================
 def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue = -9999):
     """Takes an array and writes to a GDAL compatible raster. It needs another raster to map the dimensions.
@@ -671,6 +1202,44 @@ def array2raster(rasterfn,newRasterfn,array,driver_name = "ENVI", noDataValue =
     outband.FlushCache()
 #==============================================================================
 
+#==============================================================================
+def CreateENVIRasterMemmap(rasterfn,newRasterfn,noDataValue = -9999):
+    """Makes a new float32 ENVI raster with the same georeferencing as another
+    raster and maps it into memory, so you can fill it a bit at a time without
+    ever holding the whole array.
+
+    Args:
+        rasterfn (str): The filename (with path and extension) of a raster that has the same dimensions as the raster to be written.
+        newRasterfn (str): The filename (with path and extension) of the new raster (a .bil).
+        noDataValue (float): The no data value
+
+    Return:
+        np.memmap: A writable (rows, cols) float32 array of the new raster, filled with noDataValue.
+        Delete it (or call flush) when you are done to make sure it is on disk.
+
+    Author: SMM
+    """
+    raster = gdal.Open(rasterfn)
+    cols = raster.RasterXSize
+    rows = raster.RasterYSize
+
+    # gdal writes the header, then we map the data
+    driver = gdal.GetDriverByName("ENVI")
+    outRaster = driver.Create(newRasterfn, cols, rows, 1, gdal.GDT_Float32, ["INTERLEAVE=BIL"])
+    outRaster.SetGeoTransform(raster.GetGeoTransform())
+    outRaster.SetProjection(raster.GetProjectionRef())
+    outRaster.GetRasterBand(1).SetNoDataValue( noDataValue )
+    outRaster.GetRasterBand(1).Fill( noDataValue )
+    outRaster.FlushCache()
+    outRaster = None
+    raster = None
+
+    header = ReadENVIHeader(newRasterfn)
+    byte_order = ">" if header["byte order"] == 1 else "<"
+    return np.memmap(newRasterfn, dtype=np.dtype(byte_order+"f4"), mode="r+",
+                     offset=header["header offset"], shape=(rows, cols))
+#==============================================================================
+
 
 def RasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName="Test.outfile", OutFileType="ENVI"):
     """
@@ -724,15 +1293,19 @@ def RasterDifference(RasterFile1, RasterFile2, raster_band=1, OutFileName="Test.
     gdal_array.BandWriteArray(bandOut, difference_raster_array)
 
 #==============================================================================
-def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
+def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons', write_shapefile = True):
     """
     This function takes in a raster and converts to a polygon shapefile using rasterio
     from https://gis.stackexchange.com/questions/187877/how-to-polygonize-raster-to-shapely-polygons/187883#187883?newreg=8b1f507529724a8488ce4789ba787363
 
+    Each polygon is only built once. If the same raster value appears in more than one
+    polygon only the largest one is kept.
+
     Args:
         DataDirectory (str): the data directory with the basin raster
         RasterFile (str): the name of the raster
         OutputShapefile (str): the name of the output shapefile WITHOUT EXTENSION. Default = 'polygons'
+        write_shapefile (bool): If false, the shapefile is not written and you just get the polygons back
 
     Returns:
         Dictionary where key is the raster value and the value is a shapely polygon
@@ -743,7 +1316,6 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
     import rasterio
     from rasterio.features import shapes
     from shapely.geometry import shape, Polygon, mapping
-    import fiona
 
     # define the mask
     #mask = None
@@ -755,68 +1327,45 @@ def PolygoniseRaster(DataDirectory, RasterFile, OutputShapefile='polygons'):
     # load in the raster using rasterio
     with rasterio.open(DataDirectory+RasterFile) as src:
         image = src.read(raster_band, masked=False)
-
         msk = src.read_masks(1)
+        transform = src.transform
 
-        results = (
-        {'properties': {'raster_val': v}, 'geometry': s}
-        for i, (s, v)
-        in enumerate(
-            shapes(image, mask=msk, transform=src.transform)))
-
-    # define shapefile attributes
-    # crs = src.crs.wkt
-    # print (crs)
-    print("Let me grab the coordinate reference system.")
-    crs = GetUTMEPSG(DataDirectory+RasterFile)
-    schema = {'geometry': 'Polygon',
-              'properties': { 'ID': 'float'}}
-
-
-
-    # This is necessary to filter the basin results
-    geoms = list(results)
-    #print("Geom size is: "+str(len(geoms)))
-    
-    filtered_geoms = {}
+    # This is necessary to filter the basin results: if an ID is repeated
+    # we only keep the biggest polygon
+    PolygonDict = {}
     area_dict = {}
-    for f in geoms:
-        this_shape = Polygon(shape(f['geometry']))
-        this_val = float(f['properties']['raster_val'])
-        #print("ID is: "+str(this_val))
+    n_repeated = 0
+    for s, v in shapes(image, mask=msk, transform=transform):
+        this_shape = Polygon(shape(s))
+        this_val = float(v)
         this_area = this_shape.area
-        if this_val in filtered_geoms.keys():
-            print("Whoops. Found a repeated ID. Getting rid of the smaller one.")
+        if this_val in PolygonDict:
+            n_repeated = n_repeated+1
             if area_dict[this_val] < this_area:
-                filtered_geoms[this_val] = f
-                area_dict[this_val] = this_area               
-                print("Found a repeated ID. Keeping the one with area of "+str(this_area))
-            else:
-                print("Keeping the initial ID.")
+                PolygonDict[this_val] = this_shape
+                area_dict[this_val] = this_area
         else:
-            filtered_geoms[this_val] = f
-            area_dict[this_val] = this_area
-    
-    new_geoms = []
-    for key,item in filtered_geoms.items():
-        this_shape = Polygon(shape(item['geometry']))
-        this_val = float(item['properties']['raster_val'])
-        #print("ID is: "+str(this_val)) 
-        this_area = this_shape.area
-        #print("Area is: "+str(this_area))
-        new_geoms.append(item)
-    #print("Geom size is: "+str(len(new_geoms)))
-            
-    # transform results into shapely geometries and write to shapefile using fiona
-    PolygonDict = {}
-    with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
-        for f in new_geoms:
-            this_shape = Polygon(shape(f['geometry']))
-            this_val = float(f['properties']['raster_val'])
-            print("ID is: "+str(this_val))
-            if this_val != NDV: # remove no data values
-                output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
             PolygonDict[this_val] = this_shape
+            area_dict[this_val] = this_area
+
+    if n_repeated > 0:
+        print("Whoops. Found "+str(n_repeated)+" repeated IDs. I kept the biggest polygon for each of them.")
+    print("I found "+str(len(PolygonDict))+" polygons.")
+
+    if write_shapefile:
+        import fiona
+
+        # define shapefile attributes
+        print("Let me grab the coordinate reference system.")
+        crs = GetUTMEPSG(DataDirectory+RasterFile)
+        schema = {'geometry': 'Polygon',
+                  'properties': { 'ID': 'float'}}
+
+        # write the shapely geometries to shapefile using fiona
+        with fiona.open(DataDirectory+OutputShapefile, 'w', crs=crs, driver='ESRI Shapefile', schema=schema) as output:
+            for this_val, this_shape in PolygonDict.items():
+                if this_val != NDV: # remove no data values
+                    output.write({'geometry': mapping(this_shape), 'properties':{'ID': this_val}})
 
     return PolygonDict
 
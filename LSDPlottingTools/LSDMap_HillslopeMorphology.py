@@ -207,16 +207,14 @@ def ReadHillslopeTraces(DataDirectory, FilenamePrefix,ThinningFactor=1,CustomExt
     df = df.iloc[::ThinningFactor,:]
 
     # clip to custom extent_raster
+    # (a single mask so we only go through the traces once)
     if len(CustomExtent) == 4:
-      df.drop(df[df.Easting < CustomExtent[0]].index, inplace=True)
-      df.drop(df[df.Easting > CustomExtent[1]].index, inplace=True)
-      df.drop(df[df.Northing < CustomExtent[2]].index, inplace=True)
-      df.drop(df[df.Northing > CustomExtent[3]].index, inplace=True)
+      Easting = df.Easting.values
+      Northing = df.Northing.values
+      df = df[(Easting >= CustomExtent[0]) & (Easting <= CustomExtent[1]) & (Northing >= CustomExtent[2]) & (Northing <= CustomExtent[3])]
 
     # check for and delete any traces tat are only 1 point long since these wont plot
-    df['is_unique'] = ~df['HilltopID'].duplicated(keep=False)
-    temp = ~df['HilltopID'].duplicated(keep=False)
-    df.drop(df[df.is_unique == True].index, inplace=True)
+    df = df[df['HilltopID'].duplicated(keep=False).values]
 
     geometry = [Point(xy) for xy in zip(df.Easting, df.Northing)]
     df = df.drop(['Easting','Northing','Longitude', 'Latitude'], axis=1)
@@ -0,0 +1,503 @@
+## LSDMap_ImageCache.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## A persistent cache of the coloured base images (hillshades and terrain)
+## that go under most of our maps.
+##
+## Shading a DEM and putting it through a colourmap is the same work every time
+## you make a figure over that DEM, so here it can be done once and the RGBA
+## pixels saved in tiles on disk. Each cached image is keyed by the raster (its
+## path and fingerprint), the lighting (azimuth, altitude, z factor), the
+## colourmap and the colour limits, so if any of these change you get a new
+## image. The tiles are written atomically, so several processes can share
+## the cache.
+##
+## The cache is off unless you turn it on with EnableImageCache (or set the
+## environment variable LSDMT_IMAGE_CACHE_DIR), since an uncompressed RGBA image
+## of a big DEM takes a lot of space (1.6 GB for a 20000x20000 DEM). It lives in
+## one directory, by default ~/.cache/LSDMappingTools/imagecache, and when it
+## gets bigger than its maximum size the images used least recently are deleted.
+## The base maps of LSDMapFigure.PlottingBaseMap are kept in the same directory
+## and count towards its size. You can delete it whenever you like, it will just
+## be rebuilt.
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## SMM
+## 19/10/2026
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+import LSDPlottingTools.LSDMap_OSystemTools as LSDOst
+
+# The number of images we keep in memory in this python session when the cache
+# is on. The key is the image key, the value is the RGBA array
+_LOADED_IMAGES = OrderedDict()
+_MAX_LOADED_IMAGES = 4
+
+# The settings of the image cache: None if it is off, otherwise a dict with the
+# cache directory and the maximum size in bytes
+_IMAGE_CACHE = None
+
+#==============================================================================
+def GetDefaultCacheDirectory():
+    """This gets the directory the image cache uses if you don't give one: the
+    environment variable LSDMT_IMAGE_CACHE_DIR if it is set, otherwise
+    ~/.cache/LSDMappingTools/imagecache.
+
+    Author: SMM
+    """
+    CacheDirectory = os.environ.get("LSDMT_IMAGE_CACHE_DIR")
+    if not CacheDirectory:
+        CacheDirectory = os.path.join(os.path.expanduser("~"), ".cache", "LSDMappingTools", "imagecache")
+    return CacheDirectory
+
+#==============================================================================
+def EnableImageCache(CacheDirectory = None, max_size_MB = None):
+    """This turns on the image cache, so the coloured base images are saved on
+    disk and only rendered the first time.
+
+    Args:
+        CacheDirectory (str): Where to keep the images. None uses GetDefaultCacheDirectory.
+        max_size_MB (float): The most space the cached images can take up. When the cache is bigger
+            than this the images used least recently are deleted. None uses the environment
+            variable LSDMT_IMAGE_CACHE_MAX_MB, or 4096 MB if it isn't set.
+
+    Author: SMM
+    """
+    global _IMAGE_CACHE
+    if CacheDirectory is None:
+        CacheDirectory = GetDefaultCacheDirectory()
+    if max_size_MB is None:
+        max_size_MB = float(os.environ.get("LSDMT_IMAGE_CACHE_MAX_MB", 4096))
+    _IMAGE_CACHE = {"directory": os.path.join(os.path.abspath(CacheDirectory), ""),
+                    "max_size": int(max_size_MB*1e6)}
+    print("The image cache is in "+_IMAGE_CACHE["directory"]+" and can use up to "+str(max_size_MB)+" MB")
+
+#==============================================================================
+def DisableImageCache():
+    """This turns off the image cache. The images on disk are left where they are.
+
+    Author: SMM
+    """
+    global _IMAGE_CACHE
+    _IMAGE_CACHE = None
+    _LOADED_IMAGES.clear()
+
+#==============================================================================
+def GetCacheDirectory():
+    """Gets the directory of the image cache, or None if the cache is off.
+
+    Author: SMM
+    """
+    if _IMAGE_CACHE is None:
+        return None
+    return _IMAGE_CACHE["directory"]
+
+#==============================================================================
+def ImageCacheEnabled():
+    """Returns True if the image cache is on.
+
+    Author: SMM
+    """
+    return _IMAGE_CACHE is not None
+
+#==============================================================================
+def _GetDirectorySize(Directory):
+    """Gets the total size in bytes of the files in a directory.
+
+    Author: SMM
+    """
+    size = 0
+    for root, dirs, files in os.walk(Directory):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except (IOError, OSError):
+                # another process might have just deleted it
+                pass
+    return size
+
+#==============================================================================
+def EvictImages(keep_key = None):
+    """This deletes the images used least recently until the image cache is
+    no bigger than its maximum size. An image counts as used when its meta
+    file was last touched, which happens every time it is read. Other entries
+    (e.g. base maps) count as used when their directory was last touched.
+
+    Args:
+        keep_key (str): The key of an image that shouldn't be deleted (the one being used)
+
+    Returns:
+        The number of images deleted
+
+    Author: SMM
+    """
+    if _IMAGE_CACHE is None or not os.path.isdir(_IMAGE_CACHE["directory"]):
+        return 0
+
+    images = []
+    total_size = 0
+    for key in os.listdir(_IMAGE_CACHE["directory"]):
+        ImageDirectory = os.path.join(_IMAGE_CACHE["directory"], key)
+        if not os.path.isdir(ImageDirectory):
+            continue
+        try:
+            last_used = os.path.getmtime(os.path.join(ImageDirectory, "meta.npz"))
+        except (IOError, OSError):
+            last_used = os.path.getmtime(ImageDirectory)
+        size = _GetDirectorySize(ImageDirectory)
+        total_size += size
+        images.append((last_used, key, size, ImageDirectory))
+
+    n_deleted = 0
+    for last_used, key, size, ImageDirectory in sorted(images):
+        if total_size <= _IMAGE_CACHE["max_size"]:
+            break
+        if key == keep_key:
+            continue
+        shutil.rmtree(ImageDirectory, ignore_errors = True)
+        total_size -= size
+        n_deleted += 1
+
+    if n_deleted > 0:
+        print("The image cache was full so I deleted the "+str(n_deleted)+" images used least recently")
+    return n_deleted
+
+#==============================================================================
+def GetColourmapKey(colourmap):
+    """This gets a string that identifies a colourmap, so that changing
+    the colours of a custom colourmap changes the key.
+
+    Args:
+        colourmap (str or colormap): The colourmap
+
+    Returns:
+        A string identifying the colourmap
+
+    Author: SMM
+    """
+    cmap = plt.get_cmap(colourmap)
+    lut = cmap(np.linspace(0, 1, cmap.N))
+    extra_colours = np.array([cmap.get_bad(), cmap.get_under(), cmap.get_over()])
+    lut_hash = hashlib.sha1(np.ascontiguousarray(np.vstack([lut, extra_colours])).tobytes()).hexdigest()
+    return str(cmap.name)+":"+lut_hash[:16]
+
+#==============================================================================
+def ResolveColourLimits(array, clim = None):
+    """This gets the colour limits of an image. None means the minimum or maximum
+    of the data, so clim = None (or (None,None)) is what imshow does, and
+    clim = (0,None) goes from zero to the maximum.
+
+    Args:
+        array (np.array): The raster data
+        clim (tuple): The colour limits
+
+    Returns:
+        A tuple with the minimum and maximum colour values
+
+    Author: SMM
+    """
+    if clim is None:
+        clim = (None, None)
+    vmin, vmax = clim
+    if vmin is None:
+        vmin = float(np.nanmin(array))
+    if vmax is None:
+        vmax = float(np.nanmax(array))
+    return (vmin, vmax)
+
+#==============================================================================
+def ColourArray(array, colourmap = "gray", clim = None):
+    """This puts raster data through a colourmap. NaN pixels get the "bad" colour.
+
+    Args:
+        array (np.array): The raster data
+        colourmap (str or colormap): The colourmap
+        clim (tuple): The colour limits, see ResolveColourLimits
+
+    Returns:
+        The RGBA array (uint8)
+
+    Author: SMM
+    """
+    clim = ResolveColourLimits(array, clim)
+    norm = mcolors.Normalize(vmin = clim[0], vmax = clim[1])
+    cmap = plt.get_cmap(colourmap)
+    return cmap(norm(np.ma.masked_invalid(array)), bytes = True)
+
+#==============================================================================
+class RGBATileCache(object):
+    """
+    The tiles of one coloured image of a raster. The tiles are rendered from
+    the raster data the first time they are needed and then read from disk.
+
+    Args:
+        FullPathRaster (str): The raster name with path and extension
+        colourmap (str or colormap): The colourmap
+        clim (tuple): The colour limits, see ResolveColourLimits. None uses the range of the data.
+        azimuth (float): The azimuth of the hillshade, None if the image isn't a hillshade of the raster
+        angle_altitude (float): The altitude of the sun of the hillshade
+        z_factor (float): The z factor of the hillshade
+        NoDataValue (float): The nodata value used by the hillshade
+        tile_size (int): The size of the (square) tiles in pixels
+        CacheDirectory (str): The directory of the image cache. None uses the one set by
+            EnableImageCache, or GetDefaultCacheDirectory if the cache is off.
+
+    Author: SMM
+    """
+    def __init__(self, FullPathRaster, colourmap = "gray", clim = None, azimuth = None,
+                 angle_altitude = None, z_factor = None, NoDataValue = None, tile_size = 512,
+                 CacheDirectory = None):
+
+        self._FullPathRaster = FullPathRaster
+        self._colourmap = colourmap
+        self._clim = None if clim is None else tuple(clim)
+        self.tile_size = int(tile_size)
+
+        source_files = [FullPathRaster, os.path.splitext(FullPathRaster)[0]+".hdr"]
+        self.fingerprint = LSDOst.GetFileFingerprint(source_files)
+
+        key_items = [os.path.abspath(FullPathRaster), self.fingerprint, str(azimuth), str(angle_altitude), str(z_factor), str(NoDataValue),
+                     GetColourmapKey(colourmap), str(self._clim), str(self.tile_size)]
+        self.key = hashlib.sha1("|".join(key_items).encode("utf-8")).hexdigest()
+
+        if CacheDirectory is None:
+            CacheDirectory = GetDefaultCacheDirectory() if _IMAGE_CACHE is None else _IMAGE_CACHE["directory"]
+        self.CacheDirectory = os.path.join(CacheDirectory, self.key, "")
+        self._MetaFileName = self.CacheDirectory+"meta.npz"
+        self.shape = None
+        self.resolved_clim = None
+        self._read_meta()
+
+    def _read_meta(self):
+        """
+        Reads the shape and colour limits of the image if it has been rendered before.
+
+        Author: SMM
+        """
+        try:
+            with np.load(self._MetaFileName) as meta:
+                self.shape = tuple(int(n) for n in meta["shape"])
+                self.resolved_clim = tuple(float(c) for c in meta["clim"])
+            # mark the image as used, for the least recently used eviction
+            os.utime(self._MetaFileName, None)
+        except (IOError, OSError):
+            # it hasn't been rendered, or another process has just evicted it
+            pass
+
+    def _save(self, FileName, **arrays):
+        """
+        Writes a npz file atomically, so a half written file is never read.
+
+        Author: SMM
+        """
+        temp_name = None
+        try:
+            if not os.path.isdir(self.CacheDirectory):
+                os.makedirs(self.CacheDirectory)
+        except (IOError, OSError):
+            # another process might have just made it
+            pass
+        try:
+            handle, temp_name = tempfile.mkstemp(suffix=".npz", dir=self.CacheDirectory)
+            with os.fdopen(handle, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(temp_name, FileName)
+        except (IOError, OSError):
+            print("I could not write to the image cache "+self.CacheDirectory+", the image will be rendered again next time.")
+            if temp_name is not None and os.path.isfile(temp_name):
+                os.remove(temp_name)
+
+    def get_tile_file_name(self, tile_row, tile_col):
+        """
+        Gets the name of the file of a tile.
+
+        Author: SMM
+        """
+        return self.CacheDirectory+"tile_"+str(tile_row)+"_"+str(tile_col)+".npz"
+
+    def render(self, array, row_min, row_max, col_min, col_max):
+        """
+        Colours part of the raster array.
+
+        Args:
+            array (np.array): The raster data
+            row_min, row_max, col_min, col_max (int): The window, in pixels
+
+        Returns:
+            The RGBA array (uint8) of the window
+
+        Author: SMM
+        """
+        return ColourArray(array[row_min:row_max, col_min:col_max], self._colourmap, self.resolved_clim)
+
+    def get_window(self, array_loader, row_min = 0, row_max = None, col_min = 0, col_max = None):
+        """
+        Gets the RGBA pixels of a window of the raster. Tiles that are cached are
+        read; the others are rendered and cached. The raster data is only loaded
+        if there are tiles to render.
+
+        Args:
+            array_loader (function): A function with no arguments that returns the raster data
+            row_min, row_max, col_min, col_max (int): The window, in pixels. None means the edge of the raster.
+
+        Returns:
+            The RGBA array (uint8) of the window
+
+        Author: SMM
+        """
+        array = None
+        if self.shape is None:
+            array = array_loader()
+            self.shape = tuple(array.shape)
+            self.resolved_clim = ResolveColourLimits(array, self._clim)
+            self._save(self._MetaFileName, shape = np.array(self.shape), clim = np.array(self.resolved_clim))
+
+        n_rows, n_cols = self.shape
+        row_max = n_rows if row_max is None else min(row_max, n_rows)
+        col_max = n_cols if col_max is None else min(col_max, n_cols)
+        image = np.zeros((row_max-row_min, col_max-col_min, 4), dtype = np.uint8)
+
+        ts = self.tile_size
+        n_rendered = 0
+        for tile_row in range(row_min//ts, (row_max-1)//ts+1):
+            for tile_col in range(col_min//ts, (col_max-1)//ts+1):
+                tile_r0, tile_c0 = tile_row*ts, tile_col*ts
+                tile_r1, tile_c1 = min(tile_r0+ts, n_rows), min(tile_c0+ts, n_cols)
+
+                TileFileName = self.get_tile_file_name(tile_row, tile_col)
+                tile = None
+                if os.path.isfile(TileFileName):
+                    try:
+                        with np.load(TileFileName) as cached:
+                            tile = cached["rgba"]
+                    except (IOError, OSError):
+                        # another process has just evicted it
+                        tile = None
+                if tile is None:
+                    if array is None:
+                        array = array_loader()
+                    tile = self.render(array, tile_r0, tile_r1, tile_c0, tile_c1)
+                    self._save(TileFileName, rgba = tile)
+                    n_rendered += 1
+
+                # copy the bit of the tile that is in the window
+                r0, r1 = max(tile_r0, row_min), min(tile_r1, row_max)
+                c0, c1 = max(tile_c0, col_min), min(tile_c1, col_max)
+                image[r0-row_min:r1-row_min, c0-col_min:c1-col_min] = tile[r0-tile_r0:r1-tile_r0, c0-tile_c0:c1-tile_c0]
+
+        if n_rendered > 0:
+            print("I rendered "+str(n_rendered)+" tiles of the base image of "+self._FullPathRaster)
+            EvictImages(keep_key = self.key)
+        return image
+
+    def get_image(self, array_loader):
+        """
+        Gets the RGBA pixels of the whole raster.
+
+        Args:
+            array_loader (function): A function with no arguments that returns the raster data
+
+        Author: SMM
+        """
+        return self.get_window(array_loader)
+
+#==============================================================================
+def GetBaseImage(FullPathRaster, array_loader, colourmap = "gray", clim = None, azimuth = None,
+                 angle_altitude = None, z_factor = None, NoDataValue = None, tile_size = 512, return_clim = False):
+    """This gets the coloured image of a raster from the image cache, rendering
+    it if it isn't there. Images used in this python session are kept in memory.
+    If the image cache is off (see EnableImageCache) the image is just rendered.
+
+    Args:
+        FullPathRaster (str): The raster name with path and extension
+        array_loader (function): A function with no arguments that returns the data to colour (only called if the image isn't cached)
+        colourmap (str or colormap): The colourmap
+        clim (tuple): The colour limits, see ResolveColourLimits. None uses the range of the data.
+        azimuth (float): The azimuth if the data is a hillshade computed from the raster
+        angle_altitude (float): The altitude of the sun if the data is a hillshade computed from the raster
+        z_factor (float): The z factor if the data is a hillshade computed from the raster
+        NoDataValue (float): The nodata value if the data is a hillshade computed from the raster
+        tile_size (int): The size of the tiles in pixels
+        return_clim (bool): If true, also return the colour limits used (e.g. for a colourbar)
+
+    Returns:
+        The RGBA array (uint8), which you can pass straight to imshow, and the colour limits if return_clim is True
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    if _IMAGE_CACHE is None:
+        array = array_loader()
+        resolved_clim = ResolveColourLimits(array, clim)
+        image = ColourArray(array, colourmap, resolved_clim)
+        if return_clim:
+            return image, resolved_clim
+        return image
+
+    tile_cache = RGBATileCache(FullPathRaster, colourmap = colourmap, clim = clim, azimuth = azimuth,
+                               angle_altitude = angle_altitude, z_factor = z_factor, NoDataValue = NoDataValue,
+                               tile_size = tile_size)
+
+    if tile_cache.key in _LOADED_IMAGES:
+        _LOADED_IMAGES.move_to_end(tile_cache.key)
+        image, resolved_clim = _LOADED_IMAGES[tile_cache.key]
+    else:
+        image = tile_cache.get_image(array_loader)
+        resolved_clim = tile_cache.resolved_clim
+        # nobody should draw on the cached pixels
+        image.flags.writeable = False
+        _LOADED_IMAGES[tile_cache.key] = (image, resolved_clim)
+        while len(_LOADED_IMAGES) > _MAX_LOADED_IMAGES:
+            _LOADED_IMAGES.popitem(last = False)
+
+    if return_clim:
+        return image, resolved_clim
+    return image
+
+#==============================================================================
+def GetHillshadeImage(FullPathDEM, azimuth = 315, angle_altitude = 45, z_factor = 1,
+                      colourmap = "gray", clim = None, NoDataValue = -9999, tile_size = 512, return_clim = False):
+    """This gets the coloured hillshade of a DEM from the image cache. The hillshade
+    is only computed (with LSDMap_BasicPlotting.Hillshade) if it isn't cached for
+    this DEM, lighting, colourmap and colour limits, or if the image cache is off.
+
+    Args:
+        FullPathDEM (str): The DEM name with path and extension
+        azimuth (float): Azimuth of sunlight
+        angle_altitude (float): Angle altitude of sun
+        z_factor (float): The z factor
+        colourmap (str or colormap): The colourmap
+        clim (tuple): The colour limits, see ResolveColourLimits. None uses the range of the hillshade.
+        NoDataValue (float): The nodata value of the raster
+        tile_size (int): The size of the tiles in pixels
+        return_clim (bool): If true, also return the colour limits used (e.g. for a colourbar)
+
+    Returns:
+        The RGBA array (uint8) of the hillshade, in the same orientation as Hillshade() returns it,
+        and the colour limits if return_clim is True
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    from LSDPlottingTools.LSDMap_BasicPlotting import Hillshade
+
+    def hillshade_loader():
+        return Hillshade(FullPathDEM, azimuth = azimuth, angle_altitude = angle_altitude,
+                         NoDataValue = NoDataValue, z_factor = z_factor)
+
+    return GetBaseImage(FullPathDEM, hillshade_loader, colourmap = colourmap, clim = clim, azimuth = azimuth,
+                        angle_altitude = angle_altitude, z_factor = z_factor, NoDataValue = NoDataValue,
+                        tile_size = tile_size, return_clim = return_clim)
+
+# The cache can be turned on from the environment, e.g. for the plotting scripts
+if os.environ.get("LSDMT_IMAGE_CACHE_DIR"):
+    EnableImageCache()
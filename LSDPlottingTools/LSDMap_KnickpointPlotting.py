@@ -16,6 +16,7 @@ from matplotlib import rcParams
 import matplotlib.cm as cm
 from LSDMapFigure.PlottingRaster import MapFigure
 from LSDMapFigure.PlottingRaster import BaseRaster
+from LSDMapFigure.PlottingBaseMap import GetBaseMap
 from LSDMapFigure import PlottingHelpers as Helper
 from LSDPlottingTools import colours as lsdcolours
 from LSDPlottingTools import statsutilities as SUT
@@ -772,8 +773,9 @@ class KP_plotting(object):
         BasinsName = self.fprefix+'_AllBasins'+raster_ext
 
         
-        # create the map figure
-        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7)
+        # create the map figure from the cached base map
+        BM = GetBaseMap(self.fpath, self.fprefix, coord_type="UTM_km", raster_ext = raster_ext)
+        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7, base_map = BM)
         if(black_bg):
             MF.add_drape_image(HillshadeName,self.fpath,colourmap = "gray",alpha=1,colour_min_max = [10000,10001],modify_raster_values=False,old_values=[], new_values=[],NFF_opti = True)
 
@@ -793,8 +795,7 @@ class KP_plotting(object):
                                 NFF_opti = True, custom_min_max = [])
         
         # plot the basin outlines
-        Basins = LSDP.GetBasinOutlines(self.fpath, BasinsName)
-        MF.plot_polygon_outlines(Basins, linewidth = 0.5)
+        MF.plot_polygon_outlines(BM.basins, linewidth = 0.5)
 
         # add the channel network without color
         ## First calibration of the points: I calculated a ratio of niceness from different tests - Probably need more work to adapt it to different figure styles
@@ -896,8 +897,9 @@ class KP_plotting(object):
         BasinsName = self.fprefix+'_AllBasins'+raster_ext
 
         
-        # create the map figure
-        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7)
+        # create the map figure from the cached base map
+        BM = GetBaseMap(self.fpath, self.fprefix, coord_type="UTM_km", raster_ext = raster_ext)
+        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7, base_map = BM)
         if(black_bg):
             MF.add_drape_image(HillshadeName,self.fpath,colourmap = "gray",alpha=1,colour_min_max = [10000,10001],modify_raster_values=False,old_values=[], new_values=[],NFF_opti = True)
 
@@ -917,8 +919,7 @@ class KP_plotting(object):
                                 NFF_opti = True, custom_min_max = [])
         
         # plot the basin outlines
-        Basins = LSDP.GetBasinOutlines(self.fpath, BasinsName)
-        MF.plot_polygon_outlines(Basins, linewidth = 0.5)
+        MF.plot_polygon_outlines(BM.basins, linewidth = 0.5)
 
         # add the channel network without color
         ## First calibration of the points: I calculated a ratio of niceness from different tests - Probably need more work to adapt it to different figure styles
@@ -1167,7 +1168,8 @@ class KP_plotting(object):
 
         # create the map figure
         HillshadeName = self.fprefix+'_hs'+raster_ext
-        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7)
+        BM = GetBaseMap(self.fpath, self.fprefix, coord_type="UTM_km", include_basins = False, raster_ext = raster_ext)
+        MF = MapFigure(HillshadeName, self.fpath, coord_type="UTM_km", alpha = 0.7, base_map = BM)
         MF.add_drape_image(HillshadeName,self.fpath,colourmap = "gray",alpha=1,NFF_opti = True)
         
 
@@ -34,9 +34,14 @@ from LSDMapFigure.PlottingRaster import BaseRaster
 from LSDPlottingTools import LSDMap_SAPlotting as SA
 from LSDPlottingTools import joyplot
 from . import LSDMap_MOverNPlotting as MN
+from LSDPlottingTools import LSDMap_OSystemTools as LSDOst
 import fnmatch
 import random
 
+# The lithokeys that have been read in this python session. The key is the
+# full path of the lithokey csv, the value is the LithoRegistry
+_LITHO_REGISTRIES = {}
+
 
 def litho_pre_check(directory, lk = "", fname = ""):
 	"""
@@ -95,6 +100,213 @@ def litho_pre_check(directory, lk = "", fname = ""):
 	return dict_file
 
 
+class LithoRegistry(object):
+	"""
+	This holds the lithokey of a prefix: the code (rocktype), name (ID) and
+	colour (legend) of each lithology. The colours are also kept in a dense
+	lookup table indexed by the code, so that a whole raster or a whole
+	column of codes can be coloured in one go. Use GetLithoRegistry to get
+	one, so the csv is read only once.
+
+	Args:
+		fname_prefix (str): the common prefix of all your files
+		DataDirectory (str): Path to your file with / at the end
+
+	Author: BG, SMM
+	"""
+	def __init__(self, fname_prefix, DataDirectory):
+		self.FileName = DataDirectory+fname_prefix+"_lithokey.csv"
+		self.fingerprint = LSDOst.GetFileFingerprint(self.FileName)
+
+		df = pd.read_csv(self.FileName)
+		self.has_legend = "legend" in df.columns.values
+		self.codes = df["rocktype"].values.astype(np.int64)
+		self.names = df["ID"].values
+		# negative codes (e.g. a nodata row) can't go in the lookups, they would index from the end
+		in_lut = self.codes >= 0
+		self.max_code = int(self.codes[in_lut].max()) if in_lut.any() else 0
+
+		# dense lookups from the code: the position in the key (-1 for missing codes) and the colour
+		self._position = np.full(self.max_code+1, -1, dtype=np.int64)
+		self._position[self.codes[in_lut][::-1]] = np.arange(len(self.codes))[in_lut][::-1]
+		if self.has_legend:
+			self.legend = df["legend"].values.astype(str)
+			self.rgba_lut = np.zeros((self.max_code+1, 4))
+			self.rgba_lut[self.codes[in_lut]] = colors.to_rgba_array(self.legend[in_lut])
+			self.rgba_lut[self._position < 0] = colors.to_rgba("#FFFFFF")
+
+	def check_legend(self):
+		"""
+		Stops if there isn't a legend column in the lithokey.
+
+		Author: BG
+		"""
+		if not self.has_legend:
+			print("please check your files first with -c True, I cannae find your legend column")
+			print("An alternative solution is to add a legend column in your lithokey csv file")
+			print("with an html color code for each lithologies, google html color code generator to obtain one")
+			quit()
+
+	def get_color(self, lithocode):
+		"""
+		Returns the html colour code of a lithology.
+
+		Author: BG
+		"""
+		self.check_legend()
+		return self.legend[self._lookup_position(lithocode)]
+
+	def get_code(self, name):
+		"""
+		Returns the code (rocktype) of a lithology from its name (ID).
+
+		Author: BG
+		"""
+		return self.codes[self.names == name][0]
+
+	def get_name(self, lithocode):
+		"""
+		Returns the name (ID) of a lithology from its code (rocktype).
+
+		Author: BG
+		"""
+		return self.names[self._lookup_position(lithocode)]
+
+	def _lookup_position(self, lithocode):
+		"""
+		Gets the position of a code in the lithokey.
+
+		Author: SMM
+		"""
+		lithocode = int(lithocode)
+		if lithocode < 0 or lithocode > self.max_code or self._position[lithocode] < 0:
+			raise IndexError("The lithology code "+str(lithocode)+" is not in "+self.FileName)
+		return self._position[lithocode]
+
+	def get_color_list(self, first_code, last_code, missing_colour = "#FFFFFF"):
+		"""
+		Returns the html colour codes of the codes first_code to last_code (inclusive),
+		with missing_colour for codes that are not in the lithokey.
+
+		Author: BG, SMM
+		"""
+		self.check_legend()
+		these_codes = np.arange(first_code, last_code+1)
+		in_key = (these_codes >= 0) & (these_codes <= self.max_code)
+		positions = np.full(len(these_codes), -1, dtype=np.int64)
+		positions[in_key] = self._position[these_codes[in_key]]
+		return list(np.where(positions >= 0, self.legend[np.maximum(positions, 0)], missing_colour))
+
+	def colour_array(self, litho_codes, missing_colour = (1.0, 1.0, 1.0, 0.0)):
+		"""
+		Colours an array of lithology codes (e.g. the litho raster or a column of
+		point data) with one lookup. Codes that are not in the lithokey (e.g.
+		nodata) get the missing colour, transparent by default.
+
+		Args:
+			litho_codes (array): the codes, any shape
+			missing_colour (tuple): the rgba of codes not in the lithokey
+
+		Returns:
+			array of the rgba colours, with an extra dimension of size 4
+
+		Author: SMM
+		"""
+		self.check_legend()
+		litho_codes = np.asarray(litho_codes)
+		in_key = np.isfinite(litho_codes) & (litho_codes >= 0) & (litho_codes <= self.max_code)
+		clipped = np.where(in_key, litho_codes, 0).astype(np.int64)
+		in_key &= self._position[clipped] >= 0
+		rgba = self.rgba_lut[clipped]
+		rgba[~in_key] = missing_colour
+		return rgba
+
+	def basin_fractions(self, litho_array, basin_array, basin_nodata = -9999):
+		"""
+		Gets the percentage of each lithology in each basin with a single
+		bincount over the litho raster labelled by basin.
+
+		Args:
+			litho_array (array): the lithology codes
+			basin_array (array): the basin label of each cell, the same shape as litho_array
+			basin_nodata: the label of cells outside the basins
+
+		Returns:
+			basin labels (array), and an n_basins by max_code+1 array of percentages
+
+		Author: SMM
+		"""
+		litho_array = np.ravel(litho_array)
+		basin_array = np.ravel(basin_array)
+		# cells with negative codes (nodata) are left out
+		valid = (basin_array != basin_nodata) & np.isfinite(basin_array) & np.isfinite(litho_array) & (litho_array >= 0)
+		basin_labels, basin_index = np.unique(basin_array[valid], return_inverse=True)
+		n_cells = np.bincount(basin_index, minlength=len(basin_labels))
+
+		litho_codes = litho_array[valid].astype(np.int64)
+		in_key = litho_codes <= self.max_code
+		n_codes = self.max_code+1
+		counts = np.bincount(basin_index[in_key]*n_codes+litho_codes[in_key],
+							 minlength=len(basin_labels)*n_codes).reshape(len(basin_labels), n_codes)
+		with np.errstate(invalid="ignore", divide="ignore"):
+			percentages = 100.0*counts/n_cells[:, None]
+		return basin_labels, percentages
+
+def GetLithoRegistry(fname_prefix, DataDirectory):
+	"""
+	Gets the LithoRegistry of a prefix. The lithokey is only read again if it has changed.
+
+	Args:
+		fname_prefix (str): the common prefix of all your files
+		DataDirectory (str): Path to your file with / at the end
+
+	Returns:
+		A LithoRegistry
+
+	Author: SMM
+	"""
+	FileName = DataDirectory+fname_prefix+"_lithokey.csv"
+	registry = _LITHO_REGISTRIES.get(FileName)
+	if registry is None or registry.fingerprint != LSDOst.GetFileFingerprint(FileName):
+		registry = LithoRegistry(fname_prefix, DataDirectory)
+		_LITHO_REGISTRIES[FileName] = registry
+	return registry
+
+def GetBasinLithoFractions(DataDirectory, fname_prefix, lname_prefix = "", use_keys_not_junctions = True):
+	"""
+	Gets the percentage of each lithology in each basin from the litho raster
+	and the basin raster. The result has the same layout as the percentage rows
+	of the _SBASLITH.csv from the chi mapping tool.
+
+	Args:
+		DataDirectory (str): Path to your file with / at the end
+		fname_prefix (str): the common prefix of all your files
+		lname_prefix (str): the prefix of the litho raster. Default is fname_prefix+"_LITHRAST"
+		use_keys_not_junctions (bool): If true the basins are labelled by their key, otherwise by their outlet junction
+
+	Returns:
+		pandas dataframe with the basin_id, the method and a column with the percentage of each lithology
+
+	Author: SMM
+	"""
+	if lname_prefix == "":
+		lname_prefix = fname_prefix+"_LITHRAST"
+	registry = GetLithoRegistry(fname_prefix, DataDirectory)
+	litho_array = LSDP.ReadRasterArrayBlocks(DataDirectory+lname_prefix+".bil")
+	basin_array = LSDP.ReadRasterArrayBlocks(DataDirectory+fname_prefix+"_AllBasins.bil")
+	basin_labels, percentages = registry.basin_fractions(litho_array, basin_array)
+
+	if use_keys_not_junctions:
+		BasinInfoDF = Helper.ReadBasinInfoCSV(DataDirectory, fname_prefix)
+		junction_to_key = dict(zip(BasinInfoDF['outlet_junction'], BasinInfoDF['basin_key']))
+		basin_labels = [junction_to_key.get(int(x), int(x)) for x in basin_labels]
+
+	codes = registry.codes[registry.codes >= 0]
+	df = pd.DataFrame(percentages[:, codes], columns=[str(x) for x in codes])
+	df.insert(0, "method", "percentage")
+	df.insert(0, "basin_id", basin_labels)
+	return df
+
 def getLithoColorMap(fname_prefix, DataDirectory, values = "None"):
 	"""
 		This function get the custom colormap from your lithokey file.
@@ -106,34 +318,16 @@ def getLithoColorMap(fname_prefix, DataDirectory, values = "None"):
 		@Author: BG
 		@Date: 26/09/2017
 	"""
-	df = pd.read_csv(DataDirectory+fname_prefix+"_lithokey.csv")
-	if("legend" not in df.columns.values):
-		print("please check your files first with -c True, I cannae find your legend column")
-		print("An alternative solution is to add a legend column in your lithokey csv file")
-		print("with an html color code for each lithologies, google html color code generator to obtain one")
-		quit()
-	if(values == "None"):
-		colorList = []
-		for i in range(df["rocktype"].max()):
-			if(i in df["rocktype"].values):
-				colorList.append(df["legend"][df["rocktype"] == i].values[0])
-			else:
-				colorList.append("#FFFFFF")
-
-
+	registry = GetLithoRegistry(fname_prefix, DataDirectory)
+	registry.check_legend()
+	if(isinstance(values, str) and values == "None"):
+		colorList = registry.get_color_list(0, registry.max_code-1, missing_colour = "#FFFFFF")
 
 		#Creating the colormaps
 		cm = colors.LinearSegmentedColormap.from_list("LithoColorMap", colorList, N=len(colorList))
 	else:
 		if values.shape[0]>0:
-			colorList = []
-			values_np = np.array(values)
-			for i in range(values.min(),values.max()+1):
-				if(i in df["rocktype"].values):
-					colorList.append(df["legend"][df["rocktype"] == i].values[0])
-				else:
-					colorList.append("#01FA1E")
-
+			colorList = registry.get_color_list(int(values.min()), int(values.max()), missing_colour = "#01FA1E")
 
 			#Creating the colormaps
 			if len(colorList) == 1:
@@ -162,16 +356,7 @@ def get_color_litho(fname_prefix, DataDirectory, lithocode):
 		@Date: yes
 
 	"""
-
-	df = pd.read_csv(DataDirectory+fname_prefix+"_lithokey.csv")
-	if("legend" not in df.columns.values):
-		print("please check your files first with -c True, I cannae find your legend column")
-		print("An alternative solution is to add a legend column in your lithokey csv file")
-		print("with an html color code for each lithologies, google html color code generator to obtain one")
-		quit()
-
-	cocode = df["legend"][df["rocktype"] == lithocode].values[0]
-	return cocode
+	return GetLithoRegistry(fname_prefix, DataDirectory).get_color(lithocode)
 
 
 def MakeRasterLithoBasinMap(DataDirectory, fname_prefix, lname_prefix, lithodict, size_format='ESURF', FigFormat='png', basins = True, m_chi = False, mancol = [], log_scale_river = False, minmax_m_chi = []):
@@ -249,14 +434,14 @@ def MakeRasterLithoBasinMap(DataDirectory, fname_prefix, lname_prefix, lithodict
 	# getting the right color now
 
 	color_map_litho  = getLithoColorMap(fname_prefix, DataDirectory)
-	df_litho_size = pd.read_csv(DataDirectory+fname_prefix+"_lithokey.csv")
+	registry = GetLithoRegistry(fname_prefix, DataDirectory)
 
 	MF.add_drape_image(LithoMap,DataDirectory,colourmap = color_map_litho,
 						alpha=0.6,
 						show_colourbar = False,
 						colorbarlabel = "Colourbar", discrete_cmap=False,
 						norm = "None",
-						colour_min_max = [0,df_litho_size["rocktype"].max()-1],
+						colour_min_max = [0,registry.max_code-1],
 						modify_raster_values=False,
 						old_values=[], new_values=[], cbar_type=int,
 						NFF_opti = True, custom_min_max = [])
@@ -371,10 +556,10 @@ def movern_two_litho(fname_prefix, DataDirectory, lname_prefix ='' , color_by_ba
 		quit()
 	else:
 		if isinstance(litho[0],str) and isinstance(litho[1], str):
-			#converting the litho string to litho code by reading the lithokey file
-			correspondance_pandas_DataFrame = pd.read_csv(DataDirectory+fname_prefix+"_lithokey.csv", sep =",")
-			litho[0] = correspondance_pandas_DataFrame["rocktype"][correspondance_pandas_DataFrame["ID"]==litho[0]].values[0] # ID - rocktype - legend
-			litho[1] = correspondance_pandas_DataFrame["rocktype"][correspondance_pandas_DataFrame["ID"]==litho[1]].values[0] # ID - rocktype - legend
+			#converting the litho string to litho code from the lithokey file
+			registry = GetLithoRegistry(fname_prefix, DataDirectory)
+			litho[0] = registry.get_code(litho[0])
+			litho[1] = registry.get_code(litho[1])
 
 
 
@@ -417,22 +602,20 @@ def movern_two_litho(fname_prefix, DataDirectory, lname_prefix ='' , color_by_ba
 		dfl = pd.read_csv(DataDirectory+fname_prefix+"_SBASLITH.csv", sep=",")
 		dfl = dfl[dfl["method"] == "percentage"]
 	except IOError:
-		print("You don't have the requested lithology file that summarize the basin informations") # TODO: Explain this error
-		quit()
-	# Add the lithologic informations
-	df["litho_percent"] = pd.Series(np.zeros(df.shape[0]), index=df.index)
-	# getting the litho infos
-	for i in df["basin_key"].unique():
-		first_percentage = dfl[str(litho[0])][dfl["basin_id"]==i].values
-		second_percentage = dfl[str(litho[1])][dfl["basin_id"]==i].values
-		tot = first_percentage+second_percentage
-
-		# Normalization to 100 %
-		if( tot != 100 and normalization):
-			first_percentage = first_percentage*100/tot
-			second_percentage = second_percentage*100/tot
-		# setting the value
-		df["litho_percent"][df["basin_key"]==i] = second_percentage
+		if lname_prefix == "":
+			lname_prefix = fname_prefix+"_LITHRAST"
+		if not os.path.isfile(DataDirectory+lname_prefix+".bil"):
+			print("You don't have the requested lithology file that summarize the basin informations") # TODO: Explain this error
+			quit()
+		print("I didn't find the _SBASLITH.csv so I am getting the lithology of each basin from the rasters")
+		dfl = GetBasinLithoFractions(DataDirectory, fname_prefix, lname_prefix)
+	# Add the lithologic informations, normalised to 100 % if you want
+	dfl = dfl.drop_duplicates("basin_id").set_index("basin_id")
+	first_percentage = df["basin_key"].map(dfl[str(litho[0])])
+	second_percentage = df["basin_key"].map(dfl[str(litho[1])])
+	if normalization:
+		second_percentage = second_percentage*100/(first_percentage+second_percentage)
+	df["litho_percent"] = second_percentage
 
 
 
@@ -562,9 +745,9 @@ def movern_two_litho(fname_prefix, DataDirectory, lname_prefix ='' , color_by_ba
 
 	#Now deal with the Lithology names
 
-	correspondance_pandas_DataFrame = pd.read_csv(DataDirectory+fname_prefix+"_lithokey.csv", sep =",")
-	litho_wanne = correspondance_pandas_DataFrame["ID"][correspondance_pandas_DataFrame["rocktype"]==litho[0]].values[0] # ID - rocktype - legend
-	litho_tou = correspondance_pandas_DataFrame["ID"][correspondance_pandas_DataFrame["rocktype"]==litho[1]].values[0] # ID - rocktype - legend
+	registry = GetLithoRegistry(fname_prefix, DataDirectory)
+	litho_wanne = registry.get_name(litho[0])
+	litho_tou = registry.get_name(litho[1])
 
 	ax.set_xticks([0,25,50,75,100])
 	ax.set_xticklabels([litho_wanne,'',"50",'',litho_tou])
@@ -716,19 +899,23 @@ def MakeChiPlotsByLith(DataDirectory, fname_prefix, basin_list=[0], start_movern
 			#max_K = np.max(K_array)
 			#seal_the_seal = pd.concat(TributariesK,MainStemK)
 
-			this_cmap = getLithoColorMap(fname_prefix, DataDirectory, values = ProfileDF_basin[fname_prefix+"_geol"].unique())
+			basin_K = ProfileDF_basin[fname_prefix+"_geol"].unique()
+			this_cmap = getLithoColorMap(fname_prefix, DataDirectory, values = basin_K)
 			n_colours = 10
 
-			#cNorm  = colors.Normalize(vmin=min_K, vmax=max_K)
-			#plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
+			# now plot the data coloured straight from the lithokey, so each lithology
+			# gets its own legend colour whatever the range of codes in each scatter
+			registry = GetLithoRegistry(fname_prefix, DataDirectory)
+			missing_colour = colors.to_rgba("#01FA1E")
+			ax.scatter(TributariesX,TributariesElevation,c=registry.colour_array(TributariesK, missing_colour = missing_colour), s=2.5, edgecolors='none')
+			ax.scatter(MainStemX, MainStemElevation,c=registry.colour_array(MainStemK, missing_colour = missing_colour), s=2.5, edgecolors='none')
 
-			# now plot the data with a colourmap
+			# the colourbar still needs a scalar mappable over the codes of this basin
 			if(isinstance(this_cmap,str)):
-				sc = ax.scatter(TributariesX,TributariesElevation,c=this_cmap, s=2.5, edgecolors='none')
-				sc = ax.scatter(MainStemX, MainStemElevation,c=this_cmap, s=2.5, edgecolors='none')
-			else:
-				sc = ax.scatter(TributariesX,TributariesElevation,c=TributariesK,cmap=this_cmap, s=2.5, edgecolors='none')
-				sc = ax.scatter(MainStemX, MainStemElevation,c=MainStemK,cmap=this_cmap, s=2.5, edgecolors='none')
+				this_cmap = colors.ListedColormap([this_cmap])
+			cNorm  = colors.Normalize(vmin=basin_K.min(), vmax=basin_K.max())
+			sc = plt.cm.ScalarMappable(norm=cNorm, cmap=this_cmap)
+			sc.set_array(basin_K)
 
 			# some formatting of the figure
 			ax.spines['top'].set_linewidth(1)
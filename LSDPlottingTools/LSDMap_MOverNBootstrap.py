@@ -0,0 +1,291 @@
+## LSDMap_MOverNBootstrap.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## Bootstrap estimates of the uncertainty of m/n (the concavity index).
+## These resample the slope-area and chi profile data written by the chi
+## mapping tool, so you can get uncertainty bounds on m/n without running the
+## MC points analysis in LSDTopoTools again.
+##
+## Each basin gets its own random number stream (made from one seed and the
+## basin key, so the results are reproducible whatever the number of workers
+## or the basins you pick), and the basins
+## are shared out to a pool of worker processes. Within a basin all the
+## resamples are done at once with count matrices (see
+## statsutilities.bootstrap_counts).
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## SMM
+## 19/10/2026
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import multiprocessing
+import numpy as np
+import pandas as pd
+import LSDPlottingTools.statsutilities as LSDStats
+from LSDMapFigure import PlottingHelpers as Helper
+
+
+def GetMOverNString(m_over_n):
+    """
+    Gets the m/n as it is written in the column names of the chi mapping tool
+    csv files (e.g. 0.2, 0.25, 0.3).
+
+    Author: SMM
+    """
+    movern_str = "%.2f" % round(m_over_n,2)
+    if movern_str.endswith('0'):
+        movern_str = movern_str[:-1]
+    return movern_str
+
+def GetBasinSeeds(basin_keys, seed = 1):
+    """
+    Gets an independent random number seed for each basin. Each one is made from
+    the seed and the basin key, so you get the same numbers for a basin no matter
+    how many workers there are or which other basins are in the list.
+
+    Args:
+        basin_keys (list): the basin keys
+        seed (int): the seed for the whole analysis
+
+    Returns:
+        A dict where the key is the basin key and the value is a numpy SeedSequence
+
+    Author: SMM
+    """
+    return {basin_key: np.random.SeedSequence([seed, int(basin_key)]) for basin_key in basin_keys}
+
+def _RunBasinTasks(worker, tasks, n_workers):
+    """
+    Runs one task per basin, in a pool of worker processes if there is more than one worker.
+
+    Author: SMM
+    """
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, len(tasks)))
+
+    print("Bootstrapping "+str(len(tasks))+" basins with "+str(n_workers)+" workers")
+    if n_workers == 1:
+        return [worker(task) for task in tasks]
+
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        results = pool.map(worker, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## Slope-area data
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+def _BootstrapSABasin(task):
+    """
+    Bootstraps the log S - log A regression of one basin.
+
+    Author: SMM
+    """
+    basin_key, seed_sequence, logA, logS, n_resamples = task
+    rng = np.random.default_rng(seed_sequence)
+    movern = np.abs(LSDStats.bootstrap_linregress_slopes(logA, logS, n_resamples, rng))
+    movern = movern[np.isfinite(movern)]
+    if len(movern) == 0:
+        return [basin_key, np.nan, np.nan, np.nan, np.nan]
+    FirstQ, median, ThirdQ = np.percentile(movern, [25, 50, 75])
+    return [basin_key, median, np.std(movern), FirstQ, ThirdQ]
+
+def BootstrapMOverNRawSAData(DataDirectory, fname_prefix, basin_list=[], n_resamples = 1000,
+                             seed = 1, n_workers = None, parallel = False):
+    """
+    This function bootstraps the linear regression of the raw slope-area data
+    in each basin: the nodes are resampled with replacement n_resamples times
+    and the m/n is the slope of the log S - log A regression of each resample.
+
+    Args:
+        DataDirectory (str): the data directory
+        fname_prefix (str): the prefix of the DEM
+        basin_list: a list of the basins to analyse, default = empty (all basins)
+        n_resamples (int): the number of bootstrap resamples in each basin
+        seed (int): the random seed. The same seed gives the same results.
+        n_workers (int): the number of worker processes. Default is one per cpu, 1 does them here.
+        parallel (bool): If true the data is in several files, one from each of the parallel runs
+
+    Returns:
+        pandas dataframe with the basin key and the columns of the m/n summary csv:
+        'SA_raw' (the median m/n of the resamples), 'SA_raw_sterr' (their standard deviation),
+        'SA_raw_min' and 'SA_raw_max' (their first and third quartiles)
+
+    Author: SMM
+    """
+    if not parallel:
+        df = Helper.ReadRawSAData(DataDirectory, fname_prefix)
+    else:
+        df = Helper.AppendRawSAData(DataDirectory, fname_prefix)
+
+    if len(basin_list) == 0:
+        print ("You didn't give me a basin list so I will analyse all the basins")
+        basin_list = list(df['basin_key'].unique())
+
+    df = df[(df['drainage_area'] != 0) & df['basin_key'].isin(basin_list)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logA = np.log10(df['drainage_area'].values)
+        logS = np.log10(df['slope'].values)
+
+    # split the data by basin with one sort
+    basin_keys = df['basin_key'].values
+    order = np.argsort(basin_keys, kind='stable')
+    sorted_keys = basin_keys[order]
+    seeds = GetBasinSeeds(list(basin_list), seed)
+
+    tasks = []
+    for basin_key in basin_list:
+        start = np.searchsorted(sorted_keys, basin_key, side='left')
+        end = np.searchsorted(sorted_keys, basin_key, side='right')
+        these_nodes = order[start:end]
+        tasks.append((basin_key, seeds[basin_key], logA[these_nodes], logS[these_nodes], n_resamples))
+
+    results = _RunBasinTasks(_BootstrapSABasin, tasks, n_workers)
+    return pd.DataFrame(results, columns=['basin_key', 'SA_raw', 'SA_raw_sterr', 'SA_raw_min', 'SA_raw_max'])
+
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## Chi-elevation collinearity
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+def GetCollinearityResiduals(MainStemChi, MainStemElevation, TributaryChi, TributaryElevation):
+    """
+    Gets the elevation of each tributary node minus the elevation of the main
+    stem at the same chi, for every m/n at once. Tributary nodes beyond the
+    chi of the main stem get a residual of 0 so they don't count.
+
+    Args:
+        MainStemChi (array): n_main_stem_nodes by n_movern array of chi
+        MainStemElevation (array): the elevation of the main stem nodes
+        TributaryChi (array): n_tributary_nodes by n_movern array of chi
+        TributaryElevation (array): the elevation of the tributary nodes
+
+    Returns:
+        n_tributary_nodes by n_movern array of residuals
+
+    Author: SMM
+    """
+    residuals = np.zeros(TributaryChi.shape)
+    for j in range(TributaryChi.shape[1]):
+        order = np.argsort(MainStemChi[:,j])
+        chi_ms = MainStemChi[order,j]
+        predicted = np.interp(TributaryChi[:,j], chi_ms, MainStemElevation[order])
+        in_range = (TributaryChi[:,j] >= chi_ms[0]) & (TributaryChi[:,j] <= chi_ms[-1])
+        residuals[in_range,j] = TributaryElevation[in_range]-predicted[in_range]
+    return residuals
+
+def _BootstrapChiBasin(task):
+    """
+    Bootstraps the collinearity MLE of one basin. Everything is done with the
+    log of the MLE, since with lots of nodes or a small sigma the MLE itself
+    underflows to 0 for every m/n.
+
+    Returns:
+        the basin key, the log MLE of all the data and the quartiles of the log MLE of the resamples
+
+    Author: SMM
+    """
+    basin_key, seed_sequence, MainStemChi, MainStemElevation, TributaryChi, TributaryElevation, sigma, n_resamples = task
+    n_movern = MainStemChi.shape[1]
+    if len(TributaryElevation) == 0 or len(MainStemElevation) < 2:
+        print("Basin "+str(basin_key)+" doesn't have any tributaries to compare with the main stem")
+        return basin_key, np.full(n_movern, np.nan), np.full((3,n_movern), np.nan)
+
+    squared_residuals = GetCollinearityResiduals(MainStemChi, MainStemElevation, TributaryChi, TributaryElevation)**2
+    full_log_MLE = -squared_residuals.sum(axis=0)/(2*sigma**2)
+
+    # the sum of the squared residuals of each resample, for all the resamples and m/n values at once
+    rng = np.random.default_rng(seed_sequence)
+    n_nodes = len(TributaryElevation)
+    block = max(1, min(n_resamples, 10000000//n_nodes))
+    resampled_log_MLE = np.empty((n_resamples, n_movern))
+    for start in range(0, n_resamples, block):
+        n_block = min(block, n_resamples-start)
+        counts = LSDStats.bootstrap_counts(rng, n_nodes, n_block)
+        resampled_log_MLE[start:start+n_block] = -counts.dot(squared_residuals)/(2*sigma**2)
+
+    return basin_key, full_log_MLE, np.percentile(resampled_log_MLE, [25, 50, 75], axis=0)
+
+def BootstrapMOverNChiData(DataDirectory, fname_prefix, basin_list=[], start_movern=0.2, d_movern=0.1, n_movern=7,
+                           n_resamples = 1000, sigma = 1000, seed = 1, n_workers = None, parallel = False):
+    """
+    This function bootstraps the collinearity test of the chi profiles. For each
+    m/n the elevations of the tributaries are compared with the main stem (the
+    first source in the basin) at the same chi, and the MLE is
+    exp(-sum(residuals^2)/(2 sigma^2)). The tributary nodes are then resampled
+    with replacement n_resamples times to get the spread of the MLE. The best
+    fit m/n is found from the log of the MLE, so it is still right when the
+    MLE is too small to represent (it is then 0 in the MLE columns).
+
+    It needs the profile csv with chi for every m/n (the one with the extension
+    "_movern.csv"), and gives back a dataframe with the same columns as the MC
+    points csv from the chi mapping tool, so GetMOverNRangeMCPoints can be used on it.
+
+    Args:
+        DataDirectory (str): the data directory with the m/n csv files
+        fname_prefix (str): The prefix for the m/n csv files
+        basin_list: a list of the basins to analyse, default = empty (all basins)
+        start_movern (float): the starting m/n value. Default is 0.2
+        d_movern (float): the increment between the m/n values. Default is 0.1
+        n_movern (float): the number of m/n values analysed. Default is 7.
+        n_resamples (int): the number of bootstrap resamples in each basin
+        sigma (float): the sigma used in the MLE, same as collinearity_MLE_sigma in the chi mapping tool
+        seed (int): the random seed. The same seed gives the same results.
+        n_workers (int): the number of worker processes. Default is one per cpu, 1 does them here.
+        parallel (bool): If true the data is in several files, one from each of the parallel runs
+
+    Returns:
+        MCPointsDF: pandas dataframe with 'basin_key' and the 'median_MLE_m_over_n=', 'FQ_MLE_m_over_n='
+        and 'TQ_MLE_m_over_n=' columns of the resampled MLE for each m/n
+        FullMOverNDict: dict with the best fit m/n of all the data in each basin
+
+    Author: SMM
+    """
+    if not parallel:
+        ProfileDF = Helper.ReadChiProfileCSV(DataDirectory, fname_prefix)
+    else:
+        ProfileDF = Helper.AppendMovernCSV(DataDirectory, fname_prefix)
+
+    if len(basin_list) == 0:
+        print("You didn't give me a list of basins, so I'll just run the analysis on all of them!")
+        basin_list = list(ProfileDF['basin_key'].unique())
+
+    end_movern = float(start_movern)+float(d_movern)*(float(n_movern)-1)
+    m_over_n_values = np.linspace(start_movern,end_movern,n_movern)
+    movern_strs = [GetMOverNString(m_over_n) for m_over_n in m_over_n_values]
+    chi = ProfileDF[['m_over_n = '+movern_str for movern_str in movern_strs]].values.astype(np.float64)
+    elevation = ProfileDF['elevation'].values.astype(np.float64)
+    basin_keys = ProfileDF['basin_key'].values
+    source_keys = ProfileDF['source_key'].values
+
+    seeds = GetBasinSeeds(list(basin_list), seed)
+    tasks = []
+    for basin_key in basin_list:
+        in_basin = np.flatnonzero(basin_keys == basin_key)
+        if len(in_basin) == 0:
+            print("You were looking for basin "+str(basin_key)+ " but it isn't in the profile data.")
+            main_stem = tributaries = in_basin
+        else:
+            # the main stem is the first source in the basin
+            is_main_stem = source_keys[in_basin] == source_keys[in_basin[0]]
+            main_stem = in_basin[is_main_stem]
+            tributaries = in_basin[~is_main_stem]
+        tasks.append((basin_key, seeds[basin_key], chi[main_stem], elevation[main_stem],
+                      chi[tributaries], elevation[tributaries], sigma, n_resamples))
+
+    results = _RunBasinTasks(_BootstrapChiBasin, tasks, n_workers)
+
+    FullMOverNDict = {}
+    columns = {'basin_key': [result[0] for result in results]}
+    for j, movern_str in enumerate(movern_strs):
+        columns['FQ_MLE_m_over_n='+movern_str] = [np.exp(result[2][0,j]) for result in results]
+        columns['median_MLE_m_over_n='+movern_str] = [np.exp(result[2][1,j]) for result in results]
+        columns['TQ_MLE_m_over_n='+movern_str] = [np.exp(result[2][2,j]) for result in results]
+    for basin_key, full_log_MLE, quartiles in results:
+        if np.all(np.isnan(full_log_MLE)):
+            FullMOverNDict[basin_key] = np.nan
+        else:
+            FullMOverNDict[basin_key] = float(movern_strs[int(np.nanargmax(full_log_MLE))])
+
+    return pd.DataFrame(columns), FullMOverNDict
@@ -30,8 +30,10 @@ from matplotlib import cm
 from LSDMapFigure import PlottingHelpers as Helper
 from LSDMapFigure.PlottingRaster import MapFigure
 from LSDMapFigure.PlottingRaster import BaseRaster
+from LSDMapFigure.PlottingBaseMap import GetBaseMap
 from LSDPlottingTools import LSDMap_SAPlotting as SA
 from LSDPlottingTools import joyplot
+from LSDPlottingTools import LSDMap_MOverNBootstrap as MOverNBootstrap
 
 #===========================================
 # Function to make a figure object
@@ -161,7 +163,7 @@ def GetMOverNRangeMCPoints(BasinDF, start_movern=0.2, d_movern=0.1, n_movern=7):
     ThirdQDF['threshold'] = pd.Series(FirstQF_MLEs, index=ThirdQDF.index)
     print (ThirdQDF)
     # change DF to a boolean where values are greater than the threshold
-    TempDF = ThirdQDF.drop('threshold', 1).gt(ThirdQDF['threshold'], 0)
+    TempDF = ThirdQDF.drop('threshold', axis=1).gt(ThirdQDF['threshold'], axis=0)
     # get the column names where the values are greater than the threshold for each basin
     TempDF['Range_MOverNs'] = TempDF.apply(lambda x: ','.join(x.index[x]),axis=1)
 
@@ -406,7 +408,8 @@ def CompareChiAndSAMOverN(DataDirectory, fname_prefix, basin_list=[0], start_mov
     # Now plot the figure
     PlotMOverNDicts(DataDirectory, fname_prefix, SA_movern_dict,best_fit_movern_dict, FigFormat = "png", size_format = "ESURF")
 
-def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7, parallel=False, Chi_disorder=False):
+def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0], start_movern=0.2, d_movern=0.1, n_movern=7, parallel=False, Chi_disorder=False,
+                                     native_bootstrap=False, n_resamples=1000, bootstrap_seed=1, n_workers=None):
     """
     This function reads in all the files with the data for the various methods of estimating
     the best fit m/n and produces a summary csv file which has the best fit m/n and uncertainty
@@ -421,6 +424,11 @@ def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0]
         d_movern (float): the increment between the m/n values. Default is 0.1
         n_movern (float): the number of m/n values analysed. Default is 7.
         Chi_disorder (bool): If true, will include the chi disorder stats
+        native_bootstrap (bool): If true, the chi bootstrap columns and the S-A uncertainty come from
+        resampling the data here (see LSDMap_MOverNBootstrap) rather than from the MC points csv
+        n_resamples (int): The number of resamples in each basin for the native bootstrap
+        bootstrap_seed (int): The random seed for the native bootstrap
+        n_workers (int): The number of worker processes for the native bootstrap. Default is one per cpu.
 
     Returns:
         writes a csv with the best fit m/n info for each basin
@@ -463,12 +471,23 @@ def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0]
     OutDF['basin_key'] = pd.Series(basin_list)
 
     # get the best fit m/n for each basin in the list from the full chi method
-    if bootstrap_exists:
+    if bootstrap_exists and not native_bootstrap:
         FullChiMOverNDict = SimpleMaxMLECheck(FullChiBasinDF)
         OutDF['Chi_MLE_full'] = OutDF['basin_key'].map(FullChiMOverNDict)
 
     # get the best fit m/n from the points method
-    if bootstrap_exists:
+    if native_bootstrap:
+        print("I am bootstrapping the chi profiles myself")
+        PointsChiBasinDF, FullChiMOverNDict = MOverNBootstrap.BootstrapMOverNChiData(DataDirectory, fname_prefix, basin_list,
+                                                    start_movern, d_movern, n_movern, n_resamples=n_resamples,
+                                                    seed=bootstrap_seed, n_workers=n_workers, parallel=parallel)
+        OutDF['Chi_MLE_full'] = OutDF['basin_key'].map(FullChiMOverNDict)
+
+        UncertaintyDF = GetMOverNRangeMCPoints(PointsChiBasinDF, start_movern, d_movern, n_movern)
+        OutDF['Chi_MLE_points'] = UncertaintyDF['Median_MOverNs']
+        OutDF['Chi_MLE_points_min'] = UncertaintyDF['Min_MOverNs']
+        OutDF['Chi_MLE_points_max'] = UncertaintyDF['Max_MOverNs']
+    elif bootstrap_exists:
         if not parallel:
             PointsChiBasinDF = Helper.ReadMCPointsCSV(DataDirectory,fname_prefix)
         else:
@@ -496,6 +515,14 @@ def CompareMOverNEstimatesAllMethods(DataDirectory, fname_prefix, basin_list=[0]
         OutDF['SA_raw_sterr'] = RawSADF['std_err']
         OutDF['SA_raw_R2'] = RawSADF['R2']
         OutDF['SA_raw_p'] = RawSADF['p_value']
+        if native_bootstrap:
+            # the error bars come from the spread of the bootstrapped regressions
+            SABootstrapDF = MOverNBootstrap.BootstrapMOverNRawSAData(DataDirectory, fname_prefix, basin_list,
+                                                    n_resamples=n_resamples, seed=bootstrap_seed,
+                                                    n_workers=n_workers, parallel=parallel)
+            OutDF['SA_raw_sterr'] = SABootstrapDF['SA_raw_sterr']
+            OutDF['SA_raw_min'] = SABootstrapDF['SA_raw_min']
+            OutDF['SA_raw_max'] = SABootstrapDF['SA_raw_max']
     except ValueError:
         print("Your Slope-area data is somehow empty or not conform... I am skipping it and data will be 0")
         OutDF['SA_raw'] = pd.Series(data = np.zeros(OutDF.shape[0]), index = OutDF.index)
@@ -3165,8 +3192,12 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
     HillshadeName = fname_prefix+'_hs'+raster_ext
     BasinsName = fname_prefix+'_AllBasins'+raster_ext
 
-    # create the map figure
-    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", colourbar_location='None')
+    # create the map figure. The hillshade and basins come from the cached base map
+    if not parallel:
+        BM = GetBaseMap(DataDirectory, fname_prefix, coord_type="UTM_km", raster_ext = raster_ext)
+    else:
+        BM = None
+    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", colourbar_location='None', base_map = BM)
 
     # add the basins drape
     MF.add_basin_plot(BasinsName,fname_prefix,DataDirectory,
@@ -3176,7 +3207,7 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
 
     # add the basin outlines ### need to parallelise
     if not parallel:
-      Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
+      Basins = BM.basins
     else:
       Basins = LSDP.GetMultipleBasinOutlines(DataDirectory)
 
@@ -3194,7 +3225,7 @@ def MakeRasterPlotsBasins(DataDirectory, fname_prefix, size_format='ESURF', FigF
     label_dict = dict(zip(basin_junctions,basin_keys))
 
     if not parallel:
-      Points = LSDP.GetPointWithinBasins(DataDirectory, BasinsName)
+      Points = BM.get_representative_points()
     else:
       Points = LSDP.GetPointsWithinMultipleBasins(DataDirectory, BasinsName)
 
@@ -3342,7 +3373,11 @@ def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_mover
 
     print ("THE TITLE IS:"+title)
     # create the map figure
-    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", plot_title=title)
+    if not parallel:
+        BM = GetBaseMap(DataDirectory, fname_prefix, coord_type="UTM_km", raster_ext = raster_ext)
+    else:
+        BM = None
+    MF = MapFigure(HillshadeName, DataDirectory,coord_type="UTM_km", plot_title=title, base_map = BM)
     # add the basins drape
     if lith:
 
@@ -3366,7 +3401,7 @@ def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_mover
 
     # add the basin outlines
     if not parallel:
-      Basins = LSDP.GetBasinOutlines(DataDirectory, BasinsName)
+      Basins = BM.basins
     else:
       Basins = LSDP.GetMultipleBasinOutlines(DataDirectory)
 
@@ -3382,7 +3417,7 @@ def MakeRasterPlotsMOverN(DataDirectory, fname_prefix, start_movern=0.2, n_mover
 
     # add the basin labelling
     if not parallel:
-      Points = LSDP.GetPointWithinBasins(DataDirectory, BasinsName)
+      Points = BM.get_representative_points()
     else:
       Points = LSDP.GetPointsWithinMultipleBasins(DataDirectory, BasinsName)
 
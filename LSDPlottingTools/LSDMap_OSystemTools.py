@@ -216,3 +216,21 @@ def ParseListToType(A_list):
     
         
         
+
+# This gets a fingerprint of a file (or list of files) from the size and the
+# modification time. It is used to decide if cached products made from a
+# file (base maps, basin polygons, etc.) are still valid. Missing files
+# get a fingerprint of -1 so that they invalidate the cache once they appear.
+def GetFileFingerprint(filenames):
+    if isinstance(filenames, str):
+        filenames = [filenames]
+
+    fingerprint_list = []
+    for filename in filenames:
+        if os.path.isfile(filename):
+            stat_result = os.stat(filename)
+            fingerprint_list.append(GetFileNameNoPath(filename)+":"+str(stat_result.st_size)+":"+str(int(stat_result.st_mtime*1e6)))
+        else:
+            fingerprint_list.append(GetFileNameNoPath(filename)+":-1")
+
+    return "|".join(fingerprint_list)
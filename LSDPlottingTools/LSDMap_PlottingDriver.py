@@ -8,9 +8,74 @@ Created on Sun Jan 29 10:20:18 2017
 import LSDPlottingTools.LSDMap_ChiPlotting as LSDMap_CP
 import LSDPlottingTools.LSDMap_BasicPlotting as LSDMap_BP
 import LSDPlottingTools.LSDMap_OSystemTools as LSDOst
+import LSDPlottingTools.LSDMap_GDALIO as LSDMap_IO
 import os
 import sys
 import ast
+import time
+
+# What each plotting switch needs. "inputs" are the files that have to exist
+# before we start, "optional_inputs" are files that are used if the parameter
+# isn't "None", and "fig_suffix" is used to make the default figure name.
+# Switches that are not in here are recognised but not implemented yet.
+_PLOT_REQUIREMENTS = {
+    "BasicDensityPlot": {"inputs": ["base_raster"], "optional_inputs": [], "fig_suffix": "BDP"},
+    "BasicDrapedPlotGridPlot": {"inputs": ["base_raster", "DrapeName"], "optional_inputs": [], "fig_suffix": "BDPDPG"},
+    "BasinsOverFancyHillshade": {"inputs": ["base_raster", "hillshade", "basins", "basin_csv"], "optional_inputs": ["chan_net_csv"], "fig_suffix": "Basins"},
+    "BasicChiCoordinatePlot": {"inputs": ["hillshade", "chi_raster", "basic_chi_csv", "basin_csv", "basins"], "optional_inputs": [], "fig_suffix": "Chi"},
+    "ChiProfiles": {"inputs": ["chi_csv"], "optional_inputs": [], "fig_suffix": "ChiProfile"}
+    }
+
+
+class LSDMap_PlottingPlan(object):
+    """This is a compiled parameter file: the list of plots to make, each with
+    its typed parameters and the full paths of the files it needs. It is made
+    by LSDMap_PlottingDriver.compile_plan, which checks everything before any data is read.
+
+    Attributes:
+        steps (list): One dict per plot with the keys "switch", "inputs" (a dict of file paths),
+            "parameters" (a dict of typed parameters) and "FigFileName"
+        timings (dict): The time in seconds each stage took, filled in when the plan is executed
+
+    Author: SMM
+    """
+    def __init__(self, FilePrefix, steps):
+        self.FilePrefix = FilePrefix
+        self.steps = steps
+        self.timings = {}
+
+    def get_input_files(self):
+        """Gets all the input files of the plan, each once.
+
+        Author: SMM
+        """
+        input_files = []
+        for step in self.steps:
+            for fname in step["inputs"].values():
+                if fname not in input_files:
+                    input_files.append(fname)
+        return input_files
+
+    def print_plan(self):
+        """Prints the plan.
+
+        Author: SMM
+        """
+        print("The plan for "+self.FilePrefix+" has "+str(len(self.steps))+" plots:")
+        for step in self.steps:
+            print("  "+step["switch"]+" -> "+step["FigFileName"])
+            for key in sorted(step["inputs"]):
+                print("      "+key+": "+step["inputs"][key])
+
+    def print_timings(self):
+        """Prints the time each stage took.
+
+        Author: SMM
+        """
+        print("Timings for "+self.FilePrefix+":")
+        for key in self.timings:
+            print("  "+key+": "+str(round(self.timings[key],3))+" s")
+
 
 class LSDMap_PlottingDriver(object):
     
@@ -194,10 +259,31 @@ class LSDMap_PlottingDriver(object):
                     self.bool_default_parameters[key] = False
 
         # now the parameters that are numbers (this can include lists)
+        # Anything that doesn't parse, or isn't the same sort of thing as the default,
+        # is kept in parameter_errors and reported when the plan is compiled.
+        self.parameter_errors = []
         for key in self.num_default_parameters:
             if key in self.parameter_dict:
                 print("I found the parameter: "+str(key)+ " in the parameter file.")
-                self.num_default_parameters[key]  = ast.literal_eval(self.parameter_dict[key])               
+                try:
+                    this_value = ast.literal_eval(self.parameter_dict[key])
+                except (ValueError, SyntaxError):
+                    self.parameter_errors.append("The parameter "+key+" should be a number or a list, but it is: "+self.parameter_dict[key])
+                    continue
+
+                default_value = self.num_default_parameters[key]
+                if isinstance(default_value, (list, tuple)):
+                    if not isinstance(this_value, (list, tuple)):
+                        self.parameter_errors.append("The parameter "+key+" should be a list, but it is: "+self.parameter_dict[key])
+                        continue
+                    if isinstance(default_value, tuple) and len(this_value) != len(default_value):
+                        self.parameter_errors.append("The parameter "+key+" should have "+str(len(default_value))+" values, but it is: "+self.parameter_dict[key])
+                        continue
+                elif isinstance(this_value, bool) or not isinstance(this_value, (int, float)):
+                    self.parameter_errors.append("The parameter "+key+" should be a number, but it is: "+self.parameter_dict[key])
+                    continue
+
+                self.num_default_parameters[key]  = this_value
                 print("The value is: "+str(self.num_default_parameters[key]))
 
         # now the parameters that are strings
@@ -216,136 +302,225 @@ class LSDMap_PlottingDriver(object):
         # reset the defaults, just to be safe
         self.create_default_parameters()
                 
+    def get_input_filename(self, input_name):
+        """This gets the full path of one of the inputs a plot can need.
+
+        Args:
+            input_name (str): The name of the input, e.g. "hillshade" or the name of a parameter that is a filename
+
+        Author: SMM
+        """
+        input_fnames = {"base_raster": self.base_faster_fname,
+                        "hillshade": self.hs_fname,
+                        "basins": self.basin_fname,
+                        "chi_raster": self.chi_raster_fname,
+                        "chi_csv": self.chi_csv_fname,
+                        "basic_chi_csv": self.basic_chi_csv_fname,
+                        "basin_csv": self.basin_csv_fname}
+        if input_name in input_fnames:
+            fname = input_fnames[input_name]
+        else:
+            # Otherwise it is a parameter. Relative names are relative to the parameter file
+            fname = self.plotting_parameters[input_name]
+            if not os.path.isabs(fname) and not os.path.isfile(fname):
+                fname = self.FilePath+fname
+
+        # normalise the name so the same file is only loaded once
+        return os.path.normpath(fname)
+
+    def compile_plan(self):
+        """This turns the parameter file into a plan: the list of plots, with their
+        parameters and input files. Everything is checked here, so if anything
+        is missing or wrong you find out before any data is read.
+
+        Returns:
+            A LSDMap_PlottingPlan
+
+        Author: SMM
+        """
+        errors = list(self.parameter_errors)
+
+        # warn about keywords we don't know, these are usually typos
+        known_keys = ["file_prefix"]+list(self.plotting_switches)+list(self.plotting_parameters)
+        for key in self.parameter_dict:
+            if key not in known_keys:
+                print("Warning: I don't know the keyword "+key+", I am ignoring it. Is it a typo?")
+
+        steps = []
+        for switch in self.plotting_switches:
+            if not self.plotting_switches[switch]:
+                continue
+            if switch not in _PLOT_REQUIREMENTS:
+                print("Warning: the plot "+switch+" isn't implemented in the driver yet. Skipping it.")
+                continue
+
+            requirements = _PLOT_REQUIREMENTS[switch]
+            inputs = {}
+            for input_name in requirements["inputs"]:
+                if input_name in self.plotting_parameters and self.plotting_parameters[input_name] == "None":
+                    errors.append("The plot "+switch+" needs the parameter "+input_name)
+                    continue
+                inputs[input_name] = self.get_input_filename(input_name)
+            for input_name in requirements["optional_inputs"]:
+                if self.plotting_parameters[input_name] != "None":
+                    inputs[input_name] = self.get_input_filename(input_name)
+
+            for input_name in inputs:
+                if not os.path.isfile(inputs[input_name]):
+                    errors.append("The plot "+switch+" needs the file "+inputs[input_name]+" ("+input_name+") but it doesn't exist")
+
+            # Each plot gets its own default figure name
+            FigFileName = self.plotting_parameters["FigFileName"]
+            if FigFileName == "None":
+                FigFileName = self.FilePath+os.sep+self.FilePrefix+requirements["fig_suffix"]+"."+self.plotting_parameters["FigFormat"]
+
+            steps.append({"switch": switch, "inputs": inputs,
+                          "parameters": dict(self.plotting_parameters),
+                          "FigFileName": FigFileName})
+
+        if len(errors) != 0:
+            for error in errors:
+                print("Error: "+error)
+            raise Exception("The parameter file has "+str(len(errors))+" problems, I haven't plotted anything. See the errors above.")
+
+        plan = LSDMap_PlottingPlan(self.FilePrefix, steps)
+        plan.print_plan()
+        return plan
+
+    def execute_plan(self, plan):
+        """This makes the plots in a plan. The rasters and csv files are loaded
+        once and shared by all the plots that need them, and the time each plot takes is recorded in plan.timings.
+
+        Args:
+            plan (LSDMap_PlottingPlan): The plan from compile_plan
+
+        Author: SMM
+        """
+        import LSDPlottingTools.LSDMap_PointTools as LSDMap_PD
+
+        # The point data used by the plots, loaded the first time it is needed
+        point_data = {}
+        def get_point_data(fname):
+            if fname not in point_data:
+                start_time = time.time()
+                point_data[fname] = LSDMap_PD.LSDMap_PointData(fname)
+                plan.timings["load "+LSDOst.GetFileNameNoPath(fname)] = time.time()-start_time
+            return point_data[fname]
+
+        # The plotting functions read the rasters themselves, the cache means
+        # a raster shared by several plots is only read once
+        LSDMap_IO.EnableRasterReadCache()
+        try:
+            for step in plan.steps:
+                start_time = time.time()
+                getattr(self, "_plot_"+step["switch"])(step, get_point_data)
+                plan.timings[step["switch"]] = time.time()-start_time
+        finally:
+            LSDMap_IO.DisableRasterReadCache()
+
+        plan.print_timings()
+
     def plot_data(self):
-        """This is the bit that actually plots the data.
+        """This is the bit that actually plots the data. It compiles the plan and then executes it.
         
         """
-        import LSDPlottingTools.LSDMap_PointTools as LSDMap_PD
+        plan = self.compile_plan()
+        self.execute_plan(plan)
+        return plan
 
-            
-        if self.plotting_switches["BasicDensityPlot"]: 
-            
-            # Check to see if there is a filename. If not set a default file name
-            if self.plotting_parameters["FigFileName"] == "None":
-                self.plotting_parameters["FigFileName"] = self.FilePath+os.sep+self.FilePrefix+"BDP."+self.plotting_parameters["FigFormat"]     
-            
-            print("Hey there partner, I am making a grid plot.")
-            LSDMap_BP.BasicDensityPlot(self.base_faster_fname, 
-                                       self.plotting_parameters["base_cmap"],
-                                       self.plotting_parameters["cbar_label"],
-                                       self.plotting_parameters["clim_val"],
-                                       self.plotting_parameters["FigFileName"],
-                                       self.plotting_parameters["FigFormat"],
-                                       self.plotting_parameters["size_format"],
-                                       self.plotting_parameters["is_log"])
-                
-            
-        if self.plotting_switches["BasicDrapedPlotGridPlot"]:
-            # Check to see if there is a filename. If not set a default file name
-            if self.plotting_parameters["FigFileName"] == "None":
-                self.plotting_parameters["FigFileName"] = self.FilePath+os.sep+self.FilePrefix+"BDPDPG."+self.plotting_parameters["FigFormat"]     
- 
-            LSDMap_BP.BasicDrapedPlotGridPlot(self.base_faster_fname, 
-                                       self.plotting_parameters["DrapeName"],
-                                       self.plotting_parameters["base_cmap"],
-                                       self.plotting_parameters["drape_cmap"],                                
-                                       self.plotting_parameters["cbar_label"],
-                                       self.plotting_parameters["clim_val"],
-                                       self.plotting_parameters["drape_alpha"],
-                                       self.plotting_parameters["FigFileName"],
-                                       self.plotting_parameters["FigFormat"])
-                                              
-        if self.plotting_switches["BasinsOverFancyHillshade"]:
-            # Check to see if there is a filename. If not set a default file name
-            if self.plotting_parameters["FigFileName"] == "None":
-                self.plotting_parameters["FigFileName"] = self.FilePath+os.sep+self.FilePrefix+"Basins."+self.plotting_parameters["FigFormat"]     
-            
-            print("Type of base raster is: "+str(type(self.base_faster_fname)))
-            print("The chan net csv is: " +str(self.plotting_parameters["chan_net_csv"]))
-            print("The drape cmap is: "+self.plotting_parameters["drape_cmap"])
-            
-            thisPointData = LSDMap_PD.LSDMap_PointData(self.basin_csv_fname)
-            
-            if self.plotting_parameters["chan_net_csv"] == "None":
-                chanPointData = "None"
-            else:
-                chanPointData = LSDMap_PD.LSDMap_PointData(self.plotting_parameters["chan_net_csv"])
-            
-            
-            LSDMap_BP.BasinsOverFancyHillshade(self.base_faster_fname, 
-                                       self.hs_fname,
-                                       self.basin_fname,
-                                       self.basin_csv_fname,
-                                       thisPointData,                                      
-                                       self.plotting_parameters["base_cmap"],
-                                       self.plotting_parameters["drape_cmap"],                                
-                                       self.plotting_parameters["clim_val"],
-                                       self.plotting_parameters["drape_alpha"],
-                                       self.plotting_parameters["FigFileName"],
-                                       self.plotting_parameters["FigFormat"],
-                                       self.plotting_parameters["elevation_threshold"],
-                                       self.plotting_parameters["grouped_basin_list"], 
-                                       self.plotting_parameters["basin_rename_list"],
-                                       self.plotting_parameters["spread"],
-                                       chanPointData,
-                                       self.plotting_parameters["label_sources"],
-                                       self.plotting_parameters["source_chi_threshold"],
-                                       self.plotting_parameters["size_format"])
-
-        if self.plotting_switches["BasicChiCoordinatePlot"]:
-            print("I am plotting a basic chi plot!")
-            
-            # Check to see if there is a filename. If not set a default file name
-            if self.plotting_parameters["FigFileName"] == "None":
-                self.plotting_parameters["FigFileName"] = self.FilePath+os.sep+self.FilePrefix+"Chi."+self.plotting_parameters["FigFormat"]     
+    def _plot_BasicDensityPlot(self, step, get_point_data):
+        parameters = step["parameters"]
+        print("Hey there partner, I am making a grid plot.")
+        LSDMap_BP.BasicDensityPlot(step["inputs"]["base_raster"], 
+                                   parameters["base_cmap"],
+                                   parameters["cbar_label"],
+                                   parameters["clim_val"],
+                                   step["FigFileName"],
+                                   parameters["FigFormat"],
+                                   parameters["size_format"],
+                                   parameters["is_log"])
 
-                
-                
-            thisBasinData = LSDMap_PD.LSDMap_PointData(self.basin_csv_fname)
-            chi_drape_cname = 'CMRmap_r'
-            #chi_drape_cname = 'brg_r'
-            cbar_lablel = "$\chi$ (m)"
-
-            LSDMap_CP.BasicChiCoordinatePlot(self.hs_fname, 
-                                       self.chi_raster_fname,
-                                       self.basic_chi_csv_fname,                                      
-                                       self.plotting_parameters["base_cmap"],
-                                       chi_drape_cname,
-                                       cbar_lablel,
-                                       self.plotting_parameters["clim_val"],
-                                       self.plotting_parameters["basin_order_list"],
-                                       thisBasinData,
-                                       self.basin_fname,
-                                       self.plotting_parameters["drape_alpha"],
-                                       self.plotting_parameters["FigFileName"],
-                                       self.plotting_parameters["FigFormat"],
-                                       self.plotting_parameters["size_format"])            
-            
-        if self.plotting_switches["ChiProfiles"]:
-            print("I am plotting a basic chi profile plot!")
-            
-            # Check to see if there is a filename. If not set a default file name
-            if self.plotting_parameters["FigFileName"] == "None":
-                self.plotting_parameters["FigFileName"] = self.FilePath+os.sep+self.FilePrefix+"ChiProfile."+self.plotting_parameters["FigFormat"]     
+    def _plot_BasicDrapedPlotGridPlot(self, step, get_point_data):
+        parameters = step["parameters"]
+        LSDMap_BP.BasicDrapedPlotGridPlot(step["inputs"]["base_raster"], 
+                                   step["inputs"]["DrapeName"],
+                                   parameters["base_cmap"],
+                                   parameters["drape_cmap"],                                
+                                   parameters["cbar_label"],
+                                   parameters["clim_val"],
+                                   parameters["drape_alpha"],
+                                   step["FigFileName"],
+                                   parameters["FigFormat"])
 
-                
-                
-            thisBasinData = LSDMap_PD.LSDMap_PointData(self.basin_csv_fname)
-            chi_drape_cname = 'CMRmap_r'
-            #chi_drape_cname = 'brg_r'
-            cbar_lablel = "$\chi$ (m)"
-            
-            print("The csv filename is: "+ self.chi_csv_fname)
-            
-            LSDMap_CP.ChiProfiles(self.chi_csv_fname,
-                                       self.plotting_parameters["FigFileName"],
-                                       self.plotting_parameters["FigFormat"],
-                                       self.plotting_parameters["basin_order_list"],      
-                                       self.plotting_parameters["basin_rename_list"],      
-                                       self.plotting_parameters["label_sources"], 
-                                       self.plotting_parameters["elevation_threshold"], 
-                                       self.plotting_parameters["source_thinning_threshold"], 
-                                       self.plotting_parameters["plot_M_chi"],                                       
-                                       self.plotting_parameters["plot_segments"],
-                                       self.plotting_parameters["size_format"])            
-            
\ No newline at end of file
+    def _plot_BasinsOverFancyHillshade(self, step, get_point_data):
+        parameters = step["parameters"]
+        print("The chan net csv is: " +str(parameters["chan_net_csv"]))
+        print("The drape cmap is: "+parameters["drape_cmap"])
+        
+        thisPointData = get_point_data(step["inputs"]["basin_csv"])
+        
+        if "chan_net_csv" in step["inputs"]:
+            chanPointData = get_point_data(step["inputs"]["chan_net_csv"])
+        else:
+            chanPointData = "None"
+        
+        LSDMap_BP.BasinsOverFancyHillshade(step["inputs"]["base_raster"], 
+                                   step["inputs"]["hillshade"],
+                                   step["inputs"]["basins"],
+                                   step["inputs"]["basin_csv"],
+                                   thisPointData,                                      
+                                   parameters["base_cmap"],
+                                   parameters["drape_cmap"],                                
+                                   parameters["clim_val"],
+                                   parameters["drape_alpha"],
+                                   step["FigFileName"],
+                                   parameters["FigFormat"],
+                                   parameters["elevation_threshold"],
+                                   parameters["grouped_basin_list"], 
+                                   parameters["basin_rename_list"],
+                                   parameters["spread"],
+                                   chanPointData,
+                                   parameters["label_sources"],
+                                   parameters["source_chi_threshold"],
+                                   parameters["size_format"])
+
+    def _plot_BasicChiCoordinatePlot(self, step, get_point_data):
+        parameters = step["parameters"]
+        print("I am plotting a basic chi plot!")
+        
+        thisBasinData = get_point_data(step["inputs"]["basin_csv"])
+        chi_drape_cname = 'CMRmap_r'
+        #chi_drape_cname = 'brg_r'
+        cbar_lablel = "$\chi$ (m)"
+
+        LSDMap_CP.BasicChiCoordinatePlot(step["inputs"]["hillshade"], 
+                                   step["inputs"]["chi_raster"],
+                                   step["inputs"]["basic_chi_csv"],                                      
+                                   parameters["base_cmap"],
+                                   chi_drape_cname,
+                                   cbar_lablel,
+                                   parameters["clim_val"],
+                                   parameters["basin_order_list"],
+                                   thisBasinData,
+                                   step["inputs"]["basins"],
+                                   parameters["drape_alpha"],
+                                   step["FigFileName"],
+                                   parameters["FigFormat"],
+                                   parameters["size_format"])            
+
+    def _plot_ChiProfiles(self, step, get_point_data):
+        parameters = step["parameters"]
+        print("I am plotting a basic chi profile plot!")
+        print("The csv filename is: "+ step["inputs"]["chi_csv"])
+        
+        LSDMap_CP.ChiProfiles(step["inputs"]["chi_csv"],
+                                   step["FigFileName"],
+                                   parameters["FigFormat"],
+                                   parameters["basin_order_list"],      
+                                   parameters["basin_rename_list"],      
+                                   parameters["label_sources"], 
+                                   parameters["elevation_threshold"], 
+                                   parameters["source_thinning_threshold"], 
+                                   parameters["plot_M_chi"],                                       
+                                   parameters["plot_segments"],
+                                   parameters["size_format"])
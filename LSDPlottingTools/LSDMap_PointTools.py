@@ -11,6 +11,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from osgeo import osr
 from . import LSDMap_OSystemTools as LSDOst
+from . import LSDMap_GDALIO as LSDMap_IO
 import os
 import glob
 import pandas
@@ -19,83 +20,627 @@ from pyproj import Proj, transform
 
 
 #==============================================================================
-# This function takes all the csv files in a directory and converts to
-# GeoJSON files
+# Exporting point data to GIS formats.
+# The points are written in chunks: a chunk of rows is read from the csv,
+# turned into features in one transaction and then thrown away, so the
+# memory doesn't grow with the size of the file. Directories of csv files
+# are converted in parallel.
 #==============================================================================
-def ConvertAllCSVToGeoJSON(path):
-    """This looks in a directory and converts all .csv files to GeoJSON.
+# The OGR driver and the extension for each output format
+_GIS_FORMATS = {"shapefile": ("ESRI Shapefile", ".shp"),
+                "GeoJSON": ("GeoJSON", ".geojson"),
+                "GPKG": ("GPKG", ".gpkg"),
+                "FlatGeobuf": ("FlatGeobuf", ".fgb")}
 
-    This is handy if, for example, you want to display data on the web using leaflet or D3.js
+def _GetOGRFieldType(dtype):
+    """This gets the OGR field type for a numpy (or pandas) data type
 
-    Note:
-        This assumes your csv files have latitude and longitude columns. If the LSDMap_PointData object will not be able to read them.
+    Author: SMM
+    """
+    import osgeo.ogr as ogr
+
+    kind = np.dtype(dtype).kind if not hasattr(dtype, "categories") else "O"
+    if kind in "iub":
+        if kind != "b" and np.dtype(dtype).itemsize > 4:
+            return ogr.OFTInteger64
+        return ogr.OFTInteger
+    elif kind == "f":
+        return ogr.OFTReal
+    else:
+        return ogr.OFTString
+
+def WritePointChunksToGIS(chunks, FileOut, file_format = "shapefile", layer_name = "PointData"):
+    """This writes point data, given as an iterator of pandas dataframes with
+    latitude and longitude columns (WGS84), to a GIS file. Each chunk is
+    written in one transaction. The field types come from the first chunk, so
+    the chunks should have the same dtypes (ExportCSVToGIS makes sure of this).
+    Gaps (nan) in an integer field are written as null.
+
+    Args:
+        chunks (iterator): pandas dataframes. They all need the same columns.
+        FileOut (str): The name of the output file with path and extension
+        file_format (str): "shapefile", "GeoJSON", "GPKG" or "FlatGeobuf"
+        layer_name (str): The name of the layer
+
+    Returns:
+        The number of points written
+
+    Author: SMM
+    """
+    import osgeo.ogr as ogr
+
+    if file_format not in _GIS_FORMATS:
+        raise ValueError("I don't know the format "+str(file_format)+", try one of "+str(sorted(_GIS_FORMATS)))
+    driver = ogr.GetDriverByName(_GIS_FORMATS[file_format][0])
+
+    # delete the existing file
+    if os.path.exists(FileOut):
+        driver.DeleteDataSource(FileOut)
+        print("That file exists, I am deleting it in order to start again.")
+
+    # create the spatial reference, in this case WGS84 (which is ESPG 4326)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+    data_source = None
+    layer = None
+    n_points = 0
+    for chunk in chunks:
+        if layer is None:
+            data_source = driver.CreateDataSource(FileOut)
+            layer = data_source.CreateLayer(layer_name, srs, ogr.wkbPoint)
+            VariableList = list(chunk.columns)
+            field_types = []
+            for name in VariableList:
+                field_types.append(_GetOGRFieldType(chunk[name].dtype))
+                layer.CreateField(ogr.FieldDefn(name, field_types[-1]))
+            layer_defn = layer.GetLayerDefn()
+
+        # get the columns out as python lists in one go, it is much quicker than per value
+        columns = []
+        for name, field_type in zip(VariableList, field_types):
+            if field_type == ogr.OFTString:
+                columns.append(chunk[name].astype(object).where(chunk[name].notnull(), None).tolist())
+            elif field_type != ogr.OFTReal and chunk[name].dtype.kind not in "iub":
+                # the field is an integer but this chunk isn't, so it has gaps
+                values = chunk[name]
+                present = values.notnull()
+                if (values[present] != np.round(values[present].astype(np.float64))).any():
+                    raise ValueError("The column "+name+" is an integer field but has fractions after the first chunk, give the chunks a float dtype")
+                columns.append([int(x) if is_present else None for x, is_present in zip(values.tolist(), present.tolist())])
+            else:
+                columns.append(chunk[name].tolist())
+        longitudes = chunk["longitude"].to_numpy(dtype=np.float64).tolist()
+        latitudes = chunk["latitude"].to_numpy(dtype=np.float64).tolist()
+
+        layer.StartTransaction()
+        for row in range(len(chunk)):
+            feature = ogr.Feature(layer_defn)
+            # fields are set by index since shapefiles shorten long names
+            for field_index, column in enumerate(columns):
+                value = column[row]
+                if value is not None:
+                    feature.SetField(field_index, value)
+            point = ogr.Geometry(ogr.wkbPoint)
+            point.AddPoint_2D(longitudes[row], latitudes[row])
+            feature.SetGeometry(point)
+            layer.CreateFeature(feature)
+            feature = None
+        layer.CommitTransaction()
+
+        n_points += len(chunk)
+        print("I have written "+str(n_points)+" points to "+FileOut)
+
+    # Destroy the data source to free resources
+    if data_source is not None:
+        data_source.Destroy()
+    else:
+        print("There were no points to write to "+FileOut)
+    return n_points
+
+def ExportCSVToGIS(FileName, file_format = "shapefile", chunk_rows = 100000, columns = None, FileOut = None):
+    """This converts a csv file of points (with latitude and longitude columns) to
+    a GIS file, reading the csv in chunks so that huge files (e.g. the channel
+    network of a whole mountain range) can be converted in bounded memory.
+
+    Args:
+        FileName (str): The csv file with path and extension
+        file_format (str): "shapefile", "GeoJSON", "GPKG" (GeoPackage) or "FlatGeobuf". The binary formats are much quicker for big files.
+        chunk_rows (int): The number of rows read and written at a time
+        columns (list): Only export these columns (latitude and longitude are always kept). None exports them all.
+        FileOut (str): The output file name. Default is the name of the csv with the extension of the format.
+
+    Returns:
+        The name of the file that was written
+
+    Author: SMM
+    """
+    if FileOut is None:
+        FileOut = os.path.splitext(FileName)[0]+_GIS_FORMATS[file_format][1]
+    print("The filename will be: " + FileOut)
+
+    usecols = None
+    if columns is not None:
+        header = list(pandas.read_csv(FileName, sep=",", nrows=0).columns)
+        usecols = [name for name in header if name in columns or name in ["latitude", "longitude"]]
+
+    # every chunk needs the same types so that they fit the fields. Float and
+    # string columns in the first rows can be fixed straight away, but a column
+    # of integers there can have a gap (nan) or text further down, so those
+    # columns are checked over the whole file and widened if needed.
+    sample = pandas.read_csv(FileName, sep=",", usecols=usecols, nrows=chunk_rows)
+    dtypes = {}
+    int_columns = []
+    for name in sample.columns:
+        if sample[name].dtype.kind == "O":
+            dtypes[name] = object
+        elif sample[name].dtype.kind == "f":
+            dtypes[name] = np.float64
+        else:
+            int_columns.append(name)
+    if len(int_columns) > 0 and len(sample) == chunk_rows:
+        for chunk in pandas.read_csv(FileName, sep=",", usecols=int_columns, chunksize=chunk_rows):
+            for name in int_columns:
+                kind = chunk[name].dtype.kind
+                if kind == "O":
+                    dtypes[name] = object
+                elif kind == "f" and dtypes.get(name) is not object:
+                    dtypes[name] = np.float64
+        widened = [name for name in int_columns if name in dtypes]
+        if len(widened) > 0:
+            print("These integer columns have gaps or text further down the file, I am widening them: "+str(widened))
+    chunks = pandas.read_csv(FileName, sep=",", usecols=usecols, dtype=dtypes, chunksize=chunk_rows)
+
+    layer_name = "PointData" if file_format == "GeoJSON" else LSDOst.GetFilePrefix(FileName)
+    WritePointChunksToGIS(chunks, FileOut, file_format, layer_name)
+    return FileOut
+
+def _ExportCSVToGISWorker(arguments):
+    """Runs ExportCSVToGIS in a worker process"""
+    return ExportCSVToGIS(*arguments)
+
+def ConvertAllCSVToGIS(path, file_format = "shapefile", chunk_rows = 100000, n_workers = None):
+    """This looks in a directory and converts all .csv files to a GIS format.
+    The files are converted in parallel, one per worker process.
 
     Args:
         path (str): The path in which you want to convert the csv files
+        file_format (str): "shapefile", "GeoJSON", "GPKG" or "FlatGeobuf"
+        chunk_rows (int): The number of rows each worker reads and writes at a time
+        n_workers (int): The number of worker processes. Default is one per cpu, 1 converts them here.
 
     Returns:
-        None, but you will get a load of GeoJSON files.
+        A list of the files that were written
 
     Author: SMM
     """
+    import multiprocessing
 
     # make sure names are in correct format
     NewPath = LSDOst.AppendSepToDirectoryPath(path)
-
     print("The formatted path is: " + NewPath)
 
+    FileNames = sorted(glob.glob(NewPath+"*.csv"))
+    arguments = [(FileName, file_format, chunk_rows) for FileName in FileNames]
+
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, len(FileNames)))
+
+    if n_workers == 1:
+        return [_ExportCSVToGISWorker(a) for a in arguments]
+
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        FilesOut = pool.map(_ExportCSVToGISWorker, arguments, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return FilesOut
+
+#==============================================================================
+# This function takes all the csv files in a directory and converts to
+# GeoJSON files
+#==============================================================================
+def ConvertAllCSVToGeoJSON(path, n_workers = None):
+    """This looks in a directory and converts all .csv files to GeoJSON.
+
+    This is handy if, for example, you want to display data on the web using leaflet or D3.js
+
+    Note:
+        This assumes your csv files have latitude and longitude columns.
+
+    Args:
+        path (str): The path in which you want to convert the csv files
+        n_workers (int): The number of files converted at the same time (see ConvertAllCSVToGIS)
 
-    for FileName in glob.glob(NewPath+"*.csv"):
-        print("filename is: " + FileName)
+    Returns:
+        None, but you will get a load of GeoJSON files.
 
-        thisPointData = LSDMap_PointData(FileName)
-        thisPointData.TranslateToReducedGeoJSON(FileName)
+    Author: SMM
+    """
+    ConvertAllCSVToGIS(path, "GeoJSON", n_workers = n_workers)
 
 
 #==============================================================================
 # This function takes all the csv files in a directory and converts to
 # Shapefiles files
 #==============================================================================
-def ConvertAllCSVToShapefile(path):
+def ConvertAllCSVToShapefile(path, n_workers = None):
     """This looks in a directory and converts all .csv files to shapefiles
 
     This is handy if, for example, you want to display data using ArcMap of QGIS
 
     Note:
-        This assumes your csv files have latitude and longitude columns. If the LSDMap_PointData object will not be able to read them.
+        This assumes your csv files have latitude and longitude columns.
 
     Args:
         path (str): The path in which you want to convert the csv files
+        n_workers (int): The number of files converted at the same time (see ConvertAllCSVToGIS)
 
     Returns:
-        None, but you will get a load of GeoJSON files.
+        None, but you will get a load of shapefiles.
 
     Author: SMM
     """
+    ConvertAllCSVToGIS(path, "shapefile", n_workers = n_workers)
 
-    # make sure names are in correct format
-    NewPath = LSDOst.AppendSepToDirectoryPath(path)
 
-    print("The formatted path is: " + NewPath)
+#==============================================================================
+# A spatial index for point data
+#==============================================================================
+# Label rasters (e.g. basin rasters) that have been read in this session. The
+# key is the raster name, the value is [fingerprint, array]
+_LABEL_RASTERS = {}
 
+class PointSpatialIndex(object):
+    """This is a uniform grid spatial index for a set of points. The points are
+    sorted by the grid cell they fall into, so a bounding box query only looks
+    at the points in the cells that overlap the box rather than scanning all of
+    the points.
 
-    for FileName in glob.glob(NewPath+"*.csv"):
-        print("filename is: " + FileName)
+    Args:
+        x (array): the x coordinates (easting or longitude) of the points
+        y (array): the y coordinates (northing or latitude) of the points
+        points_per_cell (int): the average number of points per grid cell. Used to set the cell size.
+
+    Author: SMM
+    """
+    def __init__(self, x, y, points_per_cell = 64):
+
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.n_points = len(self.x)
+
+        # ignore points with nan coordinates
+        valid = np.isfinite(self.x) & np.isfinite(self.y)
+        valid_index = np.flatnonzero(valid)
+
+        if len(valid_index) == 0:
+            self.extent = [0.0, 0.0, 0.0, 0.0]
+        else:
+            self.extent = [self.x[valid].min(), self.x[valid].max(), self.y[valid].min(), self.y[valid].max()]
+
+        # get the number of cells in each direction so that each cell has
+        # roughly points_per_cell points in it
+        n_cells = max(1, int(len(valid_index)/points_per_cell))
+        x_range = max(self.extent[1]-self.extent[0], 1e-12)
+        y_range = max(self.extent[3]-self.extent[2], 1e-12)
+        self.cell_size = max(np.sqrt(x_range*y_range/n_cells), 1e-12)
+        self.n_cols = int(x_range/self.cell_size)+1
+        self.n_rows = int(y_range/self.cell_size)+1
+
+        # sort the points by cell
+        cell_rows, cell_cols = self._get_cells(self.x[valid_index], self.y[valid_index])
+        cell_ids = cell_rows*self.n_cols+cell_cols
+        order = np.argsort(cell_ids, kind="stable")
+        self.sorted_index = valid_index[order]
+        self.sorted_cell_ids = cell_ids[order]
+
+    def _get_cells(self, x, y):
+        """Gets the (clipped) grid cell of coordinates
+
+        Author: SMM
+        """
+        cell_cols = np.floor((np.asarray(x)-self.extent[0])/self.cell_size).astype(np.int64)
+        cell_rows = np.floor((np.asarray(y)-self.extent[2])/self.cell_size).astype(np.int64)
+        np.clip(cell_cols, 0, self.n_cols-1, out=cell_cols)
+        np.clip(cell_rows, 0, self.n_rows-1, out=cell_rows)
+        return cell_rows, cell_cols
 
-        thisPointData = LSDMap_PointData(FileName)
-        thisPointData.TranslateToReducedShapefile(FileName)
+    def query_bbox(self, xmin, xmax, ymin, ymax):
+        """Gets the indices of the points within a bounding box (edges included)
+
+        Args:
+            xmin (float): minimum x
+            xmax (float): maximum x
+            ymin (float): minimum y
+            ymax (float): maximum y
+
+        Returns:
+            np.array: the sorted indices of the points in the box
+
+        Author: SMM
+        """
+        if (self.n_points == 0 or xmax < self.extent[0] or xmin > self.extent[1]
+            or ymax < self.extent[2] or ymin > self.extent[3]):
+            return np.array([], dtype=np.int64)
+
+        row_lims, col_lims = self._get_cells([xmin, xmax], [ymin, ymax])
+
+        # The cells of one row are contiguous in the sorted cell ids
+        candidate_list = []
+        for row in range(row_lims[0], row_lims[1]+1):
+            start = np.searchsorted(self.sorted_cell_ids, row*self.n_cols+col_lims[0], side="left")
+            end = np.searchsorted(self.sorted_cell_ids, row*self.n_cols+col_lims[1], side="right")
+            candidate_list.append(self.sorted_index[start:end])
+        candidates = np.concatenate(candidate_list)
+
+        # now check the candidates exactly, since the edge cells are only partly in the box
+        cx = self.x[candidates]
+        cy = self.y[candidates]
+        in_box = (cx >= xmin) & (cx <= xmax) & (cy >= ymin) & (cy <= ymax)
+        return np.sort(candidates[in_box])
+
+    def bbox_mask(self, xmin, xmax, ymin, ymax):
+        """Same as query_bbox but returns a boolean mask over all the points
+
+        Author: SMM
+        """
+        mask = np.zeros(self.n_points, dtype=bool)
+        mask[self.query_bbox(xmin, xmax, ymin, ymax)] = True
+        return mask
+
+
+#==============================================================================
+# A lazy query on point data. Each call adds a condition, nothing is worked
+# out until you ask for the rows, and then all the conditions are combined
+# into one mask. This is much quicker than chaining ThinData calls, which
+# copy all the columns every time.
+#==============================================================================
+class PointDataQuery(object):
+    """
+    A chain of conditions on a LSDMap_PointData object. Get one with
+    LSDMap_PointData.Query(), e.g.
+
+        rows = PointData.Query().where("elevation", ">", 100).isin("basin_key", [0,2]).indices()
+        chi = PointData.Query().where("chi", ">", 0).column("chi")
+
+    Nothing is evaluated until you call mask(), indices(), column(), count() or apply().
+
+    Args:
+        point_data (LSDMap_PointData): The point data to query
+
+    Author: SMM
+    """
+    _OPERATORS = {"==": np.equal, "!=": np.not_equal, ">": np.greater,
+                  "<": np.less, ">=": np.greater_equal, "<=": np.less_equal}
+
+    def __init__(self, point_data):
+        self._point_data = point_data
+        self._conditions = []
+        self._mask = None
+
+    def _add(self, data_name, function):
+        if data_name is not None and data_name not in self._point_data.VariableList:
+            raise KeyError("The data " + data_name + " is not one of the data elements in this point data")
+        self._conditions.append((data_name, function))
+        self._mask = None
+        return self
+
+    def where(self, data_name, operator, value):
+        """
+        Keeps the rows where data_name compares with value. The operator is one of
+        "==", "!=", ">", "<", ">=" or "<=". With "==" and "!=" the value can also be a list.
+        """
+        if isinstance(value, (list, tuple, np.ndarray)):
+            if operator == "==":
+                return self.isin(data_name, value)
+            elif operator == "!=":
+                return self.notin(data_name, value)
+            raise ValueError("I can only compare with a list using == or !=")
+        if operator not in self._OPERATORS:
+            raise ValueError("The operator " + str(operator) + " isn't one of " + str(sorted(self._OPERATORS)))
+        compare = self._OPERATORS[operator]
+        return self._add(data_name, lambda values: compare(values, value))
+
+    def threshold(self, data_name, threshold_value):
+        """
+        Keeps the rows where data_name is at or above threshold_value.
+        """
+        return self.where(data_name, ">=", threshold_value)
+
+    def isin(self, data_name, values):
+        """
+        Keeps the rows where data_name is one of values.
+        """
+        values = np.asarray(list(values))
+        return self._add(data_name, lambda column: np.isin(column, values))
+
+    def notin(self, data_name, values):
+        """
+        Keeps the rows where data_name is not one of values.
+        """
+        values = np.asarray(list(values))
+        return self._add(data_name, lambda column: ~np.isin(column, values))
+
+    def key(self, data_name, data_key):
+        """
+        Keeps the rows where data_name is data_key (e.g. a single basin_key).
+        """
+        return self.where(data_name, "==", data_key)
+
+    def join(self, data_name, other, other_name = None):
+        """
+        Keeps the rows whose data_name is also found in another data set,
+        e.g. the channel points of the basins that are in a basin info file.
+
+        Args:
+            data_name (str): The key column in this data
+            other: another LSDMap_PointData (or PointDataQuery) or an array of keys
+            other_name (str): The key column in the other data, if it is point data. Defaults to data_name.
+        """
+        if other_name is None:
+            other_name = data_name
+        if isinstance(other, PointDataQuery):
+            other_keys = other.column(other_name)
+        elif isinstance(other, LSDMap_PointData):
+            other_keys = other._GetColumnArray(other_name)
+        else:
+            other_keys = other
+        return self.isin(data_name, np.unique(np.asarray(other_keys)))
+
+    def bounding_box(self, xmin, xmax, ymin, ymax, EPSG_string = "None"):
+        """
+        Keeps the rows within a bounding box (uses the spatial index, see LSDMap_PointData.GetSpatialIndex)
+        """
+        point_data = self._point_data
+        return self._add(None, lambda rows: point_data.GetSpatialIndex(EPSG_string).bbox_mask(xmin, xmax, ymin, ymax)[rows])
+
+    def mask(self):
+        """
+        Gets the boolean mask of the rows that pass all the conditions.
+        Each condition is only tested on the rows that passed the ones before it.
+        """
+        if self._mask is None:
+            n_rows = self._point_data._GetNRows()
+            rows = np.arange(n_rows)
+            for data_name, function in self._conditions:
+                if data_name is None:
+                    passed = function(rows)
+                else:
+                    passed = np.asarray(function(self._point_data._GetColumnArray(data_name)[rows]), dtype=bool)
+                rows = rows[passed]
+            mask = np.zeros(n_rows, dtype=bool)
+            mask[rows] = True
+            self._mask = mask
+        return self._mask
+
+    def indices(self):
+        """
+        Gets the row indices of the data that pass all the conditions.
+        """
+        return np.flatnonzero(self.mask())
+
+    def count(self):
+        """
+        The number of rows that pass all the conditions.
+        """
+        return int(np.count_nonzero(self.mask()))
+
+    def column(self, data_name):
+        """
+        Gets one column of the data for the rows that pass all the conditions, as a numpy array.
+        Only this column is copied.
+        """
+        return self._point_data._GetColumnArray(data_name)[self.indices()]
+
+    def apply(self):
+        """
+        Removes the rows that don't pass the conditions from the point data (not reversible!!)
+        """
+        keep = self.indices()
+        print("I am keeping "+str(len(keep))+" of "+str(self._point_data._GetNRows())+" points")
+        self._point_data._KeepRows(keep)
+        self._conditions = []
+        self._mask = None
+        return self._point_data
+
+
+#==============================================================================
+# Loading csv files with compact data types.
+# pandas reads every number as a 64 bit float or int. For the big files from
+# LSDTopoTools (e.g. MChiSegmented) that is twice the memory we need, so the
+# measurements are read as float32, the integers (node, junction, basin_key...)
+# as int32 and repeated strings as categories. Coordinates are kept in float64
+# since float32 latitudes are only good to about a metre.
+#==============================================================================
+_FLOAT64_COLUMNS = ["latitude", "longitude", "easting", "northing", "x", "y"]
+
+def _GetCompactDtypes(data):
+    """This works out compact data types for the columns of a dataframe.
+
+    Args:
+        data (pandas.DataFrame): The data, or a sample of it
+
+    Returns:
+        A dict with the column names as keys and the data types as values
+
+    Author: SMM
+    """
+    int32_info = np.iinfo(np.int32)
+    dtypes = {}
+    for name in data.columns:
+        column = data[name]
+        if name.lower() in _FLOAT64_COLUMNS:
+            if column.dtype.kind in "fiu":
+                dtypes[name] = np.float64
+        elif column.dtype.kind == "f":
+            # ids with gaps in them come in as floats, float32 can't hold them exactly past 2^24
+            finite = column.values[np.isfinite(column.values)]
+            if finite.size != 0 and np.abs(finite).max() > 2**24 and np.all(finite == np.round(finite)):
+                dtypes[name] = np.float64
+            else:
+                dtypes[name] = np.float32
+        elif column.dtype.kind in "iu":
+            if len(column) == 0 or (column.min() >= int32_info.min and column.max() <= int32_info.max):
+                dtypes[name] = np.int32
+        elif column.dtype.kind == "O":
+            # only strings that repeat are worth turning into categories
+            if column.nunique() <= 0.5*len(column):
+                dtypes[name] = "category"
+    return dtypes
+
+def ReadPointCSV(FileName, columns = None, compact_dtypes = False):
+    """This reads a csv file of point data into a pandas dataframe, only loading
+    the columns you want and using compact data types (see _GetCompactDtypes).
+
+    Args:
+        FileName (str): The name of the csv file with path and extension
+        columns (list): The columns to load. latitude and longitude are always loaded if they are in the file. None means all of them.
+        compact_dtypes (bool): If true, use the compact data types. If false (the default) you get what pandas gives you (float64 and int64)
+
+    Returns:
+        A pandas dataframe
+
+    Author: SMM
+    """
+    usecols = None
+    if columns is not None:
+        header = list(pandas.read_csv(FileName, sep=",", nrows=0).columns)
+        usecols = [name for name in header if name in columns or name in ["latitude", "longitude"]]
+        missing_columns = [name for name in columns if name not in header]
+        if len(missing_columns) != 0:
+            print("Warning, these columns are not in "+FileName+": "+str(missing_columns))
+
+    if not compact_dtypes:
+        return pandas.read_csv(FileName, sep=",", usecols=usecols)
+
+    # Get the types from the start of the file so the data is read straight
+    # into the compact types. If the rest of the file doesn't fit (e.g. a column of
+    # ints has a gap further down) we read it the normal way and shrink it after.
+    sample = pandas.read_csv(FileName, sep=",", usecols=usecols, nrows=10000)
+    try:
+        data = pandas.read_csv(FileName, sep=",", usecols=usecols, dtype=_GetCompactDtypes(sample))
+    except (ValueError, TypeError, OverflowError):
+        data = pandas.read_csv(FileName, sep=",", usecols=usecols)
+        data = data.astype(_GetCompactDtypes(data))
+    return data
 
 
 class LSDMap_PointData(object):
 
     # The constructor: it needs a filename to read
-    def __init__(self,FileName, data_type = "csv", PANDEX = True):
+    def __init__(self,FileName, data_type = "csv", PANDEX = True, columns = None, compact_dtypes = False):
         """This is the LSDMap_pointdata object. It loads csv files that have latitude and longitude data (in WGS84) and keeps other data records.
 
         The object can convert to UTM, and it also can print data to other file formats like GeoJSON and shapefiles.
 
         Args:
             Filename (str): The name of the csv file (with path and extension) that contains the point data. It should have columns labelled "latitude" and "longitude".
+            columns (list): Only load these columns from the csv (latitude and longitude are always loaded). None loads everything.
+            compact_dtypes (bool): Load the csv with float32/int32/categorical columns to save memory (see ReadPointCSV).
+                Without PANDEX the columns are then numpy arrays rather than lists. Default False.
 
         Author: SMM
         """
@@ -107,14 +652,16 @@ class LSDMap_PointData(object):
             print("The object file prefix is: " + self.FilePrefix)
 
         self.PANDEX = PANDEX
-        
+
+        # spatial indices of the points, keyed by the coordinate system. See GetSpatialIndex
+        self._SpatialIndexes = {}
 
         ######################### THIS PART OF THE CODE IS ONLY USING PANDAS #########################
         if(self.PANDEX == True):
             print("Warning, you are using an experimental version of LSDMT that is implementing Pandas dataframe to improve the performance. It is still unstable, switch PANDEX to False in your PointData parameters to use the regular way")
             print("Loading your file from " + data_type)
             if(data_type == "csv"):
-                data = pandas.read_csv(FileName, sep=",")
+                data = ReadPointCSV(FileName, columns, compact_dtypes)
             else:
                 if(data_type == "pandas"):
                     data = FileName
@@ -204,7 +751,7 @@ class LSDMap_PointData(object):
                     #Loading the file
                     print("Loading")
                     if(data_type == "csv"):
-                        data = pandas.read_csv(FileName, sep=",")
+                        data = ReadPointCSV(FileName, columns, compact_dtypes)
                     else:
                         if(data_type == "pandas"):
                             data = FileName
@@ -217,22 +764,28 @@ class LSDMap_PointData(object):
 
                     print("Your Variable list is : ")
                     print(self.VariableList)
-                    #ingesting data values
-                    dataPoints = np.array(data.values)
-                    DataDict = {}
                     #Feeding the dictionnary[header][table of values]
                     print("I am ingesting the data")
-                    for i in range(len(self.VariableList)):
-                        DataDict[self.VariableList[i]] = dataPoints[:,i]
-                    #dealing with the types
-                    DataDictTyped = {}
+                    DataDict = {}
                     TypeList = []
-                    for name in self.VariableList:
-                        this_list = DataDict[name]
-                        typed_list = LSDOst.ParseListToType(this_list)
-                        DataDictTyped[name] = typed_list
-
-                        TypeList.append(type(typed_list[0]))
+                    if compact_dtypes:
+                        # Each column keeps its own compact type, so there is no need to go
+                        # through a big object array and parse the types again
+                        for name in self.VariableList:
+                            DataDict[name] = data[name].to_numpy()
+                            if len(DataDict[name]) != 0:
+                                TypeList.append(type(DataDict[name][0]))
+                            else:
+                                TypeList.append(DataDict[name].dtype.type)
+                    else:
+                        #ingesting data values
+                        dataPoints = np.array(data.values)
+                        for i in range(len(self.VariableList)):
+                            DataDict[self.VariableList[i]] = dataPoints[:,i]
+                        #dealing with the types
+                        for name in self.VariableList:
+                            typed_list = LSDOst.ParseListToType(DataDict[name])
+                            TypeList.append(type(typed_list[0]))
 
                     self.PointData = DataDict
                     self.DataTypes = TypeList
@@ -460,6 +1013,227 @@ class LSDMap_PointData(object):
 
 
 
+##==============================================================================
+##==============================================================================
+## Spatial queries
+##==============================================================================
+##==============================================================================
+    def GetSpatialIndex(self, EPSG_string = "None"):
+        """Gets a spatial index of the points. It is only built once for each
+        coordinate system and is thrown away if the data is thinned.
+
+        Args:
+            EPSG_string (str): The EPSG code of the UTM coordinates you want (e.g. "epsg:32611"). If "None", the index is in latitude and longitude
+
+        Returns:
+            A PointSpatialIndex. Its x and y members are the coordinates of the points.
+
+        Author: SMM
+        """
+        if not hasattr(self, "_SpatialIndexes"):
+            self._SpatialIndexes = {}
+
+        if EPSG_string not in self._SpatialIndexes:
+            if EPSG_string == "None":
+                x = np.asarray(self.Longitude, dtype=np.float64)
+                y = np.asarray(self.Latitude, dtype=np.float64)
+            else:
+                # I had an old file that didnt report lat/long so pull directly if lat/lon not found
+                try:
+                    x,y = self.GetUTMEastingNorthing(EPSG_string)
+                except:
+                    x = np.asarray(self.QueryData("easting"), dtype=np.float64)
+                    y = np.asarray(self.QueryData("northing"), dtype=np.float64)
+            self._SpatialIndexes[EPSG_string] = PointSpatialIndex(x, y)
+
+        return self._SpatialIndexes[EPSG_string]
+
+    def _ResetSpatialIndex(self):
+        """The indices point at rows of the data so they need to go if the data changes.
+
+        Author: SMM
+        """
+        self._SpatialIndexes = {}
+
+    def GetIndicesInBoundingBox(self, xmin, xmax, ymin, ymax, EPSG_string = "None"):
+        """Gets the row indices of the points within a bounding box
+
+        Args:
+            xmin, xmax, ymin, ymax (float): the bounding box
+            EPSG_string (str): The coordinate system of the bounding box. If "None", it is in longitude and latitude
+
+        Returns:
+            np.array: the row indices of the points in the box
+
+        Author: SMM
+        """
+        return self.GetSpatialIndex(EPSG_string).query_bbox(xmin, xmax, ymin, ymax)
+
+    def ThinDataToBoundingBox(self, xmin, xmax, ymin, ymax, EPSG_string = "None"):
+        """This removes all the points outside of a bounding box
+
+        Args:
+            xmin, xmax, ymin, ymax (float): the bounding box
+            EPSG_string (str): The coordinate system of the bounding box. If "None", it is in longitude and latitude
+
+        Returns:
+            None removes data from the object (not reversible!!)
+
+        Author: SMM
+        """
+        keep = self.GetIndicesInBoundingBox(xmin, xmax, ymin, ymax, EPSG_string)
+        print("I am keeping "+str(len(keep))+" of your points that are within the bounding box")
+        self._KeepRows(keep)
+
+    def ThinDataToRaster(self, FullPathRaster):
+        """This removes all the points outside of the extent of a raster (which needs to be in UTM)
+
+        Args:
+            FullPathRaster (str): The raster name with path and extension
+
+        Returns:
+            None removes data from the object (not reversible!!)
+
+        Author: SMM
+        """
+        EPSG_string = LSDMap_IO.GetUTMEPSG(FullPathRaster)
+        xmin,xmax,ymin,ymax = LSDMap_IO.GetRasterExtent(FullPathRaster)
+        self.ThinDataToBoundingBox(xmin, xmax, ymin, ymax, EPSG_string)
+
+    def _KeepRows(self, keep):
+        """Keeps only the rows in keep (an array of row indices)
+
+        Author: SMM
+        """
+        if(self.PANDEX):
+            self.PointData = self.PointData.iloc[keep]
+            self.Longitude = self.PointData["longitude"]
+            self.Latitude = self.PointData["latitude"]
+        else:
+            def keep_rows(values):
+                # keep lists as lists and arrays as arrays
+                if isinstance(values, list):
+                    return np.asarray(values, dtype=object)[keep].tolist()
+                return np.asarray(values)[keep]
+            for name in self.VariableList:
+                self.PointData[name] = keep_rows(self.PointData[name])
+            self.Latitude = keep_rows(self.Latitude)
+            self.Longitude = keep_rows(self.Longitude)
+        self._ResetSpatialIndex()
+
+    def _GetNRows(self):
+        """The number of points
+
+        Author: SMM
+        """
+        if(self.PANDEX):
+            return len(self.PointData)
+        if len(self.VariableList) == 0:
+            return 0
+        return len(self.PointData[self.VariableList[0]])
+
+    def _GetColumnArray(self, data_name):
+        """Gets a column of the data as a numpy array, without copying if possible
+
+        Author: SMM
+        """
+        if(self.PANDEX):
+            return self.PointData[data_name].to_numpy()
+        return np.asarray(self.PointData[data_name])
+
+    def Query(self):
+        """Starts a lazy query on the data. See PointDataQuery.
+
+        Returns:
+            A PointDataQuery
+
+        Author: SMM
+        """
+        return PointDataQuery(self)
+
+    def GetRasterRowCol(self, FullPathRaster):
+        """Gets the row and column of the raster cell under each point, i.e. the
+        nearest raster cell.
+
+        Args:
+            FullPathRaster (str): The raster name with path and extension
+
+        Returns:
+            rows (np.array, int), cols (np.array, int) and inside (np.array, bool), which is False for points off the raster
+
+        Author: SMM
+        """
+        EPSG_string = LSDMap_IO.GetUTMEPSG(FullPathRaster)
+        this_index = self.GetSpatialIndex(EPSG_string)
+        return LSDMap_IO.GetRowColFromEastingNorthing(FullPathRaster, this_index.x, this_index.y)
+
+    def GetLabelsFromRaster(self, FullPathRaster, column_name = "None", NoDataValue = -9999):
+        """Gets the value of a label raster (e.g. the _AllBasins.bil raster) under each point.
+        This replaces testing each point against the basin polygons: we just look up
+        the pixel under the point.
+
+        Args:
+            FullPathRaster (str): The raster name with path and extension
+            column_name (str): If not "None", the labels are also added to the point data under this name
+            NoDataValue (int): The label given to points that are off the raster or on nodata
+
+        Returns:
+            np.array (int): the label of each point
+
+        Author: SMM
+        """
+        # the label raster is kept in memory so tagging lots of point data is quick
+        fingerprint = LSDOst.GetFileFingerprint(FullPathRaster)
+        if FullPathRaster not in _LABEL_RASTERS or _LABEL_RASTERS[FullPathRaster][0] != fingerprint:
+            label_array = LSDMap_IO.ReadRasterArrayBlocks(FullPathRaster)
+            label_array[np.isnan(label_array)] = NoDataValue
+            _LABEL_RASTERS[FullPathRaster] = [fingerprint, label_array.astype(np.int64)]
+        label_array = _LABEL_RASTERS[FullPathRaster][1]
+
+        rows, cols, inside = self.GetRasterRowCol(FullPathRaster)
+        labels = label_array[rows, cols]
+        labels[~inside] = NoDataValue
+
+        if column_name != "None":
+            self._AddColumn(column_name, labels)
+
+        return labels
+
+    def GetRasterValues(self, FullPathRaster, column_name = "None", method = "nearest"):
+        """Gets the values of a raster at the points. Only the parts of the raster
+        with points on them are read.
+
+        Args:
+            FullPathRaster (str): The raster name with path and extension
+            column_name (str): If not "None", the values are also added to the point data under this name
+            method (str): "nearest" or "bilinear"
+
+        Returns:
+            np.array: the raster value at each point, nan if it is off the raster or on nodata
+
+        Author: SMM
+        """
+        EPSG_string = LSDMap_IO.GetUTMEPSG(FullPathRaster)
+        this_index = self.GetSpatialIndex(EPSG_string)
+        values = LSDMap_IO.SampleRasterAtPoints(FullPathRaster, this_index.x, this_index.y, method = method)
+
+        if column_name != "None":
+            self._AddColumn(column_name, values)
+
+        return values
+
+    def _AddColumn(self, column_name, values):
+        """Adds (or replaces) a column of the point data
+
+        Author: SMM
+        """
+        if(self.PANDEX):
+            self.PointData = self.PointData.assign(**{column_name: values})
+        else:
+            self.PointData[column_name] = list(values)
+        if column_name not in self.VariableList:
+            self.VariableList.append(column_name)
+
 ##==============================================================================
 ##==============================================================================
 ## Data manipulation
@@ -483,43 +1257,14 @@ class LSDMap_PointData(object):
         # Get the data for thinning
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
-        else:
-            if(self.PANDEX == False):
-                this_data = self.PointData[data_name]
+            return
 
+        # NB: the pandas version has always kept the values below the threshold
         if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name]<Threshold_value]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+            self.Query().where(data_name, "<", Threshold_value).apply()
         else:
-            this_data = [float(x) for x in this_data]
-
-
-            # Start a new data dict
-            NewDataDict = {}
-            NewLat = []
-            NewLon = []
-            for name in self.VariableList:
-                NewDataDict[name] = []
-
-
-            # Get all the data to be delelted
-            delete_indices = []
-            for index, data in enumerate(this_data):
-                if data<Threshold_value:
-                    delete_indices.append(index)
-                else:
-                    NewLat.append(self.Latitude[index])
-                    NewLon.append(self.Longitude[index])
-                    for name in self.VariableList:
-                        this_element = self.PointData[name][index]
-                        NewDataDict[name].append(this_element)
-
-
-            # Now reset the data dict
-            self.PointData = NewDataDict
-            self.Latitude = NewLat
-            self.Longitude = NewLon
+            this_data = np.asarray(self.PointData[data_name], dtype=float)
+            self._KeepRows(np.flatnonzero(this_data >= Threshold_value))
 
 
 ##==============================================================================
@@ -547,52 +1292,15 @@ class LSDMap_PointData(object):
         # Get the data for thinning
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
-        else:
-            if(self.PANDEX == False):
-                this_data = self.PointData[data_name]
+            return
         if(self.PANDEX):
-            self.PointData = self.PointData[self.PointData[data_name].isin(data_for_selection_list)]
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+            self.Query().isin(data_name, data_for_selection_list).apply()
         else:
-            this_data = [int(x) for x in this_data]
-            #print("The original data I need to thin is: ")
-            #print(this_data)
-
-
-            # Start a new data dict
-            NewDataDict = {}
-            NewLat = []
-            NewLon = []
-            for name in self.VariableList:
-                NewDataDict[name] = []
-
-
-            # Get all the data to be deleted
             print("The data I am keeping is: ")
             print(data_for_selection_list)
-            delete_indices = []
-            for index, data in enumerate(this_data):
-                #print("Data: "+str(data))
-                if data not in data_for_selection_list:
-                    #print("I'm not keeping it")
-                    delete_indices.append(index)
-                else:
-                    #print("I'll have that one. ")
-                    NewLat.append(self.Latitude[index])
-                    NewLon.append(self.Longitude[index])
-                    for name in self.VariableList:
-                        this_element = self.PointData[name][index]
-                        NewDataDict[name].append(this_element)
-
+            this_data = np.asarray(self.PointData[data_name]).astype(int)
+            self._KeepRows(np.flatnonzero(np.isin(this_data, data_for_selection_list)))
 
-            # Now reset the data dict
-            self.PointData = NewDataDict
-            self.Latitude = NewLat
-            self.Longitude = NewLon
-
-        #print("The updated data is:")
-        #print(self.PointData[data_name])
 ##==============================================================================
 ##==============================================================================
 ## Data manipulation
@@ -600,7 +1308,7 @@ class LSDMap_PointData(object):
 ##==============================================================================
     def selectValue(self,data_name,value = 0, operator = "=="):
         """
-        This function masks the dataset to one or several specific value for a column. Only work for PANDEX mode.
+        This function masks the dataset to one or several specific value for a column.
 
         Args:
             data_name (str): The name of the data member to select
@@ -621,35 +1329,19 @@ class LSDMap_PointData(object):
         # Get the data for thinning
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
-        else:
-            if(self.PANDEX == False):
-                print("You need to be in PANDEX mode to sort this data as I am trying to get everyone use it, sorry not sorry. To do so, add PANDEX = True when loading the data.")
-        if(self.PANDEX):
-            if(operator == "=="):
-                if(isinstance(value,list) == False):
-                    value = [value]
-                self.PointData = self.PointData[self.PointData[data_name].isin(value)]
-            else:
-                if(operator ==">" and isinstance(value,list)==False):
-                    self.PointData = self.PointData[self.PointData[data_name]>value]
-                else:
-                    if(operator =="<" and isinstance(value,list)==False):
-                        self.PointData = self.PointData[self.PointData[data_name]<value]
-                    else:
-                        if(operator == "!="):
-                            if(isinstance(value,list) == False):
-                                value = [value]
-                            self.PointData = self.PointData[~self.PointData[data_name].isin(value)]
-                        else:
-                            print("Something wrong happened, are you trying to select your data using < or > with a list rather than a single value??? in this case I cannot do it yet I am so sorry.")
-            self.Longitude = self.PointData["longitude"]
-            self.Latitude = self.PointData["latitude"]
+            return
+        if(isinstance(value,list) and operator in [">","<"]):
+            print("Something wrong happened, are you trying to select your data using < or > with a list rather than a single value??? in this case I cannot do it yet I am so sorry.")
+            return
+        if(operator not in ["==",">","<","!="]):
+            print("Something wrong happened, I don't know the operator "+str(operator))
+            return
+        self.Query().where(data_name, operator, value).apply()
 
 
     def ThinDataFromKey(self,data_name,data_key):
         """This function takes a key for a value and retains the members in data name corresponding to that selection.
         Similar to ThinDataSelection but just takes one key rather than a list.
-        Not compatible with PANDEX
 
         Args:
             data_name (str): The name of the data member to select
@@ -666,44 +1358,10 @@ class LSDMap_PointData(object):
         # Get the data for thinning
         if data_name not in self.VariableList:
             print("The data " + data_name + " is not one of the data elements in this point data")
-        else:
-            this_data = self.PointData[data_name]
-
-        this_data = [int(x) for x in this_data]
-        #print("The original data I need to thin is: ")
-        #print(this_data)
-
-
-        # Start a new data dict
-        NewDataDict = {}
-        NewLat = []
-        NewLon = []
-        for name in self.VariableList:
-            NewDataDict[name] = []
-
-
-        # Get all the data to be deleted
-        print("The data I am keeping is: ")
-        print(data_key)
-        delete_indices = []
-        for index, data in enumerate(this_data):
-            #print("Data: "+str(data))
-            if data != data_key:
-                #print("I'm not keeping it")
-                delete_indices.append(index)
-            else:
-                #print("I'll have that one. ")
-                NewLat.append(self.Latitude[index])
-                NewLon.append(self.Longitude[index])
-                for name in self.VariableList:
-                    this_element = self.PointData[name][index]
-                    NewDataDict[name].append(this_element)
-
+            return
 
-        # Now reset the data dict
-        self.PointData = NewDataDict
-        self.Latitude = NewLat
-        self.Longitude = NewLon
+        this_data = self._GetColumnArray(data_name).astype(int)
+        self._KeepRows(np.flatnonzero(this_data == data_key))
 
 
 
@@ -712,90 +1370,40 @@ class LSDMap_PointData(object):
 ## Format conversion
 ##==============================================================================
 ##==============================================================================
+    def _GetDataChunks(self, chunk_rows = 100000):
+        """Yields the data as pandas dataframes of chunk_rows rows
+
+        Author: SMM
+        """
+        n_rows = self._GetNRows()
+        for start in range(0, n_rows, chunk_rows):
+            if(self.PANDEX):
+                yield self.PointData.iloc[start:start+chunk_rows]
+            else:
+                yield pandas.DataFrame(dict((name, self.PointData[name][start:start+chunk_rows]) for name in self.VariableList),
+                                       columns = self.VariableList)
+
     # This translates the CRNData object to an Esri shapefile
-    def TranslateToReducedShapefile(self,FileName):
+    def TranslateToReducedShapefile(self,FileName, file_format = "shapefile"):
         """This converts the point data to a shapefile
 
         Args:
             FileName (str): the name of the file to be printed. The code strips the extension and turns it into .shp, so you can give it the name of the csv file and ti will still work.
+            file_format (str): You can also write a "GPKG" (GeoPackage) or "FlatGeobuf" here, they are much quicker for big files
 
         Return:
             None, but prints a new shapefile
 
         Author: SMM
         """
-
-        import osgeo.ogr as ogr
-
-        #  set up the shapefile driver
-        driver = ogr.GetDriverByName("ESRI Shapefile")
-
         # Get the path to the file
         this_path = LSDOst.GetPath(FileName)
         DataName = self.FilePrefix
 
-        FileOut = this_path+DataName+".shp"
+        FileOut = this_path+DataName+_GIS_FORMATS[file_format][1]
 
         print("The filename will be: " + FileOut)
-
-        # delete the existing file
-        if os.path.exists(FileOut):
-            driver.DeleteDataSource(FileOut)
-            print("That file exists, I am deleting it in order to start again.")
-        else:
-            print("I am making a new shapefile for you")
-
-        # create the data source
-        data_source = driver.CreateDataSource(FileOut)
-
-        # create the spatial reference, in this case WGS84 (which is ESPG 4326)
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)
-
-        print("Creating the layer")
-
-        # create the layer
-        layer = data_source.CreateLayer(DataName, srs, ogr.wkbPoint)
-
-        # Add the field names
-        for index,name in enumerate(self.VariableList):
-            print("The variable name is " + name + " and the type is: " + str(self.DataTypes[index]))
-
-
-            if self.DataTypes[index] is int:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTInteger))
-            elif self.DataTypes[index] is float:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
-            elif self.DataTypes[index] is str:
-                print("Making a sting layer for layer " + name)
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTString))
-            else:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
-
-        # Process the text file and add the attributes and features to the shapefile
-        for index,lat in enumerate(self.Latitude):
-
-            # create the feature
-            feature = ogr.Feature(layer.GetLayerDefn())
-
-            for name in self.VariableList:
-                feature.SetField(name, self.PointData[name][index])
-
-            # create the WKT for the feature using Python string formatting
-            wkt = "POINT(%f %f)" %  (float(self.Longitude[index]), float(self.Latitude[index]))
-
-            # Create the point from the Well Known Txt
-            point = ogr.CreateGeometryFromWkt(wkt)
-
-            # Set the feature geometry using the point
-            feature.SetGeometry(point)
-            # Create the feature in the layer (shapefile)
-            layer.CreateFeature(feature)
-            # Destroy the feature to free resources
-            feature.Destroy()
-
-        # Destroy the data source to free resources
-        data_source.Destroy()
+        WritePointChunksToGIS(self._GetDataChunks(), FileOut, file_format, DataName)
 
 
     # This translates the CRNData object to an GeoJSON
@@ -810,16 +1418,6 @@ class LSDMap_PointData(object):
 
         Author: SMM
         """
-
-        # Parse a delimited text file of volcano data and create a shapefile
-
-        import osgeo.ogr as ogr
-        import osgeo.osr as osr
-
-
-        #  set up the shapefile driver
-        driver = ogr.GetDriverByName("GeoJSON")
-
         # Get the path to the file
         this_path = LSDOst.GetPath(FileName)
         DataName = self.FilePrefix
@@ -827,61 +1425,4 @@ class LSDMap_PointData(object):
         FileOut = this_path+DataName+".geojson"
 
         print("The filename will be: " + FileOut)
-
-        # delete the existing file
-        if os.path.exists(FileOut):
-            driver.DeleteDataSource(FileOut)
-
-        # create the data source
-        data_source = driver.CreateDataSource(FileOut)
-
-        # create the spatial reference,  in this case WGS84 (which is ESPG 4326)
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)
-
-        print("Creating the layer")
-
-        # create the layer
-        layer = data_source.CreateLayer("PointData", srs, ogr.wkbPoint)
-
-        #print "Adding the field names"
-
-        # Add the field names
-        for index,name in enumerate(self.VariableList):
-            print("The variable name is " + name + " and the type is: " + str(self.DataTypes[index]))
-
-
-            if self.DataTypes[index] is int:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTInteger))
-            elif self.DataTypes[index] is float:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
-            elif self.DataTypes[index] is str:
-                print("Making a sting layer for layer " + name)
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTString))
-            else:
-                layer.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
-
-        # Process the text file and add the attributes and features to the shapefile
-        for index,lat in enumerate(self.Latitude):
-
-            # create the feature
-            feature = ogr.Feature(layer.GetLayerDefn())
-
-            for name in self.VariableList:
-                feature.SetField(name, self.PointData[name][index])
-
-            # create the WKT for the feature using Python string formatting
-            wkt = "POINT(%f %f)" %  (float(self.Longitude[index]), float(self.Latitude[index]))
-
-            # Create the point from the Well Known Txt
-            point = ogr.CreateGeometryFromWkt(wkt)
-
-            # Set the feature geometry using the point
-            feature.SetGeometry(point)
-            # Create the feature in the layer (shapefile)
-            layer.CreateFeature(feature)
-            # Destroy the feature to free resources
-            feature.Destroy()
-
-        # Destroy the data source to free resources
-        data_source.Destroy()
+        WritePointChunksToGIS(self._GetDataChunks(), FileOut, "GeoJSON", "PointData")
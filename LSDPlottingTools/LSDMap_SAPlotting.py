@@ -27,6 +27,64 @@ from LSDMapFigure import PlottingHelpers as Helper
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 ## Regressions
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+def GroupedLinearRegression(df, group_columns, x_column, y_column, basin_list=[]):
+    """
+    This function does a linear regression of y_column against x_column for every
+    group in the dataframe (e.g. every basin, or every basin and source) at once.
+    Instead of masking the dataframe for each group it adds up the sums the
+    regression needs for all the groups in a single pass, so it is quick
+    even with thousands of basins.
+
+    Args:
+        df (pandas dataframe): the data
+        group_columns (list): the columns that define a group. The first one must be the basin key.
+        x_column (str): the header of the x data
+        y_column (str): the header of the y data
+        basin_list: a list of the basins to analyse, default = empty (all basins)
+
+    Returns:
+        pandas dataframe with a row for each group: the group columns and then
+        'regression_slope', 'intercept', 'std_err', 'R2', 'p_value' and 'n_points'.
+        The groups come in the order of basin_list, and then in the order they appear in the data.
+
+    Author: SMM
+    """
+    if len(basin_list) != 0:
+        df = df[df[group_columns[0]].isin(basin_list)]
+
+    codes, n_groups = LSDStats.get_group_codes(df, group_columns)
+    regression = LSDStats.linregress_by_group(df[x_column].values, df[y_column].values, codes, n_groups)
+
+    # the first row of each group gives the keys of the group
+    first_rows = np.unique(codes[codes >= 0], return_index=True)[1]
+    OutDF = df.iloc[np.flatnonzero(codes >= 0)[first_rows]][group_columns].reset_index(drop=True)
+    OutDF['regression_slope'] = regression['slope']
+    OutDF['intercept'] = regression['intercept']
+    OutDF['std_err'] = regression['stderr']
+    OutDF['R2'] = regression['rvalue']**2
+    OutDF['p_value'] = regression['pvalue']
+    OutDF['n_points'] = regression['n']
+
+    # put the basins in the order of the basin list
+    if len(basin_list) != 0:
+        basin_order = pd.Series(np.arange(len(basin_list)), index=list(basin_list))
+        basin_order = basin_order[~basin_order.index.duplicated()]
+        order = np.argsort(basin_order.reindex(OutDF[group_columns[0]]).values, kind='stable')
+        OutDF = OutDF.iloc[order].reset_index(drop=True)
+
+    return OutDF
+
+def _GetLogRawSAData(df):
+    """
+    Adds the log of the slope and drainage area to the raw SA data, removing
+    the nodes with no drainage area.
+
+    Author: SMM
+    """
+    df = df[df['drainage_area'] != 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return df.assign(logS = np.log10(df['slope'].values), logA = np.log10(df['drainage_area'].values))
+
 def LinearRegressionRawData(DataDirectory, DEM_prefix, basin_list=[],parallel=False):
     """
     This function performs a linear regression on all of the slope-area data.
@@ -36,6 +94,7 @@ def LinearRegressionRawData(DataDirectory, DEM_prefix, basin_list=[],parallel=Fa
         DataDirectory (str): the data directory
         DEM_prefix (str): the prefix of the DEM_prefix
         basin_list: a list of the basins to analyse, default = empty (all basins)
+        parallel (bool): If true the data is in several files, one from each of the parallel runs
 
     Returns:
         pandas dataframe with the linear regression info
@@ -49,34 +108,25 @@ def LinearRegressionRawData(DataDirectory, DEM_prefix, basin_list=[],parallel=Fa
       df = Helper.AppendRawSAData(DataDirectory, DEM_prefix)
 
     # get a list of the basins if needed
-    if basin_list == []:
+    if len(basin_list) == 0:
         print ("You didn't give me a basin list so I will analyse all the basins")
         basin_list = df['basin_key'].unique()
 
     # now do a linear regression for each basin
-    columns = ['basin_key', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-
-    for basin_key in basin_list:
-        df_slope = (df[df['basin_key']==basin_key]['slope']).values
-        df_area = (df[df['basin_key']==basin_key]['drainage_area']).values
+    RegressionDF = GroupedLinearRegression(_GetLogRawSAData(df), ['basin_key'], 'logA', 'logS', basin_list)
 
-        logS = np.log10(df_slope[df_area!=0])
-        logA = np.log10(df_area[df_area!=0])
-
-        slope, intercept, r_value, p_value, std_err = stats.linregress(logA,logS)
-
-        #print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value))
-        this_key = int(basin_key)
-        this_row = [this_key,abs(slope),std_err,r_value**2,p_value]
-        OutDF.loc[basin_key] = this_row
+    columns = ['basin_key', 'regression_slope', 'std_err', 'R2', 'p_value']
+    OutDF = RegressionDF[columns].copy()
+    OutDF['regression_slope'] = OutDF['regression_slope'].abs()
+    OutDF.index = OutDF['basin_key'].values
+    OutDF['basin_key'] = OutDF['basin_key'].astype(int)
 
     return OutDF
 
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
 ## Regressions
 ##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
-def LinearRegressionRawDataByChannel(DataDirectory, DEM_prefix, basin_list=[]):
+def LinearRegressionRawDataByChannel(DataDirectory, DEM_prefix, basin_list=[], parallel=False):
     """
     This function performs a linear regression on the raw slope-area data separated.
     by channel.
@@ -86,6 +136,7 @@ def LinearRegressionRawDataByChannel(DataDirectory, DEM_prefix, basin_list=[]):
         DataDirectory (str): the data directory
         DEM_prefix (str): the prefix of the DEM_prefix
         basin_list: a list of the basins to analyse, default = empty (all basins)
+        parallel (bool): If true the data is in several files, one from each of the parallel runs
 
     Returns:
         pandas dataframe with the linear regression info
@@ -93,43 +144,24 @@ def LinearRegressionRawDataByChannel(DataDirectory, DEM_prefix, basin_list=[]):
     Author: SMM and FJC
     """
     # read in binned data
-
-
-    df = Helper.ReadRawSAData(DataDirectory, DEM_prefix)
+    if not parallel:
+      df = Helper.ReadRawSAData(DataDirectory, DEM_prefix)
+    else:
+      df = Helper.AppendRawSAData(DataDirectory, DEM_prefix)
 
     # get a list of the basins if needed
-    if basin_list == []:
+    if len(basin_list) == 0:
         print ("You didn't give me a basin list so I will analyse all the basins")
         basin_list = df['basin_key'].unique()
         print (basin_list)
 
+    # now do a linear regression for each channel in each basin
+    RegressionDF = GroupedLinearRegression(_GetLogRawSAData(df), ['basin_key', 'source_key'], 'logA', 'logS', basin_list)
 
-    # now do a linear regression for each basin
     columns = ['basin_key', 'source_key', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-    counter = 0
-
-    for basin_key in basin_list:
-        this_df = df[df['basin_key'] == basin_key]
-        # get the sources for this basin
-        these_sources = this_df['source_key'].unique()
-
-        for source in these_sources:
-            #mask the dataframe for this source
-            df_slope = (df[df['source_key']==source]['slope']).values
-            df_area = (df[df['source_key']==source]['drainage_area']).values
-
-            logS = np.log10(df_slope[df_area!=0])
-            logA = np.log10(df_area[df_area!=0])
-
-            slope, intercept, r_value, p_value, std_err = stats.linregress(logA,logS)
-
-            #print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value))
-            this_basin_key = int(basin_key)
-            this_source_key = int(source)
-            this_row = [this_basin_key,this_source_key,slope,std_err,r_value**2,p_value]
-            OutDF.loc[counter] = this_row
-            counter+=1
+    OutDF = RegressionDF[columns].copy()
+    OutDF['basin_key'] = OutDF['basin_key'].astype(int)
+    OutDF['source_key'] = OutDF['source_key'].astype(int)
 
     return OutDF
 
@@ -152,35 +184,18 @@ def LinearRegressionSegmentedData(DataDirectory, DEM_prefix, basin_list=[]):
     df = Helper.ReadSegmentedSAData(DataDirectory, DEM_prefix)
 
     # get a list of the basins if needed
-    if basin_list == []:
+    if len(basin_list) == 0:
         print ("You didn't give me a basin list so I will analyse all the basins")
         basin_list = df['basin_key'].unique()
 
-    columns = ['basin_key', 'segment_number', 'regression_slope', 'std_err', 'R2', 'p_value']
-    OutDF = pd.DataFrame(columns=columns)
-    counter=0
-
-    # get the segments for each basin
-    for basin_key in basin_list:
-        print ("THIS BASIN IS: "+str(basin_key))
-        SegmentDF = df[df['basin_key'] == basin_key]
-
-        # get the data for each individual segment number
-        segments = SegmentDF['segment_number'].unique()
-
-        for segment_no in segments:
-            print ("Segment number is: "+str(segment_no))
-            ThisDF = SegmentDF[SegmentDF['segment_number']==segment_no]
-            #now regress the data for this segment to get the best fit m/n
-            median_log_S = ThisDF['median_log_S']
-            median_log_A = ThisDF['median_log_A']
-            slope, intercept, r_value, p_value, std_err = stats.linregress(median_log_A,median_log_S)
-            print("Slope: " +str(slope)+ " std_err: "+str(std_err)+ " R2 is: " + str(r_value**2) + " p value is: " + str(p_value) + " intercept is: " +str(intercept))
+    # regress the data for every segment to get the best fit m/n
+    RegressionDF = GroupedLinearRegression(df, ['basin_key', 'segment_number'], 'median_log_A', 'median_log_S', basin_list)
+    print("I regressed "+str(len(RegressionDF))+" segments in "+str(RegressionDF['basin_key'].nunique())+" basins")
 
-            this_key = int(basin_key)
-            this_row = [this_key,int(segment_no),slope,std_err,r_value**2,p_value]
-            OutDF.loc[counter] = this_row
-            counter+=1
+    columns = ['basin_key', 'segment_number', 'regression_slope', 'std_err', 'R2', 'p_value']
+    OutDF = RegressionDF[columns].copy()
+    OutDF['basin_key'] = OutDF['basin_key'].astype(int)
+    OutDF['segment_number'] = OutDF['segment_number'].astype(int)
 
     return OutDF
 
@@ -329,10 +344,10 @@ def SAPlotDriver(DataDirectory, DEM_prefix, FigFormat = 'show', size_format = "E
         print("I am going to show the raw data.")
         all_csv_fname = DataDirectory+DEM_prefix+'_SAvertical.csv'
         if not parallel:
-            allPointData = PointTools.LSDMap_PointData(all_csv_fname)
+            allPointData = PointTools.LSDMap_PointData(all_csv_fname, compact_dtypes = True)
         else:
             allPointData = Helper.AppendSAVerticalCSVs(DataDirectory, DEM_prefix)
-            allPointData = PointTools.LSDMap_PointData(all_csv_fname)
+            allPointData = PointTools.LSDMap_PointData(all_csv_fname, compact_dtypes = True)
 
     # Read in the segmented data
     if(show_segments):
@@ -444,19 +459,8 @@ def BinnedRegressionDriver(DataDirectory, DEM_prefix, basin_keys = []):
     #print(final_basin_keys)
 
     print("There are "+str(len(final_basin_keys))+"basins that I will plot")
-    mn_by_basin_dict = {}
-    #basin_keys.append(0)
-    # Loop through the basin keys, making a plot for each one
-    for basin_key in final_basin_keys:
-
-        (m1,m2,m3,m4) = BinnedRegression(binnedPointData, basin_key)
-        this_basin_SA_mn = []
-        this_basin_SA_mn.append(m1)
-        this_basin_SA_mn.append(m2)
-        this_basin_SA_mn.append(m3)
-        this_basin_SA_mn.append(m4)
-
-        mn_by_basin_dict[basin_key] = this_basin_SA_mn
+    # regress all the basins at once
+    mn_by_basin_dict = BinnedRegressionAllBasins(binnedPointData, final_basin_keys)
 
     return mn_by_basin_dict
 
@@ -911,91 +915,78 @@ def BinnedWithRawSlopeAreaPlot(DataDirectory, fname_prefix, FigFileName = 'Image
 
 def BinnedRegression(BinnedPointData, basin_key):
     """
-    This function makes a slope-area plot from the chi mapping tool using the binned data.
-    It plots all the sources and all the raw data as semitransparent background.
+    This function gets the best fit m/n of a basin from a regression of the
+    binned slope-area data: from the mainstem and from all the data, and both
+    of these with outliers removed. See BinnedRegressionAllBasins if you want
+    more than one basin.
 
     Args:
-        PointData : LSDPointData object produced from the csv file with binned and segmented slope area data. Produced by chi mapping tool. It should have the extension "_SAsegmented.csv"
-        FigFileName (str): The name of the figure file
-        basin_key (int): the ID of the basin to make the plot for.#
+        BinnedPointData : LSDPointData object produced from the csv file with binned slope area data. Produced by chi mapping tool. It should have the extension "_SAbinned.csv"
+        basin_key (int): the ID of the basin
 
     Returns:
-         Does not return anything but makes a plot.
+         m/n of the mainstem, mainstem with outliers removed, all data, all data with outliers removed
 
     Author: SMM
     """
-
-    # Get the slope, drainage area, basin ID and source ID
-    median_log_S = BinnedPointData.QueryData('median_log_S')
-    median_log_S = [float(x) for x in median_log_S]
-    median_log_A = BinnedPointData.QueryData('median_log_A')
-    median_log_A = [float(x) for x in median_log_A]
-    basin = BinnedPointData.QueryData('basin_key')
-    basin = [int(x) for x in basin]
-    source_number = BinnedPointData.QueryData('source_key')
-    source_number = [int(x) for x in source_number]
-
-    # get the errors
-    firstquartile= BinnedPointData.QueryData('logS_FirstQuartile')
-    firstquartile = [float(x) for x in firstquartile]
-    thirdquartile= BinnedPointData.QueryData('logS_ThirdQuartile')
-    thirdquartile = [float(x) for x in thirdquartile]
-
-    #print("The lengths of the data vectors:")
-    #print(len(median_log_S))
-    #print(len(median_log_A))
-    #print(len(basin))
-    #print(len(source_number))
-    #print("Size of quartiles: "+ str( len(firstquartile))+ " "+str( len(thirdquartile)))
-
-    # need to convert everything into arrays so we can mask different basins
-    MedianLogSlope = np.asarray(median_log_S)
-    MedianLogArea = np.asarray(median_log_A)
-    FirstQuartile = np.asarray(firstquartile)
-    ThirdQuartile = np.asarray(thirdquartile)
-    Basin = np.asarray(basin)
-    SourceNumber = np.asarray(source_number)
-
-    # Get the errors
-    yerr_down= np.subtract(ThirdQuartile,median_log_S)
-    yerr_up= np.subtract(median_log_S,FirstQuartile)
-
-    # mask to just get the data for the basin of interest
     print("The basin key is: "+str(basin_key))
-    m = np.ma.masked_where(Basin!=basin_key, Basin)
-    MedianLogSlope = np.ma.masked_where(np.ma.getmask(m), MedianLogSlope)
-    MedianLogArea = np.ma.masked_where(np.ma.getmask(m), MedianLogArea)
-    SourceNumber = np.ma.masked_where(np.ma.getmask(m), SourceNumber)
+    mn_by_basin_dict = BinnedRegressionAllBasins(BinnedPointData, [basin_key])
+    (m_ms,m_ms_remove_outlier,m_all,m_all_remove_outlier) = mn_by_basin_dict[basin_key]
 
-    # get the compressed data
-    SlopeCompressed = np.ma.compressed(MedianLogSlope)
-    AreaCompressed = np.ma.compressed(MedianLogArea)
-    SourceCompressed = np.ma.compressed(SourceNumber)
-
-    # get main stem source
-    mainstem_source = SourceCompressed[0]
-
-    m2 = np.ma.masked_where(SourceCompressed!=mainstem_source, SourceCompressed)
-    MS_Slope =  np.ma.masked_where(np.ma.getmask(m2), SlopeCompressed)
-    MS_Area = np.ma.masked_where(np.ma.getmask(m2), AreaCompressed)
+    return(m_ms,m_ms_remove_outlier,m_all,m_all_remove_outlier)
 
-    MSSlopeCompressed = np.ma.compressed(MS_Slope)
-    MSAreaCompressed = np.ma.compressed(MS_Area)
+def BinnedRegressionAllBasins(BinnedPointData, basin_keys = []):
+    """
+    This function gets the best fit m/n of every basin from a regression of the
+    binned slope-area data, in the same way as BinnedRegression. All the basins
+    are regressed together (and their outliers removed together), rather than
+    masking the data one basin at a time.
 
-    # get the regression from the main stem
-    [MSresiduals,m_ms,b,r,pvalue,stderr]= LSDStats.linregress_residuals(MSAreaCompressed,MSSlopeCompressed)
-    #print("slope of mainstem regression is: "+str(m))
+    Args:
+        BinnedPointData : LSDPointData object produced from the csv file with binned slope area data. Produced by chi mapping tool. It should have the extension "_SAbinned.csv"
+        basin_keys (list): the basins to regress. If empty, all the basins.
 
-    # see if there are any outlying residuals
-    [new_x,new_y, is_outlier_vec, m_ms_remove_outlier,b]= LSDStats.remove_outlying_residuals(MSAreaCompressed,MSSlopeCompressed,MSresiduals)
-    #print("Removed outlier slope from mainstem data: " +str(m))
+    Returns:
+         A dict where the key is the basin key and the value is a list with the m/n of
+         the mainstem, mainstem with outliers removed, all data, all data with outliers removed
 
-    # get the regression from all the data
-    [residuals,m_all,b,r,pvalue,stderr]= LSDStats.linregress_residuals(AreaCompressed,SlopeCompressed)
-    #print("slope of all data is: "+str(m))
+    Author: SMM
+    """
+    # Get the slope, drainage area, basin ID and source ID
+    MedianLogSlope = np.asarray(BinnedPointData.QueryData('median_log_S'), dtype=np.float64)
+    MedianLogArea = np.asarray(BinnedPointData.QueryData('median_log_A'), dtype=np.float64)
+    Basin = np.asarray(BinnedPointData.QueryData('basin_key'), dtype=np.float64).astype(np.int64)
+    SourceNumber = np.asarray(BinnedPointData.QueryData('source_key'), dtype=np.float64).astype(np.int64)
+
+    # get a code for each basin, -1 for the basins we don't want
+    if len(basin_keys) == 0:
+        basin_keys = np.unique(Basin)
+    basin_keys = [int(x) for x in basin_keys]
+    codes = pd.Index(basin_keys).get_indexer(Basin)
+    n_basins = len(basin_keys)
+
+    # the main stem is the first source of each basin
+    in_basins = np.flatnonzero(codes >= 0)
+    first_row = np.full(n_basins, -1, dtype=np.int64)
+    first_row[codes[in_basins[::-1]]] = in_basins[::-1]
+    mainstem_source = SourceNumber[np.maximum(first_row, 0)]
+    is_mainstem = (codes >= 0) & (SourceNumber == mainstem_source[np.maximum(codes, 0)])
+    ms_codes = np.where(is_mainstem, codes, -1)
+
+    # get the regression from the main stem, and then with the outlying residuals removed
+    ms_regression = LSDStats.linregress_by_group(MedianLogArea, MedianLogSlope, ms_codes, n_basins)
+    is_outlier_vec, ms_regression_remove_outlier = LSDStats.remove_outlying_residuals_by_group(MedianLogArea, MedianLogSlope, ms_codes, n_basins)
+
+    # get the regression from all the data, and then with the outlying residuals removed
+    all_regression = LSDStats.linregress_by_group(MedianLogArea, MedianLogSlope, codes, n_basins)
+    is_outlier_vec, all_regression_remove_outlier = LSDStats.remove_outlying_residuals_by_group(MedianLogArea, MedianLogSlope, codes, n_basins)
 
-    # see if there are any outlying residuals
-    [new_x,new_y, is_outlier_vec, m_all_remove_outlier,b]= LSDStats.remove_outlying_residuals(AreaCompressed,SlopeCompressed,residuals)
-    #print("Removed outlier slope from all data: " +str(m))
+    mn_by_basin_dict = {}
+    for i, basin_key in enumerate(basin_keys):
+        if first_row[i] < 0:
+            print("You were looking for basin "+str(basin_key)+ " but it isn't in the basin keys.")
+            continue
+        mn_by_basin_dict[basin_key] = [ms_regression["slope"][i], ms_regression_remove_outlier["slope"][i],
+                                       all_regression["slope"][i], all_regression_remove_outlier["slope"][i]]
 
-    return(m_ms,m_ms_remove_outlier,m_all,m_all_remove_outlier)
+    return mn_by_basin_dict
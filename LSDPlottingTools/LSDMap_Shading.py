@@ -0,0 +1,300 @@
+## LSDMap_Shading.py
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## Shaded relief for maps: multi-directional hillshade, slope-shade and
+## sky-view factor.
+##
+## The multi-directional hillshade lights the DEM from several azimuths; each
+## light leaves the slopes facing away from it in shadow and the lights are
+## then averaged, so ridges stand out whichever way they run.
+##
+## All the products are made in one pass over the DEM. The DEM is split into
+## blocks of rows (with a halo of extra rows so the edges of the blocks are
+## right) and the blocks are shaded on a pool of threads; numpy lets go of the
+## GIL in the heavy array operations so the threads really run in parallel.
+## The gradient of each block is only computed once and shared by the
+## hillshade and the slope-shade.
+##
+## The products are written straight into memory mapped ENVI rasters next to
+## the DEM, so you never hold more than a few blocks in memory, and you can
+## drape them with a MapFigure:
+##
+##    shaded = LSDMap_Shading.ShadeDEM(DataDirectory, fname_prefix)
+##    MF = MapFigure(fname_prefix+"_MDHS.bil", DataDirectory, coord_type="UTM_km")
+##    MF.add_drape_image(fname_prefix+"_SVF.bil", DataDirectory, colourmap = "gray", alpha = 0.4)
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+## SMM
+## 19/10/2026
+##=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import LSDPlottingTools.LSDMap_GDALIO as LSDMap_IO
+
+# The products, and the suffix of the raster each one is written to
+_SHADING_SUFFIXES = {"multi_hillshade": "_MDHS", "slopeshade": "_SLSH", "skyview": "_SVF"}
+
+#==============================================================================
+def GetSkyViewDirections(n_directions, radius):
+    """This gets the cell offsets of the search lines of the sky-view factor.
+    Each direction is a line of up to radius cells; cells that round onto the
+    same offset are only used once.
+
+    Args:
+        n_directions (int): The number of directions, evenly spaced around the compass
+        radius (int): The search radius in cells
+
+    Returns:
+        A list with, for each direction, a list of (row offset, column offset) tuples
+
+    Author: SMM
+    """
+    directions = []
+    for angle in np.arange(n_directions)*2*np.pi/n_directions:
+        offsets = []
+        for step in range(1, int(radius)+1):
+            # angle is clockwise from north, and rows go south
+            offset = (int(np.round(-step*np.cos(angle))), int(np.round(step*np.sin(angle))))
+            if offset != (0, 0) and offset not in offsets:
+                offsets.append(offset)
+        directions.append(offsets)
+    return directions
+
+#==============================================================================
+def ShadeBlock(block, first_row, n_rows, dx, dy, products = ["multi_hillshade","slopeshade","skyview"],
+               azimuths = [225,270,315,360], azimuth_weights = None, angle_altitude = 45, z_factor = 1,
+               skyview_radius = 10, skyview_directions = 16):
+    """This shades a block of rows of a DEM. The block has some extra rows
+    above and below (the halo) so that the gradients and the sky view at the
+    edge of the block see the neighbouring cells.
+
+    Args:
+        block (np.array): The elevations of the block, with nan for nodata
+        first_row (int): The row of the block where the rows we want start (i.e. the size of the top halo)
+        n_rows (int): The number of rows we want
+        dx (float): The cell size in the x direction
+        dy (float): The cell size in the y direction
+        products (list): The products, from "multi_hillshade", "slopeshade" and "skyview"
+        azimuths (list): The azimuths of the light for the multi-directional hillshade (degrees clockwise from north)
+        azimuth_weights (list): The weight of each azimuth. Default is equal weights.
+        angle_altitude (float): The altitude of the light in degrees
+        z_factor (float): The z factor
+        skyview_radius (int): The search radius of the sky view, in cells
+        skyview_directions (int): The number of search directions of the sky view
+
+    Returns:
+        A dict with the array of each product for the rows we want.
+        The multi-directional hillshade goes from 0 (in shadow from all the lights)
+        to 255 (facing the light), the slope-shade is 255 times the cosine
+        of the slope and the sky view factor goes from 0 (sky completely hidden)
+        to 1 (open sky).
+
+    Author: SMM
+    """
+    shaded = {}
+    rows = slice(first_row, first_row+n_rows)
+
+    if "multi_hillshade" in products or "slopeshade" in products:
+        # the gradient, shared by both products. Rows go south, so the
+        # northward gradient is minus the gradient down the rows
+        dz_drow, dz_dcol = np.gradient(block, dy, dx)
+        p = z_factor*dz_dcol[rows]
+        q = -z_factor*dz_drow[rows]
+        inv_norm = 1.0/np.sqrt(1.0+p*p+q*q)
+
+        if "multi_hillshade" in products:
+            # the cosine of the angle between the surface normal and each light,
+            # set to zero where the surface faces away from the light, then
+            # averaged over the lights
+            if azimuth_weights is None:
+                azimuth_weights = np.ones(len(azimuths))
+            azimuth_weights = np.asarray(azimuth_weights, dtype=float)/np.sum(azimuth_weights)
+            altituderad = np.radians(angle_altitude)
+            illumination = np.zeros_like(p)
+            for azimuth, weight in zip(azimuths, azimuth_weights):
+                azimuthrad = np.radians(azimuth)
+                cos_incidence = np.sin(altituderad)-np.cos(altituderad)*(p*np.sin(azimuthrad)+q*np.cos(azimuthrad))
+                illumination += weight*np.maximum(cos_incidence, 0)
+            shaded["multi_hillshade"] = 255*illumination*inv_norm
+
+        if "slopeshade" in products:
+            shaded["slopeshade"] = 255*inv_norm
+
+    if "skyview" in products:
+        radius = int(skyview_radius)
+        n_cols = block.shape[1]
+        # pad with nan so the search lines can run off the edge of the DEM
+        padded = np.full((block.shape[0]+2*radius, n_cols+2*radius), np.nan)
+        padded[radius:radius+block.shape[0], radius:radius+n_cols] = block
+        centre = block[rows]
+
+        sin_horizon_sum = np.zeros((n_rows, n_cols))
+        max_tan = np.empty((n_rows, n_cols))
+        rise = np.empty((n_rows, n_cols))
+        for offsets in GetSkyViewDirections(skyview_directions, radius):
+            # the steepest angle up to the horizon in this direction, never below the horizontal.
+            # The operations are done in place since this is the slow bit.
+            max_tan.fill(0)
+            for row_offset, col_offset in offsets:
+                r0 = radius+first_row+row_offset
+                c0 = radius+col_offset
+                np.subtract(padded[r0:r0+n_rows, c0:c0+n_cols], centre, out=rise)
+                rise *= z_factor/np.hypot(row_offset*dy, col_offset*dx)
+                # fmax ignores the nan of cells off the DEM
+                np.fmax(max_tan, rise, out=max_tan)
+            sin_horizon_sum += max_tan/np.sqrt(1.0+max_tan*max_tan)
+        skyview = 1.0-sin_horizon_sum/skyview_directions
+        skyview[np.isnan(centre)] = np.nan
+        shaded["skyview"] = skyview
+
+    return shaded
+
+#==============================================================================
+def _GetBlockRows(n_rows, block_rows, halo):
+    """This gets the rows of each block: the rows it shades and the rows it
+    reads (which include the halo).
+
+    Author: SMM
+    """
+    blocks = []
+    for row_start in range(0, n_rows, block_rows):
+        row_end = min(row_start+block_rows, n_rows)
+        read_start = max(0, row_start-halo)
+        read_end = min(n_rows, row_end+halo)
+        blocks.append((row_start, row_end, read_start, read_end))
+    return blocks
+
+#==============================================================================
+def ShadeArray(dem, dx, dy = None, NoDataValue = -9999, block_rows = 512, n_workers = None, **kwargs):
+    """This shades a DEM array in memory. See ShadeBlock for the products and their options.
+
+    Args:
+        dem (np.array): The elevations
+        dx (float): The cell size in the x direction
+        dy (float): The cell size in the y direction, default is dx
+        NoDataValue (float): Elevations with this value are nodata
+        block_rows (int): The number of rows in each block
+        n_workers (int): The number of threads. Default is one per cpu.
+        kwargs: passed to ShadeBlock (products, azimuths, angle_altitude, z_factor, ...)
+
+    Returns:
+        A dict with the array of each product
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    if dy is None:
+        dy = dx
+    products = kwargs.get("products", ["multi_hillshade","slopeshade","skyview"])
+    n_rows, n_cols = dem.shape
+    outputs = {}
+    for product in products:
+        outputs[product] = np.full((n_rows, n_cols), np.nan, dtype=np.float32)
+
+    _ShadeBlocks(dem, outputs, dx, dy, NoDataValue, block_rows, n_workers, kwargs)
+    return outputs
+
+#==============================================================================
+def _ShadeBlocks(dem, outputs, dx, dy, NoDataValue, block_rows, n_workers, kwargs):
+    """This shades all the blocks of a DEM on a pool of threads, writing the
+    results into the output arrays (which can be memory maps). Each block
+    writes different rows so the threads don't get in each other's way.
+
+    Author: SMM
+    """
+    n_rows = dem.shape[0]
+    halo = 1
+    if "skyview" in kwargs.get("products", ["multi_hillshade","slopeshade","skyview"]):
+        halo = max(halo, int(kwargs.get("skyview_radius", 10)))
+    blocks = _GetBlockRows(n_rows, block_rows, halo)
+
+    def shade_one_block(block_rows_info):
+        row_start, row_end, read_start, read_end = block_rows_info
+        block = np.array(dem[read_start:read_end], dtype=np.float64)
+        if NoDataValue is not None:
+            block[block == NoDataValue] = np.nan
+        shaded = ShadeBlock(block, row_start-read_start, row_end-row_start, dx, dy, **kwargs)
+        for product, values in shaded.items():
+            outputs[product][row_start:row_end] = values
+        return row_end-row_start
+
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, len(blocks)))
+
+    if n_workers == 1:
+        for block_rows_info in blocks:
+            shade_one_block(block_rows_info)
+    else:
+        pool = ThreadPool(n_workers)
+        try:
+            pool.map(shade_one_block, blocks)
+        finally:
+            pool.close()
+            pool.join()
+
+#==============================================================================
+def ShadeDEM(DataDirectory, fname_prefix, products = ["multi_hillshade","slopeshade","skyview"],
+             block_rows = 512, n_workers = None, NoDataValue = -9999, **kwargs):
+    """This makes shaded relief rasters of a DEM. They are written next to the DEM
+    (fname_prefix+"_MDHS.bil" for the multi-directional hillshade, "_SLSH.bil"
+    for the slope-shade and "_SVF.bil" for the sky view factor) a block at a time
+    through memory maps, so you can shade DEMs that don't fit in memory.
+
+    Args:
+        DataDirectory (str): The path to the data. Needs to have the trailing slash
+        fname_prefix (str): The prefix of the DEM (no extension, it needs to be a .bil)
+        products (list): The products, from "multi_hillshade", "slopeshade" and "skyview"
+        block_rows (int): The number of rows in each block
+        n_workers (int): The number of threads. Default is one per cpu.
+        NoDataValue (float): The nodata value of the outputs (and of the DEM if its header doesn't have one)
+        kwargs: passed to ShadeBlock (azimuths, azimuth_weights, angle_altitude, z_factor, skyview_radius, skyview_directions)
+
+    Returns:
+        A dict with the name (with path) of the raster of each product
+
+    Author: SMM
+
+    Date: 19/10/2026
+    """
+    DEM_name = DataDirectory+fname_prefix+".bil"
+    for product in products:
+        if product not in _SHADING_SUFFIXES:
+            raise ValueError("I don't know the shading product "+product+". Options are "+", ".join(sorted(_SHADING_SUFFIXES)))
+
+    # the cell size
+    NDV, xsize, ysize, GeoT, Projection, DataType = LSDMap_IO.GetGeoInfo(DEM_name)
+    dx = abs(GeoT[1])
+    dy = abs(GeoT[5])
+
+    # map the DEM if we can, otherwise read it
+    dem, dem_NDV = LSDMap_IO.MemmapENVIRaster(DEM_name)
+    if dem is None:
+        dem = LSDMap_IO.ReadRasterArrayBlocks(DEM_name)
+    elif dem_NDV is not None:
+        NDV = dem_NDV
+    if NDV is None:
+        NDV = NoDataValue
+
+    OutFileNames = {}
+    outputs = {}
+    for product in products:
+        OutFileNames[product] = DataDirectory+fname_prefix+_SHADING_SUFFIXES[product]+".bil"
+        outputs[product] = LSDMap_IO.CreateENVIRasterMemmap(DEM_name, OutFileNames[product], noDataValue = NoDataValue)
+
+    print("I am shading "+DEM_name+" in blocks of "+str(block_rows)+" rows. The products are: "+", ".join(products))
+    kwargs["products"] = products
+    _ShadeBlocks(dem, outputs, dx, dy, NDV, block_rows, n_workers, kwargs)
+
+    # nan is nodata in the output rasters
+    for product in products:
+        for row_start in range(0, outputs[product].shape[0], block_rows):
+            rows = outputs[product][row_start:row_start+block_rows]
+            rows[np.isnan(rows)] = NoDataValue
+        outputs[product].flush()
+        print("I wrote "+OutFileNames[product])
+    outputs = None
+
+    return OutFileNames
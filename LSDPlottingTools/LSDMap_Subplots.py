@@ -13,7 +13,9 @@ import os.path
 import numpy as np
 import matplotlib.pyplot as pp
 import string
+import multiprocessing
 import matplotlib.image as mpimg
+import matplotlib.colors as mcolors
 import matplotlib.cm as cmx
 from matplotlib import rcParams
 from . import LSDMap_GDALIO as LSDMap_IO
@@ -149,16 +151,14 @@ def multiple_flood_maps(DataDirectory):
     n_files = len(FPFiles)
     print("Number of files = ", n_files)
 
-    # Now make the subplots
-    fig, ax = pp.subplots(2,3, figsize=(cm2inch(15),cm2inch(11)))
-    ax = ax.ravel()
-
     #use seaborn to get a nice color palette
     cmap_oranges = sns.light_palette("#ff8f66", input="hex", as_cmap=True, reverse=True)
     cmap_ice = sns.light_palette("#00ffff", input="hex", as_cmap=True, reverse=True)
 
     alphabet = list(string.ascii_lowercase)
 
+    # The hillshade and floodplain of each site are rendered in parallel
+    panels = []
     for i in range (n_files):
         print("The floodplain file name is: ", FPFiles[i])
 
@@ -170,25 +170,15 @@ def multiple_flood_maps(DataDirectory):
         HSFile = DataDirectory+split_fname[1]+'_'+split_fname[2]+"_HS.bil"
         print(HSFile)
 
-        hillshade_raster = LSDMap_IO.ReadRasterArrayBlocks(HSFile)
-        FP_raster = LSDMap_IO.ReadRasterArrayBlocks(FPFiles[i])
-        FP_raster = np.ma.masked_where(FP_raster <= 0, FP_raster)
-
-        # now get the extent
-        extent_raster = LSDMap_IO.GetRasterExtent(HSFile)
-
-        # get DEM info
-        CellSize,XMin,XMax,YMin,YMax = LSDMap_IO.GetUTMMaxMin(HSFile)
-        print(YMin, YMax)
-
-        #plot the rasters
-        ax[i].imshow(hillshade_raster, extent = extent_raster, cmap=cmx.gray)
-
         if i < 3:
-            ax[i].imshow(FP_raster, extent = extent_raster, cmap=cmap_oranges, alpha=0.8)
+            panels.append({"hillshade": HSFile, "drape": FPFiles[i], "mask_less_equal": 0, "cmap": cmap_oranges, "alpha": 0.8})
         else:
-            ax[i].imshow(FP_raster, extent = extent_raster, cmap=cmap_ice, alpha=0.6)
+            panels.append({"hillshade": HSFile, "drape": FPFiles[i], "mask_less_equal": 0, "cmap": cmap_ice, "alpha": 0.6})
+
+    # Now make the subplots
+    fig, ax, images = CompositePanels(panels, 2, 3, (cm2inch(15),cm2inch(11)))
 
+    for i in range (n_files):
         ax[i].text(0.03,0.97, alphabet[i], bbox=dict(facecolor='white', edgecolor='k', pad=5), horizontalalignment='left', verticalalignment='top', transform=ax[i].transAxes)
         #scalebars.add_scalebar(ax[i], matchx=False, sizex=500.0, loc=3, borderpad =1, lw=3, matchy=False, hidex=False, hidey=False)
 
@@ -311,17 +301,11 @@ def findmaxval_multirasters(FileList):
     """
     Loops through a list or array of rasters (np arrays)
     and finds the maximum single value in the set of arrays.
+    Uses LSDMap_IO.GetRasterCollectionStatistics, so rasters that have already
+    been scanned aren't read again.
     """
-    overall_max_val = 0
-
-    for i in range (len(FileList)):
-
-        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i])
-        this_max_val = np.nanmax(raster_as_array)
-
-        if this_max_val > overall_max_val:
-            overall_max_val = this_max_val
-            print(overall_max_val)
+    overall_max_val = LSDMap_IO.GetRasterCollectionStatistics(FileList)["max"]
+    print(overall_max_val)
 
     return overall_max_val
 
@@ -329,23 +313,238 @@ def findminval_multirasters(FileList):
     """
     Loops through a list or array of rasters (np arrays)
     and finds the minimum single value in the set of arrays.
+    Uses LSDMap_IO.GetRasterCollectionStatistics, so rasters that have already
+    been scanned aren't read again.
     """
-    overall_min_val = 0
+    overall_min_val = LSDMap_IO.GetRasterCollectionStatistics(FileList)["min"]
+    print(overall_min_val)
+
+    return overall_min_val
 
-    for i in range (len(FileList)):
 
-        raster_as_array = LSDMap_IO.ReadRasterArrayBlocks(FileList[i])
-        this_min_val = np.nanmin(raster_as_array)
+#==============================================================================
+# The panel compositor. Each panel of a multi-panel map (a hillshade with
+# a drape on top) is rendered to an RGBA image in its own worker process,
+# and the images are then laid out in a single matplotlib figure. The
+# rendering is the slow bit, the layout is quick.
+#------------------------------------------------------------------------------
 
-        if this_min_val > overall_min_val:
-            overall_min_val = this_min_val
-            print(overall_min_val)
+# The hillshades the panels use. The key is (source, file, max_pixels), the
+# value (array, step, extent). CompositePanels makes each hillshade once and
+# hands them to the workers when they start, since lots of panels often share
+# the same DEM.
+_PANEL_HILLSHADES = {}
 
-    return overall_min_val
+def _PanelMaxPixels(figsize, dpi, NRows, NCols):
+    """
+    Gets how many pixels (rows, cols) a panel of a figure needs. There is no
+    point rendering more pixels than the figure has, and this is what keeps
+    the memory of the workers bounded.
+    """
+    return (int(np.ceil(float(figsize[1])*dpi/NRows)), int(np.ceil(float(figsize[0])*dpi/NCols)))
+
+def _PanelHillshadeKey(panel):
+    if panel.get("hillshade") is not None:
+        return ("hillshade", panel["hillshade"], panel.get("max_pixels"))
+    return ("elevation", panel["elevation"], panel.get("max_pixels"))
+
+def _MakePanelHillshade(key):
+    """
+    Makes the hillshade of a panel at the resolution of the figure, either
+    reading a hillshade raster ("hillshade") or making it from a DEM
+    ("elevation"). Only the pixels that are kept are read. The DEM is
+    decimated before it is hillshaded, so the slopes are scaled by the step.
+    """
+    source, raster_file, max_pixels = key
+    if source == "hillshade":
+        hillshade, step = LSDMap_IO.ReadRasterArrayDecimated(raster_file, max_pixels)
+    else:
+        elevation, step = LSDMap_IO.ReadRasterArrayDecimated(raster_file, max_pixels)
+        hillshade = LSDMap_BP.Hillshade(elevation, z_factor = 1.0/step)
+        del elevation
+    extent_raster = LSDMap_IO.GetRasterExtent(raster_file)
+    return (np.ascontiguousarray(hillshade, dtype=np.float32), step, extent_raster)
+
+def _GetPanelHillshade(panel):
+    """
+    Gets the hillshade of a panel, making it if it hasn't been made yet.
+    """
+    key = _PanelHillshadeKey(panel)
+    if key not in _PANEL_HILLSHADES:
+        _PANEL_HILLSHADES[key] = _MakePanelHillshade(key)
+    return _PANEL_HILLSHADES[key]
+
+def _InitPanelWorker(hillshades):
+    """
+    Gives a worker process the hillshades, so they are only made once.
+    """
+    _PANEL_HILLSHADES.clear()
+    _PANEL_HILLSHADES.update(hillshades)
+
+def DecimateForPanel(data_array, max_pixels):
+    """
+    Keeps every step-th pixel of an array so it is no bigger than max_pixels
+    (rows, cols), in the same way as the panels are read.
+    """
+    step = LSDMap_IO.GetDecimationStep(data_array.shape, max_pixels)
+    return np.ascontiguousarray(data_array[::step, ::step], dtype=np.float32)
+
+def _ColourArray(data, cmap, vmin = None, vmax = None, alpha = 1.0):
+    """
+    Turns an array into float RGBA in the same way imshow does: nan is
+    transparent and the limits default to the range of the data.
+    """
+    valid = np.isfinite(data)
+    if vmin is None:
+        vmin = np.nanmin(data) if valid.any() else 0
+    if vmax is None:
+        vmax = np.nanmax(data) if valid.any() else 1
+    norm = mcolors.Normalize(vmin = vmin, vmax = vmax)
+    rgba = pp.get_cmap(cmap)(norm(np.where(valid, data, vmin)))
+    rgba[..., 3] = np.where(valid, rgba[..., 3]*alpha, 0)
+    return rgba
+
+def RenderPanel(panel):
+    """
+    Renders one panel of a multi-panel map to an RGBA image. This is run in
+    the worker processes of CompositePanels but you can use it on its own.
+
+    Args:
+        panel (dict): The panel. Keys:
+            "hillshade": a hillshade raster, or "elevation": a DEM to make a hillshade from
+            "drape": a raster to drape over the hillshade (optional)
+            "cmap": the colourmap of the drape (a name or a colourmap)
+            "vmin", "vmax": the limits of the drape colour scale
+            "alpha": the transparency of the drape (default 1)
+            "mask_below", "mask_above": drape values below/above these are not plotted
+            "middle_mask_range": drape values inside this (min,max) are not plotted
+            "mask_less_equal": drape values less than or equal to this are not plotted
+            "max_pixels": (rows, cols) the most pixels the image needs
+            "drape_array": the drape, already decimated (see DecimateForPanel), if you have read it already
+
+    Returns:
+        The RGBA image (uint8) and the extent [xmin, xmax, ymin, ymax]
+
+    Author: FJC
+    """
+    hillshade, step, extent_raster = _GetPanelHillshade(panel)
+    rgba = _ColourArray(hillshade, "gray")
+
+    if panel.get("drape_array") is not None:
+        drape = np.array(panel["drape_array"], dtype=np.float32)
+    elif panel.get("drape") is not None:
+        drape = LSDMap_IO.ReadRasterArrayDecimated(panel["drape"], step = step)[0]
+    else:
+        drape = None
+
+    if drape is not None:
+
+        # clip the drape
+        with np.errstate(invalid = "ignore"):
+            if panel.get("mask_below") is not None:
+                drape[drape < panel["mask_below"]] = np.nan
+            if panel.get("mask_above") is not None:
+                drape[drape > panel["mask_above"]] = np.nan
+            if panel.get("mask_less_equal") is not None:
+                drape[drape <= panel["mask_less_equal"]] = np.nan
+            if panel.get("middle_mask_range") is not None:
+                middle_mask_range = panel["middle_mask_range"]
+                drape[np.logical_and(drape > middle_mask_range[0], drape < middle_mask_range[1])] = np.nan
+
+        drape_rgba = _ColourArray(drape, panel.get("cmap"), panel.get("vmin"), panel.get("vmax"), panel.get("alpha", 1.0))
+        del drape
+
+        # put the drape on top of the hillshade ("over" compositing)
+        top_alpha = drape_rgba[..., 3:]
+        base_alpha = rgba[..., 3:]*(1-top_alpha)
+        out_alpha = top_alpha + base_alpha
+        rgba[..., :3] = (drape_rgba[..., :3]*top_alpha + rgba[..., :3]*base_alpha) / np.maximum(out_alpha, 1e-12)
+        rgba[..., 3:] = out_alpha
+
+    return (rgba*255).round().astype(np.uint8), extent_raster
+
+def CompositePanels(panels, NRows, NCols, figsize, dpi = 300, n_workers = None,
+                    titles = None, subplots_kw = {}):
+    """
+    Renders a list of panels in parallel (see RenderPanel for what goes in a
+    panel) and lays them out in a grid. The hillshades are made once, here,
+    and shared with the workers. Each worker renders one panel at a time and
+    only reads the pixels the figure needs, so the memory used depends on the
+    size of the figure, not the size of the rasters or the number of panels.
+
+    Args:
+        panels (list): A list of panel dicts
+        NRows, NCols (int): The layout of the subplots
+        figsize (tuple): The figure size in inches
+        dpi (int): The resolution of the final figure, used to decide how many pixels each panel needs
+        n_workers (int): The number of worker processes. Default is one per cpu. 1 renders them here.
+        titles (list): Titles of the panels (optional)
+        subplots_kw (dict): Passed to pp.subplots, e.g. sharex and sharey
+
+    Returns:
+        The figure, the raveled axes and the list of AxesImages
+
+    Author: FJC
+    """
+    # how many pixels does a panel need?
+    max_pixels = _PanelMaxPixels(figsize, dpi, NRows, NCols)
+    panels = [dict(panel) for panel in panels]
+    for panel in panels:
+        panel.setdefault("max_pixels", max_pixels)
+
+    # make each hillshade once, here, rather than in every worker
+    hillshades = {}
+    for panel in panels:
+        key = _PanelHillshadeKey(panel)
+        if key not in hillshades:
+            print("Making the hillshade of "+key[1])
+            hillshades[key] = _MakePanelHillshade(key)
+    _InitPanelWorker(hillshades)
+
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, len(panels)))
+
+    print("Rendering "+str(len(panels))+" panels with "+str(n_workers)+" workers")
+    if n_workers == 1:
+        rendered = [RenderPanel(panel) for panel in panels]
+    else:
+        pool = multiprocessing.Pool(n_workers, initializer = _InitPanelWorker, initargs = (hillshades,))
+        try:
+            rendered = pool.map(RenderPanel, panels, 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    f, ax_arr = pp.subplots(NRows, NCols, figsize=figsize, **subplots_kw)
+    ax_arr = np.ravel(ax_arr)
+
+    images = []
+    for i, (rgba, extent_raster) in enumerate(rendered):
+        images.append(ax_arr[i].imshow(rgba, extent=extent_raster, interpolation="nearest"))
+        if titles is not None:
+            ax_arr[i].set_title(titles[i])
+
+    return f, ax_arr, images
+
+def AddSharedColourbar(f, cmap, vmin, vmax, cax_position = [0.9, 0.1, 0.03, 0.8], cbar_label = None):
+    """
+    Adds one colourbar for all the panels of a CompositePanels figure.
+
+    Author: FJC
+    """
+    f.subplots_adjust(right=cax_position[0]-0.05)
+    cax = f.add_axes(cax_position)
+    mappable = cmx.ScalarMappable(norm = mcolors.Normalize(vmin = vmin, vmax = vmax), cmap = pp.get_cmap(cmap))
+    mappable.set_array([])
+    cbar = f.colorbar(mappable, cax=cax)
+    cbar.set_label(cbar_label)
+    return cbar
 
 
 def MultiDrapeFloodMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
-                        drape_min_threshold=None, drape_max=None, cbar_label=None):
+                        drape_min_threshold=None, drape_max=None, cbar_label=None,
+                        n_workers=None, dpi=300):
     """Creates a figure with multiple drape maps over a hillshade.
 
     Plots flood extents from water depth rasters
@@ -368,6 +567,8 @@ def MultiDrapeFloodMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
 		above this value will be masked and not plotted.
 	cbar_label (str, optional): Label for the colourbar on the figure. This
 		is the colourbar for the drape colourmap.
+	n_workers (int, optional): Number of processes rendering the panels, see CompositePanels.
+	dpi (int, optional): The resolution the panels are rendered at.
 
     Notes:
         Consider, if plotting multiple datasets, how you
@@ -387,92 +588,58 @@ def MultiDrapeFloodMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
     """
 
 
-    f, ax_arr = pp.subplots(2, 2, figsize=(10, 5), sharex=True, sharey=True)
-    ax_arr = ax_arr.ravel()
-
     FPFiles = sorted(glob(DataDir+DrapeRasterWild), key=str)
     n_files = len(FPFiles)
     print("Number of files = ", n_files)
 
     elev_raster_file = DataDir + ElevationRaster
 
-    hillshade = LSDMap_BP.Hillshade(elev_raster_file)
-    #hillshade_array = LSDP.ReadRasterArrayBlocks(elev_raster_file)
-
-    # now get the extent
-    extent_raster = LSDMap_IO.GetRasterExtent(elev_raster_file)
-
-    x_min = extent_raster[0]
-    x_max = extent_raster[1]
-    y_min = extent_raster[2]
-    y_max = extent_raster[3]
-
-    # now get the tick marks
-    n_target_tics = 5
-    xlocs,ylocs,new_x_labels,new_y_labels = LSDMap_BP.GetTicksForUTM(elev_raster_file,x_max,x_min,y_max,y_min,n_target_tics)
-
-    print("xmax: " + str(x_max))
-    print("xmin: " + str(x_min))
-    print("ymax: " + str(y_max))
-    print("ymin: " + str(y_min))
-
     """
     Find the maximum water depth in all rasters.
     You need this to normalize the colourscale accross
     all plots when teh imshow is done later.
     """
-
-    try:
+    # if we scan the drapes we keep the decimated arrays for the panels,
+    # so each drape is only read once
+    figsize = (10, 5)
+    max_pixels = _PanelMaxPixels(figsize, dpi, 2, 2)
+    drape_arrays = [None]*n_files
+    if drape_max is None:
         print("Calculating max drape raster value by scanning rasters...")
-        max_water_depth = findmaxval_multirasters(FPFiles)
-        drape_max = max_water_depth
-
-    except:
-        print("Something went wrong trying to obtain the max value in \
-                your drape raster file list.")
-    finally:
-        print("The drape(s) max value is set to: ", drape_max)
-
-
-    #im = mpimg.AxesImage()
+        FP_collection = LSDMap_IO.GetRasterCollectionStatistics(FPFiles, keep_arrays = True,
+                                                                array_filter = lambda data_array: DecimateForPanel(data_array, max_pixels))
+        drape_max = FP_collection["max"]
+        drape_arrays = FP_collection["arrays"]
+        if np.isnan(drape_max):
+            print("Something went wrong trying to obtain the max value in \
+                    your drape raster file list.")
+            drape_max = None
+    print("The drape(s) max value is set to: ", drape_max)
 
+    # Each panel (hillshade + clipped drape) is rendered in its own worker
+    panels = []
+    titles = []
     for i in range(n_files):
-
         print("The floodplain file name is: ", FPFiles[i])
-        FP_raster = LSDMap_IO.ReadRasterArrayBlocks(FPFiles[i])
-        #FP_raster = np.ma.masked_where(FP_raster <= 0, FP_raster)
+        panels.append({"elevation": elev_raster_file, "drape": FPFiles[i], "drape_array": drape_arrays[i],
+                       "cmap": cmap, "vmin": drape_min_threshold, "vmax": drape_max,
+                       "mask_below": drape_min_threshold, "max_pixels": max_pixels})
 
         filename = os.path.basename(FPFiles[i])
         title = lsdlabels.make_line_label(filename)
         print(title)
+        titles.append(title)
 
-        low_values_index = FP_raster < drape_min_threshold
-        FP_raster[low_values_index] = np.nan
-
-        im = ax_arr[i].imshow(hillshade, "gray", extent=extent_raster, interpolation="nearest")
-        """
-        Now we can set vmax to be the maximum water depth we calcualted earlier, making our separate
-        subplots all have the same colourscale
-        """
-        im = ax_arr[i].imshow(FP_raster, cmap, extent=extent_raster,
-                                alpha=1.0, interpolation="nearest",
-                                vmin=drape_min_threshold,
-                                vmax=drape_max)
-        ax_arr[i].set_title(title)
+    """
+    Now we can set vmax to be the maximum water depth we calcualted earlier, making our separate
+    subplots all have the same colourscale
+    """
+    f, ax_arr, images = CompositePanels(panels, 2, 2, figsize, dpi = dpi, n_workers = n_workers,
+                                        titles = titles, subplots_kw = {"sharex": True, "sharey": True})
+    for i in range(n_files):
         pp.setp( ax_arr[i].xaxis.get_majorticklabels(), rotation=70 )
 
-    f.subplots_adjust(right=0.85)
-    cax = f.add_axes([0.9, 0.1, 0.03, 0.8])
-
-    cbar = f.colorbar(im, cax=cax)
-    cbar.set_label(cbar_label)
-    #cbar.set_ticks(np.linspace(0, 8, 8))
-    #cbar = LSDP.colours.colorbar_index(f, cax, 8, cmap,
-    #                                     drape_min_threshold, drape_max)
-
-    #tick_locator = ticker.MaxNLocator(nbins=8)
-    #cbar.locator = tick_locator
-    #cbar.update_ticks()
+    AddSharedColourbar(f, cmap, drape_min_threshold, drape_max, cbar_label = cbar_label)
 
     f.text(0.5, 0.04, 'Easting (m)', ha='center', fontsize=17)
     f.text(0.04, 0.5, 'Northing (m)', va='center', rotation='vertical', fontsize=17)
@@ -481,7 +648,8 @@ def MultiDrapeFloodMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
 def MultiDrapeErodeDiffMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
                         drape_min_threshold=None, cbar_label=None,
                         drape_max_threshold=None,
-                        middle_mask_range=None):
+                        middle_mask_range=None,
+                        n_workers=None, dpi=300):
     """Plots multiple drape maps of erosion/deposition (a DEM of difference)
        over a hillshade raster of the basin.
 
@@ -507,6 +675,8 @@ def MultiDrapeErodeDiffMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
                        in the range -0.1 to 0.1 will be masked and not plotted
                        on the final map. Use for masking very small values
                        either side of zero.
+     n_workers (int, optional): Number of processes rendering the panels, see CompositePanels.
+     dpi (int, optional): The resolution the panels are rendered at.
 
     Notes:
         Consider, if plotting multiple datasets, how you
@@ -527,121 +697,67 @@ def MultiDrapeErodeDiffMaps(DataDir, ElevationRaster, DrapeRasterWild, cmap,
     """
     #import lsdmatplotlibextensions as mplext
 
-    f, ax_arr = pp.subplots(2, 2, figsize=(10, 5), sharex=True, sharey=True)
-    ax_arr = ax_arr.ravel()
-
     FPFiles = sorted(glob(DataDir+DrapeRasterWild), key=str)
     n_files = len(FPFiles)
     print("Number of files = ", n_files)
 
     elev_raster_file = DataDir + ElevationRaster
 
-    hillshade = LSDMap_BP.Hillshade(elev_raster_file)
-    #hillshade_array = LSDP.ReadRasterArrayBlocks(elev_raster_file)
-
-    # now get the extent
-    extent_raster = LSDMap_IO.GetRasterExtent(elev_raster_file)
-
-    x_min = extent_raster[0]
-    x_max = extent_raster[1]
-    y_min = extent_raster[2]
-    y_max = extent_raster[3]
-
-    # now get the tick marks
-    n_target_tics = 5
-    xlocs, ylocs, new_x_labels, new_y_labels = LSDMap_BP.GetTicksForUTM(
-                                                            elev_raster_file,
-                                                            x_max,
-                                                            x_min,
-                                                            y_max,
-                                                            y_min,
-                                                            n_target_tics)
-
-    print("xmax: " + str(x_max))
-    print("xmin: " + str(x_min))
-    print("ymax: " + str(y_max))
-    print("ymin: " + str(y_min))
-
     """
     Find the maximum water depth in all rasters.
     You need this to normalize the colourscale accross
     all plots when teh imshow is done later.
     """
+    # if we scan the drapes we keep the decimated arrays for the panels,
+    # so each drape is only read once
+    figsize = (10, 5)
+    max_pixels = _PanelMaxPixels(figsize, dpi, 2, 2)
+    drape_arrays = [None]*n_files
+    if drape_max_threshold is None or drape_min_threshold is None:
+        FP_collection = LSDMap_IO.GetRasterCollectionStatistics(FPFiles, keep_arrays = True,
+                                                                array_filter = lambda data_array: DecimateForPanel(data_array, max_pixels))
+        drape_arrays = FP_collection["arrays"]
     if drape_max_threshold is None:
-        try:
-            print("Calculating max drape raster value by scanning rasters...")
-            max_water_depth = findmaxval_multirasters(FPFiles)
-            drape_max_threshold = max_water_depth
-
-        except ValueError:
-            print("Something went wrong trying to obtain the max value in \
-                    your drape raster file list.")
-        finally:
-            print("The drape(s) max value is set to: ", drape_max_threshold)
+        print("Calculating max drape raster value by scanning rasters...")
+        drape_max_threshold = FP_collection["max"]
+        print("The drape(s) max value is set to: ", drape_max_threshold)
 
     if drape_min_threshold is None:
-        try:
-            print("Calculating min drape raster value by scanning rasters...")
-            min_water_depth = findminval_multirasters(FPFiles)
-            drape_min_threshold = min_water_depth
-
-        except ValueError:
-            print("Something went wrong trying to obtain the min value in \
-                    your drape raster file list.")
-        finally:
-            print("The drape(s) min value is set to: ", drape_min_threshold)
-
-
+        print("Calculating min drape raster value by scanning rasters...")
+        drape_min_threshold = FP_collection["min"]
+        print("The drape(s) min value is set to: ", drape_min_threshold)
+
+    # Each panel (hillshade + clipped drape) is rendered in its own worker.
+    # The extreme high and low values are masked, as are the middle values
+    # that are really close to zero (i.e. if you have negative and positive
+    # values in the raster, such as in a DEM of difference with both erosion
+    # and deposition.)
+    panels = []
+    titles = []
     for i in range(n_files):
-
         print("The floodplain file name is: ", FPFiles[i])
-        FP_raster = LSDMap_IO.ReadRasterArrayBlocks(FPFiles[i])
-        #FP_raster = np.ma.masked_where(FP_raster <= 0, FP_raster)
+        panels.append({"elevation": elev_raster_file, "drape": FPFiles[i], "drape_array": drape_arrays[i],
+                       "cmap": cmap, "vmin": drape_min_threshold, "vmax": drape_max_threshold,
+                       "mask_below": drape_min_threshold, "mask_above": drape_max_threshold,
+                       "middle_mask_range": middle_mask_range, "max_pixels": max_pixels})
 
         filename = os.path.basename(FPFiles[i])
         title = lsdlabels.make_line_label(filename)
         print(title)
+        titles.append(title)
 
-        # Mask the extreme high values
-        hi_values_index = FP_raster > drape_max_threshold
-        FP_raster[hi_values_index] = np.nan
-
-        # Mask the extreme low values
-        lo_values_index = FP_raster < drape_min_threshold
-        FP_raster[lo_values_index] = np.nan
-
-        # Mask the middle values that are really close to zero (i.e. if you
-        # have negative and positive values in the raster, such as in a DEM
-        # of difference with both erosion and deposition.)
-        if middle_mask_range is not None:
-            masked_mid_values_index = (np.logical_and(FP_raster > middle_mask_range[0],
-                                                      FP_raster < middle_mask_range[1]))
-            FP_raster[masked_mid_values_index] = np.nan
-
-        im = ax_arr[i].imshow(hillshade, "gray", extent=extent_raster, interpolation="nearest")
-        """
-        Now we can set vmax to be the maximum water depth we calcualted earlier, making our separate
-        subplots all have the same colourscale
-        """
-        im = ax_arr[i].imshow(FP_raster, cmap, extent=extent_raster,
-                                alpha=1.0, interpolation="nearest",
-                                vmin=drape_min_threshold,
-                                vmax=drape_max_threshold)
-        ax_arr[i].set_title(title)
+    """
+    Now we can set vmax to be the maximum water depth we calcualted earlier, making our separate
+    subplots all have the same colourscale
+    """
+    f, ax_arr, images = CompositePanels(panels, 2, 2, figsize, dpi = dpi, n_workers = n_workers,
+                                        titles = titles, subplots_kw = {"sharex": True, "sharey": True})
+    for i in range(n_files):
         pp.setp( ax_arr[i].xaxis.get_majorticklabels(), rotation=70 )
 
-    f.subplots_adjust(right=0.85)
-    cax = f.add_axes([0.9, 0.1, 0.03, 0.8])
-
-    cbar = f.colorbar(im, cax=cax)
-    cbar.set_label(cbar_label)
-    #cbar.set_ticks(np.linspace(0, 8, 8))
+    AddSharedColourbar(f, cmap, drape_min_threshold, drape_max_threshold, cbar_label = cbar_label)
     #cbar = mplext.colours.colorbar_index(f, cax, 8, cmap,
     #                                     drape_min_threshold, drape_max)
 
-    #tick_locator = ticker.MaxNLocator(nbins=8)
-    #cbar.locator = tick_locator
-    #cbar.update_ticks()
-
     f.text(0.5, 0.04, 'Easting (m)', ha='center', fontsize=17)
     f.text(0.04, 0.5, 'Northing (m)', va='center', rotation='vertical', fontsize=17)
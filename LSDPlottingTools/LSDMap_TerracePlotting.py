@@ -11,6 +11,7 @@ import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
 from LSDPlottingTools import colours
+from LSDPlottingTools import binnedkde
 import matplotlib.cm as cm
 from matplotlib import rcParams
 from matplotlib import colors as colors
@@ -214,11 +215,72 @@ def write_dip_and_dipdir_to_csv(DataDirectory,fname_prefix, digitised_terraces=F
     terrace_dips.to_csv(DataDirectory+fname_prefix+'_Dip_DipDirection.csv')
 
 
+def fit_planes_by_group(group_ids, X, Y, Z):
+    """
+    This function fits a plane, Z = C[0]*X + C[1]*Y + C[2], to the points of
+    every group (e.g. every terrace) at once. The data are sorted by group once
+    and the sums for the least squares normal equations are added up for each
+    group with np.add.reduceat, then all the planes are solved together. The
+    coordinates are centred on the mean of each group first so that UTM
+    coordinates don't make the equations badly conditioned.
+
+    Args:
+        group_ids: array with the group of each point
+        X, Y, Z: arrays with the coordinates of the points
+
+    Returns:
+        unique group ids (in the order they first appear), C0, C1, Xbar and Ybar of each group
+
+    Author: FJC
+    """
+    codes, unique_ids = pd.factorize(np.asarray(group_ids), sort=False)
+    order = np.argsort(codes, kind="mergesort")
+    sorted_codes = codes[order]
+    X = np.asarray(X, dtype=np.float64)[order]
+    Y = np.asarray(Y, dtype=np.float64)[order]
+    Z = np.asarray(Z, dtype=np.float64)[order]
+
+    # where each group starts in the sorted data
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, len(sorted_codes)]).astype(np.float64)
+
+    Xbar = np.add.reduceat(X, starts)/counts
+    Ybar = np.add.reduceat(Y, starts)/counts
+    Zbar = np.add.reduceat(Z, starts)/counts
+    dX = X - Xbar[sorted_codes]
+    dY = Y - Ybar[sorted_codes]
+    dZ = Z - Zbar[sorted_codes]
+
+    # the normal equations for the centred plane
+    Sxx = np.add.reduceat(dX*dX, starts)
+    Sxy = np.add.reduceat(dX*dY, starts)
+    Syy = np.add.reduceat(dY*dY, starts)
+    Sxz = np.add.reduceat(dX*dZ, starts)
+    Syz = np.add.reduceat(dY*dZ, starts)
+
+    det = Sxx*Syy - Sxy*Sxy
+    scale = np.maximum(Sxx*Syy, np.finfo(np.float64).tiny)
+    solvable = np.abs(det) > 1e-12*scale
+    C0 = np.full(len(starts), np.nan)
+    C1 = np.full(len(starts), np.nan)
+    C0[solvable] = (Syy*Sxz - Sxy*Syz)[solvable]/det[solvable]
+    C1[solvable] = (Sxx*Syz - Sxy*Sxz)[solvable]/det[solvable]
+
+    # the odd group with too few points, or all in a line, gets the minimum norm solution
+    for group in np.flatnonzero(~solvable):
+        this_group = slice(starts[group], starts[group]+int(counts[group]))
+        _XY = np.vstack((dX[this_group], dY[this_group])).transpose()
+        C,_,_,_ = np.linalg.lstsq(_XY, dZ[this_group], rcond=None)
+        C0[group], C1[group] = C
+
+    return unique_ids, C0, C1, Xbar, Ybar
+
 def get_terrace_dip_and_dipdir(terrace_df):
     """
     This function takes the initial terrace dataframe and calculates the dip and
     strike of the terrace surfaces. Fits a polynomial surface to the distribution
     of terrace elevations and then gets the dip and dip directions of this surface.
+    All the terraces are fitted at once (see fit_planes_by_group).
 
     Args:
         terrace_df: pandas dataframe with the terrace info
@@ -228,79 +290,36 @@ def get_terrace_dip_and_dipdir(terrace_df):
 
     Author: AW and FJC
     """
-    from scipy import linalg
-    import math
-    from mpl_toolkits.mplot3d import Axes3D
-
-    # get the unique terrace IDs
-    terraceIDs = terrace_df.TerraceID.unique()
-    print (terraceIDs)
-
-    dips = []
-    dip_dirs = []
-    strikes = []
-    XbarTerraces = []
-    YbarTerraces = []
-
-    # get the info for each terrace ID
-    for terraceID in terraceIDs:
-        _terrace_subset = (terrace_df.TerraceID.values == terraceID)
-        _x = terrace_df['DistAlongBaseline'].values[_terrace_subset]
-        _y = terrace_df['DistToBaseline'].values[_terrace_subset]
-        _z = terrace_df['Elevation'].values[_terrace_subset]
-        _X = terrace_df['X'].values[_terrace_subset]
-        _Y = terrace_df['Y'].values[_terrace_subset]
-
-        # fit a plane to these points
-        # form: Z = C[0]*X + C[1]*Y + C[2]
-        _XY = np.vstack((_X, _Y, np.ones(len(_Y)))).transpose()
-        C,_,_,_ = linalg.lstsq(_XY, _z)
-
-        # going to get the dip and dip direction using the unit normal vector
-        # to the plane.
-        a = -C[0]
-        b = -C[1]
-        c = 1
-        n_vec = np.array([a,b,c])
-        print (n_vec)
-        # n vector projected onto the xy plane (multiply n_vec by (1,1,0))
-        n_xy = np.array([a,b,0])
-
-        #print n_vec
-
-        # now get the dip = angle between n_vec and n_xy. angle between 2 vectors:
-        # cos theta = (alpha . beta) / (|alpha| |beta|)
-        # This gives the dip in radians
-        dip = np.arccos((np.dot(n_vec,n_xy))/(np.linalg.norm(n_vec)*np.linalg.norm(n_xy)))
-        # convert to degrees
-        dip = 90 - math.degrees(dip)
-
-        # get the dip direction = angle between n_proj and the due north vector y = (0,1,0)
-        y_vec = np.array([0,1,0])
-        theta = np.arccos((np.dot(n_xy,y_vec))/(np.linalg.norm(n_xy)*np.linalg.norm(y_vec)))
-        theta = math.degrees(theta)
-        print ("Theta", theta)
-
-        # work out strike depending on orientation
-        if a > 0 and b > 0: # x is positive so dip dir is just theta
-            strike = 270 + theta
-        elif a < 0:
-            strike = 270 - theta
-        elif a > 0 and b < 0: # x is negative so dip dir is 180+theta?
-            strike = theta - 90
-
-        # now get the dip dir using the right hand rule
-        dip_dir = strike+90
-        if dip_dir > 359:
-            dip_dir = dip_dir - 360
-
-        dips.append(dip)
-        dip_dirs.append(dip_dir)
-        strikes.append(strike)
-
-        # get the mean x and y for plotting
-        XbarTerraces.append(np.mean(_X))
-        YbarTerraces.append(np.mean(_Y))
+    # fit a plane to the points of each terrace
+    # form: Z = C[0]*X + C[1]*Y + C[2]
+    terraceIDs, C0, C1, XbarTerraces, YbarTerraces = fit_planes_by_group(terrace_df['TerraceID'].values,
+                                                                         terrace_df['X'].values,
+                                                                         terrace_df['Y'].values,
+                                                                         terrace_df['Elevation'].values)
+    print ("I fitted planes to "+str(len(terraceIDs))+" terraces")
+
+    # going to get the dip and dip direction using the unit normal vector
+    # to the plane, n_vec = (a, b, 1), and its projection onto the xy plane (a, b, 0).
+    a = -C0
+    b = -C1
+    n_xy_length = np.sqrt(a*a + b*b)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # the dip is the angle between n_vec and n_xy
+        dips = 90 - np.degrees(np.arccos(n_xy_length/np.sqrt(a*a + b*b + 1)))
+
+        # theta is the angle between n_xy and the due north vector y = (0,1,0)
+        theta = np.degrees(np.arccos(b/n_xy_length))
+
+    # work out strike depending on orientation
+    strikes = np.full(len(a), np.nan)
+    strikes = np.where((a > 0) & (b > 0), 270 + theta, strikes)
+    strikes = np.where(a < 0, 270 - theta, strikes)
+    strikes = np.where((a > 0) & (b < 0), theta - 90, strikes)
+
+    # now get the dip dir using the right hand rule
+    dip_dirs = strikes+90
+    dip_dirs = np.where(dip_dirs > 359, dip_dirs - 360, dip_dirs)
 
     outarray = np.vstack((XbarTerraces, YbarTerraces, dips, dip_dirs, strikes)).transpose()
     _column_names = ('X', 'Y', 'dip', 'dip_azimuth', 'strike')
@@ -700,6 +719,8 @@ def MakeTerracePlotChiSpace(DataDirectory,fname_prefix,shapefile_name, colour_by
 def MakeTerraceHeatMap(DataDirectory,fname_prefix, mchi_fname, prec=100, bw_method=0.03, FigFormat='png', ages=""):
     """
     Function to make a heat map of the terrace pixels using Gaussian KDE.
+    The points are binned onto the grid and convolved with the kernel (see binnedkde), and the
+    bandwidth works like scipy's gaussian_kde:
     see https://docs.scipy.org/doc/scipy-0.14.0/reference/generated/scipy.stats.gaussian_kde.html
     for more details.
 
@@ -714,7 +735,6 @@ def MakeTerraceHeatMap(DataDirectory,fname_prefix, mchi_fname, prec=100, bw_meth
 
     FJC 26/03/18
     """
-    import scipy.stats as st
 
     # check if a directory exists for the chi plots. If not then make it.
     T_directory = DataDirectory+'terrace_plots/'
@@ -744,16 +764,16 @@ def MakeTerraceHeatMap(DataDirectory,fname_prefix, mchi_fname, prec=100, bw_meth
     ymin = 0
     ymax = terrace_df["Elevation"].max()
 
-    ## formatting the data in a meshgrid
-    X,Y = np.meshgrid(np.linspace(0,xmax,num = prec),np.linspace(0,ymax, num = prec))
-    positions = np.vstack([X.ravel(), Y.ravel()[::-1]]) # inverted Y to get the axis in the bottom left
-    values = np.vstack([flow_dist, terrace_df['Elevation']])
-    if len(values) == 0:
+    ## the grid for the density
+    x_grid = np.linspace(0,xmax,num = prec)
+    y_grid = np.linspace(0,ymax, num = prec)
+    if len(terrace_df) == 0:
         print("You don't have any terraces, I'm going to quit now.")
     else:
-        # get the kernel density estimation
-        KDE = st.gaussian_kde(values, bw_method = bw_method)
-        Z = np.reshape(KDE(positions).T,X.shape)
+        # get the kernel density estimation. The points are binned onto the grid
+        # so this is quick even with millions of terrace pixels.
+        Z = binnedkde.binned_kde_2d(flow_dist, terrace_df['Elevation'], x_grid, y_grid, bw_method = bw_method)
+        Z = Z[::-1] # inverted Y to get the axis in the bottom left
 
         # plot the density on the profile
         cmap = cm.gist_heat_r
@@ -794,7 +814,8 @@ def MakeTerraceHeatMap(DataDirectory,fname_prefix, mchi_fname, prec=100, bw_meth
 def MakeTerraceHeatMapNormalised(DataDirectory,fname_prefix, mchi_fname, prec=100, bw_method=0.03, FigFormat='png', ages=""):
     """
     Function to make a heat map of the terrace pixels using Gaussian KDE. Pixels are normalised based on
-    elevation of closest channel pixel.
+    elevation of closest channel pixel. The points are binned onto the grid and convolved with the kernel
+    (see binnedkde), and the bandwidth works like scipy's gaussian_kde:
     see https://docs.scipy.org/doc/scipy-0.14.0/reference/generated/scipy.stats.gaussian_kde.html
     for more details.
 
@@ -810,7 +831,6 @@ def MakeTerraceHeatMapNormalised(DataDirectory,fname_prefix, mchi_fname, prec=10
 
     FJC 26/03/18
     """
-    import scipy.stats as st
 
     # check if a directory exists for the chi plots. If not then make it.
     T_directory = DataDirectory+'terrace_plots/'
@@ -840,12 +860,11 @@ def MakeTerraceHeatMapNormalised(DataDirectory,fname_prefix, mchi_fname, prec=10
     ymin = 0
     ymax = terrace_df["ChannelRelief"].max()
 
-    ## formatting the data in a meshgrid
-    X,Y = np.meshgrid(np.linspace(0,xmax,num = prec),np.linspace(0,ymax, num = prec))
-    positions = np.vstack([X.ravel(), Y.ravel()[::-1]]) # inverted Y to get the axis in the bottom left
-    values = np.vstack([flow_dist, terrace_df["ChannelRelief"]])
-    KDE = st.gaussian_kde(values, bw_method = bw_method)
-    Z = np.reshape(KDE(positions).T,X.shape)
+    ## get the kernel density estimation on the grid
+    x_grid = np.linspace(0,xmax,num = prec)
+    y_grid = np.linspace(0,ymax, num = prec)
+    Z = binnedkde.binned_kde_2d(flow_dist, terrace_df["ChannelRelief"], x_grid, y_grid, bw_method = bw_method)
+    Z = Z[::-1] # inverted Y to get the axis in the bottom left
     #Z = np.ma.masked_where(Z < 0.00000000001, Z)
 
     # try a 2d hist
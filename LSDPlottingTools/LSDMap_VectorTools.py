@@ -9,6 +9,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import numpy as np
 from . import LSDMap_GDALIO as LSDMap_IO
+from . import LSDMap_OSystemTools as LSDOst
 from shapely.geometry import Point, Polygon
 import os
 from os.path import exists
@@ -18,6 +19,225 @@ import gdal as gdal
 from osgeo.gdalconst import GA_ReadOnly
 from LSDMapFigure import PlottingHelpers as Helper
 
+#=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+# BASIN GEOMETRY STORE
+# Polygonising the basin raster is slow, so we only do it once per raster.
+# The polygons are saved as well known binary in a sidecar file next to the
+# raster (<raster prefix>_polygons.npz) together with the centroids,
+# representative points and bounds, and are only rebuilt if the raster changes.
+#=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
+
+# Basin stores that have been loaded in this python session.
+# The key is the full path of the raster
+_BASIN_STORES = {}
+
+class BasinGeometryStore(object):
+	"""
+	This holds the polygons of a basin raster along with their centroids,
+	representative points and bounds, plus an STRtree spatial index.
+	The keys are the raster values (usually junction indices) as floats,
+	the same as the keys returned by LSDMap_GDALIO.PolygoniseRaster.
+
+	Args:
+		DataDirectory (str): the data directory with the basin raster
+		basins_fname (str): the basin raster
+		rebuild (bool): If true, ignore the sidecar file and polygonise the raster again
+
+	Author: FJC
+	"""
+	def __init__(self, DataDirectory, basins_fname, rebuild = False):
+		self._Directory = DataDirectory
+		self._RasterName = basins_fname
+		self._FullPathRaster = DataDirectory+basins_fname
+
+		raster_prefix = basins_fname.split('.')[0]
+		self._ShapefileName = raster_prefix+'.shp'
+		self.SidecarFileName = DataDirectory+raster_prefix+'_polygons.npz'
+
+		# The hdr has the georeferencing so it is part of the fingerprint
+		self.fingerprint = LSDOst.GetFileFingerprint([self._FullPathRaster, self._FullPathRaster[:-4]+'.hdr'])
+
+		self._tree = None
+
+		loaded = False
+		if not rebuild and exists(self.SidecarFileName):
+			loaded = self.load()
+
+		if not loaded:
+			self.build()
+			self.save()
+
+	def build(self):
+		"""
+		Polygonises the raster (also writes the shapefile, as GetBasinOutlines always did)
+		and gets the centroids, representative points and bounds.
+
+		Author: FJC
+		"""
+		print("I am polygonising "+self._RasterName+". This only happens once for this raster.")
+		PolygonDict = LSDMap_IO.PolygoniseRaster(self._Directory, self._RasterName, self._ShapefileName)
+
+		self.keys = np.array(sorted(PolygonDict.keys()), dtype=np.float64)
+		self._polygons = [PolygonDict[key] for key in self.keys]
+
+		n_basins = len(self.keys)
+		self._centroid_xy = np.zeros((n_basins,2))
+		self._rep_point_xy = np.zeros((n_basins,2))
+		self._bounds = np.zeros((n_basins,4))
+		for i, poly in enumerate(self._polygons):
+			centroid = poly.centroid
+			rep_point = poly.representative_point()
+			self._centroid_xy[i] = [centroid.x, centroid.y]
+			self._rep_point_xy[i] = [rep_point.x, rep_point.y]
+			self._bounds[i] = poly.bounds
+
+		self._make_dicts()
+
+	def save(self):
+		"""
+		Writes the polygons (as well known binary), centroids, representative points
+		and bounds to the sidecar file.
+
+		Author: FJC
+		"""
+		from shapely import wkb
+
+		wkb_list = [wkb.dumps(poly) for poly in self._polygons]
+		wkb_offsets = np.cumsum([0]+[len(w) for w in wkb_list]).astype(np.int64)
+		wkb_bytes = np.frombuffer(b"".join(wkb_list), dtype=np.uint8)
+
+		try:
+			np.savez(self.SidecarFileName,
+					 fingerprint = np.array(self.fingerprint),
+					 keys = self.keys,
+					 wkb = wkb_bytes,
+					 wkb_offsets = wkb_offsets,
+					 centroids = self._centroid_xy,
+					 representative_points = self._rep_point_xy,
+					 bounds = self._bounds)
+		except (IOError, OSError):
+			print("I could not write the basin polygon file "+self.SidecarFileName+", the raster will be polygonised again next time.")
+
+	def load(self):
+		"""
+		Reads the sidecar file. Returns False if it is out of date.
+
+		Author: FJC
+		"""
+		from shapely import wkb
+
+		with np.load(self.SidecarFileName) as sidecar:
+			if str(sidecar["fingerprint"]) != self.fingerprint:
+				print("The basin polygon file is out of date, I will polygonise the raster again.")
+				return False
+			self.keys = sidecar["keys"]
+			wkb_bytes = sidecar["wkb"].tobytes()
+			wkb_offsets = sidecar["wkb_offsets"]
+			self._centroid_xy = sidecar["centroids"]
+			self._rep_point_xy = sidecar["representative_points"]
+			self._bounds = sidecar["bounds"]
+
+		self._polygons = [wkb.loads(wkb_bytes[wkb_offsets[i]:wkb_offsets[i+1]]) for i in range(len(self.keys))]
+		self._make_dicts()
+		return True
+
+	def _make_dicts(self):
+		"""
+		Makes the lookup dicts. Keys are python floats, like PolygoniseRaster.
+
+		Author: FJC
+		"""
+		float_keys = [float(key) for key in self.keys]
+		self._index = dict(zip(float_keys, range(len(float_keys))))
+		self.outlines = dict(zip(float_keys, self._polygons))
+		self.centroids = dict(zip(float_keys, [Point(xy) for xy in self._centroid_xy]))
+		self.representative_points = dict(zip(float_keys, [Point(xy) for xy in self._rep_point_xy]))
+
+	def get_bounds(self, key):
+		"""
+		Returns the bounds (minx, miny, maxx, maxy) of a basin
+
+		Author: FJC
+		"""
+		return tuple(self._bounds[self._index[float(key)]])
+
+	@property
+	def tree(self):
+		"""
+		The STRtree of the polygons. Only built when you first need it.
+
+		Author: FJC
+		"""
+		if self._tree is None:
+			from shapely.strtree import STRtree
+			self._tree = STRtree(self._polygons)
+			# shapely < 2 returns geometries rather than indices from the queries
+			self._tree_ids = dict((id(poly), i) for i, poly in enumerate(self._polygons))
+		return self._tree
+
+	def query(self, geometry):
+		"""
+		Gets the keys of the basins whose polygons intersect a shapely geometry.
+
+		Args:
+			geometry: a shapely geometry (e.g. a box from shapely.geometry.box)
+
+		Returns:
+			list of basin keys
+
+		Author: FJC
+		"""
+		candidates = self.tree.query(geometry)
+		keys = []
+		for candidate in candidates:
+			if isinstance(candidate, (int, np.integer)):
+				idx = int(candidate)
+			else:
+				idx = self._tree_ids[id(candidate)]
+			if self._polygons[idx].intersects(geometry):
+				keys.append(float(self.keys[idx]))
+		return keys
+
+	def get_basin_at(self, x, y):
+		"""
+		Gets the key of the basin that contains the point x,y, or None if
+		there is no basin there.
+
+		Author: FJC
+		"""
+		this_point = Point(x,y)
+		for key in self.query(this_point):
+			if self.outlines[key].covers(this_point):
+				return key
+		return None
+
+
+def GetBasinGeometryStore(DataDirectory, basins_fname, rebuild = False):
+	"""
+	Gets the BasinGeometryStore of a basin raster. It is kept in memory for the
+	session and on disk in the sidecar file, so the raster is only polygonised
+	when it changes.
+
+	Args:
+		DataDirectory (str): the data directory with the basin raster
+		basins_fname (str): the basin raster
+		rebuild (bool): If true, polygonise the raster again
+
+	Returns:
+		A BasinGeometryStore object
+
+	Author: FJC
+	"""
+	FullPathRaster = DataDirectory+basins_fname
+	if not rebuild and FullPathRaster in _BASIN_STORES:
+		this_store = _BASIN_STORES[FullPathRaster]
+		if LSDOst.GetFileFingerprint([FullPathRaster, FullPathRaster[:-4]+'.hdr']) == this_store.fingerprint:
+			return this_store
+
+	this_store = BasinGeometryStore(DataDirectory, basins_fname, rebuild = rebuild)
+	_BASIN_STORES[FullPathRaster] = this_store
+	return this_store
+
 #=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=#
 # BASIN FUNCTIONS
 # These functions do various operations on basin polygons
@@ -40,13 +260,10 @@ def GetBasinOutlines(DataDirectory, basins_fname):
 
 	Author: FJC
 	"""
-	# read in the basins raster
-	this_fname = basins_fname.split('.')
-	print(basins_fname)
-	OutputShapefile = this_fname[0]+'.shp'
-
-	# polygonise the raster
-	BasinDict = LSDMap_IO.PolygoniseRaster(DataDirectory, basins_fname, OutputShapefile)
+	# get the polygons from the basin store. This only polygonises the raster
+	# the first time. We return a copy since callers delete basins from the dict.
+	BasinStore = GetBasinGeometryStore(DataDirectory, basins_fname)
+	BasinDict = dict(BasinStore.outlines)
 	return BasinDict
 
 def GetMultipleBasinOutlines(DataDirectory):
@@ -70,15 +287,16 @@ def GetMultipleBasinOutlines(DataDirectory):
   basin_dict = Helper.MapBasinsToKeys(DataDirectory)
   BasinsDict = {}
 
-  #loop across the basins
-  for outlet_jn, basin_key in basin_dict.iteritems():
+  #loop across the basins. Each basin raster is only polygonised once, after
+  #that the polygons come from its sidecar file
+  for outlet_jn, basin_key in basin_dict.items():
     this_fname = "basin"+str(outlet_jn)+"_AllBasins.bil"
 
     TempBasins = GetBasinOutlines(DataDirectory,this_fname)
 
-    for temp_outlet, temp_basin_key in TempBasins.iteritems():
-      if len(TempBasins) > 1:
-        print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
+    if len(TempBasins) > 1:
+      print("WARNING: MULTIPLE BASINS IN basin #", outlet_jn)
+    for temp_outlet in list(TempBasins.keys()):
       TempBasins[int(outlet_jn)] = TempBasins.pop(temp_outlet)
 
     BasinsDict.update(TempBasins)
@@ -103,13 +321,9 @@ def GetBasinCentroids(DataDirectory, basins_fname):
 
 	Author: FJC
 	"""
-	# get the basin polygons
-	BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-	# get the centroids
-	CentroidDict = {}
-	for basin_key, basin in BasinDict.iteritems():
-		CentroidDict[basin_key] = Point(basin.centroid)
+	# the centroids are precomputed in the basin store
+	BasinStore = GetBasinGeometryStore(DataDirectory, basins_fname)
+	CentroidDict = dict(BasinStore.centroids)
 
 	return CentroidDict
 
@@ -132,13 +346,9 @@ def GetPointWithinBasins(DataDirectory,basins_fname):
 
 	Author: FJC
 	"""
-	# get the basin polygons
-	BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
-
-	# get the centroids
-	PointDict = {}
-	for basin_key, basin in BasinDict.items():
-		PointDict[basin_key] = Point(basin.representative_point())
+	# the representative points are precomputed in the basin store
+	BasinStore = GetBasinGeometryStore(DataDirectory, basins_fname)
+	PointDict = dict(BasinStore.representative_points)
 
 	return PointDict
 
@@ -202,18 +412,16 @@ def GetPointWithinBasinsBuffered(DataDirectory,basins_fname, basin_list = [], bu
 	Author: FJC
 	"""
 	# get the basin polygons
-	BasinDict = GetBasinOutlines(DataDirectory, basins_fname)
+	BasinStore = GetBasinGeometryStore(DataDirectory, basins_fname)
 
 	# buffer and get the centre of the buffered polygons
 	PointDict = {}
-	for basin_key, basin in BasinDict.iteritems():
-		# get the x and y lengths of the basin and append to list
-		print("This basin key is: "+str(basin_key))
+	for basin_key, basin in BasinStore.outlines.items():
+		# get the x and y lengths of the basin from the stored bounds
 		lengths = []
-		bounds = basin.bounds
+		bounds = BasinStore.get_bounds(basin_key)
 		lengths.append(bounds[2] - bounds[0])
 		lengths.append(bounds[3] - bounds[1])
-		print(min(lengths))
 
 		# buffer with a fraction of the minimum length
 		new_basin = Polygon(basin.buffer(min(lengths)*buffer_frac*-1))
@@ -561,30 +769,233 @@ def Copy_Shapefile(shapefile_name,new_shapefile_name):
 		#out_ds.Destroy()
 
 
-def rasterize_shapefile(path_to_shp, res = 30, field = ""):
+def _GetLayerFieldValues(daLayer, field):
+	"""
+	Reads the FID and one field of every feature in a layer. If GDAL can give
+	the layer as arrow arrays (GDAL >= 3.6) the whole column comes in one go,
+	otherwise the features are read one by one.
+
+	Returns:
+		fids (int array), values (array)
+
+	Author: BG, SMM
+	"""
+	daLayer.ResetReading()
+	if hasattr(daLayer, "GetArrowStreamAsNumPy"):
+		try:
+			fids = []
+			values = []
+			stream = daLayer.GetArrowStreamAsNumPy(options = ["INCLUDE_FID=YES", "USE_MASKED_ARRAYS=NO"])
+			fid_name = daLayer.GetFIDColumn() or "OGC_FID"
+			for batch in stream:
+				fids.append(np.asarray(batch[fid_name]))
+				values.append(np.asarray(batch[field], dtype = object))
+			daLayer.ResetReading()
+			if len(fids) == 0:
+				return np.array([], dtype = np.int64), np.array([], dtype = object)
+			return np.concatenate(fids).astype(np.int64), np.concatenate(values)
+		except (RuntimeError, KeyError, ValueError):
+			print("I couldn't read the layer as arrays, so I will read the features one by one.")
+			daLayer.ResetReading()
+
+	field_index = daLayer.GetLayerDefn().GetFieldIndex(str(field))
+	if field_index < 0:
+		raise KeyError("The field "+str(field)+" is not in the shapefile")
+	fids = []
+	values = []
+	for feature in daLayer:
+		fids.append(feature.GetFID())
+		values.append(feature.GetField(field_index))
+	daLayer.ResetReading()
+	return np.array(fids, dtype = np.int64), np.array(values, dtype = object)
+
+def GetGeologicCodes(values):
+	"""
+	Gives every different value of the field a code, starting at 1, in the
+	order they first appear (the same codes geologic_maps_modify_shapefile gives).
+
+	Args:
+		values (array): the value of the field for each feature
+
+	Returns:
+		codes (int array): the code of each feature
+		geol_dict (dict): the code of each value
+
+	Author: SMM
+	"""
+	values = np.asarray(values, dtype = object)
+	if len(values) == 0:
+		return np.array([], dtype = np.int64), {}
+	# np.unique sorts, so get the order they first appear in from the first index of each value
+	as_str = np.array([str(v) for v in values])
+	unique_str, first_index, inverse = np.unique(as_str, return_index = True, return_inverse = True)
+	appearance_rank = np.empty(len(unique_str), dtype = np.int64)
+	appearance_rank[np.argsort(first_index, kind = "stable")] = np.arange(len(unique_str))
+	codes = appearance_rank[np.ravel(inverse)]+1
+	geol_dict = dict((values[first_index[i]], int(appearance_rank[i]+1)) for i in np.argsort(first_index, kind = "stable"))
+	return codes, geol_dict
+
+def _GetTargetGrid(daLayer, reference_raster, res):
+	"""
+	Gets the grid to rasterize onto: the grid of the reference raster if there is one,
+	otherwise the extent of the layer at the resolution res.
+
+	Returns:
+		ncols, nrows, geotransform, projection (wkt)
+
+	Author: SMM
 	"""
-		I am going to lead the rasterization of the shapefile into a tif raster.
-		I'll work on the bil version at some points.
+	if reference_raster is not None:
+		reference = gdal.Open(reference_raster, GA_ReadOnly)
+		if reference is None:
+			raise Exception("Unable to read the reference raster "+reference_raster)
+		return reference.RasterXSize, reference.RasterYSize, reference.GetGeoTransform(), reference.GetProjection()
+
+	xMin, xMax, yMin, yMax = daLayer.GetExtent()
+	res = float(res)
+	ncols = max(1, int(np.ceil((xMax-xMin)/res)))
+	nrows = max(1, int(np.ceil((yMax-yMin)/res)))
+	srs = daLayer.GetSpatialRef()
+	projection = srs.ExportToWkt() if srs is not None else ""
+	return ncols, nrows, (xMin, res, 0, yMax, 0, -res), projection
+
+def RasterizeShapefileToBil(shapefile_name, field, reference_raster = None, res = 30, OutFileName = None,
+							tile_size = None, NoDataVal = -9999):
+	"""
+	Rasterizes a shapefile (e.g. a geologic map) straight to an ENVI bil, with
+	a lithokey csv giving the code of each value of the field. The layer is
+	read once into memory and nothing else is written to disk: each feature
+	is burned with its FID into an in-memory raster and the FIDs are turned
+	into codes with a lookup array.
+
+	If you give a reference raster (e.g. your DEM) the bil is on exactly the
+	same grid, and the shapes are reprojected to it if they need to be.
+	Large extents can be done in tiles of tile_size by tile_size pixels.
+
+	Args:
+		shapefile_name (str): the path and name of the shapefile
+		field (str): the field with the values to rasterize
+		reference_raster (str): the raster with the grid to use. If None, the extent of the shapefile at resolution res
+		res (float): the resolution if there is no reference raster
+		OutFileName (str): the name of the bil. Default is the shapefile name with "_LITHRAST.bil"
+		tile_size (int): if not None, the raster is done in tiles of this many pixels a side
+		NoDataVal: the value of the pixels that are not in any shape
+
+	Returns:
+		The name of the bil and the geol_dict (the code of each value)
+
+	Author: BG, SMM
+	"""
+	print("I will rasterize the field "+str(field)+" of "+shapefile_name)
+	shapefilefilepath = LSDOst.GetPath(shapefile_name)
+	shapefileshortname = LSDOst.GetFilePrefix(shapefile_name)
+	if OutFileName is None:
+		OutFileName = shapefilefilepath+shapefileshortname+"_LITHRAST.bil"
+	outcsv = shapefilefilepath+shapefileshortname+"_lithokey.csv"
+
+	# read the shapefile into memory once
+	dataSource = ogr.Open(shapefile_name)
+	if dataSource is None:
+		raise Exception("Unable to read the shapefile "+shapefile_name)
+	memory_driver = ogr.GetDriverByName("Memory") or ogr.GetDriverByName("MEM")
+	memDS = memory_driver.CreateDataSource("geology")
+	memDS.CopyLayer(dataSource.GetLayer(0), "geology")
+	dataSource = None
+	daLayer = memDS.GetLayer("geology")
+	print("I read "+str(daLayer.GetFeatureCount())+" shapes into memory")
+
+	# get the codes, and a lookup from the FID to the code
+	fids, values = _GetLayerFieldValues(daLayer, field)
+	codes, geol_dict = GetGeologicCodes(values)
+	print("I found "+str(len(geol_dict))+" rock types")
+	fid_to_code = np.full(fids.max()+2 if len(fids) > 0 else 1, NoDataVal, dtype = np.float32)
+	fid_to_code[fids] = codes
+	# FIDs are burned into a raster full of -1, so -1 picks up the last element, which is nodata
+
+	# the layer we burn: the same shapes with the FID as an attribute
+	burnLayer = memDS.ExecuteSQL('SELECT FID AS LSD_FID, * FROM "geology"')
+
+	ncols, nrows, geotransform, projection = _GetTargetGrid(daLayer, reference_raster, res)
+	print("The raster will be "+str(ncols)+" by "+str(nrows)+" pixels")
+
+	# we can only skip the shapes outside a tile if they are in the same projection as the raster
+	layer_srs = daLayer.GetSpatialRef()
+	raster_srs = osr.SpatialReference(wkt = projection) if projection != "" else None
+	same_srs = layer_srs is None or raster_srs is None or bool(layer_srs.IsSame(raster_srs))
+
+	outDS = gdal.GetDriverByName("ENVI").Create(OutFileName, ncols, nrows, 1, gdal.GDT_Float32)
+	outDS.SetGeoTransform(geotransform)
+	if projection != "":
+		outDS.SetProjection(projection)
+	outBand = outDS.GetRasterBand(1)
+	outBand.SetNoDataValue(NoDataVal)
+
+	if tile_size is None:
+		tile_size = max(ncols, nrows)
+	mem_raster_driver = gdal.GetDriverByName("MEM")
+	for row0 in range(0, nrows, tile_size):
+		for col0 in range(0, ncols, tile_size):
+			tile_rows = min(tile_size, nrows-row0)
+			tile_cols = min(tile_size, ncols-col0)
+			tile_geotransform = (geotransform[0]+col0*geotransform[1], geotransform[1], geotransform[2],
+								 geotransform[3]+row0*geotransform[5], geotransform[4], geotransform[5])
+
+			tileDS = mem_raster_driver.Create("", tile_cols, tile_rows, 1, gdal.GDT_Int32)
+			tileDS.SetGeoTransform(tile_geotransform)
+			if projection != "":
+				tileDS.SetProjection(projection)
+			tileDS.GetRasterBand(1).Fill(-1)
+
+			if same_srs:
+				x0 = tile_geotransform[0]
+				x1 = x0+tile_cols*geotransform[1]
+				y0 = tile_geotransform[3]
+				y1 = y0+tile_rows*geotransform[5]
+				burnLayer.SetSpatialFilterRect(min(x0,x1), min(y0,y1), max(x0,x1), max(y0,y1))
+			gdal.RasterizeLayer(tileDS, [1], burnLayer, options = ["ATTRIBUTE=LSD_FID"])
+			burnLayer.SetSpatialFilter(None)
+
+			tile_fids = tileDS.GetRasterBand(1).ReadAsArray()
+			outBand.WriteArray(fid_to_code[tile_fids], col0, row0)
+			tileDS = None
+
+	outBand.FlushCache()
+	outDS = None
+	memDS.ReleaseResultSet(burnLayer)
+
+	with open(outcsv, 'w') as f:
+		f.write('ID,rocktype\n')
+		for key in geol_dict:
+			f.write(str(key)+','+ str(geol_dict[key])+'\n')
+
+	print("Done rasterizing! The raster is "+OutFileName+" and the key is "+outcsv)
+	return OutFileName, geol_dict
+
+def rasterize_shapefile(path_to_shp, res = 30, field = "", reference_raster = None, OutFileName = None, tile_size = None):
+	"""
+		I am going to lead the rasterization of the shapefile into a bil raster
+		(and a lithokey csv), in one pass with no temporary files.
+		See RasterizeShapefileToBil.
 
 		@param:
 			path_to_shapefile (str) the path and name of the shapefile
+			res (float) the resolution, if there is no reference raster
+			field (str) the field to rasterize
+			reference_raster (str) a raster (e.g. the DEM) whose grid the bil will have
+			OutFileName (str) the name of the bil. Default is the shapefile name with "_LITHRAST.bil"
+			tile_size (int) do big rasters in tiles of this many pixels a side
 
-		@returns: Nothing but write a raster
+		@returns: the name of the raster
 		@Author: BG
 		@date: 28/09/2017
 
 	"""
 
 	print("I will raterize your shapefile:")
-	shapefile_name = path_to_shp
-	print(shapefile_name)
-
-	#launching the  rasterization
-	new_shapefile_name, geol_dict = geologic_maps_modify_shapefile(shapefile_name, geol_field = field)
-	tifname = Rasterize_geologic_maps_pythonic(new_shapefile_name,raster_resolution = res, geol_field = field)
-	Correct_Raterized_GLIM_map(tifname)
-
-	print("Now removing the temporary files")
-	os.remove(new_shapefile_name)
-	os.remove(tifname)
+	print(path_to_shp)
+	OutFileName, geol_dict = RasterizeShapefileToBil(path_to_shp, field, reference_raster = reference_raster, res = res,
+													 OutFileName = OutFileName, tile_size = tile_size)
+	print("The rocks are: ")
+	print(geol_dict)
 	print("done with the rasterization")
+	return OutFileName
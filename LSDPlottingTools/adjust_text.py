@@ -307,6 +307,414 @@ def repel_text_from_axes(texts, ax=None, bboxes=None, renderer=None,
             texts[i].set_position((newx, newy))
     return texts
 
+#==============================================================================
+# The functions below are an LSDMappingTools addition. The original repel
+# functions compare every text with every other text and measure the texts with
+# the renderer on every iteration, which takes minutes with a thousand basin
+# labels. Here the texts are measured once, kept as arrays of boxes, and only
+# boxes in neighbouring cells of a uniform grid are compared.
+#==============================================================================
+def get_bbox_array(objs, r, expand=(1.0, 1.0), ax=None):
+    """
+    Gets the bounding boxes of matplotlib objects in data coordinates as an
+    (n, 4) array of xmin, ymin, xmax, ymax
+    """
+    if len(objs) == 0:
+        return np.zeros((0, 4))
+    bboxes = get_bboxes(objs, r, expand, ax)
+    return np.array([[b.xmin, b.ymin, b.xmax, b.ymax] for b in bboxes])
+
+def _grid_cells(x, y, origin, cell_size):
+    cx = np.floor((x-origin[0])/cell_size).astype(np.int64)
+    cy = np.floor((y-origin[1])/cell_size).astype(np.int64)
+    return cx, cy
+
+class _UniformGrid(object):
+    """
+    Points (or box corners) sorted by grid cell, so we can find the ones in a
+    few cells with searchsorted.
+    """
+    def __init__(self, x, y, origin, cell_size):
+        self.origin = origin
+        self.cell_size = cell_size
+        cx, cy = _grid_cells(np.asarray(x), np.asarray(y), origin, cell_size)
+        # shift so that all the cell ids are positive
+        self.cx_min = cx.min() if len(cx) else 0
+        self.cy_min = cy.min() if len(cy) else 0
+        self.n_cx = (cx.max()-self.cx_min+3) if len(cx) else 1
+        ids = (cy-self.cy_min)*self.n_cx+(cx-self.cx_min)
+        self.order = np.argsort(ids, kind='stable')
+        self.sorted_ids = ids[self.order]
+
+    def query(self, x0, y0, x1, y1):
+        """
+        For each query box (arrays) finds the items in the cells it covers.
+        The boxes must not span more than three cells in each direction.
+        Returns two arrays: the query index and the item index of each candidate pair.
+        """
+        cx0, cy0 = _grid_cells(x0, y0, self.origin, self.cell_size)
+        cx1, cy1 = _grid_cells(x1, y1, self.origin, self.cell_size)
+        query_list = []
+        item_list = []
+        query_index = np.arange(len(x0))
+        for di, dj in product(range(3), range(3)):
+            cx = cx0+di
+            cy = cy0+dj
+            valid = (cx <= cx1) & (cy <= cy1)
+            cx = cx[valid]-self.cx_min
+            cy = cy[valid]-self.cy_min
+            valid_query = query_index[valid]
+            in_grid = (cx >= 0) & (cx < self.n_cx) & (cy >= 0)
+            ids = cy[in_grid]*self.n_cx+cx[in_grid]
+            valid_query = valid_query[in_grid]
+
+            starts = np.searchsorted(self.sorted_ids, ids, side='left')
+            ends = np.searchsorted(self.sorted_ids, ids, side='right')
+            lengths = ends-starts
+            total = lengths.sum()
+            if total == 0:
+                continue
+            # concatenate all the ranges start:end without a python loop
+            offsets = np.arange(total)-np.repeat(np.cumsum(lengths)-lengths, lengths)
+            query_list.append(np.repeat(valid_query, lengths))
+            item_list.append(self.order[np.repeat(starts, lengths)+offsets])
+        if len(query_list) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(query_list), np.concatenate(item_list)
+
+def _box_overlaps(boxes, other_boxes, cell_size, same_set=False):
+    """
+    Finds the pairs of overlapping boxes and how much they overlap.
+    Returns i (index in boxes), j (index in other_boxes), overlap in x and y.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if len(boxes) == 0 or len(other_boxes) == 0:
+        return empty, empty, np.zeros(0), np.zeros(0)
+    origin = (min(boxes[:, 0].min(), other_boxes[:, 0].min()),
+              min(boxes[:, 1].min(), other_boxes[:, 1].min()))
+    # The other boxes are put in the grid by their lower left corner. A box
+    # can only overlap the boxes with corners in [x0-cell_size, x1]
+    grid = _UniformGrid(other_boxes[:, 0], other_boxes[:, 1], origin, cell_size)
+    i, j = grid.query(boxes[:, 0]-cell_size, boxes[:, 1]-cell_size,
+                      boxes[:, 2], boxes[:, 3])
+    if same_set:
+        keep = i != j
+        i, j = i[keep], j[keep]
+    overlap_x = (np.minimum(boxes[i, 2], other_boxes[j, 2]) -
+                 np.maximum(boxes[i, 0], other_boxes[j, 0]))
+    overlap_y = (np.minimum(boxes[i, 3], other_boxes[j, 3]) -
+                 np.maximum(boxes[i, 1], other_boxes[j, 1]))
+    overlapping = (overlap_x > 0) & (overlap_y > 0)
+    return i[overlapping], j[overlapping], overlap_x[overlapping], overlap_y[overlapping]
+
+def _repel_boxes_from_boxes(boxes, other_boxes, cell_size, same_set=False):
+    """
+    The same forces as repel_text and repel_text_from_bboxes, but only for
+    the pairs found by the grid.
+    """
+    n = len(boxes)
+    i, j, overlap_x, overlap_y = _box_overlaps(boxes, other_boxes, cell_size, same_set)
+    direction_x = np.sign(boxes[i, 0]-other_boxes[j, 0])
+    direction_y = np.sign(boxes[i, 1]-other_boxes[j, 1])
+    delta_x = np.bincount(i, weights=overlap_x*direction_x, minlength=n)
+    delta_y = np.bincount(i, weights=overlap_y*direction_y, minlength=n)
+    q = np.sum(np.abs(delta_x)+np.abs(delta_y))
+    return delta_x, delta_y, q
+
+def _repel_boxes_from_points(boxes, x, y, cell_size):
+    """
+    The same forces as repel_text_from_points, but only for the points found
+    by the grid.
+    """
+    n = len(boxes)
+    if n == 0 or len(x) == 0:
+        return np.zeros(n), np.zeros(n), 0
+    origin = (min(boxes[:, 0].min(), x.min()), min(boxes[:, 1].min(), y.min()))
+    grid = _UniformGrid(x, y, origin, cell_size)
+    i, j = grid.query(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+    xp = x[j]
+    yp = y[j]
+    inside = ((xp > boxes[i, 0]) & (xp < boxes[i, 2]) &
+              (yp > boxes[i, 1]) & (yp < boxes[i, 3]))
+    i, xp, yp = i[inside], xp[inside], yp[inside]
+
+    cx = (boxes[i, 0]+boxes[i, 2])/2
+    cy = (boxes[i, 1]+boxes[i, 3])/2
+    dir_x = np.sign(cx-xp)
+    dir_y = np.sign(cy-yp)
+    dx = np.where(dir_x == -1, xp-boxes[i, 2], np.where(dir_x == 1, xp-boxes[i, 0], 0))
+    dy = np.where(dir_y == -1, yp-boxes[i, 3], np.where(dir_y == 1, yp-boxes[i, 1], 0))
+
+    delta_x = np.bincount(i, weights=dx, minlength=n)
+    delta_y = np.bincount(i, weights=dy, minlength=n)
+    q = np.sum(np.abs(delta_x)+np.abs(delta_y))
+    return delta_x, delta_y, q
+
+def _expand_boxes(boxes, expand):
+    """
+    Scales (n, 4) boxes about their centres, like Bbox.expanded
+    """
+    cx = (boxes[:, 0]+boxes[:, 2])/2
+    cy = (boxes[:, 1]+boxes[:, 3])/2
+    half_w = (boxes[:, 2]-boxes[:, 0])*expand[0]/2
+    half_h = (boxes[:, 3]-boxes[:, 1])*expand[1]/2
+    return np.column_stack([cx-half_w, cy-half_h, cx+half_w, cy+half_h])
+
+def _clip_moves_to_axes(boxes, dx, dy, limits):
+    """
+    Vectorised move_texts: a move that takes a box out of the axes is cancelled
+    """
+    xmin, xmax, ymin, ymax = limits
+    dx = np.where((boxes[:, 0]+dx < xmin) | (boxes[:, 2]+dx > xmax), 0, dx)
+    dy = np.where((boxes[:, 1]+dy < ymin) | (boxes[:, 3]+dy > ymax), 0, dy)
+    return dx, dy
+
+def _greedy_placement(boxes, anchor_x, anchor_y, fixed_boxes, point_x, point_y,
+                      limits, cell_size, max_rings=4):
+    """
+    Deterministic placement: the texts are placed one by one (in the order they
+    are given, so put the important ones first) at the first candidate
+    position around their anchor that doesn't overlap a text that has already
+    been placed, a fixed box or a point. Texts that can't be placed anywhere
+    stay where they are.
+    Returns the shifts in x and y, and a boolean array of which texts were placed.
+    """
+    n = len(boxes)
+    widths = boxes[:, 2]-boxes[:, 0]
+    heights = boxes[:, 3]-boxes[:, 1]
+    xmin, xmax, ymin, ymax = limits
+
+    # unit candidate offsets: on the anchor, then right, left, above, below
+    # and the diagonals, further out in each ring
+    directions = [(0, 0), (0.5, 0), (-0.5, 0), (0, 0.5), (0, -0.5),
+                  (0.5, 0.5), (-0.5, 0.5), (0.5, -0.5), (-0.5, -0.5)]
+    candidates = [directions[0]]
+    for ring in range(1, max_rings+1):
+        candidates.extend([(d[0]*(ring+1), d[1]*(ring+1)) for d in directions[1:]])
+
+    # the placed boxes are kept in a dict of grid cells
+    placed_cells = {}
+    placed_boxes = []
+    def cells_of(box):
+        cx0, cy0 = int(np.floor(box[0]/cell_size)), int(np.floor(box[1]/cell_size))
+        cx1, cy1 = int(np.floor(box[2]/cell_size)), int(np.floor(box[3]/cell_size))
+        return [(a, b) for a in range(cx0, cx1+1) for b in range(cy0, cy1+1)]
+    def add_box(box):
+        placed_boxes.append(box)
+        for cell in cells_of(box):
+            placed_cells.setdefault(cell, []).append(len(placed_boxes)-1)
+    def overlaps_placed(box):
+        for cell in cells_of(box):
+            for k in placed_cells.get(cell, []):
+                other = placed_boxes[k]
+                if (box[0] < other[2] and box[2] > other[0] and
+                        box[1] < other[3] and box[3] > other[1]):
+                    return True
+        return False
+
+    for box in fixed_boxes:
+        add_box(box)
+
+    point_grid = None
+    if len(point_x) > 0:
+        origin = (point_x.min(), point_y.min())
+        point_grid = _UniformGrid(point_x, point_y, origin, cell_size)
+
+    shift_x = np.zeros(n)
+    shift_y = np.zeros(n)
+    placed = np.zeros(n, dtype=bool)
+    for t in range(n):
+        for ox, oy in candidates:
+            dx = ox*widths[t]
+            dy = oy*heights[t]
+            box = boxes[t]+np.array([dx, dy, dx, dy])
+            if box[0] < xmin or box[2] > xmax or box[1] < ymin or box[3] > ymax:
+                continue
+            if overlaps_placed(box):
+                continue
+            if point_grid is not None:
+                i, j = point_grid.query(box[0:1], box[1:2], box[2:3], box[3:4])
+                px, py = point_x[j], point_y[j]
+                # the text's own anchor point doesn't count
+                own = (px == anchor_x[t]) & (py == anchor_y[t])
+                inside = ((px > box[0]) & (px < box[2]) & (py > box[1]) & (py < box[3]) & ~own)
+                if np.any(inside):
+                    continue
+            shift_x[t], shift_y[t] = dx, dy
+            placed[t] = True
+            add_box(box)
+            break
+        if not placed[t]:
+            add_box(boxes[t])
+    return shift_x, shift_y, placed
+
+def adjust_text_grid(texts, x=None, y=None, add_objects=None, ax=None,
+                     expand_text=(1.2, 1.2), expand_points=(1.2, 1.2),
+                     expand_objects=(1.2, 1.2), force_text=0.5,
+                     force_points=0.5, force_objects=0.5, lim=100,
+                     precision=0, tolerance=0.001, patience=10, only_move={},
+                     text_from_text=True, text_from_points=True,
+                     greedy=False, hide_unplaced=False, draggable=True,
+                     *args, **kwargs):
+    """
+    A fast version of adjust_text for lots of labels (e.g. basin labels on a
+    big map). The texts are measured once and then moved as arrays of boxes;
+    overlaps are only looked for between boxes in neighbouring cells of a
+    uniform grid, so each iteration is roughly linear in the number of texts.
+    The total overlap doesn't go down steadily from one iteration to the next,
+    so the best positions found so far are kept, and the iterations stop when
+    there has been no improvement of more than tolerance (as a fraction) for
+    patience iterations, or the overlap reaches precision.
+
+    With greedy=True the texts are instead placed one at a time, in the order
+    given, at the first of a set of positions around their anchor that doesn't
+    overlap anything already placed. This is deterministic and doesn't iterate.
+
+    Args:
+        texts (list): a list of text.Text objects to adjust
+        x (seq): x-coordinates of points to repel from; if not provided only
+            uses text coordinates
+        y (seq): y-coordinates of points to repel from
+        add_objects (list): additional matplotlib objects to avoid (they don't move)
+        ax (obj): axes object with the plot; if not provided is determined by
+            plt.gca()
+        expand_text, expand_points, expand_objects (seq): as in adjust_text
+        force_text, force_points, force_objects (float): as in adjust_text
+        lim (int): limit of number of iterations
+        precision (float): stop once the sum of all overlaps is below this
+        tolerance (float): an iteration only counts as an improvement if it
+            lowers the best overlap so far by more than this fraction
+        patience (int): stop after this many iterations without an improvement
+        only_move (dict): as in adjust_text
+        text_from_text (bool): whether to repel texts from each other
+        text_from_points (bool): whether to repel texts from points
+        greedy (bool): use the deterministic greedy placement
+        hide_unplaced (bool): in greedy mode, hide the texts that could not be
+            placed without an overlap
+        draggable (bool): whether to make the annotations draggable
+        *args and **kwargs: fed into plt.annotate, as in adjust_text
+
+    Returns:
+        int: the number of iterations
+    """
+    if ax is None:
+        ax = plt.gca()
+    if len(texts) == 0:
+        return 0
+    r = get_renderer(ax.get_figure())
+    orig_xy = [text.get_position() for text in texts]
+    orig_x = np.array([xy[0] for xy in orig_xy], dtype=float)
+    orig_y = np.array([xy[1] for xy in orig_xy], dtype=float)
+    if (x is None) != (y is None):
+        raise ValueError('Please specify both x and y, or neither')
+    if x is None:
+        x, y = orig_x, orig_y
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # These are the only calls to the renderer
+    boxes = get_bbox_array(texts, r, (1, 1), ax)
+    fixed_boxes = np.zeros((0, 4))
+    if add_objects is not None:
+        try:
+            fixed_boxes = get_bbox_array(add_objects, r, expand_objects, ax)
+        except:
+            raise ValueError("Can't get bounding boxes from add_objects - is'\
+                             it a flat list of matplotlib objects?")
+
+    xmin, xmax = ax.get_xlim()
+    ymin, ymax = ax.get_ylim()
+    limits = (min(xmin, xmax), max(xmin, xmax), min(ymin, ymax), max(ymin, ymax))
+
+    # The cell size has to be at least as big as the biggest (expanded) box
+    biggest_expand = max(max(expand_text), max(expand_points), max(expand_objects), 1)
+    all_boxes = np.vstack([boxes, fixed_boxes])
+    cell_size = biggest_expand*max(np.max(all_boxes[:, 2]-all_boxes[:, 0]),
+                                   np.max(all_boxes[:, 3]-all_boxes[:, 1]))
+    if not cell_size > 0:
+        cell_size = 1.0
+
+    # first move the texts into the axes, like repel_text_from_axes
+    shift_x = (np.where(boxes[:, 0] < limits[0], limits[0]-boxes[:, 0], 0) +
+               np.where(boxes[:, 2] > limits[1], limits[1]-boxes[:, 2], 0))
+    shift_y = (np.where(boxes[:, 1] < limits[2], limits[2]-boxes[:, 1], 0) +
+               np.where(boxes[:, 3] > limits[3], limits[3]-boxes[:, 3], 0))
+    boxes = boxes+np.column_stack([shift_x, shift_y, shift_x, shift_y])
+    text_x = orig_x+shift_x
+    text_y = orig_y+shift_y
+
+    n_iterations = 0
+    if greedy:
+        points_x = x if text_from_points else np.zeros(0)
+        points_y = y if text_from_points else np.zeros(0)
+        dx, dy, placed = _greedy_placement(boxes, orig_x, orig_y, fixed_boxes,
+                                           points_x, points_y, limits, cell_size)
+        text_x += dx
+        text_y += dy
+        print("I placed "+str(np.sum(placed))+" of "+str(len(texts))+" labels without overlaps.")
+    else:
+        placed = np.ones(len(texts), dtype=bool)
+        best_q = np.inf
+        best_state = (boxes, text_x, text_y)
+        n_stale = 0
+        for n_iterations in range(1, lim+1):
+            zeros = np.zeros(len(texts))
+            if text_from_text:
+                expanded = _expand_boxes(boxes, expand_text)
+                d_x_text, d_y_text, q1 = _repel_boxes_from_boxes(expanded, expanded, cell_size, same_set=True)
+            else:
+                d_x_text, d_y_text, q1 = zeros, zeros, 0
+            if text_from_points:
+                d_x_points, d_y_points, q2 = _repel_boxes_from_points(_expand_boxes(boxes, expand_points), x, y, cell_size)
+            else:
+                d_x_points, d_y_points, q2 = zeros, zeros, 0
+            if len(fixed_boxes) > 0:
+                d_x_objects, d_y_objects, q3 = _repel_boxes_from_boxes(_expand_boxes(boxes, expand_objects), fixed_boxes, cell_size)
+            else:
+                d_x_objects, d_y_objects, q3 = zeros, zeros, 0
+
+            for key, (d_x, d_y) in (('text', (d_x_text, d_y_text)),
+                                    ('points', (d_x_points, d_y_points)),
+                                    ('objects', (d_x_objects, d_y_objects))):
+                if key in only_move:
+                    if 'x' not in only_move[key]:
+                        d_x *= 0
+                    if 'y' not in only_move[key]:
+                        d_y *= 0
+
+            q = q1+q2+q3
+            if q < best_q*(1-tolerance):
+                n_stale = 0
+            else:
+                n_stale += 1
+            if q < best_q:
+                best_q = q
+                best_state = (boxes, text_x.copy(), text_y.copy())
+            if q <= precision or n_stale >= patience:
+                break
+
+            dx = d_x_text*force_text+d_x_points*force_points+d_x_objects*force_objects
+            dy = d_y_text*force_text+d_y_points*force_points+d_y_objects*force_objects
+            dx, dy = _clip_moves_to_axes(boxes, dx, dy, limits)
+            boxes = boxes+np.column_stack([dx, dy, dx, dy])
+            text_x += dx
+            text_y += dy
+
+        # go back to the positions with the least overlap
+        boxes, text_x, text_y = best_state
+
+    for j, text in enumerate(texts):
+        a = ax.annotate(text.get_text(), xy = (orig_xy[j]),
+                    xytext=(text_x[j], text_y[j]), *args, **kwargs)
+        a.__dict__.update(text.__dict__)
+        a.set_position((text_x[j], text_y[j]))
+        if hide_unplaced and not placed[j]:
+            a.set_visible(False)
+        if draggable:
+            a.draggable()
+        texts[j].remove()
+    return n_iterations
+
 def adjust_text(texts, x=None, y=None, add_objects=None, ax=None,
                 expand_text=(1.2, 1.2), expand_points=(1.2, 1.2),
                 expand_objects=(1.2, 1.2), expand_align=(0.9, 0.9),
@@ -315,7 +723,7 @@ def adjust_text(texts, x=None, y=None, add_objects=None, ax=None,
                 lim=100, precision=0,
                 only_move={}, text_from_text=True, text_from_points=True,
                 save_steps=False, save_prefix='', save_format='png',
-                add_step_numbers=True, draggable=True,
+                add_step_numbers=True, draggable=True, method='original',
                 *args, **kwargs):
     """
     Iteratively adjusts the locations of texts. First moves all texts that are
@@ -323,6 +731,11 @@ def adjust_text(texts, x=None, y=None, add_objects=None, ax=None,
     from each other and from points. In the end hides texts and substitutes
     them with annotations to link them to the respective points.
 
+    With method='grid' this hands over to adjust_text_grid, which does the same
+    thing much faster for lots of texts (it skips the autoalign step), and with
+    method='greedy' it uses the deterministic greedy placement. The default is
+    the original adjustText algorithm, which is also used if you save the steps.
+
     Args:
         texts (list): a list of text.Text objects to adjust
         x (seq): x-coordinates of points to repel from; if not provided only
@@ -377,7 +790,18 @@ def adjust_text(texts, x=None, y=None, add_objects=None, ax=None,
             images of saving steps
         draggable (bool): whether to make the annotations draggable; default
             True
+        method (str): 'original' (default), 'grid' or 'greedy'
     """
+    if method in ('grid', 'greedy') and not save_steps:
+        # everything is passed by position so that args end up in the args
+        # of adjust_text_grid (for plt.annotate) rather than in x, y, ...
+        return adjust_text_grid(texts, x, y, add_objects, ax,
+                                expand_text, expand_points, expand_objects,
+                                force_text, force_points, force_objects,
+                                lim, precision, 0.001, 10, only_move,
+                                text_from_text, text_from_points,
+                                method == 'greedy', False, draggable,
+                                *args, **kwargs)
     if ax is None:
         ax = plt.gca()
     r = get_renderer(ax.get_figure())
@@ -0,0 +1,251 @@
+"""
+Gaussian kernel density estimates on regular grids, for when there are lots
+of points. scipy's gaussian_kde sums a kernel over every point at every place
+you evaluate it, which gets very slow for heat maps of millions of terrace
+pixels. Here the points are binned onto a grid (linear binning) and the bins
+are convolved with the gaussian kernel using FFTs, so the cost is roughly
+O(N + G log G) for N points and G grid nodes.
+
+The bandwidth follows the same rules as scipy.stats.gaussian_kde: bw_method can
+be "scott", "silverman", a scalar or a callable, and the kernel covariance is the
+data covariance times the square of the bandwidth factor. Linear binning is only
+accurate if the bins are small compared to the kernel, and if the data are
+correlated (e.g. terrace elevations rising downstream) the kernel is a narrow
+ellipse at an angle to the grid. So the points are binned in whitened
+coordinates, where the kernel is round with a standard deviation of 1, onto a
+grid with a spacing of half that. The density is then interpolated (with cubic
+splines) at the nodes of the grid you ask for. The result is the same as
+gaussian_kde at the grid nodes to within about a percent of the peak density.
+If the grid is enormous compared to the kernel (more than about 4 million bins)
+the bins are made wider, and the density is smoother than the exact one.
+
+Created on Mon Oct 19th 2026
+
+    Author: FJC
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import itertools
+import numpy as np
+from scipy.stats import gaussian_kde
+from scipy.signal import fftconvolve
+from scipy.ndimage import map_coordinates
+
+# The kernel is cut off at this many standard deviations
+_KERNEL_TRUNCATE = 4.0
+# The spacing of the bins in whitened coordinates, in kernel standard deviations
+_BIN_SPACING = 0.5
+# The most nodes the grid the points are binned onto can have. If the bins
+# would need more than this they are made wider.
+_MAX_BINNED_NODES = 2**22
+
+
+def get_kde_covariance(data, bw_method=None, weights=None):
+    """
+    Gets the covariance of the gaussian kernel that scipy's gaussian_kde would
+    use for this data. This only needs the covariance of the data so it is quick.
+
+    Args:
+        data: the points, either a 1D array or a (n_dims, n_points) array like gaussian_kde
+        bw_method: "scott", "silverman", a scalar or a callable. See gaussian_kde.
+        weights: optional weights of the points
+
+    Returns:
+        the (n_dims, n_dims) kernel covariance
+
+    Author: FJC
+    """
+    return np.atleast_2d(gaussian_kde(data, bw_method=bw_method, weights=weights).covariance)
+
+
+def is_regular_grid(x, rtol=1e-6):
+    """
+    Checks if a set of positions is evenly spaced and increasing, which is
+    what you need for the binned KDE.
+
+    Args:
+        x: the positions
+        rtol: the tolerance on the spacing relative to the mean spacing
+
+    Returns:
+        True if the positions are a regular grid
+
+    Author: FJC
+    """
+    x = np.asarray(x, dtype=float)
+    if x.ndim != 1 or len(x) < 2:
+        return False
+    spacing = np.diff(x)
+    mean_spacing = (x[-1]-x[0])/(len(x)-1)
+    if mean_spacing <= 0:
+        return False
+    return bool(np.all(np.abs(spacing-mean_spacing) <= rtol*mean_spacing))
+
+
+def linear_binning(data, grid_min, spacing, n_nodes, weights=None):
+    """
+    Bins points onto a regular grid. Each point shares its weight between
+    the 2^n_dims nodes around it, in proportion to how close it is to them.
+    Points that fall off the grid are dropped.
+
+    Args:
+        data: (n_dims, n_points) array of points
+        grid_min: the position of the first node in each dimension
+        spacing: the node spacing in each dimension
+        n_nodes: the number of nodes in each dimension
+        weights: the weights of the points (default is 1 each)
+
+    Returns:
+        an array of shape n_nodes with the weight at each node
+
+    Author: FJC
+    """
+    n_dims, n_points = data.shape
+    n_nodes = tuple(int(n) for n in n_nodes)
+    if weights is None:
+        weights = np.ones(n_points)
+
+    # the position of each point in grid units
+    position = (data-np.asarray(grid_min, dtype=float)[:,None])/np.asarray(spacing, dtype=float)[:,None]
+    lower = np.floor(position).astype(np.int64)
+    fraction = position-lower
+
+    counts = np.zeros(int(np.prod(n_nodes)))
+    # loop over the corners of the cell each point is in
+    for corner in range(2**n_dims):
+        corner_weight = weights.copy()
+        flat_index = np.zeros(n_points, dtype=np.int64)
+        on_grid = np.ones(n_points, dtype=bool)
+        for dim in range(n_dims):
+            upper = (corner >> dim) & 1
+            index = lower[dim]+upper
+            corner_weight *= fraction[dim] if upper else 1.0-fraction[dim]
+            on_grid &= (index >= 0) & (index < n_nodes[dim])
+            flat_index = flat_index*n_nodes[dim]+index
+        counts += np.bincount(flat_index[on_grid], weights=corner_weight[on_grid], minlength=counts.size)
+    return counts.reshape(n_nodes)
+
+
+def binned_kde_on_grid(data, grid_axes, bw_method=None, weights=None, covariance=None):
+    """
+    Gets the gaussian kernel density of some points at the nodes of a regular grid.
+
+    Args:
+        data: the points, either a 1D array or a (n_dims, n_points) array like gaussian_kde
+        grid_axes: a list with the (evenly spaced, increasing) node positions along each dimension.
+            For 1D data you can just pass the positions.
+        bw_method: "scott", "silverman", a scalar or a callable, as in gaussian_kde
+        weights: optional weights of the points
+        covariance: you can pass the kernel covariance instead of working it out from bw_method
+
+    Returns:
+        the density, an array of shape (len(grid_axes[0]), len(grid_axes[1]), ...),
+        i.e. indexed like np.meshgrid(*grid_axes, indexing="ij")
+
+    Author: FJC
+    """
+    data = np.atleast_2d(np.asarray(data, dtype=float))
+    n_dims, n_points = data.shape
+    if n_dims == 1 and np.ndim(grid_axes[0]) == 0:
+        grid_axes = [grid_axes]
+    grid_axes = [np.asarray(axis, dtype=float) for axis in grid_axes]
+    if len(grid_axes) != n_dims:
+        raise ValueError("You need one grid axis for each dimension of the data")
+    for axis in grid_axes:
+        if not is_regular_grid(axis):
+            raise ValueError("The binned KDE needs evenly spaced, increasing grid positions")
+
+    if covariance is None:
+        covariance = get_kde_covariance(data, bw_method=bw_method, weights=weights)
+    covariance = np.atleast_2d(covariance)
+    if weights is None:
+        weights = np.full(n_points, 1.0/n_points)
+    else:
+        weights = np.asarray(weights, dtype=float)
+        weights = weights/weights.sum()
+
+    n_nodes = tuple(len(axis) for axis in grid_axes)
+
+    # whiten the coordinates: with covariance = L L^T, u = L^-1 x has a round
+    # kernel with a standard deviation of 1, whatever the correlation of the data
+    L = np.linalg.cholesky(covariance)
+    inv_L = np.linalg.inv(L)
+
+    # the bins cover the grid (a parallelogram in whitened coordinates), padded
+    # by the kernel radius so that points just off the grid still add to it
+    corners = np.array(list(itertools.product(*[(axis[0], axis[-1]) for axis in grid_axes]))).T
+    corners = np.dot(inv_L, corners)
+    bins_min = corners.min(axis=1)-_KERNEL_TRUNCATE
+    bins_extent = corners.max(axis=1)+_KERNEL_TRUNCATE-bins_min
+    bin_spacing = _BIN_SPACING
+    n_bins = np.floor(bins_extent/bin_spacing).astype(np.int64)+2
+    if np.prod(n_bins) > _MAX_BINNED_NODES:
+        bin_spacing *= (np.prod(n_bins)/float(_MAX_BINNED_NODES))**(1.0/n_dims)
+        n_bins = np.floor(bins_extent/bin_spacing).astype(np.int64)+2
+        print("The KDE grid is very big compared to the bandwidth, so I am using bins "+str(bin_spacing)+" kernel standard deviations wide")
+    counts = linear_binning(np.dot(inv_L, data), bins_min, np.full(n_dims, bin_spacing), n_bins, weights=weights)
+
+    # the kernel in whitened coordinates. Linear binning spreads each point over
+    # a bin either side, which adds bin_spacing^2/6 to the variance, so that
+    # is taken off the kernel.
+    kernel_sd = np.sqrt(max(1.0-bin_spacing**2/6.0, 0.25))
+    radius = int(np.ceil(_KERNEL_TRUNCATE/bin_spacing))
+    offsets = np.arange(-radius, radius+1)*bin_spacing
+    kernel_1d = np.exp(-0.5*(offsets/kernel_sd)**2)/(np.sqrt(2*np.pi)*kernel_sd)
+    kernel = kernel_1d
+    for dim in range(1, n_dims):
+        kernel = np.multiply.outer(kernel, kernel_1d)
+
+    # the density at the bins, which is then interpolated at the grid nodes.
+    # The density in x is the density in u divided by the determinant of L.
+    binned_density = fftconvolve(counts, kernel, mode="same")
+    nodes = np.meshgrid(*grid_axes, indexing="ij")
+    nodes = np.vstack([node.ravel() for node in nodes])
+    position = (np.dot(inv_L, nodes)-bins_min[:,None])/bin_spacing
+    density = map_coordinates(binned_density, position, order=3, mode="nearest")
+    density = density.reshape(n_nodes)/np.prod(np.diag(L))
+    # FFTs and splines leave tiny negative values where the density is zero
+    return np.maximum(density, 0)
+
+
+def binned_kde_1d(data, x_range, bw_method=None, weights=None):
+    """
+    Gets the gaussian kernel density of some values at evenly spaced positions.
+    The same as gaussian_kde(data, bw_method).evaluate(x_range) but quick.
+
+    Args:
+        data: the values
+        x_range: the (evenly spaced, increasing) positions
+        bw_method: "scott", "silverman", a scalar or a callable, as in gaussian_kde
+        weights: optional weights of the values
+
+    Returns:
+        the density at each position
+
+    Author: FJC
+    """
+    return binned_kde_on_grid(np.asarray(data, dtype=float)[None,:], [x_range],
+                              bw_method=bw_method, weights=weights)
+
+
+def binned_kde_2d(x, y, x_grid, y_grid, bw_method=None, weights=None):
+    """
+    Gets the gaussian kernel density of some points on an evenly spaced grid.
+    The same as evaluating gaussian_kde(np.vstack([x,y]), bw_method) at
+    np.meshgrid(x_grid, y_grid) but quick.
+
+    Args:
+        x: the x positions of the points
+        y: the y positions of the points
+        x_grid: the (evenly spaced, increasing) x positions of the grid
+        y_grid: the (evenly spaced, increasing) y positions of the grid
+        bw_method: "scott", "silverman", a scalar or a callable, as in gaussian_kde
+        weights: optional weights of the points
+
+    Returns:
+        the density, an array of shape (len(y_grid), len(x_grid)) like the arrays from np.meshgrid
+
+    Author: FJC
+    """
+    data = np.vstack([np.asarray(x, dtype=float), np.asarray(y, dtype=float)])
+    return binned_kde_on_grid(data, [x_grid, y_grid], bw_method=bw_method, weights=weights).T
@@ -6,14 +6,19 @@ A script that calculates the area of the model/DEM domain that is inundated by
 water; either across the entire domain, the floodplain (using Fiona's floodplain
 ID algorithm, or in the Channel, using the channel network and measuring along 
 this line. The mean, max, and total area wil be able to be calculated.)
+
+Importing the module doesn't do anything, the Ryedale example at the bottom
+only runs if you call it as a script:
+    python -m LSDPlottingTools.inundation
 """
 
-import LSDMap_GDALIO as lsdgdal
+from . import LSDMap_GDALIO as lsdgdal
 import numpy as _np
-import matplotlib.pyplot as plt
+import multiprocessing
 import glob
 import os
 import re
+import warnings
 
 
 def calculate_mean_waterdepth(raster):
@@ -28,7 +33,7 @@ def calculate_waterinundation_area(raster, cellsize, threshold):
     """Note: this will probably need some sort of threshold as Caesar maps 
     out very small water depths and so could give huge 'inundation' areas."""
     total_cells = _np.count_nonzero(raster > threshold)
-    area = DX * DX * total_cells  # metres
+    area = cellsize * cellsize * total_cells  # metres
     
     print("Inundation area is: ", area, " metres square")
     return area
@@ -95,9 +100,130 @@ def natural_key(string_):
     """
     return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', string_)]
 
+def get_mask_indices(floodplain_mask, stream_mask, channel_order=5):
+    """Gets the flat indices of the floodplain (flagged==1) and main channel
+    (stream order == channel_order) cells. These only need to be worked out
+    once for the whole time series, after which each timestep is just a lookup.
+    
+    Returns:
+        floodplain_indices, channel_indices (numpy arrays of ints)
+    """
+    floodplain_indices = _np.flatnonzero(_np.asarray(floodplain_mask).ravel() == 1)
+    channel_indices = _np.flatnonzero(_np.asarray(stream_mask).ravel() == channel_order)
+    return floodplain_indices, channel_indices
+
+def read_water_raster(water_raster_file):
+    """Reads a water depth raster. ENVI .bil files are memory mapped so only
+    the cells we need are read; anything else (e.g. the .asc from Caesar) is
+    read with GDAL, which turns the nodata into nan.
+    
+    Returns:
+        The raster and its nodata value (None if the nodata is already nan)
+    """
+    water_raster = None
+    nodata = None
+    if water_raster_file.endswith(".bil"):
+        water_raster, nodata = lsdgdal.MemmapENVIRaster(water_raster_file)
+    if water_raster is None:
+        water_raster = lsdgdal.ReadRasterArrayBlocks(water_raster_file)
+        nodata = None
+    return water_raster, nodata
+
+def _drop_nodata(values, nodata):
+    """The values that aren't nodata or nan, so the metrics are the same
+    whichever way the raster was read"""
+    values = _np.asarray(values)
+    valid = ~_np.isnan(values) if values.dtype.kind == "f" else _np.ones(values.shape, dtype=bool)
+    if nodata is not None:
+        valid &= values != nodata
+    return values[valid]
+
+def _mean_at_indices(flat_raster, indices, nodata=None):
+    """Mean of the raster at the given flat indices, leaving out the nodata
+    (nan if there are no cells with data)"""
+    values = _drop_nodata(flat_raster[indices], nodata)
+    if values.size == 0:
+        return _np.nan
+    return _np.mean(values, dtype=_np.float64)
+
+# These are set once per worker process by _init_timestep_worker so the
+# index arrays aren't sent over to the workers with every timestep.
+_WORKER_STATE = {}
+
+def _init_timestep_worker(floodplain_indices, channel_indices, cellsize, threshold):
+    _WORKER_STATE["floodplain_indices"] = floodplain_indices
+    _WORKER_STATE["channel_indices"] = channel_indices
+    _WORKER_STATE["cellsize"] = cellsize
+    _WORKER_STATE["threshold"] = threshold
+
+def timestep_metrics(water_raster_file):
+    """Calculates the metrics for one timestep raster.
+    
+    Returns:
+        [timestep, inundation area, mean water depth (catchment),
+         mean water depth (floodplain), mean water depth (main channel)]
+    """
+    water_raster, nodata = read_water_raster(water_raster_file)
+    flat_raster = water_raster.reshape(-1)
+    
+    cellsize = _WORKER_STATE["cellsize"]
+    valid_raster = _drop_nodata(flat_raster, nodata)
+    total_cells = _np.count_nonzero(valid_raster > _WORKER_STATE["threshold"])
+    
+    return [float(timestep_string_from_filename(water_raster_file)),
+            cellsize * cellsize * total_cells,
+            _np.mean(valid_raster, dtype=_np.float64) if valid_raster.size > 0 else _np.nan,
+            _mean_at_indices(flat_raster, _WORKER_STATE["floodplain_indices"], nodata),
+            _mean_at_indices(flat_raster, _WORKER_STATE["channel_indices"], nodata)]
+
+class _TimeseriesWriter(object):
+    """Writes the timeseries a row at a time so nothing is lost if a long run
+    falls over. The format comes from the extension: .csv gives a csv with a
+    header, .nc a NetCDF file (needs netCDF4) and anything else the space
+    separated text file this script has always written."""
+    columns = ["timestep", "inundation_area", "mean_depth_catchment",
+               "mean_depth_floodplain", "mean_depth_channel"]
+    
+    def __init__(self, savefilename):
+        self.savefilename = savefilename
+        self.n_rows = 0
+        if savefilename.endswith(".nc"):
+            import netCDF4
+            self._nc = netCDF4.Dataset(savefilename, "w")
+            self._nc.createDimension("time", None)
+            self._variables = [self._nc.createVariable(name, "f8", ("time",)) for name in self.columns]
+            self._variables[1].units = "m2"
+            for variable in self._variables[2:]:
+                variable.units = "m"
+        else:
+            self._nc = None
+            self._file = open(savefilename, "w")
+            if savefilename.endswith(".csv"):
+                self._fmt = "%i,%f,%f,%f,%f"
+                self._file.write(",".join(self.columns)+"\n")
+            else:
+                self._fmt = "%i %f %f %f %f"
+    
+    def write(self, row):
+        if self._nc is not None:
+            for variable, value in zip(self._variables, row):
+                variable[self.n_rows] = value
+        else:
+            self._file.write(self._fmt % tuple(row) + "\n")
+            self._file.flush()
+        self.n_rows += 1
+    
+    def close(self):
+        if self._nc is not None:
+            self._nc.close()
+        else:
+            self._file.close()
+
 def simulation_inundation_timeseries(glob_wildcard, floodplain_mask, stream_mask,
-                                     threshold=0,
-                                     savefilename="inundation_metrics.txt"):
+                                     threshold=None,
+                                     savefilename="inundation_metrics.txt",
+                                     cellsize=None, inundation_threshold=0.02,
+                                     channel_order=5, n_workers=None):
     """Creates a timeseries of a given inundation metric. 
     
     Options should be:
@@ -105,69 +231,85 @@ def simulation_inundation_timeseries(glob_wildcard, floodplain_mask, stream_mask
         Mean Water Depth (Entire catchment)
         Mean Water Depth (Floodplain only)
         Mean Water Depth (Channel)
+    
+    The masks are turned into index arrays once, the timesteps are then
+    processed in a pool of worker processes (n_workers, defaults to the number
+    of cpus, 1 means no pool) and written to savefilename as they come in.
+    Use a .csv or .nc savefilename to get csv or NetCDF output.
+    
+    cellsize is read from the first raster if you don't give it. Cells deeper
+    than inundation_threshold count as inundated. threshold is the old name of
+    inundation_threshold and is deprecated; if you give it, it is used as the
+    inundation threshold.
+    
+    Returns:
+        The (n_timesteps, 5) array of metrics
     """
-    # Create an empty array with the correct number of columns
-    data_array = _np.empty((0,5), dtype=_np.float32)
-    print("Data array shape: ", data_array.shape)
-
-    for water_raster_file in sorted(glob.glob(glob_wildcard), key=natural_key):
-        print(water_raster_file)
-        water_raster = lsdgdal.ReadRasterArrayBlocks(water_raster_file)
-        
-        timestep_row = [] # Empty list to store elements of the row
-        cur_timestep = timestep_string_from_filename(water_raster_file) # get the current timestep by parsing the filename
-
-        # Inundation area
-        this_inundation_area = calculate_waterinundation_area(water_raster, DX, 0.02)
-        this_mean_catchment_waterdepth = calculate_mean_waterdepth(water_raster)
-        this_mean_floodplain_waterdepth = floodplain_mean_depth(water_raster, floodplain_mask)
-        this_mean_mainchannel_waterdepth = main_channel_mean_depth(water_raster, floodplain_mask, stream_mask)
+    if threshold is not None:
+        warnings.warn("threshold is deprecated, use inundation_threshold instead. "
+                      "Using threshold=" + str(threshold) + " as the inundation threshold.",
+                      DeprecationWarning, stacklevel=2)
+        inundation_threshold = threshold
+    
+    water_raster_files = sorted(glob.glob(glob_wildcard), key=natural_key)
+    n_timesteps = len(water_raster_files)
+    print("I found ", n_timesteps, " timesteps")
+    
+    # Preallocate the results, one row per timestep
+    data_array = _np.full((n_timesteps, 5), _np.nan, dtype=_np.float64)
+    if n_timesteps == 0:
+        return data_array
+    
+    if cellsize is None:
+        cellsize = lsdgdal.GetUTMMaxMin(water_raster_files[0])[0]
+    floodplain_indices, channel_indices = get_mask_indices(floodplain_mask, stream_mask, channel_order)
+    worker_args = (floodplain_indices, channel_indices, cellsize, inundation_threshold)
+    
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    n_workers = max(1, min(n_workers, n_timesteps))
+    
+    writer = _TimeseriesWriter(savefilename)
+    try:
+        if n_workers == 1:
+            _init_timestep_worker(*worker_args)
+            rows = (timestep_metrics(f) for f in water_raster_files)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(n_workers, initializer=_init_timestep_worker, initargs=worker_args)
+            chunksize = max(1, n_timesteps // (4 * n_workers))
+            rows = pool.imap(timestep_metrics, water_raster_files, chunksize)
         
-        # Append each value to the current row list object
-        timestep_row.append([cur_timestep,
-                             this_inundation_area,
-                             this_mean_catchment_waterdepth,
-                             this_mean_floodplain_waterdepth,
-                             this_mean_mainchannel_waterdepth])
-        # Convert the list into a numpy array
-        timestep_row = _np.asarray(timestep_row, dtype=_np.float32)
+        # imap keeps the order of the files so the rows can go straight out
+        for i, row in enumerate(rows):
+            data_array[i] = row
+            writer.write(row)
         
-        # Now append (stack) that row onto the bottom of the array (axis=0)
-        data_array = _np.append(data_array, timestep_row, axis=0)
-    
-    print(data_array)
-    print(data_array.shape)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        writer.close()
     
-    with open(savefilename,'wb') as f:
-        _np.savetxt(f, data_array, fmt='%i %f %f %f %f')
-
+    print("I wrote ", n_timesteps, " timesteps to ", savefilename)
+    return data_array
 
 
+if __name__ == "__main__":
+    """Get your rasters into arrays"""    
+    water_raster_wildcard = "/run/media/dav/SHETLAND/ModelRuns/Ryedale_storms/Gridded/Hydro/WaterDepths*.asc"
+    water_raster_file = "/mnt/SCRATCH/Analyses/HydrogeomorphPaper/peak_flood_maps/ryedale/WaterDepths2880_GRID_TLIM.asc"
+    #raster_file = "/run/media/dav/SHETLAND/Analyses/HydrogeomorphPaper/peak_flood_maps/boscastle/peak_flood/WaterDepths2400_GRID_HYDRO.asc"
+    floodplain_file = "/mnt/SCRATCH/Analyses/ChannelMaskAnalysis/floodplain_ryedale/RyedaleElevations_FP.bil"
+    stream_raster_file = "/mnt/SCRATCH/Analyses/ChannelMaskAnalysis/floodplain_ryedale/RyedaleElevations_SO.bil"
     
-"""Get your rasters into arrays"""    
-water_raster_wildcard = "/run/media/dav/SHETLAND/ModelRuns/Ryedale_storms/Gridded/Hydro/WaterDepths*.asc"
-water_raster_file = "/mnt/SCRATCH/Analyses/HydrogeomorphPaper/peak_flood_maps/ryedale/WaterDepths2880_GRID_TLIM.asc"
-#raster_file = "/run/media/dav/SHETLAND/Analyses/HydrogeomorphPaper/peak_flood_maps/boscastle/peak_flood/WaterDepths2400_GRID_HYDRO.asc"
-floodplain_file = "/mnt/SCRATCH/Analyses/ChannelMaskAnalysis/floodplain_ryedale/RyedaleElevations_FP.bil"
-stream_raster_file = "/mnt/SCRATCH/Analyses/ChannelMaskAnalysis/floodplain_ryedale/RyedaleElevations_SO.bil"
-
-water_raster = lsdgdal.ReadRasterArrayBlocks(water_raster_file)
-
-floodplain_mask = lsdgdal.ReadRasterArrayBlocks(floodplain_file)
-stream_mask = lsdgdal.ReadRasterArrayBlocks(stream_raster_file)
-#print(stream_mask)
-
-DX = lsdgdal.GetUTMMaxMin(water_raster_file)[0]   # I never realised you could do this!
-print(DX)
-
-"""Calculate the depths and areas"""
-#calculate_mean_waterdepth(water_raster)
-#calcualte_max_waterdepth(water_raster)
-#calculate_waterinundation_area(water_raster, DX, 0.02)
-#floodplain_mean_depth(water_raster, floodplain_mask)
-#main_channel_mean_depth(water_raster, floodplain_mask, stream_mask)
-
-"""Make the timeseries file"""
-simulation_inundation_timeseries(water_raster_wildcard, floodplain_mask,
-                                 stream_mask,
-                                 savefilename="ryedale_inundation_GRIDDED_HYDRO.txt")
+    floodplain_mask = lsdgdal.ReadRasterArrayBlocks(floodplain_file)
+    stream_mask = lsdgdal.ReadRasterArrayBlocks(stream_raster_file)
+    
+    DX = lsdgdal.GetUTMMaxMin(water_raster_file)[0]   # I never realised you could do this!
+    print(DX)
+    
+    """Make the timeseries file"""
+    simulation_inundation_timeseries(water_raster_wildcard, floodplain_mask,
+                                     stream_mask, cellsize=DX,
+                                     savefilename="ryedale_inundation_GRIDDED_HYDRO.txt")
@@ -13,6 +13,7 @@ from pandas import (DataFrame, Series)
 from pandas.core.dtypes.common import is_number
 from pandas.core.groupby import DataFrameGroupBy
 from scipy.stats import gaussian_kde
+from LSDPlottingTools import binnedkde
 from warnings import warn
 from matplotlib import ticker
 
@@ -250,14 +251,20 @@ def plot_density(ax, x_range, v, kind="kde", bw_method=None,
                  fill=False, linecolor=None, clip_on=True, **kwargs):
     """ Draw a density plot given an axis, an array of values v and an array
         of x positions where to return the estimated density.
+        If the x positions are evenly spaced the kde is binned (see binnedkde).
     """
     v = _remove_na(v)
     if len(v) == 0 or len(x_range) == 0:
         return
 
     if kind == "kde":
-        gkde = gaussian_kde(v, bw_method=bw_method)
-        y = gkde.evaluate(x_range)
+        # evenly spaced x positions (the default) can use the binned KDE,
+        # which is much quicker when there are lots of values
+        if binnedkde.is_regular_grid(x_range):
+            y = binnedkde.binned_kde_1d(v, x_range, bw_method=bw_method)
+        else:
+            gkde = gaussian_kde(v, bw_method=bw_method)
+            y = gkde.evaluate(x_range)
     elif kind == "counts":
         y, bin_edges = np.histogram(v, bins=bins, range=(min(x_range), max(x_range)))
         # np.histogram returns the edges of the bins.
@@ -79,76 +79,367 @@ def get_MAD(points):
     return med_abs_deviation
 
 
-def get_outlier_from_KernelDensityStuff(df, column = "", binning = "", threshold = 6, method = "gaussian", sort_by = ""):
+def _grouped_median(values, codes, n_groups):
+    """
+    Gets the median of each group with a single sort (by group, then value),
+    rather than looping over the groups.
 
-    from sklearn.neighbors.kde import KernelDensity as harry
+    Args:
+        values (array): the data. No nans.
+        codes (int array): the group of each value, 0 to n_groups-1
+        n_groups (int): the number of groups
 
+    Returns:
+        An array with the median of each group (nan for empty groups)
 
-    if(column ==""):
-        print("I need a column")
-        quit()
+    Author: SMM
+    """
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts)-counts
+    has_data = counts > 0
+    lo = (starts+(counts-1)//2)[has_data]
+    hi = (starts+counts//2)[has_data]
 
+    medians = np.full(n_groups, np.nan)
+    medians[has_data] = 0.5*(sorted_values[lo]+sorted_values[hi])
+    return medians
 
 
+def get_group_codes(df, header_for_group = []):
+    """
+    Gets an integer code for the group of each row of a dataframe.
 
+    Args:
+        df (pandas dataframe): the data
+        header_for_group (str or list): the column(s) that define the groups. If empty, everything is one group.
 
-    out_df = pd.DataFrame(data = None, columns = df.columns)
+    Returns:
+        codes (int array): the group of each row, 0 to n_groups-1 (-1 if any of the group columns is nan)
+        n_groups (int): the number of groups
 
-    if(binning != ""):
-        for potter in df[binning].unique():
-            tdf = df[df[binning] == potter]
-            if(sort_by!= ""):
-                tdf = tdf.sort_values(sort_by)
+    Author: SMM
+    """
+    if isinstance(header_for_group, str):
+        header_for_group = [header_for_group]
+    if len(header_for_group) == 0:
+        return np.zeros(df.shape[0], dtype=np.int64), 1
+    codes = df.groupby(header_for_group, sort=False).ngroup().fillna(-1).values.astype(np.int64)
+    n_groups = codes.max()+1 if len(codes) > 0 else 0
+    return codes, n_groups
 
-            if(column == "deriv_ksn"):
-                tdf["deriv_ksn"] = pd.Series(np.abs(tdf.ksn.diff()/tdf.chi.diff()),index = tdf.index)
-                tdf["deriv_ksn"].iloc[0] = 0
-                print(tdf.shape[0])
 
-            dumbledore = np.copy(tdf[column].values.reshape((-1,1)))
+def modified_z_score_by_group(df, data_column_name, header_for_group = []):
+    """
+    Gets the modified z-score (0.6745*|x-median|/MAD, as in is_outlier) of each
+    row, using the median and MAD of its group. It works for all the groups at
+    once so it is quick even with millions of rows and thousands of groups.
 
-            severus = harry(kernel = method).fit(dumbledore)
+    Args:
+        df (pandas dataframe): the data
+        data_column_name (str): the column to test
+        header_for_group (str or list): the column(s) that define the groups (e.g. "source_key"). If empty, the whole column is one group.
 
-            snake = np.abs(severus.score_samples(dumbledore))
+    Returns:
+        A numpy array of modified z-scores aligned with the rows of df. Nans in the data get a score of 0.
+        Like is_outlier, groups with a MAD of 0 have scores of 0.
 
-            McGonagal = []
-            for gobelins in snake:
-                if gobelins<threshold:
-                    McGonagal.append(False)
-                else:
-                    McGonagal.append(True)
+    Author: SMM
+    """
+    values = df[data_column_name].values.astype(np.float64)
+    codes, n_groups = get_group_codes(df, header_for_group)
+    return modified_z_score_from_codes(values, codes, n_groups)
 
-            aCat = tdf[McGonagal]
 
+def modified_z_score_from_codes(values, codes, n_groups):
+    """
+    The array version of modified_z_score_by_group, for when you already have
+    the group codes (e.g. from get_group_codes).
 
-            out_df = pd.concat([out_df,aCat])
+    Args:
+        values (array): the data
+        codes (int array): the group of each value, 0 to n_groups-1 (-1 to leave it out)
+        n_groups (int): the number of groups
 
+    Returns:
+        A numpy array of modified z-scores. Nans get a score of 0, as do groups with a MAD of 0.
+
+    Author: SMM
+    """
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.asarray(codes)
+    z_scores = np.zeros(len(values))
+
+    valid = np.isfinite(values) & (codes >= 0)
+    if not np.any(valid):
+        return z_scores
+    these_values = values[valid]
+    these_codes = codes[valid]
+
+    medians = _grouped_median(these_values, these_codes, n_groups)
+    abs_deviations = np.abs(these_values-medians[these_codes])
+    MADs = _grouped_median(abs_deviations, these_codes, n_groups)
+
+    this_MAD = MADs[these_codes]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z_scores[valid] = np.where(this_MAD > 0, 0.6745*abs_deviations/this_MAD, 0)
+    return z_scores
 
-    return out_df
 
+def is_outlier_by_group(df, data_column_name, header_for_group = [], thresh = 3.5):
+    """
+    The grouped version of is_outlier: a row is an outlier if its modified
+    z-score within its group is greater than thresh.
 
+    Args:
+        df (pandas dataframe): the data
+        data_column_name (str): the column to test
+        header_for_group (str or list): the column(s) that define the groups. If empty, the whole column is one group.
+        thresh (float): the modified z-score threshold
 
+    Returns:
+        A boolean pandas Series with the same index as df
 
+    Author: SMM
+    """
+    z_scores = modified_z_score_by_group(df, data_column_name, header_for_group)
+    return pd.Series(z_scores > thresh, index = df.index)
 
-def add_outlier_column_to_PD(df, column = "none", threshold = "none"):
+
+def _dense_binned_density(left, frac, codes, n_groups, n_bins, bin_width, bandwidth):
+    """
+    The kernel density sums for binned_kde_log_density_by_group on a full grid
+    for each group, with the kernel applied with an FFT.
+
+    Args:
+        left (int array): the grid point to the left of each value
+        frac (array): how far each value is from its left grid point, as a fraction of the bin width
+        codes (int array): the group of each value, 0 to n_groups-1
+        n_groups (int): the number of groups
+        n_bins (int): the number of grid points per group
+        bin_width (float): the grid spacing
+        bandwidth (float): the standard deviation of the gaussian kernel
+
+    Returns:
+        The (unnormalised) density at each value
+
+    Author: SMM
+    """
+    flat_left = codes*n_bins+left
+    grid = np.bincount(flat_left, weights=1-frac, minlength=n_groups*n_bins)
+    grid += np.bincount(flat_left+1, weights=frac, minlength=n_groups*n_bins)
+    grid = grid.reshape(n_groups, n_bins)
+
+    # Zero padding stops the kernel wrapping round
+    n_fft = 2*n_bins
+    kernel_x = np.fft.fftfreq(n_fft, d=1.0/n_fft)*bin_width
+    kernel = np.exp(-0.5*(kernel_x/bandwidth)**2)/(np.sqrt(2*np.pi)*bandwidth)
+    smoothed = np.fft.irfft(np.fft.rfft(grid, n=n_fft, axis=1)*np.fft.rfft(kernel)[None, :], n=n_fft, axis=1)[:, :n_bins]
+    smoothed = np.maximum(smoothed, 0)
+    return smoothed[codes, left]*(1-frac)+smoothed[codes, left+1]*frac
+
+
+def _sparse_binned_density(left, frac, codes, bin_width, bandwidth, truncate = 8.0):
+    """
+    The kernel density sums for binned_kde_log_density_by_group using only the
+    grid points that have data, for groups that are spread over so many
+    bandwidths that a full grid would be too big. Each occupied grid point adds
+    up the kernel from the occupied grid points within truncate bandwidths.
+
+    Args:
+        left (int array): the grid point to the left of each value
+        frac (array): how far each value is from its left grid point, as a fraction of the bin width
+        codes (int array): the group of each value
+        bin_width (float): the grid spacing
+        bandwidth (float): the standard deviation of the gaussian kernel
+        truncate (float): the kernel is cut off at this many bandwidths
+
+    Returns:
+        The (unnormalised) density at each value
+
+    Author: SMM
+    """
+    n_values = len(left)
+    # each value is shared between its two grid points. The grid points are
+    # numbered with a key that orders them by group then position.
+    max_bin = int(np.max(left))+2
+    reach = int(np.ceil(truncate*bandwidth/bin_width))
+    stride = max_bin+2*reach+1
+    keys = np.concatenate([codes*stride+left, codes*stride+left+1])
+    occupied_keys, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    weights = np.bincount(inverse, weights=np.concatenate([1-frac, frac]), minlength=len(occupied_keys))
+
+    density = np.zeros(len(occupied_keys))
+    norm = np.sqrt(2*np.pi)*bandwidth
+    for offset in range(-reach, reach+1):
+        neighbours = np.searchsorted(occupied_keys, occupied_keys+offset)
+        neighbours = np.minimum(neighbours, len(occupied_keys)-1)
+        found = occupied_keys[neighbours] == occupied_keys+offset
+        kernel = np.exp(-0.5*(offset*bin_width/bandwidth)**2)/norm
+        density[found] += kernel*weights[neighbours[found]]
+
+    return density[inverse[:n_values]]*(1-frac)+density[inverse[n_values:]]*frac
+
+
+def binned_kde_log_density_by_group(df, data_column_name, header_for_group = [], bandwidth = 1.0,
+                                    bins_per_bandwidth = 4, max_bins = 65536, max_grid_size = 2**22):
+    """
+    Gets the log of the gaussian kernel density of each row's value within its
+    group, like sklearn's KernelDensity(bandwidth).score_samples, but with the
+    data binned onto a grid and the kernel applied to the grid rather than to
+    every pair of values.
+
+    The bin width is tied to the bandwidth so the accuracy doesn't depend on the
+    range of the data. Groups that need up to max_bins grid points are done with
+    FFTs, in batches of up to max_grid_size grid points. Groups with a long tail
+    (e.g. deriv_ksn), that would need more, only use the grid points that have data.
+
+    Args:
+        df (pandas dataframe): the data
+        data_column_name (str): the column to score
+        header_for_group (str or list): the column(s) that define the groups. If empty, the whole column is one group.
+        bandwidth (float): the standard deviation of the gaussian kernel, in data units
+        bins_per_bandwidth (int): the number of grid points per bandwidth. More is more accurate.
+        max_bins (int): groups that need more grid points than this use the sparse grid
+        max_grid_size (int): the most grid points in one batch of FFTs
+
+    Returns:
+        A numpy array of log densities aligned with the rows of df (nan where the data is nan)
+
+    Author: SMM
+    """
+    values = df[data_column_name].values.astype(np.float64)
+    codes, n_groups = get_group_codes(df, header_for_group)
+    log_density = np.full(len(values), np.nan)
+
+    valid = np.isfinite(values) & (codes >= 0)
+    if not np.any(valid):
+        return log_density
+    these_values = values[valid]
+    these_codes = codes[valid]
+
+    # each group gets a grid covering its data plus 4 bandwidths either side
+    group_min = np.full(n_groups, np.inf)
+    group_max = np.full(n_groups, -np.inf)
+    np.minimum.at(group_min, these_codes, these_values)
+    np.maximum.at(group_max, these_codes, these_values)
+    counts = np.bincount(these_codes, minlength=n_groups)
+    bin_width = float(bandwidth)/bins_per_bandwidth
+    grid_start = group_min-4*bandwidth
+    with np.errstate(invalid="ignore"):
+        group_bins = np.ceil((group_max-group_min+8*bandwidth)/bin_width)+2
+
+    # linear binning: each value is shared between its two nearest grid points
+    position = (these_values-grid_start[these_codes])/bin_width
+    left = np.floor(position).astype(np.int64)
+    frac = position-left
+
+    density = np.zeros(len(these_values))
+    present = np.flatnonzero(counts > 0)
+    dense_groups = present[group_bins[present] <= max_bins]
+    sparse_groups = present[group_bins[present] > max_bins]
+
+    # the dense groups are done in batches of similar sized grids
+    dense_groups = dense_groups[np.argsort(group_bins[dense_groups], kind="mergesort")]
+    local_codes = np.full(n_groups, -1, dtype=np.int64)
+    first = 0
+    while first < len(dense_groups):
+        last = first+1
+        while last < len(dense_groups) and (last-first+1)*int(group_bins[dense_groups[last]]) <= max_grid_size:
+            last += 1
+        batch = dense_groups[first:last]
+        n_bins = int(group_bins[batch[-1]])
+        local_codes[batch] = np.arange(len(batch))
+        in_batch = np.flatnonzero(np.isin(these_codes, batch))
+        density[in_batch] = _dense_binned_density(left[in_batch], frac[in_batch], local_codes[these_codes[in_batch]],
+                                                  len(batch), n_bins, bin_width, bandwidth)
+        first = last
+
+    if len(sparse_groups) > 0:
+        print("Some groups are spread over lots of bandwidths, so I'll only use the grid points with data for them.")
+        in_sparse = np.flatnonzero(np.isin(these_codes, sparse_groups))
+        density[in_sparse] = _sparse_binned_density(left[in_sparse], frac[in_sparse], these_codes[in_sparse],
+                                                    bin_width, bandwidth)
+
+    density = density/counts[these_codes]
+    with np.errstate(divide="ignore"):
+        log_density[valid] = np.log(density)
+    return log_density
+
+
+def get_outlier_from_KernelDensityStuff(df, column = "", binning = "", threshold = 6, method = "gaussian", sort_by = "", bandwidth = 1.0):
+    """
+    Selects the rows of a dataframe with a low kernel density within their group:
+    the ones where the absolute log density is at least threshold.
+
+    Args:
+        df (pandas dataframe): the data
+        column (str): the column to test. "deriv_ksn" is calculated from ksn and chi within each group.
+        binning (str): the column that defines the groups (e.g. "source_key")
+        threshold (float): the threshold on the absolute log density
+        method (str): the kernel. "gaussian" uses the binned FFT density estimate, others use sklearn group by group.
+        sort_by (str): the column to sort each group by (needed for deriv_ksn)
+        bandwidth (float): the kernel bandwidth (sklearn's default is 1)
+
+    Returns:
+        A dataframe with the outlying rows
+
+    Author: BG, SMM
+    """
+    if(column ==""):
+        print("I need a column")
+        quit()
+
+    if(binning == ""):
+        return pd.DataFrame(data = None, columns = df.columns)
+
+    tdf = df
+    if(sort_by!= ""):
+        tdf = tdf.sort_values([binning,sort_by], kind = "mergesort")
+    else:
+        # so the rows come out grouped as before
+        tdf = tdf.sort_values(binning, kind = "mergesort")
+
+    if(column == "deriv_ksn"):
+        tdf = tdf.copy()
+        grouped = tdf.groupby(binning, sort=False)
+        tdf["deriv_ksn"] = np.abs(grouped["ksn"].diff()/grouped["chi"].diff())
+        tdf.loc[grouped.cumcount() == 0, "deriv_ksn"] = 0
+
+    if(method == "gaussian"):
+        scores = np.abs(binned_kde_log_density_by_group(tdf, column, binning, bandwidth = bandwidth))
+    else:
+        from sklearn.neighbors import KernelDensity as harry
+        scores = np.zeros(tdf.shape[0])
+        codes, n_groups = get_group_codes(tdf, binning)
+        values = tdf[column].values.reshape((-1,1))
+        for potter in range(n_groups):
+            this_group = np.flatnonzero(codes == potter)
+            severus = harry(kernel = method, bandwidth = bandwidth).fit(values[this_group])
+            scores[this_group] = np.abs(severus.score_samples(values[this_group]))
+
+    return tdf[scores >= threshold]
+
+
+
+
+
+def add_outlier_column_to_PD(df, column = "none", threshold = "none", header_for_group = []):
 
     """
     Takes a pandas dataframe and returns the same with added boolean columns (True if outlier).
-    Uses the function is_outlier to detect the outliers. Can also take a list of dataframes
+    Uses the modified z-score of is_outlier to detect the outliers, optionally within groups. Can also take a list or dict of dataframes
     Args:
-        df (Pandas dataframe): The dataframe or a list of dataframe
+        df (Pandas dataframe): The dataframe or a list (or dict) of dataframes
         column (list or string): name of the column(s) you want to outlier-check
         threshold  (list or float): list of threshold for each columns (must be same size as column)
+        header_for_group (str or list): If given, the outliers are found within the groups defined by these column(s)
     returns
-        Pandas.DataFrame
+        Pandas.DataFrame (or the list/dict of them)
     """
 
-    # Check the DataType
-    if(isinstance(df,list) == False and isinstance(df,dict) == False):
-        lst_df = [df]
-
-    else:
-        lst_df = df
     # check the data validity
     if(isinstance(column,str) and column =="none"):
         print("you need to give me the name of at least a column, or a list ([])")
@@ -157,30 +448,29 @@ def add_outlier_column_to_PD(df, column = "none", threshold = "none"):
         print("you need to give me the name of at least a column, or a list ([])")
         quit()
 
+    if(isinstance(column,str)):
+        column = [column]
+    if(isinstance(threshold,float) or isinstance(threshold,int)):
+        threshold = [threshold]
+    if(len(threshold) != len(column)):
+        print("You need to assign one threshold per columns name")
 
+    # Check the DataType
+    if(isinstance(df,dict)):
+        keys = list(df.keys())
+    elif(isinstance(df,list)):
+        keys = list(range(len(df)))
+    else:
+        keys = [None]
 
     # calculate the outliers
-    for instance in lst_df:
-
-        if(isinstance(column,str)):
-            column = [column]
-
-        if(isinstance(threshold,float) or isinstance(threshold,int)):
-            threshold = [threshold]
-
-        if(len(threshold) != len(column)):
-            print("You need to assign one threshold per columns name")
-
+    for instance in keys:
+        this_df = df if instance is None else df[instance]
         for i in range(len(column)):
-            # print(lst_df[instance])
-            is_outliers = is_outlier(lst_df[instance][column[i]],threshold[i])
-            coln =column[i]+"_outlier"
-            lst_df[instance][coln] = pd.Series(is_outliers,index = lst_df[instance].index)
+            z_scores = modified_z_score_by_group(this_df, column[i], header_for_group)
+            this_df[column[i]+"_outlier"] = z_scores > threshold[i]
 
-    if len(lst_df) == 1:
-        return lst_df[0]
-    else:
-        return lst_df
+    return df
 
 def binning_PD(df, column = "", values = [], log = False):
     """
@@ -390,64 +680,198 @@ def remove_outlying_residuals(xdata,ydata,residuals):
     
 
 
-def extract_outliers_by_header(df, data_column_name = "diff", header_for_group = "source_key", threshold = 3.5):
+def linregress_by_group(xdata, ydata, codes, n_groups):
     """
-    Extract outliers from a dataframe, groupped by a specific column. 
-    for example, as in default, extract the outliers in the diff column, groupped by source_key
+    Does scipy.stats.linregress for every group at once. The sums the regression
+    needs are added up for all the groups in one pass (np.bincount), so this
+    takes about as long as one regression on all the data.
 
-    param:
-        df (pandas dataframe): The dataframe containing at least the two columns in param
-        data_column_name (str): Name of the column containing the data
-        header_for_group (str): Name of the column for groupping
+    Args:
+        xdata (array-like): The x data
+        ydata (array-like): The y data
+        codes (int array): the group of each point, 0 to n_groups-1 (-1 to leave it out). See get_group_codes.
+        n_groups (int): the number of groups
 
-    return: a dataframe containing only the outliers
+    Returns:
+        A dict of arrays, one value per group: "slope", "intercept", "rvalue",
+        "pvalue", "stderr" and "n". Groups where the x data are all the same get nans.
 
-    Author: BG - 05/10/2017
+    Author: SMM
+    """
+    x = np.asarray(xdata, dtype=np.float64)
+    y = np.asarray(ydata, dtype=np.float64)
+    codes = np.asarray(codes)
+    valid = codes >= 0
+    x = x[valid]
+    y = y[valid]
+    codes = codes[valid]
+
+    n = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        xmean = np.bincount(codes, weights=x, minlength=n_groups)/n
+        ymean = np.bincount(codes, weights=y, minlength=n_groups)/n
+
+        # centre the data on the mean of each group, it keeps the sums accurate
+        dx = x-xmean[codes]
+        dy = y-ymean[codes]
+        ssxm = np.bincount(codes, weights=dx*dx, minlength=n_groups)/n
+        ssym = np.bincount(codes, weights=dy*dy, minlength=n_groups)/n
+        ssxym = np.bincount(codes, weights=dx*dy, minlength=n_groups)/n
+
+        r = np.clip(ssxym/np.sqrt(ssxm*ssym), -1.0, 1.0)
+        r = np.where((ssxm == 0) | (ssym == 0), np.where(ssxym == 0, np.nan, 0.0), r)
+        slope = np.where(ssxm > 0, ssxym/ssxm, np.nan)
+        intercept = ymean-slope*xmean
+
+        dof = n-2
+        TINY = 1.0e-20
+        t = r*np.sqrt(dof/((1.0-r+TINY)*(1.0+r+TINY)))
+        pvalue = 2*ss.t.sf(np.abs(t), np.maximum(dof, 1))
+        stderr = np.sqrt((1-r**2)*ssym/ssxm/dof)
+
+    # linregress gives these for two points
+    two_points = n == 2
+    pvalue[two_points] = np.where(ssym[two_points] == 0, 1.0, 0.0)
+    stderr[two_points] = 0.0
+    too_few = n < 2
+    for values in (slope, intercept, r, pvalue, stderr):
+        values[too_few] = np.nan
+
+    return {"slope": slope, "intercept": intercept, "rvalue": r,
+            "pvalue": pvalue, "stderr": stderr, "n": n.astype(np.int64)}
+
+
+def linregress_residuals_by_group(xdata, ydata, codes, n_groups):
+    """
+    The grouped version of linregress_residuals: regresses every group and
+    gets the residuals (fitted y - y) of each point from its own group's line.
 
+    Args:
+        xdata, ydata (array-like): The data
+        codes (int array): the group of each point, 0 to n_groups-1. See get_group_codes.
+        n_groups (int): the number of groups
+
+    Returns:
+        residuals (array), and the dict from linregress_by_group
+
+    Author: SMM
     """
+    x = np.asarray(xdata, dtype=np.float64)
+    y = np.asarray(ydata, dtype=np.float64)
+    codes = np.asarray(codes)
+    regression = linregress_by_group(x, y, codes, n_groups)
+    residuals = np.full(len(x), np.nan)
+    valid = codes >= 0
+    residuals[valid] = regression["slope"][codes[valid]]*x[valid]+regression["intercept"][codes[valid]]-y[valid]
+    return residuals, regression
 
-    ### Let's do it
 
-    # Output dataframe initialized as an integer, you'll see why later 
-    out_df = 0
-    for i in df[header_for_group].unique():
-        # I am grouping the dataset for each value of the header, for example each basins
-        tdf = df[df[header_for_group]==i]
-        tdfpositive = tdf[tdf["sign"] == 1]
-        tdfnegative = tdf[tdf["sign"] == -1]
+def remove_outlying_residuals_by_group(xdata, ydata, codes, n_groups, thresh = 3.5):
+    """
+    The grouped version of remove_outlying_residuals: points whose residual has
+    a modified z-score (within their group) above thresh are removed and every
+    group is regressed again.
 
-        # masking the outliers
-        maskpositive = is_outlier(tdfpositive[data_column_name].values, thresh = threshold)
-        masknegative = is_outlier(tdfnegative[data_column_name].values, thresh = threshold)
-        # Applying the mask
-        tdfpositive = tdfpositive[maskpositive]
-        tdfnegative = tdfnegative[masknegative]
-        tdf = pd.concat([tdfpositive,tdfnegative])
-        # Feeding the out dataset
-        
-        if(isinstance(out_df, int)):
-            out_df = tdf
-        else:
-            out_df = pd.concat([out_df,tdf])
-    print("I selected %s outliers" %(out_df.shape[0]))
+    Args:
+        xdata, ydata (array-like): The data
+        codes (int array): the group of each point, 0 to n_groups-1. See get_group_codes.
+        n_groups (int): the number of groups
+        thresh (float): the modified z-score threshold
 
-    return out_df
+    Returns:
+        is_outlier_vec (bool array), and the dict from linregress_by_group for the data without the outliers
 
+    Author: SMM
+    """
+    codes = np.asarray(codes)
+    residuals, regression = linregress_residuals_by_group(xdata, ydata, codes, n_groups)
+    is_outlier_vec = modified_z_score_from_codes(residuals, codes, n_groups) > thresh
+    return is_outlier_vec, linregress_by_group(xdata, ydata, np.where(is_outlier_vec, -1, codes), n_groups)
 
 
+def bootstrap_counts(rng, n_points, n_resamples):
+    """
+    Draws bootstrap resamples as counts: element [i,j] is the number of times
+    point j is in resample i. Sums over a resample are then just a matrix
+    product with the data, so all the resamples are done at once.
 
+    Args:
+        rng (numpy Generator): the random number generator
+        n_points (int): the number of data points
+        n_resamples (int): the number of resamples
+
+    Returns:
+        An n_resamples by n_points int array of counts
 
+    Author: SMM
+    """
+    picks = rng.integers(0, n_points, size=(n_resamples, n_points))
+    picks += np.arange(n_resamples)[:, None]*n_points
+    return np.bincount(picks.ravel(), minlength=n_resamples*n_points).reshape(n_resamples, n_points)
 
 
+def bootstrap_linregress_slopes(xdata, ydata, n_resamples, rng, max_block_size = 10000000):
+    """
+    Gets the slope of the regression line of y against x for many bootstrap
+    resamples of the data (pairs drawn with replacement). The resamples are
+    done in blocks of count matrices (see bootstrap_counts) so there is no
+    python loop over the resamples.
 
+    Args:
+        xdata, ydata (array-like): The data
+        n_resamples (int): the number of resamples
+        rng (numpy Generator): the random number generator
+        max_block_size (int): the maximum number of elements in a block of counts. Limits the memory used.
 
+    Returns:
+        An array with the slope of each resample. Resamples where the x data are all the same get nan.
 
+    Author: SMM
+    """
+    x = np.asarray(xdata, dtype=np.float64)
+    y = np.asarray(ydata, dtype=np.float64)
+    n_points = len(x)
+    slopes = np.full(n_resamples, np.nan)
+    if n_points < 2:
+        return slopes
+
+    # centre the data, it keeps the sums accurate
+    x = x-x.mean()
+    y = y-y.mean()
+    moments = np.column_stack((x, y, x*x, x*y))
+
+    block = max(1, min(n_resamples, max_block_size//n_points))
+    for start in range(0, n_resamples, block):
+        n_block = min(block, n_resamples-start)
+        sums = bootstrap_counts(rng, n_points, n_block).dot(moments)/float(n_points)
+        ssxm = sums[:, 2]-sums[:, 0]**2
+        ssxym = sums[:, 3]-sums[:, 0]*sums[:, 1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slopes[start:start+n_block] = np.where(ssxm > 0, ssxym/ssxm, np.nan)
+    return slopes
 
 
+def extract_outliers_by_header(df, data_column_name = "diff", header_for_group = "source_key", threshold = 3.5):
+    """
+    Extract outliers from a dataframe, groupped by a specific column. 
+    for example, as in default, extract the outliers in the diff column, groupped by source_key.
+    Positive and negative values (the "sign" column) are tested separately.
 
+    param:
+        df (pandas dataframe): The dataframe containing at least the two columns in param
+        data_column_name (str): Name of the column containing the data
+        header_for_group (str): Name of the column for groupping
 
+    return: a dataframe containing only the outliers
 
+    Author: BG - 05/10/2017
 
+    """
 
+    # Only the positive and negative knickpoints are tested, each group is a header value and a sign
+    tdf = df[df["sign"].isin([1,-1])]
+    mask = is_outlier_by_group(tdf, data_column_name, [header_for_group, "sign"], thresh = threshold)
+    out_df = tdf[mask.values]
+    print("I selected %s outliers" %(out_df.shape[0]))
 
-#
+    return out_df
@@ -67,6 +67,8 @@ def main(argv):
 	parser.add_argument("-UTM", "--UTM_CODE", type = str, default = "", help = "Give the UTM UTM_CODE of your zone to automate the conversion of the raster into an LSDTopoTools compatible raster.")
 	parser.add_argument("-S", "--SOUTH", type = bool, default = False, help = "Turn to True if your UTM zone is in the southern hemisphere. A quick way to check that is to go on field and to observe how flow the water in a ")
 	parser.add_argument("-res", "--resolution", type = int, default = 30, help = "Precise this argument if you want to change the raster resolution, default 30")
+	parser.add_argument("-ref", "--reference_raster", type = str, default = "", help = "The name of a raster in the directory (e.g. your DEM, with extension). The litho raster will be on exactly the same grid, so you won't need to convert it.")
+	parser.add_argument("-tile", "--tile_size", type = int, default = 0, help = "For huge maps: rasterize in tiles of this many pixels a side. Default 0 (no tiles)")
 	args = parser.parse_args()
 #=============================================================================
 	rast_name = ""
@@ -81,18 +83,24 @@ def main(argv):
 			sys.exit()
 		#launching the rasterization
 		# fd_name_corr = args.field_name.encode('utf-8')
-		VT.rasterize_shapefile(args.directory + args.fname_prefix + ".shp", res = args.resolution, field = args.field_name)
+		if(args.reference_raster != ""):
+			reference_raster = args.directory + args.reference_raster
+		else:
+			reference_raster = None
+		if(args.tile_size > 0):
+			tile_size = args.tile_size
+		else:
+			tile_size = None
 		#getting file names and prefix
-		rast_name = args.fname_prefix + "_new2.tif"
-		rast_pre = args.fname_prefix + "_new2"
-		#Renaming in case you want to
 		if(args.rename != ""):
-			os.rename(args.directory + rast_name,args.directory+args.rename+".tif")
-			# updating the file name and prefix
-			rast_name = args.rename+".tif"
 			rast_pre = args.rename
-			
-		if(args.UTM_CODE != ""):
+		else:
+			rast_pre = args.fname_prefix + "_LITHRAST"
+		rast_name = rast_pre + ".bil"
+		VT.rasterize_shapefile(args.directory + args.fname_prefix + ".shp", res = args.resolution, field = args.field_name,
+							   reference_raster = reference_raster, OutFileName = args.directory + rast_name, tile_size = tile_size)
+
+		if(args.UTM_CODE != "" and reference_raster is None):
 			#Conversion to UTM
 			if(args.SOUTH):
 				south_string = " +south"
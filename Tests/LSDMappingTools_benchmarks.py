@@ -0,0 +1,201 @@
+"""
+These are benchmarks for the parts of LSDMappingTools that are slow with big
+datasets: reading rasters, hillshading, polygonising basins, loading and
+plotting point data, the m/n outlier checks and the knickpoint plotting setup.
+They run on synthetic data (see LSDMappingTools_synthetic_data.py) so you can
+try them at the sizes of real DEMs. Each benchmark records the time (with
+pytest-benchmark) and the peak memory allocated by python and numpy while it
+runs (with tracemalloc), which goes in the "extra_info" of the results.
+
+You need pytest-benchmark (pip install pytest-benchmark) and the LSDTT
+environment (GDAL etc.). Run from the LSDMappingTools directory with:
+python -m pytest Tests/LSDMappingTools_benchmarks.py
+
+These environment variables control the runs:
+    LSDMT_BENCHMARK_SIZES: comma separated DEM sizes in pixels (default 1000). e.g. 1000,5000,20000
+    LSDMT_BENCHMARK_SCALE: the scale of the csv files (default 1, see make_synthetic_dataset)
+    LSDMT_BENCHMARK_ROUNDS: the number of times each benchmark is timed (default 3)
+    LSDMT_BENCHMARK_DIR: where to keep the synthetic data. The big DEMs take a
+        while to make so if you set this they are only made once. The default
+        is a temporary directory.
+
+To compare with an earlier run, save the results with --benchmark-save=NAME and
+compare them with --benchmark-compare.
+
+Author: SMM
+
+Date: 19/10/2026
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import os
+import tracemalloc
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+pytest.importorskip("osgeo")
+
+# We need the path since we don't install mapping tools directly
+this_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(this_dir))
+sys.path.append(this_dir)
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import LSDMappingTools_synthetic_data as SynData
+from LSDPlottingTools import LSDMap_GDALIO as LSDMap_IO
+from LSDPlottingTools import LSDMap_BasicPlotting as LSDMap_BP
+from LSDPlottingTools import LSDMap_PointTools as LSDMap_PD
+from LSDPlottingTools import LSDMap_MOverNPlotting as MN
+from LSDPlottingTools import LSDMap_KnickpointPlotting as KP
+from LSDPlottingTools import LSDMap_ImageCache as LSDImageCache
+from LSDMapFigure.PlottingRaster import MapFigure
+
+SIZES = [int(size) for size in os.environ.get("LSDMT_BENCHMARK_SIZES", "1000").split(",")]
+SCALE = float(os.environ.get("LSDMT_BENCHMARK_SCALE", "1"))
+ROUNDS = int(os.environ.get("LSDMT_BENCHMARK_ROUNDS", "3"))
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: str(size)+"px")
+def synthetic_data(request, tmp_path_factory):
+    """
+    This makes (or finds) the synthetic dataset of each size.
+
+    Author: SMM
+    """
+    DataDirectory = os.environ.get("LSDMT_BENCHMARK_DIR")
+    if DataDirectory is None:
+        DataDirectory = str(tmp_path_factory.mktemp("synthetic"))
+    return SynData.make_synthetic_dataset(os.path.join(DataDirectory, ""), request.param, SCALE)
+
+
+@pytest.fixture(scope="module")
+def channel_point_data(synthetic_data):
+    """
+    This loads the channel nodes as point data, for the plotting benchmarks.
+
+    Author: SMM
+    """
+    return LSDMap_PD.LSDMap_PointData(synthetic_data["DataDirectory"]+synthetic_data["fname_prefix"]+"_MChiSegmented.csv",
+                                     compact_dtypes = True)
+
+
+def measure_peak_memory(benchmark, function, setup = None):
+    """
+    This runs the function once with tracemalloc and puts the peak memory in
+    the benchmark results. It is a separate run since tracemalloc slows things down.
+
+    Args:
+        benchmark: the pytest-benchmark fixture
+        function: the function to run
+        setup: a function that returns the (args, kwargs) of the function, like in benchmark.pedantic
+
+    Author: SMM
+    """
+    args, kwargs = setup() if setup is not None else ((), {})
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory_MB"] = peak/1.0e6
+
+
+def run_benchmark(benchmark, function, setup = None):
+    """
+    This gets the peak memory of the function and then times it.
+
+    Args:
+        benchmark: the pytest-benchmark fixture
+        function: the function to run
+        setup: a function that returns the (args, kwargs) of the function. It is called before each round and isn't timed.
+
+    Returns:
+        what the function returns
+
+    Author: SMM
+    """
+    measure_peak_memory(benchmark, function, setup)
+    return benchmark.pedantic(function, setup = setup, rounds = ROUNDS, iterations = 1)
+
+
+def test_read_raster_array_blocks(benchmark, synthetic_data):
+    DEM_name = synthetic_data["DataDirectory"]+synthetic_data["fname_prefix"]+".bil"
+    LSDMap_IO.DisableRasterReadCache()
+    raster = run_benchmark(benchmark, lambda: LSDMap_IO.ReadRasterArrayBlocks(DEM_name))
+    assert raster.shape == (synthetic_data["size"], synthetic_data["size"])
+
+
+def test_hillshade(benchmark, synthetic_data):
+    DEM_name = synthetic_data["DataDirectory"]+synthetic_data["fname_prefix"]+".bil"
+    hillshade = run_benchmark(benchmark, lambda: LSDMap_BP.Hillshade(DEM_name))
+    assert hillshade.shape == (synthetic_data["size"], synthetic_data["size"])
+
+
+def test_polygonise_raster(benchmark, synthetic_data):
+    pytest.importorskip("rasterio")
+    basin_raster = synthetic_data["fname_prefix"]+"_AllBasins.bil"
+    polygons = run_benchmark(benchmark, lambda: LSDMap_IO.PolygoniseRaster(synthetic_data["DataDirectory"], basin_raster,
+                                                                           write_shapefile = False))
+    assert 0 < len(polygons) <= synthetic_data["n_basins"]
+
+
+def test_point_data_load(benchmark, synthetic_data):
+    csv_name = synthetic_data["DataDirectory"]+synthetic_data["fname_prefix"]+"_MChiSegmented.csv"
+    run_benchmark(benchmark, lambda: LSDMap_PD.LSDMap_PointData(csv_name, compact_dtypes = True))
+
+
+def test_check_mle_outliers(benchmark, synthetic_data):
+    results = run_benchmark(benchmark, lambda: MN.CheckMLEOutliers(synthetic_data["DataDirectory"],
+                                                                   synthetic_data["fname_prefix"], basin_list = []))
+    assert len(results[2]) == synthetic_data["n_basins"]
+
+
+def test_add_point_data(benchmark, synthetic_data, channel_point_data):
+    def setup():
+        plt.close("all")
+        MF = MapFigure(synthetic_data["fname_prefix"]+".bil", synthetic_data["DataDirectory"], coord_type = "UTM_km")
+        return (MF,), {}
+
+    def add_point_data(MF):
+        MF.add_point_data(channel_point_data, column_for_plotting = "m_chi", this_colourmap = "viridis",
+                          scale_points = True, column_for_scaling = "drainage_area")
+
+    run_benchmark(benchmark, add_point_data, setup)
+    plt.close("all")
+
+
+@pytest.mark.parametrize("use_image_cache", [False, True], ids=["no_image_cache", "image_cache"])
+def test_save_fig(benchmark, synthetic_data, channel_point_data, tmp_path, use_image_cache):
+    FigFileName = str(tmp_path / (synthetic_data["fname_prefix"]+".png"))
+    if use_image_cache:
+        LSDImageCache.EnableImageCache(str(tmp_path / "imagecache"))
+
+    def setup():
+        plt.close("all")
+        MF = MapFigure(synthetic_data["fname_prefix"]+".bil", synthetic_data["DataDirectory"], coord_type = "UTM_km",
+                       use_image_cache = use_image_cache)
+        MF.add_point_data(channel_point_data, column_for_plotting = "m_chi", this_colourmap = "viridis")
+        return (MF,), {}
+
+    def save_fig(MF):
+        MF.save_fig(fig_width_inches = 6, FigFileName = FigFileName, FigFormat = "png", Fig_dpi = 300)
+
+    try:
+        run_benchmark(benchmark, save_fig, setup)
+    finally:
+        LSDImageCache.DisableImageCache()
+    assert os.path.isfile(FigFileName)
+
+
+def test_kp_plotting(benchmark, synthetic_data):
+    # size_kp is given each time since its default list is filled in by the first object
+    def setup():
+        return (synthetic_data["DataDirectory"], synthetic_data["fname_prefix"]), {"size_kp": []}
+
+    run_benchmark(benchmark, KP.KP_plotting, setup)
@@ -0,0 +1,74 @@
+"""
+These test the binned kernel density estimates in LSDPlottingTools.binnedkde
+against scipy's gaussian_kde. Run from the LSDMappingTools directory with:
+python -m pytest Tests/LSDMappingTools_binnedkde_test.py
+
+Author: FJC
+
+Date: 19/10/2026
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import os
+import numpy as np
+import pytest
+from scipy.stats import gaussian_kde
+
+pytest.importorskip("osgeo")
+
+# We need the path since we don't install mapping tools directly
+this_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(this_dir))
+
+from LSDPlottingTools import binnedkde
+
+
+def make_terrace_points(n_points, seed = 0):
+    """
+    This makes points like terrace pixels: elevations in a few levels that rise
+    with distance downstream, so the two coordinates are strongly correlated.
+
+    Author: FJC
+    """
+    rng = np.random.RandomState(seed)
+    distance = rng.uniform(0, 10000, n_points)
+    elevation = 0.004*distance+rng.choice([5, 12, 20], n_points)+rng.normal(0, 0.7, n_points)
+    return distance, elevation
+
+
+def test_binned_kde_2d_correlated_uses_fft(monkeypatch):
+    x, y = make_terrace_points(4000)
+    bw_method = 0.03
+    x_grid = np.linspace(0, x.max(), 300)
+    y_grid = np.linspace(0, y.max(), 300)
+
+    # count the FFT convolutions, and the number of bins in each
+    n_fft = []
+    fftconvolve = binnedkde.fftconvolve
+    def counting_fftconvolve(counts, kernel, mode):
+        n_fft.append(counts.size)
+        return fftconvolve(counts, kernel, mode)
+    monkeypatch.setattr(binnedkde, "fftconvolve", counting_fftconvolve)
+
+    density = binnedkde.binned_kde_2d(x, y, x_grid, y_grid, bw_method = bw_method)
+    monkeypatch.undo()
+
+    assert len(n_fft) == 1
+    assert n_fft[0] <= binnedkde._MAX_BINNED_NODES
+
+    X, Y = np.meshgrid(x_grid, y_grid)
+    exact = gaussian_kde(np.vstack([x, y]), bw_method = bw_method)(np.vstack([X.ravel(), Y.ravel()])).reshape(X.shape)
+    assert density.shape == exact.shape
+    assert np.abs(density-exact).max() < 0.01*exact.max()
+
+
+def test_binned_kde_1d():
+    rng = np.random.RandomState(1)
+    values = rng.normal(0, 1, 5000)
+    for bw_method in [0.05, "scott"]:
+        x_range = np.linspace(-4, 4, 50)
+        exact = gaussian_kde(values, bw_method = bw_method)(x_range)
+        density = binnedkde.binned_kde_1d(values, x_range, bw_method = bw_method)
+        assert np.abs(density-exact).max() < 0.01*exact.max()
@@ -0,0 +1,614 @@
+"""
+This makes synthetic data for the benchmarks (see LSDMappingTools_benchmarks.py).
+It writes a DEM, a basin raster and the csv files that LSDTopoTools makes
+(the MChiSegmented, knickpoint, fullstats and hilltop files) at whatever size
+you want, so we can time the plotting and IO at the sizes people actually use
+rather than with the tiny WA dataset.
+
+The DEM is fractal noise (a sum of octaves of smoothly interpolated random
+lattices) on a tilted plane. It is made in blocks of rows and written straight
+to an ENVI .bil file, so even the 20000x20000 DEMs don't need to fit in memory.
+The basins are the Voronoi cells of random outlets. The channels, knickpoints,
+m/n stats and hilltops are random but have the columns (and roughly the
+values) of the real files.
+
+The rasters are in UTM zone 30N near the central meridian. The latitudes and
+longitudes of the points come from the usual series for the inverse transverse
+mercator projection, so we don't need pyproj to make the data.
+
+Run with: python LSDMappingTools_synthetic_data.py DataDirectory size [scale]
+
+Author: SMM
+
+Date: 19/10/2026
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+import os
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# The raster origin (upper left corner, UTM zone 30N)
+UTM_ORIGIN = (500000.0, 6190000.0)
+CENTRAL_MERIDIAN = -3.0
+
+UTM30N_WKT = ('PROJCS["WGS_1984_UTM_Zone_30N",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",'
+              'SPHEROID["WGS_1984",6378137,298.257223563]],PRIMEM["Greenwich",0],'
+              'UNIT["Degree",0.017453292519943295]],PROJECTION["Transverse_Mercator"],'
+              'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",-3],'
+              'PARAMETER["scale_factor",0.9996],PARAMETER["false_easting",500000],'
+              'PARAMETER["false_northing",0],UNIT["Meter",1]]}')
+
+# The m/n values of the fullstats files. These are the defaults of CheckMLEOutliers
+START_MOVERN = 0.2
+D_MOVERN = 0.1
+N_MOVERN = 7
+
+# The rows written at a time
+BLOCK_ROWS = 512
+
+
+def write_envi_header(header_name, n_rows, n_cols, dx, data_type, NoDataValue = -9999):
+    """
+    This writes an ENVI header like the ones LSDTopoTools writes.
+
+    Args:
+        header_name (str): the header file name with path and extension
+        n_rows (int): the number of rows
+        n_cols (int): the number of columns
+        dx (float): the pixel size in metres
+        data_type (int): the ENVI data type (3 = int32, 4 = float32)
+        NoDataValue (float): the nodata value
+
+    Author: SMM
+    """
+    with open(header_name, "w") as header:
+        header.write("ENVI\n")
+        header.write("description = {\n"+os.path.basename(header_name)+"}\n")
+        header.write("samples = "+str(n_cols)+"\n")
+        header.write("lines   = "+str(n_rows)+"\n")
+        header.write("bands   = 1\n")
+        header.write("header offset = 0\n")
+        header.write("file type = ENVI Standard\n")
+        header.write("data type = "+str(data_type)+"\n")
+        header.write("interleave = bsq\n")
+        header.write("byte order = 0\n")
+        header.write("map info = {UTM, 1, 1, "+str(UTM_ORIGIN[0])+", "+str(UTM_ORIGIN[1])+", "
+                     +str(dx)+", "+str(dx)+", 30, North,WGS-84}\n")
+        header.write("coordinate system string = {"+UTM30N_WKT+"\n")
+        header.write("band names = {\nBand 1}\n")
+        header.write("data ignore value = "+str(NoDataValue)+"\n")
+
+
+def utm_to_latlon(easting, northing):
+    """
+    This converts UTM zone 30N coordinates to WGS84 latitude and longitude
+    with the series in Snyder (1987), Map Projections: A Working Manual, p. 63.
+    It is good to well under a metre near the central meridian.
+
+    Args:
+        easting (np.array): the eastings
+        northing (np.array): the northings
+
+    Returns:
+        the latitudes and longitudes
+
+    Author: SMM
+    """
+    a = 6378137.0
+    flattening = 1/298.257223563
+    k0 = 0.9996
+    e2 = flattening*(2-flattening)
+    ep2 = e2/(1-e2)
+    e1 = (1-np.sqrt(1-e2))/(1+np.sqrt(1-e2))
+
+    x = np.asarray(easting, dtype=np.float64)-500000.0
+    mu = np.asarray(northing, dtype=np.float64)/k0/(a*(1-e2/4-3*e2**2/64-5*e2**3/256))
+    phi1 = (mu+(3*e1/2-27*e1**3/32)*np.sin(2*mu)+(21*e1**2/16-55*e1**4/32)*np.sin(4*mu)
+            +(151*e1**3/96)*np.sin(6*mu)+(1097*e1**4/512)*np.sin(8*mu))
+
+    C1 = ep2*np.cos(phi1)**2
+    T1 = np.tan(phi1)**2
+    N1 = a/np.sqrt(1-e2*np.sin(phi1)**2)
+    R1 = a*(1-e2)/(1-e2*np.sin(phi1)**2)**1.5
+    D = x/(N1*k0)
+
+    latitude = phi1-(N1*np.tan(phi1)/R1)*(D**2/2-(5+3*T1+10*C1-4*C1**2-9*ep2)*D**4/24
+                                          +(61+90*T1+298*C1+45*T1**2-252*ep2-3*C1**2)*D**6/720)
+    longitude = (D-(1+2*T1+C1)*D**3/6+(5-2*C1+28*T1-3*C1**2+8*ep2+24*T1**2)*D**5/120)/np.cos(phi1)
+    return np.degrees(latitude), CENTRAL_MERIDIAN+np.degrees(longitude)
+
+
+def pixel_to_utm(row, col, dx):
+    """
+    This gets the UTM coordinates of the centre of pixels.
+
+    Args:
+        row (np.array): the rows
+        col (np.array): the columns
+        dx (float): the pixel size
+
+    Returns:
+        the eastings and northings
+
+    Author: SMM
+    """
+    return UTM_ORIGIN[0]+(np.asarray(col)+0.5)*dx, UTM_ORIGIN[1]-(np.asarray(row)+0.5)*dx
+
+
+def fractal_noise_block(lattices, amplitudes, cell_sizes, first_row, n_rows, n_cols):
+    """
+    This gets some rows of the fractal noise. Each octave is a lattice of random
+    values, interpolated (with a smoothstep, so there are no creases) onto the pixels.
+
+    Args:
+        lattices (list): the random lattice of each octave
+        amplitudes (list): the amplitude of each octave
+        cell_sizes (list): the lattice spacing of each octave in pixels
+        first_row (int): the first row of the block
+        n_rows (int): the number of rows in the block
+        n_cols (int): the number of columns
+
+    Returns:
+        (n_rows, n_cols) float32 array
+
+    Author: SMM
+    """
+    noise = np.zeros((n_rows, n_cols), dtype=np.float32)
+    for lattice, amplitude, cell_size in zip(lattices, amplitudes, cell_sizes):
+        y = (np.arange(first_row, first_row+n_rows, dtype=np.float64)+0.5)/cell_size
+        x = (np.arange(n_cols, dtype=np.float64)+0.5)/cell_size
+        i0 = np.floor(y).astype(np.int64)
+        j0 = np.floor(x).astype(np.int64)
+        ty = y-i0
+        tx = x-j0
+        ty = (ty*ty*(3-2*ty)).astype(np.float32)[:,None]
+        tx = (tx*tx*(3-2*tx)).astype(np.float32)[None,:]
+
+        top = lattice[i0][:,j0]*(1-tx)+lattice[i0][:,j0+1]*tx
+        bottom = lattice[i0+1][:,j0]*(1-tx)+lattice[i0+1][:,j0+1]*tx
+        noise += amplitude*(top*(1-ty)+bottom*ty)
+    return noise
+
+
+def write_synthetic_dem(DataDirectory, fname_prefix, n_rows, n_cols, dx = 5.0, relief = 500.0,
+                        hurst = 0.8, min_cell_size = 4, seed = 0):
+    """
+    This writes a fractal DEM as an ENVI .bil file.
+
+    Args:
+        DataDirectory (str): the directory to write to
+        fname_prefix (str): the DEM name without extension
+        n_rows (int): the number of rows
+        n_cols (int): the number of columns
+        dx (float): the pixel size in metres
+        relief (float): roughly the relief of the noise in metres
+        hurst (float): the Hurst exponent. The amplitude of each octave goes with its wavelength to this power, so bigger is smoother.
+        min_cell_size (int): the wavelength of the finest octave in pixels
+        seed (int): the random seed
+
+    Returns:
+        the name of the DEM with path and extension
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed)
+
+    # the octaves go from a quarter of the DEM size down to min_cell_size
+    cell_sizes = []
+    cell_size = max(n_rows, n_cols)/4.0
+    while cell_size >= min_cell_size:
+        cell_sizes.append(cell_size)
+        cell_size /= 2.0
+    if len(cell_sizes) == 0:
+        cell_sizes = [float(min_cell_size)]
+
+    lattices = []
+    amplitudes = []
+    for cell_size in cell_sizes:
+        lattice_shape = (int(np.ceil(n_rows/cell_size))+2, int(np.ceil(n_cols/cell_size))+2)
+        lattices.append(rng.standard_normal(lattice_shape).astype(np.float32))
+        amplitudes.append(cell_size**hurst)
+    amplitudes = relief*np.asarray(amplitudes)/np.sqrt(np.sum(np.square(amplitudes)))/4.0
+
+    # the DEM slopes down to the south and east
+    tilt = 0.5*relief/(max(n_rows, n_cols)*dx)
+
+    DEM_name = DataDirectory+fname_prefix+".bil"
+    DEM = np.memmap(DEM_name, dtype=np.float32, mode="w+", shape=(n_rows, n_cols))
+    for first_row in range(0, n_rows, BLOCK_ROWS):
+        block_rows = min(BLOCK_ROWS, n_rows-first_row)
+        block = fractal_noise_block(lattices, amplitudes, cell_sizes, first_row, block_rows, n_cols)
+        rows = np.arange(first_row, first_row+block_rows)[:,None]
+        cols = np.arange(n_cols)[None,:]
+        block += (2*relief-tilt*dx*(rows+cols)).astype(np.float32)
+        DEM[first_row:first_row+block_rows] = np.maximum(block, 1.0)
+    DEM.flush()
+    del DEM
+
+    write_envi_header(DataDirectory+fname_prefix+".hdr", n_rows, n_cols, dx, 4)
+    return DEM_name
+
+
+def get_basin_outlets(n_rows, n_cols, n_basins, seed = 0):
+    """
+    This gets random basin outlets and their junction numbers.
+
+    Args:
+        n_rows (int): the number of rows
+        n_cols (int): the number of columns
+        n_basins (int): the number of basins
+        seed (int): the random seed
+
+    Returns:
+        the outlet rows, the outlet columns and the junction numbers
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed+1)
+    outlet_rows = rng.uniform(0, n_rows, n_basins)
+    outlet_cols = rng.uniform(0, n_cols, n_basins)
+    # the junctions are numbered like the real ones: increasing but not contiguous
+    junctions = np.sort(rng.choice(np.arange(1, 50*n_basins+1), n_basins, replace=False)).astype(np.int32)
+    return outlet_rows, outlet_cols, junctions
+
+
+def write_basin_raster(DataDirectory, fname_prefix, n_rows, n_cols, n_basins, dx = 5.0,
+                       edge_fraction = 0.02, seed = 0):
+    """
+    This writes a basin raster (like the _AllBasins rasters) where each pixel
+    has the junction number of its basin. The basins are the Voronoi cells of
+    the outlets, and there is a nodata margin around the edge.
+
+    Args:
+        DataDirectory (str): the directory to write to
+        fname_prefix (str): the DEM prefix, the raster is fname_prefix+"_AllBasins.bil"
+        n_rows (int): the number of rows
+        n_cols (int): the number of columns
+        n_basins (int): the number of basins
+        dx (float): the pixel size in metres
+        edge_fraction (float): the width of the nodata margin as a fraction of the raster size
+        seed (int): the random seed
+
+    Returns:
+        the name of the basin raster with path and extension
+
+    Author: SMM
+    """
+    outlet_rows, outlet_cols, junctions = get_basin_outlets(n_rows, n_cols, n_basins, seed)
+    outlet_tree = cKDTree(np.column_stack([outlet_rows, outlet_cols]))
+    edge_rows = int(edge_fraction*n_rows)
+    edge_cols = int(edge_fraction*n_cols)
+
+    basin_name = DataDirectory+fname_prefix+"_AllBasins.bil"
+    basins = np.memmap(basin_name, dtype=np.int32, mode="w+", shape=(n_rows, n_cols))
+    cols = np.arange(n_cols)
+    for first_row in range(0, n_rows, BLOCK_ROWS):
+        block_rows = min(BLOCK_ROWS, n_rows-first_row)
+        rows = np.arange(first_row, first_row+block_rows)
+        pixels = np.column_stack([np.repeat(rows, n_cols), np.tile(cols, block_rows)])
+        nearest = outlet_tree.query(pixels)[1]
+        block = junctions[nearest].reshape(block_rows, n_cols)
+
+        edge = (rows < edge_rows) | (rows >= n_rows-edge_rows)
+        block[edge] = -9999
+        if edge_cols > 0:
+            block[:,:edge_cols] = -9999
+            block[:,-edge_cols:] = -9999
+        basins[first_row:first_row+block_rows] = block
+    basins.flush()
+    del basins
+
+    write_envi_header(DataDirectory+fname_prefix+"_AllBasins.hdr", n_rows, n_cols, dx, 3)
+    return basin_name
+
+
+def make_channel_data(n_rows, n_cols, n_basins, sources_per_basin = 5, nodes_per_source = 200,
+                      dx = 5.0, seed = 0):
+    """
+    This makes channel nodes with the columns of the _MChiSegmented.csv file.
+    Each source is a straight channel from a random point to its basin outlet,
+    with a concave profile.
+
+    Args:
+        n_rows (int): the number of rows of the DEM
+        n_cols (int): the number of columns of the DEM
+        n_basins (int): the number of basins
+        sources_per_basin (int): the number of sources (tributaries) in each basin
+        nodes_per_source (int): the number of nodes in each source
+        dx (float): the pixel size in metres
+        seed (int): the random seed
+
+    Returns:
+        pandas dataframe with the channel nodes
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed+2)
+    outlet_rows, outlet_cols, junctions = get_basin_outlets(n_rows, n_cols, n_basins, seed)
+    n_sources = n_basins*sources_per_basin
+
+    # each source starts somewhere around its outlet
+    source_basin = np.repeat(np.arange(n_basins), sources_per_basin)
+    reach = 0.5*np.sqrt(n_rows*n_cols/float(n_basins))
+    start_rows = np.clip(outlet_rows[source_basin]+rng.uniform(-reach, reach, n_sources), 0, n_rows-1)
+    start_cols = np.clip(outlet_cols[source_basin]+rng.uniform(-reach, reach, n_sources), 0, n_cols-1)
+
+    # the fraction of the way from the source to the outlet of each node
+    fraction = np.tile(np.linspace(0, 1, nodes_per_source), n_sources)
+    node_source = np.repeat(np.arange(n_sources), nodes_per_source)
+    node_basin = source_basin[node_source]
+    rows = start_rows[node_source]+fraction*(outlet_rows[node_basin]-start_rows[node_source])
+    cols = start_cols[node_source]+fraction*(outlet_cols[node_basin]-start_cols[node_source])
+    easting, northing = pixel_to_utm(rows, cols, dx)
+    latitude, longitude = utm_to_latlon(easting, northing)
+
+    length = dx*np.hypot(outlet_rows[source_basin]-start_rows, outlet_cols[source_basin]-start_cols)
+    flow_distance = (1-fraction)*length[node_source]
+    drainage_area = 1e4+5e3*np.power(np.maximum(length[node_source]-flow_distance, dx), 1.7)
+    chi = (1-fraction)*rng.uniform(2, 10, n_sources)[node_source]
+    ksn = rng.lognormal(3.5, 0.5, n_sources)[node_source]
+    elevation = 10+ksn*chi+rng.normal(0, 1, chi.size)
+
+    # the segments are runs of about 20 nodes
+    segments_per_source = (nodes_per_source-1)//20+1
+    segment_number = node_source*segments_per_source+np.tile(np.arange(nodes_per_source)//20, n_sources)
+    m_chi = ksn*rng.lognormal(0, 0.2, segment_number.max()+1)[segment_number]
+
+    return pd.DataFrame({"latitude": latitude,
+                         "longitude": longitude,
+                         "chi": chi,
+                         "elevation": elevation,
+                         "flow_distance": flow_distance,
+                         "drainage_area": drainage_area,
+                         "m_chi": m_chi,
+                         "b_chi": elevation-m_chi*chi,
+                         "source_key": node_source,
+                         "basin_key": node_basin,
+                         "segmented_elevation": 10+m_chi*chi,
+                         "segment_number": segment_number})
+
+
+def write_channel_csvs(DataDirectory, fname_prefix, channel_data, seed = 0):
+    """
+    This writes the channel csv files: the _MChiSegmented.csv file and the
+    knickpoint files that KP_plotting reads (_ksnkp_mchi.csv, _ksnkp.csv,
+    _ksnkp_raw.csv and _ksnkp_SK.csv).
+
+    Args:
+        DataDirectory (str): the directory to write to
+        fname_prefix (str): the DEM prefix
+        channel_data (dataframe): the channel nodes from make_channel_data
+        seed (int): the random seed
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed+3)
+    channel_data.to_csv(DataDirectory+fname_prefix+"_MChiSegmented.csv", index=False)
+    channel_data.to_csv(DataDirectory+fname_prefix+"_ksnkp_mchi.csv", index=False)
+
+    # about one knickpoint every 50 nodes. Half of them are steps in the segmented elevation.
+    n_knickpoints = max(1, len(channel_data)//50)
+    kp_index = np.sort(rng.choice(len(channel_data), n_knickpoints, replace=False))
+    knickpoints = channel_data.iloc[kp_index][["latitude", "longitude", "elevation", "flow_distance",
+                                               "chi", "drainage_area", "source_key", "basin_key"]].copy()
+    knickpoints["delta_ksn"] = rng.normal(0, 30, n_knickpoints)
+    knickpoints["delta_segelev"] = np.where(rng.uniform(size=n_knickpoints) < 0.5,
+                                            0.0, rng.lognormal(1.5, 0.7, n_knickpoints))
+    knickpoints["sharpness"] = rng.lognormal(1, 0.5, n_knickpoints)
+    knickpoints["sign"] = np.sign(knickpoints["delta_ksn"])
+    knickpoints.to_csv(DataDirectory+fname_prefix+"_ksnkp_raw.csv", index=False)
+    knickpoints.to_csv(DataDirectory+fname_prefix+"_ksnkp.csv", index=False)
+
+    sources = channel_data.groupby("source_key").agg(basin_key=("basin_key", "first"),
+                                                     length=("flow_distance", "max"))
+    sources = sources.reset_index()[["basin_key", "source_key", "length"]]
+    sources.to_csv(DataDirectory+fname_prefix+"_ksnkp_SK.csv", index=False)
+
+
+def get_movern_strings(start_movern = START_MOVERN, d_movern = D_MOVERN, n_movern = N_MOVERN):
+    """
+    This gets the m/n values as they appear in the fullstats file names (0.2, 0.3 etc.)
+
+    Author: SMM
+    """
+    end_movern = float(start_movern)+float(d_movern)*(float(n_movern)-1)
+    movern_strs = []
+    for movern in np.linspace(start_movern, end_movern, n_movern):
+        movern_str = '%.2f' % movern
+        if movern_str.endswith('0'):
+            movern_str = movern_str[:-1]
+        movern_strs.append(movern_str)
+    return movern_strs
+
+
+def write_fullstats_csvs(DataDirectory, fname_prefix, channel_data, start_movern = START_MOVERN,
+                         d_movern = D_MOVERN, n_movern = N_MOVERN, seed = 0):
+    """
+    This writes the _movernstats_<m/n>_fullstats.csv files. In each basin the
+    first source is the reference and the others are the tributaries. The MLE
+    of each tributary peaks at the best fit m/n of its basin, and a few
+    tributaries are noisy so there are outliers to find.
+
+    Args:
+        DataDirectory (str): the directory to write to
+        fname_prefix (str): the DEM prefix
+        channel_data (dataframe): the channel nodes from make_channel_data
+        start_movern (float): the first m/n value
+        d_movern (float): the m/n spacing
+        n_movern (int): the number of m/n values
+        seed (int): the random seed
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed+4)
+    sources = channel_data.groupby("source_key")["basin_key"].first().reset_index()
+    reference_sources = sources.groupby("basin_key")["source_key"].min()
+    tributaries = sources[~sources["source_key"].isin(reference_sources.values)]
+
+    basin_keys = tributaries["basin_key"].values
+    n_basins = len(reference_sources)
+    best_movern = rng.uniform(start_movern, start_movern+d_movern*(n_movern-1), n_basins)
+    noise = np.where(rng.uniform(size=len(tributaries)) < 0.1, 1.0, 0.05)
+
+    for movern_str in get_movern_strings(start_movern, d_movern, n_movern):
+        misfit = np.square((float(movern_str)-best_movern[basin_keys])/0.15)
+        misfit += noise*rng.uniform(0, 1, len(tributaries))*5
+        fullstats = pd.DataFrame({"basin_key": basin_keys,
+                                  "reference_source_key": reference_sources[basin_keys].values,
+                                  "test_source_key": tributaries["source_key"].values,
+                                  "MLE": np.exp(-misfit),
+                                  "RMSE": np.sqrt(misfit)+rng.uniform(0, 0.1, len(tributaries))})
+        fullstats.to_csv(DataDirectory+fname_prefix+"_movernstats_"+movern_str+"_fullstats.csv", index=False)
+
+
+def write_hillslope_csv(DataDirectory, fname_prefix, channel_data, hilltops_per_basin = 500,
+                        n_rows = None, n_cols = None, dx = 5.0, seed = 0):
+    """
+    This writes a _HilltopData.csv file with the hilltop curvature, gradient,
+    relief and hillslope length of random hilltop pixels.
+
+    Args:
+        DataDirectory (str): the directory to write to
+        fname_prefix (str): the DEM prefix
+        channel_data (dataframe): the channel nodes from make_channel_data
+        hilltops_per_basin (int): the number of hilltops in each basin
+        n_rows (int): the number of rows of the DEM
+        n_cols (int): the number of columns of the DEM
+        dx (float): the pixel size in metres
+        seed (int): the random seed
+
+    Author: SMM
+    """
+    rng = np.random.RandomState(seed+5)
+    sources = channel_data.groupby("source_key")["basin_key"].first()
+    n_basins = int(sources.max())+1
+    n_hilltops = n_basins*hilltops_per_basin
+
+    basin_keys = np.repeat(np.arange(n_basins), hilltops_per_basin)
+    outlet_rows, outlet_cols, junctions = get_basin_outlets(n_rows, n_cols, n_basins, seed)
+    # each hilltop drains to one of the sources of its basin
+    basin_sources = [sources.index[sources.values == basin].values for basin in range(n_basins)]
+    stream_ids = np.array([basin_sources[basin][rng.randint(len(basin_sources[basin]))] for basin in basin_keys])
+
+    reach = 0.5*np.sqrt(n_rows*n_cols/float(n_basins))
+    rows = np.clip(outlet_rows[basin_keys]+rng.uniform(-reach, reach, n_hilltops), 0, n_rows-1)
+    cols = np.clip(outlet_cols[basin_keys]+rng.uniform(-reach, reach, n_hilltops), 0, n_cols-1)
+    easting, northing = pixel_to_utm(rows, cols, dx)
+    latitude, longitude = utm_to_latlon(easting, northing)
+
+    Cht = -rng.lognormal(-4.5, 0.5, n_hilltops)
+    S = np.clip(rng.normal(0.4, 0.15, n_hilltops), 0.01, None)
+    Lh = rng.lognormal(4.5, 0.4, n_hilltops)
+    R = S*Lh*rng.uniform(0.3, 0.7, n_hilltops)
+    Sc = 0.8
+    hilltops = pd.DataFrame({"hilltop_id": np.arange(n_hilltops),
+                             "Easting": easting,
+                             "Northing": northing,
+                             "latitude": latitude,
+                             "longitude": longitude,
+                             "BasinID": junctions[basin_keys],
+                             "StreamID": stream_ids,
+                             "Cht": Cht,
+                             "S": S,
+                             "R": R,
+                             "Lh": Lh,
+                             "E_Star": -2*Cht*Lh/Sc,
+                             "R_Star": R/(Lh*Sc)})
+    hilltops.to_csv(DataDirectory+fname_prefix+"_HilltopData.csv", index=False)
+
+
+def make_synthetic_dataset(DataDirectory, size = 1000, scale = 1.0, dx = 5.0, seed = 0, overwrite = False):
+    """
+    This makes a full synthetic dataset: the DEM, the basin raster and the
+    csv files. The number of basins, the number of nodes in each channel and
+    the number of hilltops go up with the scale, so the scale of the csv files
+    can be set separately from the size of the rasters. Files that are already
+    there are kept unless you overwrite them, so the big datasets are only made once.
+
+    Args:
+        DataDirectory (str): the directory to write to (with the trailing separator)
+        size (int): the DEM is size x size pixels
+        scale (float): the scale of the csv files. 1 gives 20 basins with 5 sources of 200 nodes and 500 hilltops each.
+        dx (float): the pixel size in metres
+        seed (int): the random seed
+        overwrite (bool): if true the files are made again even if they are there
+
+    Returns:
+        dictionary with the DataDirectory, the fname_prefix and the number of basins, channel nodes and hilltops
+
+    Author: SMM
+    """
+    if not os.path.isdir(DataDirectory):
+        os.makedirs(DataDirectory)
+
+    size = int(size)
+    n_basins = max(2, int(round(20*scale)))
+    nodes_per_source = max(20, int(round(200*scale)))
+    hilltops_per_basin = max(10, int(round(500*scale)))
+    fname_prefix = "synthetic_"+str(size)+"_s"+('%g' % scale).replace(".", "p")
+
+    dataset = {"DataDirectory": DataDirectory,
+               "fname_prefix": fname_prefix,
+               "size": size,
+               "n_basins": n_basins,
+               "n_channel_nodes": n_basins*5*nodes_per_source,
+               "n_hilltops": n_basins*hilltops_per_basin}
+
+    def is_done(suffixes):
+        return not overwrite and all(os.path.isfile(DataDirectory+fname_prefix+suffix) for suffix in suffixes)
+
+    if is_done([".bil", ".hdr"]):
+        print("The DEM "+fname_prefix+" is already there.")
+    else:
+        print("Making a "+str(size)+"x"+str(size)+" DEM")
+        write_synthetic_dem(DataDirectory, fname_prefix, size, size, dx = dx, seed = seed)
+
+    if is_done(["_AllBasins.bil", "_AllBasins.hdr"]):
+        print("The basin raster is already there.")
+    else:
+        print("Making a basin raster with "+str(n_basins)+" basins")
+        write_basin_raster(DataDirectory, fname_prefix, size, size, n_basins, dx = dx, seed = seed)
+
+    csv_suffixes = ["_MChiSegmented.csv", "_ksnkp_mchi.csv", "_ksnkp.csv", "_ksnkp_raw.csv", "_ksnkp_SK.csv",
+                    "_HilltopData.csv"]
+    csv_suffixes += ["_movernstats_"+movern_str+"_fullstats.csv" for movern_str in get_movern_strings()]
+    if is_done(csv_suffixes):
+        print("The csv files are already there.")
+    else:
+        print("Making the csv files with "+str(dataset["n_channel_nodes"])+" channel nodes")
+        channel_data = make_channel_data(size, size, n_basins, nodes_per_source = nodes_per_source,
+                                         dx = dx, seed = seed)
+        write_channel_csvs(DataDirectory, fname_prefix, channel_data, seed = seed)
+        write_fullstats_csvs(DataDirectory, fname_prefix, channel_data, seed = seed)
+        write_hillslope_csv(DataDirectory, fname_prefix, channel_data, hilltops_per_basin = hilltops_per_basin,
+                            n_rows = size, n_cols = size, dx = dx, seed = seed)
+
+    return dataset
+
+
+def main(argv):
+    """
+    The main driving function.
+
+    Author: SMM
+    """
+    if len(argv) < 2:
+        print("Run with: python LSDMappingTools_synthetic_data.py DataDirectory size [scale]")
+        print("For example: python LSDMappingTools_synthetic_data.py ./synthetic/ 5000 2")
+        quit()
+
+    DataDirectory = os.path.join(argv[0], "")
+    size = int(argv[1])
+    scale = float(argv[2]) if len(argv) > 2 else 1.0
+    dataset = make_synthetic_dataset(DataDirectory, size, scale)
+    print("The dataset is: ")
+    print(dataset)
+
+
+#=============================================================================
+if __name__ == "__main__":
+    main(sys.argv[1:])